@@ -2,13 +2,16 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional
 import os
-from sqlalchemy import create_engine, func, or_
-from sqlalchemy.orm import sessionmaker
-import glob
+from sqlalchemy import func, or_
 from datetime import datetime
 
 from ai.claude_integration import ClaudeAI
-from database.models import Base, CaptureSession, Packet, Anomaly
+from database.models import CaptureSession, Packet, Anomaly
+from database.analytics import get_analytics_backend
+from database.engine_cache import get_session
+from database.dal import run_db, run_blocking
+from database.catalog import latest_database_path
+from database.tcp_flags import count_flag_patterns
 
 router = APIRouter(prefix="/api/ai", tags=["ai"])
 
@@ -39,8 +42,8 @@ def get_claude():
             )
     return _claude_instance
 
-def get_db_session(db_file: Optional[str] = None):
-    """Crea y retorna una sesión de base de datos"""
+def resolve_db_path(db_file: Optional[str] = None) -> str:
+    """Resuelve la ruta de la base de datos solicitada (o la más reciente si no se indica)"""
     db_dir = os.getenv('DATABASE_DIRECTORY', './data/db_files')
     
     if db_file:
@@ -48,19 +51,420 @@ def get_db_session(db_file: Optional[str] = None):
         if not db_path.startswith(os.path.abspath(db_dir)) or not db_file.endswith('.db') or not os.path.exists(db_path):
             raise HTTPException(status_code=400, detail="Base de datos no válida")
     else:
-        db_files = glob.glob(os.path.join(db_dir, 'database_*.db'))
+        # La más reciente según el catálogo, sin recorrer el directorio
+        db_path = latest_database_path(db_dir=db_dir)
         
-        if not db_files:
+        if not db_path:
             raise HTTPException(status_code=500, detail="No se encontró ninguna base de datos")
+    return db_path
+
+def get_db_session(db_file: Optional[str] = None):
+    """Retorna una sesión sobre el engine compartido de la base de datos"""
+    return get_session(resolve_db_path(db_file))
+
+def build_session_context(analytics, capture, packet_count):
+    """
+    Construye el contexto estadístico de una sesión para la IA.
+    
+    Args:
+        analytics: Backend de analítica (database.analytics)
+        capture: Sesión de captura (CaptureSession)
+        packet_count: Número de paquetes de la sesión
+        
+    Returns:
+        dict: Datos de la sesión para contextualizar la consulta
+    """
+    session_id = capture.id
+    
+    # Análisis detallado por protocolos para esta sesión específica
+    protocol_counts = analytics.protocol_counts(session_id)
+    
+    # Análisis TCP específico de la sesión
+    tcp_session_analysis = {}
+    if 'TCP' in protocol_counts:
+        tcp_session_analysis = analytics.tcp_flag_counts(session_id)
+        tcp_session_analysis["total_tcp"] = protocol_counts.get('TCP', 0)
+    
+    # Top IPs y puertos más atacados en esta sesión
+    top_src_ips_session = analytics.top_values(session_id, 'src_ip', 10)
+    top_dst_ips_session = analytics.top_values(session_id, 'dst_ip', 10)
+    top_ports_session = analytics.top_values(session_id, 'dst_port', 15, exclude_null=True)
+    
+    # Análisis temporal de la sesión
+    session_temporal = {}
+    bounds = analytics.time_bounds(session_id)
+    if bounds:
+        first_ts, last_ts = bounds
+        duration = last_ts - first_ts
+        pps = packet_count / duration if duration > 0 else 0
+        session_temporal = {
+            "duration_seconds": round(duration, 2),
+            "packets_per_second": round(pps, 2),
+            "start_time": datetime.fromtimestamp(first_ts).strftime('%Y-%m-%d %H:%M:%S'),
+            "end_time": datetime.fromtimestamp(last_ts).strftime('%Y-%m-%d %H:%M:%S')
+        }
+    
+    # Tamaños de paquetes en la sesión
+    size_stats = analytics.size_stats(session_id)
+    
+    # Anomalías específicas de esta sesión
+    session_anomalies = analytics.anomaly_counts(session_id)
+    
+    return {
+        "session_id": session_id,
+        "file_name": capture.file_name,
+        "packet_count": packet_count,
+        "protocols": protocol_counts,
+        "tcp_detailed_analysis": tcp_session_analysis,
+        "top_source_ips": [{"ip": ip, "packets": count} for ip, count in top_src_ips_session],
+        "top_destination_ips": [{"ip": ip, "packets": count} for ip, count in top_dst_ips_session],
+        "most_targeted_ports": [{"port": port, "packets": count} for port, count in top_ports_session if port],
+        "temporal_analysis": session_temporal,
+        "packet_sizes": {
+            "average": round(size_stats[0], 2) if size_stats[0] else 0,
+            "maximum": size_stats[1] if size_stats[1] else 0,
+            "minimum": size_stats[2] if size_stats[2] else 0
+        },
+        "anomaly_count": sum(count for _, count in session_anomalies),
+        "anomalies_by_type": [{"type": anom_type, "count": count} for anom_type, count in session_anomalies]
+    }
+
+def collect_database_aggregates(db_session):
+    """
+    Agrega en vivo todos los paquetes de una base de datos (cualquier número de sesiones).
+    
+    Returns:
+        dict: Agregados en el formato que espera format_capture_context()
+    """
+    total_packets = db_session.query(func.count(Packet.id)).scalar()
+    
+    # Todos los patrones de flags se cuentan en una sola pasada sobre el índice de tcp_flags_raw
+    flag_patterns = count_flag_patterns(db_session, Packet.tcp_flags_raw, Packet.tcp_flags_raw.isnot(None))
+    
+    first_packet = db_session.query(Packet.timestamp).order_by(Packet.timestamp).first()
+    last_packet = db_session.query(Packet.timestamp).order_by(Packet.timestamp.desc()).first()
+    
+    # Paquetes por intervalo de 10 segundos para detectar ráfagas
+    intervals = {}
+    if first_packet:
+        for (ts,) in db_session.query(Packet.timestamp):
+            interval_key = int((ts - first_packet[0]) / 10)
+            intervals[interval_key] = intervals.get(interval_key, 0) + 1
+    
+    # Pares con comunicación muy asimétrica (posible spoofing)
+    comm_pairs = db_session.query(
+        Packet.src_ip,
+        Packet.dst_ip,
+        func.count(Packet.id).label('outbound'),
+    ).group_by(Packet.src_ip, Packet.dst_ip).all()
+    pair_counts = {(src, dst): count for src, dst, count in comm_pairs}
+    asymmetric_pairs = []
+    for src, dst, out_count in comm_pairs:
+        in_count = pair_counts.get((dst, src), 0) if src is not None and dst is not None else 0
+        if out_count > 100 and (in_count == 0 or out_count / in_count > 50):
+            asymmetric_pairs.append((src, dst, out_count, in_count))
+    
+    return {
+        "total_packets": total_packets,
+        "protocol_counts": dict(db_session.query(Packet.transport_protocol, func.count(Packet.id)).group_by(Packet.transport_protocol).all()),
+        "flag_patterns": flag_patterns,
+        "top_src_ips": db_session.query(
+            Packet.src_ip, func.count(Packet.id).label('count')
+        ).group_by(Packet.src_ip).order_by(func.count(Packet.id).desc(), Packet.src_ip).limit(10).all(),
+        "top_dst_ips": db_session.query(
+            Packet.dst_ip, func.count(Packet.id).label('count')
+        ).group_by(Packet.dst_ip).order_by(func.count(Packet.id).desc(), Packet.dst_ip).limit(10).all(),
+        "top_dst_ports": db_session.query(
+            Packet.dst_port, func.count(Packet.id).label('count')
+        ).filter(Packet.dst_port.is_not(None)).group_by(Packet.dst_port).order_by(func.count(Packet.id).desc(), Packet.dst_port).limit(15).all(),
+        "time_bounds": (first_packet[0], last_packet[0]) if first_packet else None,
+        "size_stats": db_session.query(
+            func.avg(Packet.packet_length), func.max(Packet.packet_length), func.min(Packet.packet_length)
+        ).one(),
+        "unique_dst_ports": db_session.query(func.count(func.distinct(Packet.dst_port))).scalar(),
+        "ttl_histogram": db_session.query(Packet.ip_ttl, func.count(Packet.id).label('count')).filter(
+            Packet.ip_ttl.isnot(None)
+        ).group_by(Packet.ip_ttl).all(),
+        "port_scanners": db_session.query(
+            Packet.src_ip,
+            func.count(func.distinct(Packet.dst_port)).label('unique_ports'),
+            func.count(Packet.id).label('total_packets')
+        ).filter(
+            Packet.dst_port.isnot(None),
+            Packet.src_ip.isnot(None)
+        ).group_by(Packet.src_ip).having(
+            func.count(func.distinct(Packet.dst_port)) > 50  # Más de 50 puertos únicos
+        ).all(),
+        "fragmentation": {
+            "fragmented_packets": db_session.query(func.count(Packet.id)).filter(
+                or_(Packet.ip_flag_mf == True, Packet.ip_fragment_offset > 0)
+            ).scalar() or 0,
+            "tiny_packets": db_session.query(func.count(Packet.id)).filter(Packet.packet_length < 60).scalar() or 0,
+            "jumbo_packets": db_session.query(func.count(Packet.id)).filter(Packet.packet_length > 1500).scalar() or 0,
+        },
+        "intervals": {
+            "max_packets": max(intervals.values()) if intervals else 0,
+            "average_packets": sum(intervals.values()) / len(intervals) if intervals else 0,
+        },
+        "asymmetric_pairs": asymmetric_pairs,
+        "anomaly_counts": db_session.query(Anomaly.type, func.count(Anomaly.id).label('count')).group_by(Anomaly.type).all(),
+    }
+
+def collect_session_aggregates(analytics, session_id):
+    """
+    Agregados de una sesión a partir de un backend de analítica
+    (estadísticas precalculadas si existen, consultas en vivo si no).
+    
+    Returns:
+        dict: Agregados en el formato que espera format_capture_context()
+    """
+    protocol_counts = analytics.protocol_counts(session_id)
+    return {
+        "total_packets": sum(protocol_counts.values()),
+        "protocol_counts": protocol_counts,
+        "flag_patterns": analytics.flag_pattern_counts(session_id),
+        "top_src_ips": analytics.top_values(session_id, 'src_ip', 10),
+        "top_dst_ips": analytics.top_values(session_id, 'dst_ip', 10),
+        "top_dst_ports": analytics.top_values(session_id, 'dst_port', 15, exclude_null=True),
+        "time_bounds": analytics.time_bounds(session_id),
+        "size_stats": analytics.size_stats(session_id),
+        "unique_dst_ports": analytics.distinct_count(session_id, 'dst_port'),
+        "ttl_histogram": analytics.ttl_histogram(session_id),
+        "port_scanners": analytics.port_scanners(session_id),
+        "fragmentation": analytics.fragmentation_counts(session_id),
+        "intervals": analytics.interval_summary(session_id, 10),
+        "asymmetric_pairs": analytics.asymmetric_pairs(session_id),
+        "anomaly_counts": analytics.anomaly_counts(session_id),
+    }
+
+def format_capture_context(db_file, aggregates):
+    """
+    Construye el contexto global de una captura para la IA, incluyendo la
+    detección de patrones sospechosos.
+    
+    Args:
+        db_file: Nombre del archivo de base de datos
+        aggregates: Resultado de collect_database_aggregates() o collect_session_aggregates()
+        
+    Returns:
+        dict: Datos globales para contextualizar la consulta
+    """
+    total_packets = aggregates["total_packets"]
+    protocol_counts = aggregates["protocol_counts"]
+    tcp_packets = protocol_counts.get('TCP', 0)
+    udp_packets = protocol_counts.get('UDP', 0)
+    icmp_packets = sum(count for protocol, count in protocol_counts.items() if protocol and protocol.startswith('ICMP'))
+    
+    flag_patterns = aggregates["flag_patterns"]
+    tcp_syn_packets = flag_patterns['syn_packets']
+    tcp_rst_packets = flag_patterns['rst_packets']
+    tcp_fin_packets = flag_patterns['fin_packets']
+    
+    # Análisis temporal
+    temporal_analysis = {}
+    if aggregates["time_bounds"]:
+        first_ts, last_ts = aggregates["time_bounds"]
+        duration_seconds = last_ts - first_ts
+        packets_per_second = total_packets / duration_seconds if duration_seconds > 0 else 0
+        temporal_analysis = {
+            "duration_seconds": round(duration_seconds, 2),
+            "packets_per_second": round(packets_per_second, 2),
+            "capture_start": datetime.fromtimestamp(first_ts).strftime('%Y-%m-%d %H:%M:%S'),
+            "capture_end": datetime.fromtimestamp(last_ts).strftime('%Y-%m-%d %H:%M:%S')
+        }
+    
+    avg_packet_size, max_packet_size, min_packet_size = aggregates["size_stats"]
+    
+    # Detección de patrones sospechosos
+    suspicious_patterns = {}
+    
+    # 1. Posible SYN Flood
+    if tcp_syn_packets > 1000:
+        syn_ratio = tcp_syn_packets / tcp_packets if tcp_packets > 0 else 0
+        if syn_ratio > 0.7:  # Más del 70% son SYN
+            suspicious_patterns["possible_syn_flood"] = {
+                "syn_packets": tcp_syn_packets,
+                "syn_ratio": round(syn_ratio, 3),
+                "severity": "HIGH"
+            }
+    
+    # 2. Escaneo de puertos
+    unique_dst_ports = aggregates["unique_dst_ports"]
+    if unique_dst_ports > 100:
+        suspicious_patterns["possible_port_scan"] = {
+            "unique_ports_targeted": unique_dst_ports,
+            "severity": "MEDIUM"
+        }
+    
+    # 3. DDoS por volumen
+    if temporal_analysis.get("packets_per_second", 0) > 5000:
+        suspicious_patterns["possible_ddos"] = {
+            "packets_per_second": temporal_analysis["packets_per_second"],
+            "total_volume": total_packets,
+            "severity": "HIGH"
+        }
+    
+    # 4. Análisis de RST storms
+    if tcp_rst_packets > tcp_packets * 0.3:  # Más del 30% son RST
+        suspicious_patterns["rst_storm"] = {
+            "rst_packets": tcp_rst_packets,
+            "rst_ratio": round(tcp_rst_packets / tcp_packets, 3),
+            "severity": "MEDIUM"
+        }
+    
+    # ======= ANÁLISIS AVANZADO DE ANOMALÍAS =======
+    
+    # Análisis de TTL inusuales
+    suspicious_ttl = []
+    for ttl, count in aggregates["ttl_histogram"]:
+        if ttl and ttl < 10:  # TTL muy bajo = posible traceroute/escaneo
+            suspicious_ttl.append({"ttl": ttl, "count": count, "risk": "high", "description": "Possible traceroute/scanning"})
+        elif ttl and ttl > 250:  # TTL muy alto = posible manipulación
+            suspicious_ttl.append({"ttl": ttl, "count": count, "risk": "medium", "description": "Unusually high TTL"})
+    
+    # Detección avanzada de escaneo de puertos por IP origen
+    port_scanners = []
+    for src_ip, unique_ports, packets in aggregates["port_scanners"]:
+        intensity = "critical" if unique_ports > 1000 else "high" if unique_ports > 200 else "medium"
+        port_scanners.append({
+            "ip": src_ip,
+            "unique_ports_scanned": unique_ports,
+            "total_packets": packets,
+            "scan_intensity": intensity,
+            "attack_type": "Port Scan"
+        })
+    
+    # Análisis de fragmentación IP sospechosa y tamaños anómalos
+    fragmentation = aggregates["fragmentation"]
+    fragmented_packets = fragmentation["fragmented_packets"]
+    fragmentation_percentage = round((fragmented_packets / total_packets * 100), 2) if total_packets > 0 else 0
+    tiny_packets = fragmentation["tiny_packets"]    # Menores a 60 bytes
+    jumbo_packets = fragmentation["jumbo_packets"]  # Mayores a MTU estándar
+    
+    # Christmas tree packets (múltiples flags activos simultáneamente), NULL scan (sin flags) y FIN scan
+    christmas_tree = flag_patterns['christmas_tree']
+    null_scan = flag_patterns['null_scan']
+    fin_scan = flag_patterns['fin_scan']
+    
+    # Ráfagas: intervalos de 10 segundos con un pico 20x mayor que el promedio
+    temporal_anomalies = {}
+    max_per_interval = aggregates["intervals"]["max_packets"]
+    avg_per_interval = aggregates["intervals"]["average_packets"]
+    if total_packets > 1 and avg_per_interval and max_per_interval > avg_per_interval * 20:
+        temporal_anomalies["traffic_burst"] = {
+            "max_packets_per_10s": max_per_interval,
+            "average_packets_per_10s": round(avg_per_interval, 2),
+            "burst_ratio": round(max_per_interval / avg_per_interval, 2),
+            "severity": "HIGH"
+        }
+    
+    # Comunicaciones asimétricas (posible spoofing)
+    asymmetric_patterns = [
+        {
+            "src_ip": src,
+            "dst_ip": dst,
+            "outbound_packets": out_count,
+            "inbound_packets": in_count,
+            "asymmetry_ratio": "∞" if in_count == 0 else round(out_count / in_count, 2),
+            "possible_attack": "IP Spoofing or DDoS"
+        }
+        for src, dst, out_count, in_count in aggregates["asymmetric_pairs"]
+    ]
+    
+    anomaly_types = aggregates["anomaly_counts"]
+    
+    return {
+        "file_name": db_file,
+        "total_packets": total_packets,
+        "protocol_breakdown": {
+            "tcp": tcp_packets,
+            "udp": udp_packets,
+            "icmp": icmp_packets,
+            "other": total_packets - tcp_packets - udp_packets - icmp_packets
+        },
+        "tcp_analysis": {
+            "syn_packets": tcp_syn_packets,
+            "rst_packets": tcp_rst_packets,
+            "fin_packets": tcp_fin_packets,
+            "syn_ratio": round(tcp_syn_packets / tcp_packets, 3) if tcp_packets > 0 else 0
+        },
+        "top_source_ips": [{"ip": ip, "packets": count} for ip, count in aggregates["top_src_ips"]],
+        "top_destination_ips": [{"ip": ip, "packets": count} for ip, count in aggregates["top_dst_ips"]],
+        "top_targeted_ports": [{"port": port, "packets": count} for port, count in aggregates["top_dst_ports"] if port],
+        "temporal_analysis": temporal_analysis,
+        "packet_size_stats": {
+            "average": round(avg_packet_size, 2) if avg_packet_size else 0,
+            "maximum": max_packet_size or 0,
+            "minimum": min_packet_size or 0
+        },
+        "suspicious_patterns_detected": suspicious_patterns,
+        "advanced_anomaly_analysis": {
+            "suspicious_ttl_values": suspicious_ttl,
+            "port_scanning_detected": {
+                "scanner_count": len(port_scanners),
+                "scanners": port_scanners
+            },
+            "fragmentation_analysis": {
+                "fragmented_packets": fragmented_packets,
+                "fragmentation_percentage": fragmentation_percentage,
+                "potential_evasion": fragmentation_percentage > 5.0
+            },
+            "packet_size_anomalies": {
+                "tiny_packets": tiny_packets,
+                "jumbo_packets": jumbo_packets,
+                "size_distribution_suspicious": tiny_packets > total_packets * 0.1 or jumbo_packets > total_packets * 0.1
+            },
+            "advanced_tcp_attacks": {
+                "christmas_tree_packets": christmas_tree,
+                "null_scan_packets": null_scan,
+                "fin_scan_packets": fin_scan,
+                "stealth_scan_detected": christmas_tree > 0 or null_scan > 100 or fin_scan > 100
+            },
+            "temporal_anomalies": temporal_anomalies,
+            "asymmetric_communications": {
+                "suspicious_pairs": asymmetric_patterns,
+                "potential_spoofing": len(asymmetric_patterns) > 0
+            }
+        },
+        "anomalies": {
+            "total_count": sum(count for _, count in anomaly_types),
+            "by_type": [{"type": anom_type, "count": count} for anom_type, count in anomaly_types]
+        }
+    }
+
+def _build_chat_context(chat_request: ChatRequest) -> Optional[Dict[str, Any]]:
+    """Contexto de la captura para el chat (se ejecuta en el pool de base de datos)"""
+    session_data = None
+    db_session = None
+    try:
+        if chat_request.session_id:
+            db_session = get_db_session(chat_request.db_file)
+            # Verificar que existe la sesión
+            capture = db_session.query(CaptureSession).filter(CaptureSession.id == chat_request.session_id).first()
+            if not capture:
+                raise HTTPException(status_code=404, detail=f"Sesión con ID {chat_request.session_id} no encontrada")
+            
+            packet_count = capture.packet_count
             
-        # Ordenar por fecha de modificación (más reciente primero)
-        db_path = max(db_files, key=os.path.getmtime)
-    
-    engine = create_engine(f'sqlite:///{db_path}')
-    # Asegurar que las tablas existan antes de operar
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    return Session()
+            # Las agregaciones se leen de session_stats o, si no existen, se ejecutan en el backend configurado
+            with get_analytics_backend(resolve_db_path(chat_request.db_file)) as analytics:
+                session_data = build_session_context(analytics, capture, packet_count)
+            
+        elif chat_request.db_file:
+            db_session = get_db_session(chat_request.db_file)
+            session_ids = [sid for (sid,) in db_session.query(CaptureSession.id).all()]
+            if len(session_ids) == 1:
+                # Una captura por base de datos: se usan las estadísticas precalculadas de la sesión
+                with get_analytics_backend(resolve_db_path(chat_request.db_file)) as analytics:
+                    aggregates = collect_session_aggregates(analytics, session_ids[0])
+            else:
+                # Estadísticas globales enriquecidas si no hay session_id
+                aggregates = collect_database_aggregates(db_session)
+            session_data = format_capture_context(chat_request.db_file, aggregates)
+    finally:
+        if db_session:
+            db_session.close()
+    return session_data
 
 @router.post("/chat", response_model=ChatResponse)
 async def process_chat(
@@ -74,445 +478,9 @@ async def process_chat(
     de esa sesión de captura.
     """
     try:
-        session_data = None
-        db_session = None
-        try:
-            if chat_request.session_id:
-                db_session = get_db_session(chat_request.db_file)
-                # Verificar que existe la sesión
-                capture = db_session.query(CaptureSession).filter(CaptureSession.id == chat_request.session_id).first()
-                if not capture:
-                    raise HTTPException(status_code=404, detail=f"Sesión con ID {chat_request.session_id} no encontrada")
-                
-                packet_count = capture.packet_count
-                
-                # Análisis detallado por protocolos para esta sesión específica
-                protocol_rows = db_session.query(Packet.transport_protocol, func.count(Packet.id)).filter(
-                    Packet.session_id == chat_request.session_id
-                ).group_by(Packet.transport_protocol).all()
-                protocol_counts = {protocol: count for protocol, count in protocol_rows}
-                
-                # Análisis TCP específico de la sesión
-                tcp_session_analysis = {}
-                if 'TCP' in protocol_counts:
-                    tcp_syn = db_session.query(func.count(Packet.id)).filter(
-                        Packet.session_id == chat_request.session_id,
-                        Packet.transport_protocol == 'TCP',
-                        Packet.tcp_flag_syn == True,
-                        Packet.tcp_flag_ack == False
-                    ).scalar()
-                    
-                    tcp_rst = db_session.query(func.count(Packet.id)).filter(
-                        Packet.session_id == chat_request.session_id,
-                        Packet.transport_protocol == 'TCP',
-                        Packet.tcp_flag_rst == True
-                    ).scalar()
-                    
-                    tcp_fin = db_session.query(func.count(Packet.id)).filter(
-                        Packet.session_id == chat_request.session_id,
-                        Packet.transport_protocol == 'TCP',
-                        Packet.tcp_flag_fin == True
-                    ).scalar()
-                    
-                    tcp_session_analysis = {
-                        "syn_packets": tcp_syn,
-                        "rst_packets": tcp_rst,
-                        "fin_packets": tcp_fin,
-                        "total_tcp": protocol_counts.get('TCP', 0)
-                    }
-                
-                # Top IPs en esta sesión
-                top_src_ips_session = db_session.query(
-                    Packet.src_ip,
-                    func.count(Packet.id).label('count')
-                ).filter(Packet.session_id == chat_request.session_id).group_by(
-                    Packet.src_ip
-                ).order_by(func.count(Packet.id).desc()).limit(10).all()
-                
-                top_dst_ips_session = db_session.query(
-                    Packet.dst_ip,
-                    func.count(Packet.id).label('count')
-                ).filter(Packet.session_id == chat_request.session_id).group_by(
-                    Packet.dst_ip
-                ).order_by(func.count(Packet.id).desc()).limit(10).all()
-                
-                # Puertos más atacados en esta sesión
-                top_ports_session = db_session.query(
-                    Packet.dst_port,
-                    func.count(Packet.id).label('count')
-                ).filter(
-                    Packet.session_id == chat_request.session_id,
-                    Packet.dst_port.is_not(None)
-                ).group_by(Packet.dst_port).order_by(func.count(Packet.id).desc()).limit(15).all()
-                
-                # Análisis temporal de la sesión
-                session_temporal = {}
-                first_packet = db_session.query(Packet.timestamp).filter(
-                    Packet.session_id == chat_request.session_id
-                ).order_by(Packet.timestamp).first()
-                last_packet = db_session.query(Packet.timestamp).filter(
-                    Packet.session_id == chat_request.session_id
-                ).order_by(Packet.timestamp.desc()).first()
-                
-                if first_packet and last_packet:
-                    duration = last_packet[0] - first_packet[0]
-                    pps = packet_count / duration if duration > 0 else 0
-                    session_temporal = {
-                        "duration_seconds": round(duration, 2),
-                        "packets_per_second": round(pps, 2),
-                        "start_time": datetime.fromtimestamp(first_packet[0]).strftime('%Y-%m-%d %H:%M:%S'),
-                        "end_time": datetime.fromtimestamp(last_packet[0]).strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                
-                # Tamaños de paquetes en la sesión
-                size_stats = db_session.query(
-                    func.avg(Packet.packet_length),
-                    func.max(Packet.packet_length),
-                    func.min(Packet.packet_length)
-                ).filter(Packet.session_id == chat_request.session_id).first()
-                
-                # Anomalías específicas de esta sesión
-                anomaly_count = db_session.query(func.count(Anomaly.id)).join(
-                    Packet, Packet.id == Anomaly.packet_id
-                ).filter(Packet.session_id == chat_request.session_id).scalar()
-                
-                session_anomalies = db_session.query(
-                    Anomaly.type,
-                    func.count(Anomaly.id).label('count')
-                ).join(Packet, Packet.id == Anomaly.packet_id).filter(
-                    Packet.session_id == chat_request.session_id
-                ).group_by(Anomaly.type).all()
-                
-                session_data = {
-                    "session_id": chat_request.session_id,
-                    "file_name": capture.file_name,
-                    "packet_count": packet_count,
-                    "protocols": protocol_counts,
-                    "tcp_detailed_analysis": tcp_session_analysis,
-                    "top_source_ips": [{"ip": ip, "packets": count} for ip, count in top_src_ips_session],
-                    "top_destination_ips": [{"ip": ip, "packets": count} for ip, count in top_dst_ips_session],
-                    "most_targeted_ports": [{"port": port, "packets": count} for port, count in top_ports_session if port],
-                    "temporal_analysis": session_temporal,
-                    "packet_sizes": {
-                        "average": round(size_stats[0], 2) if size_stats[0] else 0,
-                        "maximum": size_stats[1] if size_stats[1] else 0,
-                        "minimum": size_stats[2] if size_stats[2] else 0
-                    },
-                    "anomaly_count": anomaly_count,
-                    "anomalies_by_type": [{"type": anom_type, "count": count} for anom_type, count in session_anomalies]
-                }
-                
-            elif chat_request.db_file:
-                db_session = get_db_session(chat_request.db_file)
-                # Estadísticas globales enriquecidas si no hay session_id
-                total_packets = db_session.query(func.count(Packet.id)).scalar()
-                udp_packets = db_session.query(func.count(Packet.id)).filter(Packet.transport_protocol == 'UDP').scalar()
-                tcp_packets = db_session.query(func.count(Packet.id)).filter(Packet.transport_protocol == 'TCP').scalar()
-                icmp_packets = db_session.query(func.count(Packet.id)).filter(Packet.transport_protocol.like('ICMP%')).scalar()
-                
-                # Análisis detallado de TCP - flags y patrones sospechosos
-                tcp_syn_packets = db_session.query(func.count(Packet.id)).filter(
-                    Packet.transport_protocol == 'TCP',
-                    Packet.tcp_flag_syn == True,
-                    Packet.tcp_flag_ack == False
-                ).scalar()
-                
-                tcp_rst_packets = db_session.query(func.count(Packet.id)).filter(
-                    Packet.transport_protocol == 'TCP',
-                    Packet.tcp_flag_rst == True
-                ).scalar()
-                
-                tcp_fin_packets = db_session.query(func.count(Packet.id)).filter(
-                    Packet.transport_protocol == 'TCP',
-                    Packet.tcp_flag_fin == True
-                ).scalar()
-                
-                # Top IPs más activas (posibles atacantes)
-                top_src_ips = db_session.query(
-                    Packet.src_ip,
-                    func.count(Packet.id).label('count')
-                ).group_by(Packet.src_ip).order_by(func.count(Packet.id).desc()).limit(10).all()
-                
-                top_dst_ips = db_session.query(
-                    Packet.dst_ip,
-                    func.count(Packet.id).label('count')
-                ).group_by(Packet.dst_ip).order_by(func.count(Packet.id).desc()).limit(10).all()
-                
-                # Puertos más atacados
-                top_dst_ports = db_session.query(
-                    Packet.dst_port,
-                    func.count(Packet.id).label('count')
-                ).filter(Packet.dst_port.is_not(None)).group_by(Packet.dst_port).order_by(func.count(Packet.id).desc()).limit(15).all()
-                
-                # Análisis temporal - paquetes por minuto (para detectar ráfagas)
-                # Obtener timestamps del primer y último paquete
-                first_packet = db_session.query(Packet.timestamp).order_by(Packet.timestamp).first()
-                last_packet = db_session.query(Packet.timestamp).order_by(Packet.timestamp.desc()).first()
-                
-                temporal_analysis = {}
-                if first_packet and last_packet:
-                    duration_seconds = last_packet[0] - first_packet[0]
-                    packets_per_second = total_packets / duration_seconds if duration_seconds > 0 else 0
-                    temporal_analysis = {
-                        "duration_seconds": round(duration_seconds, 2),
-                        "packets_per_second": round(packets_per_second, 2),
-                        "capture_start": datetime.fromtimestamp(first_packet[0]).strftime('%Y-%m-%d %H:%M:%S'),
-                        "capture_end": datetime.fromtimestamp(last_packet[0]).strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                
-                # Análisis de tamaños de paquetes
-                avg_packet_size = db_session.query(func.avg(Packet.packet_length)).scalar()
-                max_packet_size = db_session.query(func.max(Packet.packet_length)).scalar()
-                min_packet_size = db_session.query(func.min(Packet.packet_length)).scalar()
-                
-                # Detección de patrones sospechosos
-                suspicious_patterns = {}
-                
-                # 1. Posible SYN Flood
-                if tcp_syn_packets > 1000:
-                    syn_ratio = tcp_syn_packets / tcp_packets if tcp_packets > 0 else 0
-                    if syn_ratio > 0.7:  # Más del 70% son SYN
-                        suspicious_patterns["possible_syn_flood"] = {
-                            "syn_packets": tcp_syn_packets,
-                            "syn_ratio": round(syn_ratio, 3),
-                            "severity": "HIGH"
-                        }
-                
-                # 2. Escaneo de puertos
-                unique_dst_ports = db_session.query(func.count(func.distinct(Packet.dst_port))).scalar()
-                if unique_dst_ports > 100:
-                    suspicious_patterns["possible_port_scan"] = {
-                        "unique_ports_targeted": unique_dst_ports,
-                        "severity": "MEDIUM"
-                    }
-                
-                # 3. DDoS por volumen
-                if temporal_analysis.get("packets_per_second", 0) > 5000:
-                    suspicious_patterns["possible_ddos"] = {
-                        "packets_per_second": temporal_analysis["packets_per_second"],
-                        "total_volume": total_packets,
-                        "severity": "HIGH"
-                    }
-                  # 4. Análisis de RST storms
-                if tcp_rst_packets > tcp_packets * 0.3:  # Más del 30% son RST
-                    suspicious_patterns["rst_storm"] = {
-                        "rst_packets": tcp_rst_packets,
-                        "rst_ratio": round(tcp_rst_packets / tcp_packets, 3),
-                        "severity": "MEDIUM"
-                    }
-                
-                # ======= ANÁLISIS AVANZADO DE ANOMALÍAS =======
-                
-                # Análisis de TTL inusuales
-                ttl_analysis = db_session.query(Packet.ip_ttl, func.count(Packet.id).label('count')).filter(
-                    Packet.ip_ttl.isnot(None)
-                ).group_by(Packet.ip_ttl).all()
-                
-                suspicious_ttl = []
-                for ttl, count in ttl_analysis:
-                    if ttl and ttl < 10:  # TTL muy bajo = posible traceroute/escaneo
-                        suspicious_ttl.append({"ttl": ttl, "count": count, "risk": "high", "description": "Possible traceroute/scanning"})
-                    elif ttl and ttl > 250:  # TTL muy alto = posible manipulación
-                        suspicious_ttl.append({"ttl": ttl, "count": count, "risk": "medium", "description": "Unusually high TTL"})
-
-                # Detección avanzada de escaneo de puertos por IP origen
-                port_scan_detection = db_session.query(
-                    Packet.src_ip,
-                    func.count(func.distinct(Packet.dst_port)).label('unique_ports'),
-                    func.count(Packet.id).label('total_packets')
-                ).filter(
-                    Packet.dst_port.isnot(None),
-                    Packet.src_ip.isnot(None)
-                ).group_by(Packet.src_ip).having(
-                    func.count(func.distinct(Packet.dst_port)) > 50  # Más de 50 puertos únicos
-                ).all()
-                
-                port_scanners = []
-                for src_ip, unique_ports, packets in port_scan_detection:
-                    intensity = "critical" if unique_ports > 1000 else "high" if unique_ports > 200 else "medium"
-                    port_scanners.append({
-                        "ip": src_ip,
-                        "unique_ports_scanned": unique_ports,
-                        "total_packets": packets,
-                        "scan_intensity": intensity,
-                        "attack_type": "Port Scan"
-                    })
-
-                # Análisis de fragmentación IP sospechosa
-                fragmented_packets = db_session.query(func.count(Packet.id)).filter(
-                    or_(Packet.ip_flag_mf == True, Packet.ip_fragment_offset > 0)
-                ).scalar() or 0
-                
-                fragmentation_percentage = round((fragmented_packets / total_packets * 100), 2) if total_packets > 0 else 0
-
-                # Paquetes con tamaños anómalos
-                tiny_packets = db_session.query(func.count(Packet.id)).filter(
-                    Packet.packet_length < 60  # Menores a 60 bytes
-                ).scalar() or 0
-                
-                jumbo_packets = db_session.query(func.count(Packet.id)).filter(
-                    Packet.packet_length > 1500  # Mayores a MTU estándar
-                ).scalar() or 0                # Análisis de flags TCP sospechosos adicionales
-                
-                # Christmas tree packets (múltiples flags activos simultáneamente)
-                christmas_tree = db_session.query(func.count(Packet.id)).filter(
-                    Packet.transport_protocol == 'TCP',
-                    Packet.tcp_flag_syn == True,
-                    Packet.tcp_flag_fin == True,
-                    Packet.tcp_flag_rst == True,
-                    Packet.tcp_flag_psh == True,
-                    Packet.tcp_flag_urg == True
-                ).scalar() or 0
-
-                # NULL scan (sin flags)
-                null_scan = db_session.query(func.count(Packet.id)).filter(
-                    Packet.transport_protocol == 'TCP',
-                    Packet.tcp_flag_syn == False,
-                    Packet.tcp_flag_fin == False,
-                    Packet.tcp_flag_rst == False,
-                    Packet.tcp_flag_psh == False,
-                    Packet.tcp_flag_urg == False,
-                    Packet.tcp_flag_ack == False
-                ).scalar() or 0
-
-                # FIN scan
-                fin_scan = db_session.query(func.count(Packet.id)).filter(
-                    Packet.transport_protocol == 'TCP',
-                    Packet.tcp_flag_fin == True,
-                    Packet.tcp_flag_syn == False,
-                    Packet.tcp_flag_ack == False
-                ).scalar() or 0
-
-                # Análisis de distribución temporal para detectar ráfagas
-                # Obtener todos los timestamps para análisis temporal detallado
-                all_timestamps = db_session.query(Packet.timestamp).order_by(Packet.timestamp).all()
-                
-                temporal_anomalies = {}
-                if len(all_timestamps) > 1:
-                    timestamps = [t[0] for t in all_timestamps]
-                    first_time, last_time = timestamps[0], timestamps[-1]
-                    duration = last_time - first_time
-                    
-                    # Dividir en intervalos de 10 segundos para detectar ráfagas
-                    interval_size = 10  # segundos
-                    intervals = {}
-                    
-                    for ts in timestamps:
-                        interval_key = int((ts - first_time) / interval_size)
-                        intervals[interval_key] = intervals.get(interval_key, 0) + 1
-                    
-                    if intervals:
-                        avg_per_interval = sum(intervals.values()) / len(intervals)
-                        max_per_interval = max(intervals.values())
-                        
-                        if max_per_interval > avg_per_interval * 20:  # Pico 20x mayor que promedio
-                            temporal_anomalies["traffic_burst"] = {
-                                "max_packets_per_10s": max_per_interval,
-                                "average_packets_per_10s": round(avg_per_interval, 2),
-                                "burst_ratio": round(max_per_interval / avg_per_interval, 2),
-                                "severity": "HIGH"
-                            }
-
-                # Análisis de comunicaciones asimétricas (posible spoofing)
-                asymmetric_comms = db_session.query(
-                    Packet.src_ip,
-                    Packet.dst_ip,
-                    func.count(Packet.id).label('outbound'),
-                ).group_by(Packet.src_ip, Packet.dst_ip).subquery()
-
-                # Buscar pares con comunicación muy asimétrica
-                comm_pairs = db_session.query(asymmetric_comms).all()
-                asymmetric_patterns = []
-                
-                for src, dst, out_count in comm_pairs:
-                    # Buscar tráfico de vuelta
-                    in_count = db_session.query(func.count(Packet.id)).filter(
-                        Packet.src_ip == dst,
-                        Packet.dst_ip == src
-                    ).scalar() or 0
-                    
-                    if out_count > 100 and (in_count == 0 or out_count / in_count > 50):
-                        asymmetric_patterns.append({
-                            "src_ip": src,
-                            "dst_ip": dst,
-                            "outbound_packets": out_count,
-                            "inbound_packets": in_count,
-                            "asymmetry_ratio": "∞" if in_count == 0 else round(out_count / in_count, 2),
-                            "possible_attack": "IP Spoofing or DDoS"
-                        })
-
-                # Compilar análisis completo de anomalías
-                advanced_anomaly_analysis = {
-                    "suspicious_ttl_values": suspicious_ttl,
-                    "port_scanning_detected": {
-                        "scanner_count": len(port_scanners),
-                        "scanners": port_scanners
-                    },
-                    "fragmentation_analysis": {
-                        "fragmented_packets": fragmented_packets,
-                        "fragmentation_percentage": fragmentation_percentage,
-                        "potential_evasion": fragmentation_percentage > 5.0
-                    },
-                    "packet_size_anomalies": {
-                        "tiny_packets": tiny_packets,
-                        "jumbo_packets": jumbo_packets,
-                        "size_distribution_suspicious": tiny_packets > total_packets * 0.1 or jumbo_packets > total_packets * 0.1
-                    },
-                    "advanced_tcp_attacks": {
-                        "christmas_tree_packets": christmas_tree,
-                        "null_scan_packets": null_scan,
-                        "fin_scan_packets": fin_scan,
-                        "stealth_scan_detected": christmas_tree > 0 or null_scan > 100 or fin_scan > 100
-                    },
-                    "temporal_anomalies": temporal_anomalies,
-                    "asymmetric_communications": {
-                        "suspicious_pairs": asymmetric_patterns,
-                        "potential_spoofing": len(asymmetric_patterns) > 0
-                    }
-                }
-
-                # Anomalías detectadas automáticamente
-                anomaly_count = db_session.query(func.count(Anomaly.id)).scalar()
-                anomaly_types = db_session.query(
-                    Anomaly.type,
-                    func.count(Anomaly.id).label('count')
-                ).group_by(Anomaly.type).all()
-                
-                session_data = {
-                    "file_name": chat_request.db_file,
-                    "total_packets": total_packets,
-                    "protocol_breakdown": {
-                        "tcp": tcp_packets,
-                        "udp": udp_packets,
-                        "icmp": icmp_packets,
-                        "other": total_packets - tcp_packets - udp_packets - icmp_packets
-                    },
-                    "tcp_analysis": {
-                        "syn_packets": tcp_syn_packets,
-                        "rst_packets": tcp_rst_packets,
-                        "fin_packets": tcp_fin_packets,
-                        "syn_ratio": round(tcp_syn_packets / tcp_packets, 3) if tcp_packets > 0 else 0
-                    },
-                    "top_source_ips": [{"ip": ip, "packets": count} for ip, count in top_src_ips],
-                    "top_destination_ips": [{"ip": ip, "packets": count} for ip, count in top_dst_ips],
-                    "top_targeted_ports": [{"port": port, "packets": count} for port, count in top_dst_ports if port],
-                    "temporal_analysis": temporal_analysis,
-                    "packet_size_stats": {
-                        "average": round(avg_packet_size, 2) if avg_packet_size else 0,
-                        "maximum": max_packet_size or 0,
-                        "minimum": min_packet_size or 0
-                    },                    "suspicious_patterns_detected": suspicious_patterns,
-                    "advanced_anomaly_analysis": advanced_anomaly_analysis,
-                    "anomalies": {
-                        "total_count": anomaly_count,
-                        "by_type": [{"type": anom_type, "count": count} for anom_type, count in anomaly_types]
-                    }
-                }
-        finally:
-            if db_session:
-                db_session.close()
-                
-        response = claude.query(chat_request.message, session_data, chat_request.user_preference)
+        # Consultas y llamada al modelo fuera del bucle de eventos
+        session_data = await run_db(_build_chat_context, chat_request)
+        response = await run_blocking(claude.query, chat_request.message, session_data, chat_request.user_preference)
         return ChatResponse(response=response)
     except HTTPException:
         raise
@@ -1,61 +1,260 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
 from typing import Optional, List, Dict, Any
 import os
+import asyncio
 from datetime import datetime
 
-from capture.network_interfaces import get_interfaces, capture_packets
+from capture.network_interfaces import get_interfaces
+from capture.tshark_runtime import get_tshark_runtime
+from capture.capture_manager import (
+    get_capture_manager, CaptureError, CaptureNotFound, CaptureConflict, CAPTURE_STATUSES
+)
+from capture.capture_filters import (
+    compile_capture_filter, default_snaplen, CaptureFilterError, MAX_SNAPLEN
+)
+from capture.live_stream import get_live_hub, LiveCaptureError
+from database.dal import run_blocking, run_db
+from processing.jobs import enqueue_job
 
 router = APIRouter(prefix="/api/capture", tags=["capture"])
 
 @router.get("/interfaces")
-async def list_interfaces() -> List[Dict[str, Any]]:
+async def list_interfaces(
+    refresh: bool = Query(False, description="Volver a listar las interfaces aunque la caché esté vigente")
+) -> List[Dict[str, Any]]:
     """
-    Lista las interfaces de red disponibles para captura.
+    Lista las interfaces de red disponibles para captura (en caché).
     """
-    interfaces = get_interfaces()
+    interfaces = await run_blocking(get_interfaces, refresh=refresh)
     if not interfaces:
         raise HTTPException(status_code=500, detail="No se pudieron obtener las interfaces de red")
     return interfaces
 
-@router.post("/start")
+@router.get("/interfaces/{interface_id}/link-types")
+async def interface_link_types(
+    interface_id: str,
+    refresh: bool = Query(False, description="Volver a consultarlos aunque estén en caché")
+) -> Dict[str, Any]:
+    """
+    Tipos de enlace que admite una interfaz.
+    """
+    try:
+        link_types = await run_blocking(get_tshark_runtime().link_types, interface_id, refresh=refresh)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudieron obtener los tipos de enlace: {str(e)}")
+    return {"interface_id": interface_id, "link_types": link_types}
+
+@router.get("/capabilities")
+async def capture_capabilities() -> Dict[str, Any]:
+    """
+    Ejecutables de Wireshark disponibles, sus versiones y el estado de la caché de interfaces.
+    """
+    return await run_blocking(get_tshark_runtime().capabilities)
+
+@router.get("/filters/compile")
+async def compile_filter(
+    interface_id: str,
+    capture_filter: str = Query(..., description="Filtro de captura (BPF)"),
+    snaplen: Optional[int] = Query(None, ge=1, le=MAX_SNAPLEN, description="Bytes capturados de cada paquete")
+) -> Dict[str, Any]:
+    """
+    Compila un filtro de captura para una interfaz y devuelve el código BPF generado.
+    """
+    try:
+        instructions = await run_blocking(compile_capture_filter, interface_id, capture_filter, snaplen)
+    except CaptureFilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "interface_id": interface_id,
+        "capture_filter": capture_filter,
+        "snaplen": snaplen,
+        # False: dumpcap no está disponible y el filtro no se pudo comprobar
+        "validated": instructions is not None,
+        "instructions": instructions or [],
+    }
+
+def _capture_http_error(e: CaptureError) -> HTTPException:
+    if isinstance(e, CaptureNotFound):
+        return HTTPException(status_code=404, detail=str(e))
+    if isinstance(e, CaptureConflict):
+        return HTTPException(status_code=409, detail=str(e))
+    return HTTPException(status_code=500, detail=f"Error durante la captura: {str(e)}")
+
+@router.post("/start", status_code=202)
 async def start_capture(
     interface_id: str,
-    duration: int = Query(60, description="Duración de la captura en segundos"),
-    packet_count: Optional[int] = Query(None, description="Número de paquetes a capturar")
-) -> Dict[str, str]:
+    duration: int = Query(60, ge=0, description="Duración de la captura en segundos (0: hasta detenerla)"),
+    packet_count: Optional[int] = Query(None, ge=1, description="Número de paquetes a capturar"),
+    capture_filter: Optional[str] = Query(None, description="Filtro de captura (BPF), aplicado en el kernel"),
+    snaplen: Optional[int] = Query(None, ge=1, le=MAX_SNAPLEN, description="Bytes capturados de cada paquete (por defecto CAPTURE_SNAPLEN)"),
+    process: bool = Query(False, description="Encolar el PCAP para su procesamiento al terminar"),
+    priority: int = Query(0, description="Prioridad del trabajo de procesamiento (mayor primero)"),
+    ring_filesize: Optional[int] = Query(None, ge=1, description="Búfer circular: rotar al alcanzar este tamaño (kB)"),
+    ring_duration: Optional[int] = Query(None, ge=1, description="Búfer circular: rotar cada estos segundos"),
+    ring_files: Optional[int] = Query(None, ge=1, description="Búfer circular: número máximo de archivos conservados (sin process)")
+) -> Dict[str, Any]:
     """
     Inicia una captura de paquetes en la interfaz especificada.
+    
+    Responde en cuanto arranca la captura; el estado se consulta en /captures/{capture_id}.
+    Con búfer circular y process=true cada archivo se procesa en cuanto se cierra;
+    ring_files no se admite con process=true: dumpcap borraría archivos aún en cola.
+    Un filtro de captura que no compila se rechaza con 400 sin iniciar la captura.
     """
+    if ring_files and not (ring_filesize or ring_duration):
+        raise HTTPException(status_code=400, detail="ring_files requiere ring_filesize o ring_duration")
+    if ring_files and process:
+        # Con procesamiento el disco ya queda acotado: cada archivo se borra tras ingerirlo
+        raise HTTPException(status_code=400, detail="ring_files no se admite con process=true")
     try:
-        # Configurar el nombre del archivo
-        pcap_dir = os.getenv("PCAP_DIRECTORY", "./data/pcap_files/")
-        os.makedirs(pcap_dir, exist_ok=True)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = os.path.join(pcap_dir, f"capture_{timestamp}.pcap")
-        
-        # Iniciar la captura
-        result_file = capture_packets(
-            interface_id=interface_id,
+        capture = await get_capture_manager().start(
+            interface_id,
             duration=duration,
-            output_file=output_file,
-            packet_count=packet_count
+            packet_count=packet_count,
+            capture_filter=capture_filter,
+            process=process,
+            priority=priority,
+            ring_buffer={"filesize": ring_filesize, "duration": ring_duration, "files": ring_files},
+            snaplen=snaplen
         )
-        
-        if not result_file:
-            raise HTTPException(status_code=500, detail="Error al realizar la captura")
-            
-        return {
-            "message": "Captura completada con éxito",
-            "file_path": result_file,
-            "file_name": os.path.basename(result_file)
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error durante la captura: {str(e)}")
+    except CaptureFilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CaptureError as e:
+        raise _capture_http_error(e)
+    return {"message": "Captura iniciada", **capture.to_dict()}
+
+@router.post("/ingest", status_code=202)
+async def start_direct_capture(
+    interface_id: str,
+    duration: Optional[int] = Query(None, ge=1, description="Duración en segundos (sin límite: hasta cancelar el trabajo)"),
+    packet_count: Optional[int] = Query(None, ge=1, description="Número de paquetes a capturar"),
+    capture_filter: Optional[str] = Query(None, description="Filtro de captura (BPF), aplicado en el kernel"),
+    snaplen: Optional[int] = Query(None, ge=1, le=MAX_SNAPLEN, description="Bytes capturados de cada paquete (por defecto CAPTURE_SNAPLEN)"),
+    archive: bool = Query(True, description="Guardar también la captura original comprimida (.pcap.zst)"),
+    priority: int = Query(0, description="Prioridad del trabajo (mayor primero)")
+) -> Dict[str, Any]:
+    """
+    Captura directamente a una base de datos, sin PCAP intermedio.
+    
+    Se ejecuta como trabajo de la cola: la sesión se puede consultar mientras dura
+    la captura y cancelar el trabajo la detiene conservando lo capturado.
+    """
+    snaplen = default_snaplen(snaplen)
+    # El filtro se compila antes de encolar: un error llega en esta respuesta
+    try:
+        await run_blocking(compile_capture_filter, interface_id, capture_filter, snaplen)
+    except CaptureFilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job = await run_db(enqueue_job, 'capture_to_db', {
+        "interface": interface_id,
+        "duration": duration,
+        "packet_count": packet_count,
+        "capture_filter": capture_filter,
+        "snaplen": snaplen,
+        "archive": archive,
+    }, priority=priority)
+    print(f"Captura directa en {interface_id} encolada: trabajo {job['id']}")
+    return job
+
+@router.get("/captures")
+async def list_captures(
+    status: Optional[str] = Query(None, description="Filtrar por estado")
+) -> Dict[str, Any]:
+    """
+    Lista las capturas en curso y las últimas terminadas.
+    """
+    if status is not None and status not in CAPTURE_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Estado no válido. Valores admitidos: {', '.join(CAPTURE_STATUSES)}")
+    manager = get_capture_manager()
+    captures = manager.list(status)
+    for capture in captures:
+        await manager.refresh_savings(capture)
+    captures = [capture.to_dict() for capture in captures]
+    return {"captures": captures, "total": len(captures)}
+
+@router.get("/captures/{capture_id}")
+async def capture_status(capture_id: str) -> Dict[str, Any]:
+    """
+    Estado de una captura: en curso, completada, detenida o fallida.
+    """
+    manager = get_capture_manager()
+    try:
+        capture = manager.get(capture_id)
+    except CaptureError as e:
+        raise _capture_http_error(e)
+    # El ahorro se completa a medida que los trabajos de ingesta miden cada archivo
+    await manager.refresh_savings(capture)
+    return capture.to_dict()
+
+@router.post("/captures/{capture_id}/stop")
+async def stop_capture(capture_id: str) -> Dict[str, Any]:
+    """
+    Detiene una captura en curso conservando lo capturado hasta el momento.
+    """
+    try:
+        capture = await get_capture_manager().stop(capture_id)
+    except CaptureError as e:
+        raise _capture_http_error(e)
+    return capture.to_dict()
+
+@router.websocket("/live/{interface_id}")
+async def live_capture(
+    websocket: WebSocket,
+    interface_id: str,
+    capture_filter: Optional[str] = None,
+    max_samples: Optional[int] = None
+):
+    """
+    Captura en vivo: un resumen por segundo ({"type": "stats"}) y una muestra de
+    paquetes ({"type": "packet"}) limitada a max_samples por segundo.
+    """
+    await websocket.accept()
+    try:
+        # Un filtro no válido se rechaza antes de lanzar (o compartir) tshark
+        await run_blocking(compile_capture_filter, interface_id, capture_filter)
+    except CaptureFilterError as e:
+        await websocket.send_json({"type": "end", "error": str(e)})
+        await websocket.close(code=1008)
+        return
+    hub = get_live_hub()
+    try:
+        session, subscriber = await hub.subscribe(interface_id, capture_filter, max_samples)
+    except LiveCaptureError as e:
+        await websocket.send_json({"type": "end", "error": str(e)})
+        await websocket.close(code=1011)
+        return
+
+    async def wait_disconnect():
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    disconnected = asyncio.create_task(wait_disconnect())
+    try:
+        while True:
+            next_message = asyncio.create_task(subscriber.queue.get())
+            await asyncio.wait({next_message, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_message.done():
+                next_message.cancel()
+                break
+            message = next_message.result()
+            if message["type"] == "stats":
+                # Mensajes descartados porque este cliente no los leía a tiempo
+                message = {**message, "dropped": subscriber.dropped}
+            await websocket.send_json(message)
+            if message["type"] == "end":
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
+        await hub.unsubscribe(session, subscriber)
 
 @router.get("/files")
-async def list_pcap_files() -> List[Dict[str, Any]]:
+def list_pcap_files() -> List[Dict[str, Any]]:
     """
     Lista los archivos PCAP disponibles.
     """
@@ -1,32 +1,51 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
-from sqlalchemy import create_engine, func, desc, or_, and_
-from sqlalchemy.orm import sessionmaker, joinedload
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
+from fastapi.encoders import jsonable_encoder
+from starlette.background import BackgroundTask
+from starlette.responses import FileResponse, StreamingResponse, Response
+from sqlalchemy import func, desc, or_, and_
+from sqlalchemy.orm import joinedload
 from typing import List, Dict, Any, Optional
 import os
 from datetime import datetime, timedelta
-from database.models import Base, CaptureSession, Packet, TCPInfo, UDPInfo, ICMPInfo, Anomaly
-import glob
+from database.models import CaptureSession, Packet, TCPInfo, UDPInfo, ICMPInfo, Anomaly
+from database.parquet_export import export_table, pyarrow_available, EXPORT_TABLES
+from database.analytics import get_analytics_backend
+from database.engine_cache import get_engine, get_session
+from database.dal import run_db
+from database.response_cache import cached_json
+from database.catalog import (
+    latest_database_path, list_databases, list_sessions, get_database_entry,
+    index_database, reconcile_catalog, SORT_COLUMNS
+)
+from database.tcp_flags import flags_to_text
+from database.session_queries import (
+    list_session_packets, list_session_anomalies, session_exists, SessionQueryError, MAX_PAGE_SIZE
+)
+from database.stream_export import (
+    stream_session_packets, check_export_options, export_media_type, export_file_name, StreamExportError
+)
+from database.federated import search_packets, count_matches, build_filters, FederatedQueryError
+from database.fulltext import search_packets as search_packet_text, FullTextSearchError
+from database.frame_store import get_frame_reader, frame_store_stats, zstd_available, FrameStoreError
+from database.seal import seal_database, unseal_database, read_seal, verify_seal
+from database.migrations import migration_status, start_migration_runner, migrate_database, MigrationError
+from database.retention import (
+    apply_retention, archive_status, rehydrate_session, RetentionPolicy, RetentionError
+)
+import json
+import tempfile
 from collections import defaultdict
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/database", tags=["database"])
 
 # Función auxiliar para obtener flags TCP como texto
-def _get_tcp_flags(tcp_info):
-    """Obtiene una representación legible de los flags TCP"""
-    flags = []
-    if tcp_info.flag_syn: flags.append("SYN")
-    if tcp_info.flag_ack: flags.append("ACK")
-    if tcp_info.flag_fin: flags.append("FIN")
-    if tcp_info.flag_rst: flags.append("RST")
-    if tcp_info.flag_psh: flags.append("PSH")
-    if tcp_info.flag_urg: flags.append("URG")
-    if tcp_info.flag_ece: flags.append("ECE")
-    if tcp_info.flag_cwr: flags.append("CWR")
-    return ", ".join(flags) if flags else "None"
+def _get_tcp_flags(tcp_flags_raw):
+    """Obtiene una representación legible de los flags TCP a partir del valor empaquetado"""
+    return flags_to_text(tcp_flags_raw)
 
-def get_db_session(db_file: Optional[str] = None):
-    """Crea y retorna una sesión de base de datos, asegurando que las tablas existen."""
+def resolve_db_path(db_file: Optional[str] = None) -> str:
+    """Resuelve la ruta de la base de datos solicitada (o la más reciente si no se indica)."""
     db_dir = os.getenv('DATABASE_DIRECTORY', './data/db_files')
     if db_file:
         # Seguridad: solo permitir archivos dentro del directorio y con extensión .db
@@ -34,14 +53,31 @@ def get_db_session(db_file: Optional[str] = None):
         if not db_path.startswith(os.path.abspath(db_dir)) or not db_file.endswith('.db') or not os.path.exists(db_path):
             raise HTTPException(status_code=400, detail="Base de datos no válida")
     else:
-        db_files = glob.glob(os.path.join(db_dir, 'database_*.db'))
-        if not db_files:
+        # La más reciente según el catálogo, sin recorrer el directorio
+        db_path = latest_database_path(db_dir=db_dir)
+        if not db_path:
             raise HTTPException(status_code=500, detail="No se encontró ninguna base de datos")
-        db_path = max(db_files, key=os.path.getmtime)
-    engine = create_engine(f'sqlite:///{db_path}')
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    return Session()
+    return db_path
+
+def get_db_session(db_file: Optional[str] = None):
+    """Retorna una sesión sobre el engine compartido de la base de datos (esquema verificado una vez)."""
+    return get_session(resolve_db_path(db_file))
+
+def cached_response(request: Request, db_path: str, endpoint: str, params: dict, compute) -> Response:
+    """
+    Respuesta JSON servida desde la caché de respuestas, con ETag.
+
+    Si la petición trae un If-None-Match vigente se responde 304 sin calcular
+    nada; la clave cambia cuando la base de datos se modifica o se sella.
+    """
+    etag, body = cached_json(
+        db_path, endpoint, params, lambda: jsonable_encoder(compute()),
+        if_none_match=request.headers.get('if-none-match')
+    )
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 class SessionResponseItem(BaseModel):
     id: int
@@ -74,18 +110,26 @@ class PacketResponse(BaseModel):
 
 # Endpoint para obtener todas las sesiones de captura
 @router.get("/sessions", response_model=SessionsResponse)
-async def get_sessions(db_file: Optional[str] = Query(None)):
-    db = get_db_session(db_file)
+async def get_sessions(request: Request, db_file: Optional[str] = Query(None)):
+    # La consulta se ejecuta en el pool de base de datos, fuera del bucle de eventos
+    return await run_db(_sessions_response, request, db_file)
+
+def _sessions_response(request: Request, db_file: Optional[str]) -> Response:
+    db_path = resolve_db_path(db_file)
+    return cached_response(request, db_path, "sessions", {}, lambda: _list_sessions(db_path))
+
+def _list_sessions(db_path: str) -> SessionsResponse:
+    db = get_session(db_path)
     try:
-        # Obtenemos las sesiones con conteo de anomalías
+        # Obtenemos las sesiones con conteo de anomalías (por Anomaly.session_id, sin pasar por packets)
+        anomaly_counts = (
+            db.query(Anomaly.session_id, func.count(Anomaly.id).label('anomaly_count'))
+            .group_by(Anomaly.session_id)
+            .subquery()
+        )
         sessions_with_anomalies = (
-            db.query(
-                CaptureSession,
-                func.count(Anomaly.id).label('anomaly_count')
-            )
-            .outerjoin(Packet, CaptureSession.id == Packet.session_id)
-            .outerjoin(Anomaly, Packet.id == Anomaly.packet_id)
-            .group_by(CaptureSession.id)
+            db.query(CaptureSession, anomaly_counts.c.anomaly_count)
+            .outerjoin(anomaly_counts, anomaly_counts.c.session_id == CaptureSession.id)
             .order_by(desc(CaptureSession.capture_date))
             .all()
         )
@@ -122,8 +166,15 @@ async def get_sessions(db_file: Optional[str] = Query(None)):
 
 # Obtener detalles de una sesión específica
 @router.get("/sessions/{session_id}", response_model=dict)
-def get_session_details(session_id: int, db_file: Optional[str] = Query(None)):
-    db_session = get_db_session(db_file)
+def get_session_details(request: Request, session_id: int, db_file: Optional[str] = Query(None)):
+    db_path = resolve_db_path(db_file)
+    return cached_response(
+        request, db_path, "session_details", {"session_id": session_id},
+        lambda: _session_details(db_path, session_id)
+    )
+
+def _session_details(db_path: str, session_id: int) -> dict:
+    db_session = get_session(db_path)
     try:
         # Buscar la sesión por ID
         session = db_session.query(CaptureSession).filter(CaptureSession.id == session_id).first()
@@ -153,91 +204,554 @@ def get_session_details(session_id: int, db_file: Optional[str] = Query(None)):
     finally:
         db_session.close()
 
+# Paquetes de una sesión paginados por clave
+@router.get("/sessions/{session_id}/packets", response_model=dict)
+def get_session_packets(
+    session_id: int,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, description="Paquetes a saltar (si no se indica after)"),
+    after: Optional[int] = Query(None, description="Cursor: packet_number del último paquete de la página anterior"),
+    src_ip: Optional[str] = Query(None),
+    dst_ip: Optional[str] = Query(None),
+    protocol: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description="Campos separados por comas (por defecto los de la tabla de paquetes)"),
+    with_total: bool = Query(True, description="Contar los paquetes que cumplen los filtros"),
+    db_file: Optional[str] = Query(None)
+):
+    """
+    Página de paquetes de la sesión ordenada por packet_number.
+
+    La respuesta incluye next_cursor: pasarlo como after en la siguiente
+    petición recorre la sesión sin OFFSET.
+    """
+    engine = get_engine(resolve_db_path(db_file))
+    with engine.connect() as conn:
+        if not session_exists(conn, session_id):
+            raise HTTPException(status_code=404, detail=f"Sesión con ID {session_id} no encontrada")
+        try:
+            page = list_session_packets(
+                conn, session_id, limit=limit, after=after, offset=offset,
+                filters={"src_ip": src_ip, "dst_ip": dst_ip, "protocol": protocol},
+                fields=fields, with_total=with_total
+            )
+        except SessionQueryError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    page["session_id"] = session_id
+    return page
+
+# Anomalías de una sesión con filtros, facetas y paginación por clave
+@router.get("/sessions/{session_id}/anomalies", response_model=dict)
+def get_session_anomalies(
+    session_id: int,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, description="Anomalías a saltar (si no se indica after)"),
+    after: Optional[int] = Query(None, description="Cursor: id de la última anomalía de la página anterior"),
+    severity: Optional[str] = Query(None),
+    type: Optional[str] = Query(None, description="Tipo de anomalía"),
+    include_packet: bool = Query(True, description="Añadir la proyección reducida del paquete"),
+    with_facets: bool = Query(True, description="Conteos por severidad y tipo"),
+    db_file: Optional[str] = Query(None)
+):
+    """
+    Página de anomalías de la sesión ordenada por fecha de detección.
+
+    La respuesta incluye next_cursor (pasarlo como after en la siguiente
+    petición) y las facetas por severidad y tipo.
+    """
+    engine = get_engine(resolve_db_path(db_file))
+    with engine.connect() as conn:
+        if not session_exists(conn, session_id):
+            raise HTTPException(status_code=404, detail=f"Sesión con ID {session_id} no encontrada")
+        try:
+            page = list_session_anomalies(
+                conn, session_id, limit=limit, after=after, offset=offset, severity=severity,
+                anomaly_type=type, include_packet=include_packet, with_facets=with_facets
+            )
+        except SessionQueryError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    page["session_id"] = session_id
+    return page
+
+@router.get("/sessions/{session_id}/export")
+def export_session_packets(
+    session_id: int,
+    format: str = Query("ndjson", description="Formato: ndjson, csv o arrow"),
+    compression: str = Query("none", description="Compresión: none, gzip o zstd"),
+    src_ip: Optional[str] = Query(None),
+    dst_ip: Optional[str] = Query(None),
+    protocol: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description="Campos separados por comas"),
+    db_file: Optional[str] = Query(None)
+):
+    """
+    Exporta los paquetes de la sesión en streaming (NDJSON, CSV o Arrow IPC).
+
+    Admite los mismos filtros y proyección que /sessions/{id}/packets. Los
+    paquetes se leen, codifican y comprimen por bloques mientras se envían.
+    """
+    db_path = resolve_db_path(db_file)
+    engine = get_engine(db_path)
+    with engine.connect() as conn:
+        if not session_exists(conn, session_id):
+            raise HTTPException(status_code=404, detail=f"Sesión con ID {session_id} no encontrada")
+    try:
+        check_export_options(format, compression, fields)
+    except (SessionQueryError, StreamExportError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    base = os.path.splitext(os.path.basename(db_path))[0]
+    filename = export_file_name(base, session_id, format, compression)
+    return StreamingResponse(
+        stream_session_packets(
+            engine, session_id, export_format=format, compression=compression,
+            filters={"src_ip": src_ip, "dst_ip": dst_ip, "protocol": protocol}, fields=fields
+        ),
+        media_type=export_media_type(format, compression),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # Obtener análisis estadísticos de una sesión
 @router.get("/analytics/{session_id}", response_model=dict)
-def get_session_analytics(session_id: int, db_file: Optional[str] = Query(None)):
-    db_session = get_db_session(db_file)
+def get_session_analytics(request: Request, session_id: int, db_file: Optional[str] = Query(None)):
+    db_path = resolve_db_path(db_file)
+    return cached_response(
+        request, db_path, "analytics", {"session_id": session_id},
+        lambda: _session_analytics(db_path, session_id)
+    )
+
+def _session_analytics(db_path: str, session_id: int) -> dict:
+    db_session = get_session(db_path)
     try:
         # Verificar que la sesión existe
         session = db_session.query(CaptureSession).filter(CaptureSession.id == session_id).first()
         if not session:
             raise HTTPException(status_code=404, detail=f"Sesión con ID {session_id} no encontrada")
-        
-        # Estadísticas por protocolo
-        protocol_stats = db_session.query(
-            Packet.protocol,
-            func.count(Packet.id).label('count')
-        ).filter(
-            Packet.session_id == session_id
-        ).group_by(
-            Packet.protocol
-        ).all()
-        
-        protocol_data = {p[0]: p[1] for p in protocol_stats}
-        
-        # Top IPs origen
-        top_src_ips = db_session.query(
-            Packet.src_ip,
-            func.count(Packet.id).label('count')
-        ).filter(
-            Packet.session_id == session_id
-        ).group_by(
-            Packet.src_ip
-        ).order_by(
-            desc('count')
-        ).limit(10).all()
-        
-        # Top IPs destino
-        top_dst_ips = db_session.query(
-            Packet.dst_ip,
-            func.count(Packet.id).label('count')
-        ).filter(
-            Packet.session_id == session_id
-        ).group_by(
-            Packet.dst_ip
-        ).order_by(
-            desc('count')
-        ).limit(10).all()
-        
-        # Distribución de anomalías
-        anomaly_distribution = db_session.query(
-            Anomaly.type,
-            func.count(Anomaly.id).label('count')
-        ).filter(
-            Anomaly.session_id == session_id
-        ).group_by(
-            Anomaly.type
-        ).all()
-        
-        return {
-            "session_id": session_id,
-            "protocol_distribution": protocol_data,
-            "top_source_ips": [{"ip": ip, "count": count} for ip, count in top_src_ips],
-            "top_destination_ips": [{"ip": ip, "count": count} for ip, count in top_dst_ips],
-            "anomaly_distribution": [{"type": type_, "count": count} for type_, count in anomaly_distribution],
-            "total_packets": sum(p[1] for p in protocol_stats) if protocol_stats else 0
-        }
     finally:
         db_session.close()
 
+    # Las agregaciones se leen de session_stats o, si no existen, se ejecutan en el backend configurado
+    with get_analytics_backend(db_path) as analytics:
+        return analytics.session_analytics(session_id)
+
 @router.get("/list-db-files", response_model=List[dict])
-def list_db_files():
+def list_db_files(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    sort: str = Query("name"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    search: Optional[str] = Query(None)
+):
     """
     Lista los archivos de base de datos (.db) disponibles en el directorio de bases de datos.
+    
+    Los datos se leen del catálogo; sin limit se devuelven todos.
     """
-    db_dir = os.getenv('DATABASE_DIRECTORY', './data/db_files')
-    if not os.path.exists(db_dir):
-        return []
-    db_files = []
-    for file in sorted(os.listdir(db_dir), reverse=True):
-        if file.endswith(".db"):
-            file_path = os.path.join(db_dir, file)
-            size = os.path.getsize(file_path) / 1024  # KB
-            mod_time = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m-%d %H:%M:%S")
-            db_files.append({
-                "name": file,
-                "path": file_path,
-                "size_kb": round(size, 2),
-                "modified": mod_time
-            })
+    if sort not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Orden no válido. Opciones: {', '.join(SORT_COLUMNS)}")
+    db_files, _ = list_databases(offset=offset, limit=limit, sort=sort, order=order, search=search)
     return db_files
+
+# Catálogo de bases de datos de captura
+@router.get("/catalog", response_model=dict)
+def get_catalog(
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    sort: str = Query("modified"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    search: Optional[str] = Query(None, description="Texto en el nombre del .db o de un PCAP"),
+    min_packets: Optional[int] = Query(None, ge=0),
+    start_time: Optional[float] = Query(None, description="Epoch: capturas que terminan después"),
+    end_time: Optional[float] = Query(None, description="Epoch: capturas que empiezan antes")
+):
+    """
+    Lista paginada, ordenable y filtrable de las bases de datos catalogadas.
+    """
+    if sort not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Orden no válido. Opciones: {', '.join(SORT_COLUMNS)}")
+    databases, total = list_databases(
+        offset=offset, limit=limit, sort=sort, order=order, search=search,
+        min_packets=min_packets, start_time=start_time, end_time=end_time
+    )
+    return {"databases": databases, "total": total, "offset": offset, "limit": limit}
+
+@router.get("/catalog/sessions", response_model=dict)
+def get_catalog_sessions(
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    search: Optional[str] = Query(None),
+    start_time: Optional[float] = Query(None),
+    end_time: Optional[float] = Query(None)
+):
+    """
+    Lista paginada de las sesiones de todas las bases de datos catalogadas.
+    """
+    sessions, total = list_sessions(
+        offset=offset, limit=limit, search=search, start_time=start_time, end_time=end_time
+    )
+    return {"sessions": sessions, "total": total, "offset": offset, "limit": limit}
+
+@router.post("/catalog/reconcile", response_model=dict)
+def reconcile_db_catalog():
+    """
+    Sincroniza el catálogo con el directorio de bases de datos.
+    """
+    return reconcile_catalog(os.getenv('DATABASE_DIRECTORY', './data/db_files'))
+
+@router.get("/catalog/{db_file}", response_model=dict)
+def get_catalog_entry(db_file: str, refresh: bool = Query(False)):
+    """
+    Entrada del catálogo de una base de datos, con el resumen de sus sesiones.
+    """
+    db_path = resolve_db_path(db_file)
+    entry = None if refresh else get_database_entry(db_file)
+    if entry is None:
+        entry = index_database(db_path)
+    return entry
+
+# Sellado de bases de datos finalizadas
+@router.get("/catalog/{db_file}/seal", response_model=dict)
+def get_database_seal(db_file: str, verify: bool = Query(False, description="Recalcular el checksum del archivo")):
+    """
+    Estado del sellado de una base de datos (checksum y estadísticas finales).
+    """
+    db_path = resolve_db_path(db_file)
+    seal = read_seal(db_path)
+    result = {"db_file": db_file, "sealed": seal is not None, "seal": seal}
+    if verify and seal is not None:
+        result["verification"] = verify_seal(db_path)
+    return result
+
+@router.post("/catalog/{db_file}/seal", response_model=dict)
+def seal_db_file(db_file: str):
+    """
+    Sella una base de datos: checksum, estadísticas finales y solo lectura inmutable.
+    """
+    db_path = resolve_db_path(db_file)
+    try:
+        seal = seal_database(db_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al sellar la base de datos: {e}")
+    index_database(db_path)
+    return {"db_file": db_file, "sealed": True, "seal": seal}
+
+@router.delete("/catalog/{db_file}/seal", response_model=dict)
+def unseal_db_file(db_file: str):
+    """
+    Quita el sellado de una base de datos para poder modificarla.
+    """
+    db_path = resolve_db_path(db_file)
+    was_sealed = unseal_database(db_path)
+    index_database(db_path)
+    return {"db_file": db_file, "sealed": False, "was_sealed": was_sealed}
+
+
+# Búsquedas federadas en todas las capturas
+def _federated_filters(ip, src_ip, dst_ip, port, src_port, dst_port, protocol, start_time, end_time):
+    """Valida los filtros de una búsqueda federada"""
+    filters = dict(ip=ip, src_ip=src_ip, dst_ip=dst_ip, port=port, src_port=src_port, dst_port=dst_port,
+                   protocol=protocol, start_time=start_time, end_time=end_time)
+    try:
+        build_filters(**filters)
+    except FederatedQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return filters
+
+@router.get("/federated/packets")
+def federated_packets(
+    ip: Optional[str] = Query(None, description="IP origen o destino"),
+    src_ip: Optional[str] = Query(None),
+    dst_ip: Optional[str] = Query(None),
+    port: Optional[int] = Query(None, ge=0, le=65535, description="Puerto origen o destino"),
+    src_port: Optional[int] = Query(None, ge=0, le=65535),
+    dst_port: Optional[int] = Query(None, ge=0, le=65535),
+    protocol: Optional[str] = Query(None),
+    start_time: Optional[float] = Query(None, description="Epoch"),
+    end_time: Optional[float] = Query(None, description="Epoch"),
+    limit: int = Query(1000, ge=1, le=100000),
+    ordered: bool = Query(True, description="Orden temporal global (False: por lotes según terminan)")
+):
+    """
+    Busca paquetes en todas las bases de datos de captura y los devuelve en streaming (NDJSON).
+    """
+    filters = _federated_filters(ip, src_ip, dst_ip, port, src_port, dst_port, protocol, start_time, end_time)
+
+    def generate():
+        try:
+            for packet in search_packets(limit=limit, ordered=ordered, **filters):
+                yield json.dumps(packet) + "\n"
+        except FederatedQueryError as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@router.get("/federated/summary", response_model=dict)
+def federated_summary(
+    ip: Optional[str] = Query(None, description="IP origen o destino"),
+    src_ip: Optional[str] = Query(None),
+    dst_ip: Optional[str] = Query(None),
+    port: Optional[int] = Query(None, ge=0, le=65535, description="Puerto origen o destino"),
+    src_port: Optional[int] = Query(None, ge=0, le=65535),
+    dst_port: Optional[int] = Query(None, ge=0, le=65535),
+    protocol: Optional[str] = Query(None),
+    start_time: Optional[float] = Query(None, description="Epoch"),
+    end_time: Optional[float] = Query(None, description="Epoch")
+):
+    """
+    Indica en qué capturas (base de datos y sesión) aparecen paquetes que cumplen los filtros.
+    """
+    filters = _federated_filters(ip, src_ip, dst_ip, port, src_port, dst_port, protocol, start_time, end_time)
+    try:
+        matches = count_matches(**filters)
+    except FederatedQueryError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "matches": matches,
+        "capture_count": len({match["db_file"] for match in matches}),
+        "total_packets": sum(match["packets"] for match in matches)
+    }
+
+@router.get("/sessions/{session_id}/parquet")
+def download_session_parquet(
+    session_id: int,
+    table: str = Query("packets", description="Tabla a exportar: packets, flows o anomalies"),
+    db_file: Optional[str] = Query(None)
+):
+    """
+    Descarga una tabla de la sesión en formato Parquet (zstd).
+
+    Los paquetes salen ordenados por packet_number, las anomalías por
+    (detection_time, id) y los flujos por first_seen.
+    """
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=400, detail=f"Tabla no válida. Opciones: {', '.join(EXPORT_TABLES)}")
+    if not pyarrow_available():
+        raise HTTPException(status_code=501, detail="La exportación a Parquet requiere pyarrow")
+
+    db_path = resolve_db_path(db_file)
+    engine = get_engine(db_path)
+    with engine.connect() as conn:
+        exists = conn.execute(
+            CaptureSession.__table__.select().where(CaptureSession.id == session_id)
+        ).first()
+    if not exists:
+        raise HTTPException(status_code=404, detail=f"Sesión con ID {session_id} no encontrada")
+
+    # Las tablas archivadas por la retención se sirven directamente desde el archivo
+    base = os.path.splitext(os.path.basename(db_path))[0]
+    for segment in archive_status(db_path, session_id):
+        if segment["table"] == table and segment["available"]:
+            return FileResponse(
+                segment["path"],
+                media_type="application/vnd.apache.parquet",
+                filename=f"{base}_session{session_id}_{table}.parquet"
+            )
+
+    # El archivo se genera en disco por row groups y se elimina tras enviarlo
+    fd, output_path = tempfile.mkstemp(suffix=".parquet")
+    os.close(fd)
+    try:
+        export_table(engine, session_id, table, output_path)
+    except Exception as e:
+        os.remove(output_path)
+        raise HTTPException(status_code=500, detail=f"Error al exportar la sesión: {str(e)}")
+
+    return FileResponse(
+        output_path,
+        media_type="application/vnd.apache.parquet",
+        filename=f"{base}_session{session_id}_{table}.parquet",
+        background=BackgroundTask(os.remove, output_path)
+    )
+
+# Retención por niveles
+@router.post("/retention/run", response_model=dict)
+def run_retention(
+    db_file: Optional[str] = Query(None, description="Base de datos a procesar (por defecto: todas)"),
+    raw_days: Optional[float] = Query(None, ge=0, description="Días de paquetes en bruto"),
+    flow_days: Optional[float] = Query(None, ge=0, description="Días de flujos"),
+    dry_run: bool = Query(False)
+):
+    """
+    Archiva en Parquet los paquetes y flujos caducados según la política de retención.
+    """
+    policy = RetentionPolicy.from_env()
+    if raw_days is not None:
+        policy.raw_days = raw_days
+    if flow_days is not None:
+        policy.flow_days = flow_days
+
+    if db_file:
+        db_paths = [resolve_db_path(db_file)]
+    else:
+        db_dir = os.getenv('DATABASE_DIRECTORY', './data/db_files')
+        db_paths = [os.path.join(db_dir, entry["name"]) for entry in list_databases(limit=None)[0]]
+
+    results = []
+    errors = []
+    for db_path in db_paths:
+        try:
+            summary = apply_retention(db_path, policy, dry_run=dry_run)
+        except RetentionError as e:
+            raise HTTPException(status_code=501, detail=str(e))
+        except Exception as e:
+            errors.append({"db_file": os.path.basename(db_path), "error": str(e)})
+            continue
+        summary["db_file"] = os.path.basename(summary.pop("db_path"))
+        results.append(summary)
+    return {"policy": policy.to_dict(), "dry_run": dry_run, "results": results, "errors": errors}
+
+@router.get("/sessions/{session_id}/archive", response_model=dict)
+def get_session_archive(session_id: int, db_file: Optional[str] = Query(None)):
+    """
+    Segmentos archivados de la sesión.
+    """
+    db_path = resolve_db_path(db_file)
+    segments = archive_status(db_path, session_id)
+    return {"session_id": session_id, "archived": bool(segments), "segments": segments}
+
+@router.post("/sessions/{session_id}/rehydrate", response_model=dict)
+def rehydrate_session_data(
+    session_id: int,
+    table: Optional[List[str]] = Query(None, description="Tablas a rehidratar (por defecto: todas)"),
+    keep_archive: bool = Query(False),
+    db_file: Optional[str] = Query(None)
+):
+    """
+    Devuelve a la base de datos las tablas archivadas de la sesión.
+    """
+    db_path = resolve_db_path(db_file)
+    try:
+        restored = rehydrate_session(db_path, session_id, tables=table, keep_archive=keep_archive)
+    except RetentionError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    try:
+        index_database(db_path)
+    except Exception as e:
+        print(f"Error al actualizar el catálogo tras la rehidratación: {e}")
+    return {"session_id": session_id, "restored": restored}
+
+# Migraciones de esquema
+@router.get("/migrations", response_model=dict)
+def get_migrations():
+    """
+    Versión de esquema de cada base de datos y estado del migrador en segundo plano.
+    """
+    return migration_status()
+
+@router.post("/migrations/run", response_model=dict)
+def run_migrations(db_file: Optional[str] = Query(None, description="Base de datos a migrar (por defecto: todas, en segundo plano)")):
+    """
+    Migra una base de datos al esquema actual, o lanza el migrador para todas.
+    """
+    if db_file:
+        db_path = resolve_db_path(db_file)
+        try:
+            result = migrate_database(db_path)
+        except MigrationError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        result["db_file"] = os.path.basename(result.pop("db_path"))
+        return result
+    started = start_migration_runner() is not None
+    return {"started": started, "status": migration_status()["runner"]}
+
+# Almacén de frames en bruto
+def _frame_reader(db_path, session_id):
+    """Lector del almacén de frames, con 404 si la sesión no tiene frames guardados"""
+    if not zstd_available():
+        raise HTTPException(status_code=501, detail="El almacén de frames requiere zstandard")
+    reader = get_frame_reader(db_path)
+    if reader.store_info(session_id) is None:
+        raise HTTPException(status_code=404, detail=f"La sesión {session_id} no tiene frames guardados")
+    return reader
+
+@router.get("/sessions/{session_id}/frames", response_model=dict)
+def get_frame_store_stats(session_id: int, db_file: Optional[str] = Query(None)):
+    """
+    Coste de almacenamiento de los frames de la sesión frente al PCAP original.
+    """
+    db_path = resolve_db_path(db_file)
+    stats = frame_store_stats(db_path, session_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"La sesión {session_id} no tiene frames guardados")
+    return stats
+
+@router.get("/sessions/{session_id}/frames/{packet_number}")
+def get_frame(
+    session_id: int,
+    packet_number: int,
+    format: str = Query("raw", pattern="^(raw|hex)$"),
+    db_file: Optional[str] = Query(None)
+):
+    """
+    Bytes en bruto de un paquete (binario o en hexadecimal).
+    """
+    reader = _frame_reader(resolve_db_path(db_file), session_id)
+    try:
+        frame = reader.get_frame(session_id, packet_number)
+    except FrameStoreError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if frame is None:
+        raise HTTPException(status_code=404, detail=f"Paquete {packet_number} no encontrado")
+    if format == "hex":
+        return {
+            "packet_number": frame.packet_number,
+            "timestamp": frame.timestamp,
+            "captured_length": len(frame.data),
+            "original_length": frame.orig_len,
+            "data": frame.data.hex(),
+        }
+    return Response(content=frame.data, media_type="application/octet-stream")
+
+def _pcap_stream(first, parts, session_id):
+    yield from first
+    try:
+        yield from parts
+    except FrameStoreError as e:
+        # Las cabeceras ya se enviaron: el PCAP termina en el último paquete completo
+        print(f"Descarga PCAP de la sesión {session_id} truncada: {e}")
+
+@router.get("/sessions/{session_id}/pcap")
+def download_session_pcap(
+    session_id: int,
+    start_packet: int = Query(1, ge=1),
+    end_packet: Optional[int] = Query(None, ge=1),
+    db_file: Optional[str] = Query(None)
+):
+    """
+    Descarga en formato PCAP los frames guardados de un rango de paquetes (en streaming).
+    """
+    db_path = resolve_db_path(db_file)
+    reader = _frame_reader(db_path, session_id)
+    parts = reader.iter_pcap(session_id, start_packet, end_packet)
+    try:
+        # Cabecera y primer paquete antes de responder: un bloque dañado al principio es un 500
+        first = [part for part in (next(parts), next(parts, None)) if part is not None]
+    except FrameStoreError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    base = os.path.splitext(os.path.basename(db_path))[0]
+    suffix = f"_{start_packet}-{end_packet}" if end_packet else ""
+    return StreamingResponse(
+        _pcap_stream(first, parts, session_id),
+        media_type="application/vnd.tcpdump.pcap",
+        headers={"Content-Disposition": f'attachment; filename="{base}_session{session_id}{suffix}.pcap"'}
+    )
+
+# Búsqueda de texto completo
+@router.get("/search", response_model=dict)
+def search_packet_text_endpoint(
+    q: str = Query(..., min_length=1, description='Términos, "frases", prefijos* y columnas (info:, stack:)'),
+    session_id: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    order: str = Query("rank", pattern="^(rank|time)$"),
+    db_file: Optional[str] = Query(None)
+):
+    """
+    Busca paquetes por info_text y protocol_stack con el índice FTS5, ordenados por relevancia o por tiempo.
+    """
+    engine = get_engine(resolve_db_path(db_file))
+    try:
+        with engine.connect() as conn:
+            packets, total = search_packet_text(conn, q, session_id, limit, offset, order)
+    except FullTextSearchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"query": q, "packets": packets, "total": total, "offset": offset, "limit": limit}
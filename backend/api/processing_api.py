@@ -1,17 +1,20 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Query
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Header, Request, Response
+from pydantic import BaseModel
 from typing import List, Optional
 import os
 import subprocess
 import datetime
 import uuid
 import shutil
-import concurrent.futures
 from pathlib import Path
 from starlette.responses import FileResponse
 
-from processing.pcap_processor import PCAPProcessor
-from database.models import init_db
-from capture.network_interfaces import get_interfaces  # Corregir la importación
+from processing.jobs import enqueue_job, get_job, list_jobs, cancel_job, get_job_manager, JobError, JOB_STATUSES
+from processing.uploads import (
+    create_upload, get_upload, open_upload_writer, abort_upload, UploadError, UploadNotFound, UploadConflict
+)
+from capture.tshark_runtime import get_tshark_runtime
+from database.dal import run_blocking, run_db
 
 router = APIRouter(prefix="/api/processing", tags=["processing"])
 
@@ -19,48 +22,35 @@ router = APIRouter(prefix="/api/processing", tags=["processing"])
 PCAP_DIRECTORY = os.getenv('PCAP_DIRECTORY', './data/pcap_files')
 os.makedirs(PCAP_DIRECTORY, exist_ok=True)
 
-# Función para ejecutar en un proceso separado
-def process_pcap_in_separate_process(pcap_file, interface=None, filter_applied=None):
-    """
-    Procesa un archivo PCAP en un proceso separado para evitar conflictos con el bucle de eventos.
-    
-    Args:
-        pcap_file: Ruta al archivo PCAP
-        interface: Nombre de la interfaz de captura
-        filter_applied: Filtro utilizado durante la captura
-        
-    Returns:
-        str: Ruta a la base de datos generada
-    """
-    try:
-        processor = PCAPProcessor(pcap_file=pcap_file)
-        db_path = processor.db_path
-        processor.process_pcap_file(pcap_file, interface, filter_applied)
-        return db_path
-    except Exception as e:
-        print(f"Error en el procesamiento del archivo PCAP: {e}")
-        import traceback
-        traceback.print_exc()
+def _save_upload(upload, file_path):
+    """Copia el archivo subido al disco"""
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(upload, f)
+
+def _interface_name(interface_id: Optional[str]) -> Optional[str]:
+    """Nombre de la interfaz de captura a partir de su id (de la lista en caché, sin lanzar tshark)"""
+    if not interface_id:
         return None
+    return get_tshark_runtime().interface_name(interface_id)
 
 @router.post("/upload-pcap/")
 async def upload_pcap_file(
     file: UploadFile = File(...),
     process_immediately: bool = Form(True),
-    interface_index: Optional[str] = Form(None),
-    background_tasks: BackgroundTasks = None
+    interface_id: Optional[str] = Form(None),
+    priority: int = Form(0)
 ):
     """
-    Sube un archivo PCAP y opcionalmente lo procesa.
+    Sube un archivo PCAP y opcionalmente encola su procesamiento.
     
     Args:
         file: Archivo PCAP a subir
-        process_immediately: Si es True, procesa el archivo inmediatamente
-        interface_index: Índice de la interfaz de captura (opcional)
-        background_tasks: Tareas en segundo plano
+        process_immediately: Si es True, encola el procesamiento en la cola de trabajos
+        interface_id: Id de la interfaz de captura, el de /api/capture/interfaces (opcional)
+        priority: Prioridad del trabajo (mayor primero)
     
     Returns:
-        dict: Información sobre el archivo subido y su procesamiento
+        dict: Información sobre el archivo subido y el id del trabajo de procesamiento
     """
     # Verificar que es un archivo PCAP
     if not file.filename.lower().endswith('.pcap'):
@@ -75,63 +65,163 @@ async def upload_pcap_file(
     
     # Guardar el archivo
     file_path = os.path.join(PCAP_DIRECTORY, file.filename)
-    with open(file_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    await run_blocking(_save_upload, file.file, file_path)
     
-    # Si se especifica un índice de interfaz, obtener el nombre de la interfaz
-    interface = None
-    if interface_index is not None:
-        try:
-            interfaces = get_interfaces()
-            if interfaces and len(interfaces) > int(interface_index):
-                interface = interfaces[int(interface_index)].get('name')
-        except Exception as e:
-            print(f"Error al obtener la interfaz: {e}")
+    # Si se especifica una interfaz, obtener su nombre
+    interface = _interface_name(interface_id)
     
-    # Procesar el archivo si se solicita
-    db_path = None
-    file_size = None # Variable para guardar el tamaño antes de borrar
+    # El procesamiento se encola: la respuesta no espera a la ingesta
+    file_size = os.path.getsize(file_path)
+    job = None
     if process_immediately:
-        try:
-            print(f"Procesando archivo: {file_path}")
-            file_size = os.path.getsize(file_path) # Obtener tamaño ANTES de procesar/borrar
-            
-            # Usar concurrent.futures para ejecutar en un proceso separado
-            with concurrent.futures.ProcessPoolExecutor() as executor:
-                future = executor.submit(
-                    process_pcap_in_separate_process,
-                    file_path,
-                    interface,
-                    None  # filter_applied
-                )
-                db_path = future.result()  # Esperar a que termine el procesamiento
-                
-            if not db_path:
-                print(f"⚠️ El procesamiento del archivo {file.filename} no generó una base de datos válida")
-            else:
-                # Eliminar el archivo PCAP original si el procesamiento fue exitoso
-                try:
-                    os.remove(file_path)
-                    print(f"Archivo PCAP original '{file.filename}' eliminado después del procesamiento exitoso.")
-                except OSError as e:
-                    print(f"Error al eliminar el archivo PCAP '{file_path}': {e}")
-                    
-        except Exception as e:
-            print(f"❌ Error al procesar el archivo {file.filename}: {e}")
-            import traceback
-            traceback.print_exc()
-            # Si hubo error procesando, no borramos y file_size puede ser None o tener valor previo
-            if file_size is None and os.path.exists(file_path):
-                 file_size = os.path.getsize(file_path)
-
-    # Si no se procesó inmediatamente, obtener tamaño ahora
-    elif os.path.exists(file_path):
-        file_size = os.path.getsize(file_path)
+        job = await run_db(enqueue_job, 'process_pcap', {
+            "pcap_file": file_path,
+            "interface": interface,
+            "filter_applied": None,
+            # El PCAP original se elimina si el procesamiento termina bien
+            "delete_source": True,
+        }, priority=priority)
+        print(f"Procesamiento de {file.filename} encolado: trabajo {job['id']}")
     
     return {
         "file_name": file.filename,
         "file_path": file_path, 
-        "size": file_size, # Usar el tamaño guardado
-        "processed": process_immediately and db_path is not None,
-        "db_path": db_path if db_path else None
+        "size": file_size,
+        "processed": False,
+        "job_id": job["id"] if job else None,
+        "job_status": job["status"] if job else None
     }
+
+# Subidas por bloques reanudables (tipo tus)
+class UploadCreateRequest(BaseModel):
+    file_name: str
+    size: int
+    process_immediately: bool = True
+    interface_id: Optional[str] = None
+    priority: int = 0
+
+def _upload_headers(upload: dict) -> dict:
+    return {
+        "Upload-Offset": str(upload["offset"]),
+        "Upload-Length": str(upload["size"]),
+        "Cache-Control": "no-store",
+    }
+
+@router.post("/uploads", status_code=201)
+async def create_chunked_upload(upload_request: UploadCreateRequest, response: Response):
+    """
+    Crea una subida por bloques.
+
+    Los bloques se envían con PATCH /uploads/{id} y la cabecera Upload-Offset.
+    Si se pide procesarla, la ingesta empieza con el primer bloque recibido.
+    """
+    interface = _interface_name(upload_request.interface_id)
+    try:
+        upload = await run_db(
+            create_upload, upload_request.file_name, upload_request.size, PCAP_DIRECTORY,
+            process=upload_request.process_immediately, interface=interface, priority=upload_request.priority
+        )
+    except UploadConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(_upload_headers(upload))
+    response.headers["Location"] = f"{router.prefix}/uploads/{upload['id']}"
+    return upload
+
+@router.head("/uploads/{upload_id}")
+def get_chunked_upload_offset(upload_id: str):
+    """Offset recibido de una subida (para reanudarla)"""
+    try:
+        upload = get_upload(upload_id)
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(status_code=200, headers=_upload_headers(upload))
+
+@router.get("/uploads/{upload_id}", response_model=dict)
+def get_chunked_upload(upload_id: str):
+    """Estado de una subida: offset, progreso, SHA-256 al completarse y trabajo de procesamiento"""
+    try:
+        return get_upload(upload_id)
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.patch("/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., alias="Upload-Offset")
+):
+    """
+    Recibe un bloque de la subida a partir de Upload-Offset.
+
+    El cuerpo se escribe a medida que llega (sin guardarlo entero en memoria);
+    si la conexión se corta, se conserva lo recibido y HEAD devuelve el offset
+    desde el que continuar.
+    """
+    try:
+        writer = await run_db(open_upload_writer, upload_id, upload_offset)
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    error = None
+    try:
+        async for piece in request.stream():
+            if piece:
+                await run_blocking(writer.write, piece)
+    except UploadError as e:
+        error = e
+    finally:
+        upload = await run_db(writer.close)
+    if error is not None:
+        raise HTTPException(status_code=400, detail=str(error))
+    response.headers.update(_upload_headers(upload))
+    return upload
+
+@router.delete("/uploads/{upload_id}", response_model=dict)
+def abort_chunked_upload(upload_id: str):
+    """Cancela una subida en curso (y su procesamiento)"""
+    try:
+        return abort_upload(upload_id)
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+# Cola de trabajos
+@router.get("/jobs", response_model=dict)
+def get_jobs(
+    status: Optional[str] = Query(None, description=f"Estado: {', '.join(JOB_STATUSES)}"),
+    kind: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Lista los trabajos más recientes y el estado del pool"""
+    try:
+        jobs = list_jobs(status=status, kind=kind, limit=limit)
+    except JobError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    manager = get_job_manager()
+    return {"jobs": jobs, "total": len(jobs), "pool": manager.stats() if manager else None}
+
+@router.get("/jobs/{job_id}", response_model=dict)
+def get_job_status(job_id: str):
+    """Estado, resultado o error de un trabajo"""
+    try:
+        return get_job(job_id)
+    except JobError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/jobs/{job_id}/cancel", response_model=dict)
+def cancel_job_request(job_id: str):
+    """Cancela un trabajo encolado o solicita la detención de uno en curso"""
+    try:
+        get_job(job_id)
+    except JobError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    try:
+        return cancel_job(job_id)
+    except JobError as e:
+        raise HTTPException(status_code=409, detail=str(e))
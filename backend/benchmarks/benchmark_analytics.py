@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los backends de analítica (SQLite vs DuckDB) sobre una sesión sintética
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import sqlite3
+import statistics
+from datetime import datetime
+
+# Añadir el directorio raíz al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.models import Base
+from database.analytics import SQLiteAnalytics, DuckDBAnalytics, duckdb, get_analytics_backend
+from database.session_stats import refresh_session_stats
+from database.parquet_export import export_session, pyarrow_available
+from database.tcp_flags import raw_from_flags
+from sqlalchemy import create_engine
+
+PROTOCOLS = ['TCP', 'TCP', 'TCP', 'UDP', 'UDP', 'ICMP', None]
+ANOMALY_TYPES = ['port_scan', 'syn_flood', 'ttl_anomaly', 'fragmentation']
+
+class AnalyticsBenchmark:
+    def __init__(self, packet_total=10_000_000):
+        self.results = []
+        self.packet_total = packet_total
+        self.db_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'db_files')
+        self.sidecar_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'exports')
+        self.db_path = os.path.join(self.db_dir, f'benchmark_analytics_{packet_total}.db')
+        self.session_id = 1
+
+    def generate_database(self, batch_size=100_000):
+        """Genera (o reutiliza) una base de datos con una sesión de packet_total paquetes"""
+        if os.path.exists(self.db_path):
+            print(f"Reutilizando base de datos sintética: {self.db_path}")
+            return
+
+        os.makedirs(self.db_dir, exist_ok=True)
+        print(f"Generando {self.packet_total:,} paquetes sintéticos en {self.db_path}...")
+        engine = create_engine(f'sqlite:///{self.db_path}')
+        Base.metadata.create_all(engine)
+        engine.dispose()
+
+        rng = random.Random(42)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(
+            "INSERT INTO capture_sessions (id, file_name, packet_count, status) VALUES (?, ?, ?, ?)",
+            (self.session_id, 'benchmark.pcap', self.packet_total, 'completado')
+        )
+
+        start_time = time.time()
+        base_ts = 1700000000.0
+        for offset in range(0, self.packet_total, batch_size):
+            rows = []
+            for n in range(offset, min(offset + batch_size, self.packet_total)):
+                protocol = rng.choice(PROTOCOLS)
+                syn = protocol == 'TCP' and rng.random() < 0.1
+                rows.append((
+                    self.session_id, n + 1, base_ts + n * 0.0005,
+                    rng.randint(60, 1514),
+                    f"10.{rng.randint(0, 3)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                    f"192.168.{rng.randint(0, 3)}.{rng.randint(1, 254)}",
+                    protocol,
+                    rng.randint(1024, 65535) if protocol in ('TCP', 'UDP') else None,
+                    rng.choice([22, 53, 80, 443, 8080, rng.randint(1, 65535)]) if protocol in ('TCP', 'UDP') else None,
+                    rng.choice([32, 64, 128, 255]),
+                    raw_from_flags(
+                        syn=syn, ack=not syn,
+                        rst=rng.random() < 0.02, fin=rng.random() < 0.03
+                    ) if protocol == 'TCP' else None,
+                ))
+            conn.executemany("""
+                INSERT INTO packets (session_id, packet_number, timestamp, packet_length, src_ip, dst_ip,
+                                     transport_protocol, src_port, dst_port, ip_ttl, tcp_flags_raw)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+            anomalies = [
+                (n + 1, self.session_id, rng.choice(ANOMALY_TYPES), 'anomalía sintética', rng.choice(['alta', 'media', 'baja']))
+                for n in range(offset, min(offset + batch_size, self.packet_total), 997)
+            ]
+            conn.executemany(
+                "INSERT INTO anomalies (packet_id, session_id, type, description, severity) VALUES (?, ?, ?, ?, ?)",
+                anomalies
+            )
+            conn.commit()
+            print(f"  {min(offset + batch_size, self.packet_total):,} paquetes insertados")
+
+        conn.close()
+        print(f"Base de datos generada en {time.time() - start_time:.1f}s "
+              f"({os.path.getsize(self.db_path) / (1024 * 1024):.1f} MB)")
+
+    def run_workload(self, analytics):
+        """Ejecuta las agregaciones de /analytics y del contexto de chat"""
+        return {
+            "session_analytics": analytics.session_analytics(self.session_id),
+            "tcp_flags": analytics.tcp_flag_counts(self.session_id),
+            "top_ports": analytics.top_values(self.session_id, 'dst_port', 15, exclude_null=True),
+            "time_bounds": analytics.time_bounds(self.session_id),
+            "size_stats": [round(v, 6) if isinstance(v, float) else v for v in analytics.size_stats(self.session_id)],
+        }
+
+    def benchmark_backend(self, name, factory, iterations):
+        """Mide el tiempo de la carga de trabajo en un backend"""
+        print(f"\n--- Backend: {name} ---")
+        times = []
+        output = None
+        for i in range(iterations):
+            start_time = time.time()
+            with factory() as analytics:
+                output = self.run_workload(analytics)
+            times.append(time.time() - start_time)
+            print(f"  Iteración {i+1}/{iterations}: {times[-1]:.3f}s")
+
+        result = {
+            'backend': name,
+            'iterations': iterations,
+            'avg_time_seconds': statistics.mean(times),
+            'min_time_seconds': min(times),
+            'max_time_seconds': max(times),
+        }
+        self.results.append(result)
+        return result, output
+
+    def run_benchmark(self, iterations=3):
+        """Ejecuta el benchmark completo"""
+        print("=== BENCHMARK DE BACKENDS DE ANALÍTICA ===")
+        print(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Paquetes por sesión: {self.packet_total:,}")
+
+        self.generate_database()
+
+        backends = [('sqlite', lambda: SQLiteAnalytics(self.db_path))]
+        if duckdb is None:
+            print("⚠️ duckdb no está instalado, solo se medirá SQLite")
+        else:
+            # DuckDB leyendo el archivo SQLite directamente (sin sidecar)
+            empty_dir = os.path.join(self.sidecar_dir, 'none')
+            backends.append(('duckdb_sqlite', lambda: DuckDBAnalytics(self.db_path, sidecar_dir=empty_dir)))
+            if pyarrow_available():
+                print("\nGenerando sidecar Parquet...")
+                start_time = time.time()
+                export_session(self.db_path, self.session_id, self.sidecar_dir, tables=('packets', 'anomalies'))
+                print(f"Sidecar generado en {time.time() - start_time:.1f}s")
+                backends.append(('duckdb_parquet', lambda: DuckDBAnalytics(self.db_path, sidecar_dir=self.sidecar_dir)))
+
+        # Estadísticas precalculadas (tabla session_stats), como tras la ingesta
+        print("\nCalculando estadísticas de la sesión...")
+        start_time = time.time()
+        refresh_session_stats(self.db_path, force=True)
+        print(f"Estadísticas calculadas en {time.time() - start_time:.1f}s")
+        backends.append(('session_stats', lambda: get_analytics_backend(self.db_path, backend='sqlite', use_stats=True)))
+
+        reference = None
+        for name, factory in backends:
+            result, output = self.benchmark_backend(name, factory, iterations)
+            if reference is None:
+                reference = output
+            result['identical_results'] = output == reference
+            if not result['identical_results']:
+                print(f"❌ Los resultados de {name} difieren de SQLite")
+
+        self.save_results()
+        self.print_summary()
+
+    def save_results(self):
+        """Guarda resultados en archivo JSON"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        results_file = f"benchmark_analytics_{timestamp}.json"
+
+        with open(results_file, 'w') as f:
+            json.dump({
+                'benchmark_type': 'analytics',
+                'timestamp': datetime.now().isoformat(),
+                'packet_total': self.packet_total,
+                'results': self.results
+            }, f, indent=2)
+
+        print(f"\nResultados guardados en: {results_file}")
+
+    def print_summary(self):
+        """Imprime resumen de resultados"""
+        if not self.results:
+            return
+
+        print("\n=== RESUMEN ANALÍTICA ===")
+        baseline = self.results[0]['avg_time_seconds']
+        print(f"{'Backend':<18} {'Tiempo(s)':<12} {'Speedup':<10} {'Idéntico':<10}")
+        print("-" * 52)
+        for result in self.results:
+            speedup = baseline / result['avg_time_seconds'] if result['avg_time_seconds'] > 0 else 0
+            identical = "sí" if result.get('identical_results') else "no"
+            print(f"{result['backend']:<18} {result['avg_time_seconds']:<12.3f} {speedup:<10.1f} {identical:<10}")
+
+if __name__ == "__main__":
+    # Permitir especificar número de paquetes e iteraciones
+    packet_total = 10_000_000
+    iterations = 3
+    try:
+        if len(sys.argv) > 1:
+            packet_total = int(sys.argv[1])
+        if len(sys.argv) > 2:
+            iterations = int(sys.argv[2])
+    except ValueError:
+        print("Uso: python benchmark_analytics.py [paquetes] [iteraciones]")
+        sys.exit(1)
+
+    benchmark = AnalyticsBenchmark(packet_total)
+    benchmark.run_benchmark(iterations)
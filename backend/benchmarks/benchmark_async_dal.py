@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la capa de acceso a datos no bloqueante (database.dal): latencia
+de /api/database/sessions mientras se ejecuta una consulta pesada en el pool
+de base de datos frente a la misma consulta en el bucle de eventos
+"""
+
+import os
+import sys
+import time
+import json
+import asyncio
+import sqlite3
+import tempfile
+import statistics
+from datetime import datetime
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Añadir el directorio raíz al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.database_api import router as database_router
+from database.dal import run_db, shutdown_pools
+from database.engine_cache import clear_engine_cache
+from database.models import Base, CaptureSession
+
+class AsyncDALBenchmark:
+    def __init__(self, heavy_rows=3_000_000):
+        self.results = {}
+        # Filas de la consulta pesada (~1 s de CPU dentro de SQLite con 3M)
+        self.heavy_rows = heavy_rows
+
+    def _heavy_query(self, db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute(
+                "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < ?) SELECT SUM(x) FROM c",
+                (self.heavy_rows,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+    def _create_app(self, db_path):
+        app = FastAPI()
+        app.include_router(database_router)
+
+        @app.get("/heavy")
+        async def heavy():
+            return {"sum": await run_db(self._heavy_query, db_path)}
+
+        @app.get("/heavy-blocking")
+        async def heavy_blocking():
+            # Lo que hacían los handlers async antes: la consulta en el bucle de eventos
+            return {"sum": self._heavy_query(db_path)}
+
+        return app
+
+    async def _latencies_during(self, client, heavy_path, db_file, interval=0.02):
+        """
+        Latencias de /sessions mientras se ejecuta la consulta pesada.
+
+        Las peticiones se programan cada `interval` segundos y la latencia se mide
+        desde el instante programado, de modo que un bucle de eventos bloqueado
+        se refleja en la latencia aunque la petición salga tarde.
+        """
+        started = time.perf_counter()
+        heavy = asyncio.create_task(client.get(heavy_path))
+        latencies = []
+        while len(latencies) < 200:
+            scheduled = started + (len(latencies) + 1) * interval
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            response = await client.get("/api/database/sessions", params={"db_file": db_file})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - scheduled)
+            if heavy.done():
+                break
+        (await heavy).raise_for_status()
+        return latencies
+
+    async def _run_load(self, app, db_file):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            baseline = []
+            for _ in range(20):
+                request_start = time.perf_counter()
+                (await client.get("/api/database/sessions", params={"db_file": db_file})).raise_for_status()
+                baseline.append(time.perf_counter() - request_start)
+
+            start = time.perf_counter()
+            (await client.get("/heavy")).raise_for_status()
+            heavy_seconds = time.perf_counter() - start
+
+            concurrent = await self._latencies_during(client, "/heavy", db_file)
+            blocked = await self._latencies_during(client, "/heavy-blocking", db_file)
+        return baseline, heavy_seconds, concurrent, blocked
+
+    def run_benchmark(self):
+        """Ejecuta el benchmark sobre una base de datos temporal con una sesión"""
+        print("=== BENCHMARK DE LA CAPA DE ACCESO A DATOS ===")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "database_benchmark.db")
+            engine = create_engine(f'sqlite:///{db_path}')
+            Base.metadata.create_all(engine)
+            db = sessionmaker(bind=engine)()
+            db.add(CaptureSession(file_name="benchmark.pcap", capture_date=datetime.now(), packet_count=0))
+            db.commit()
+            db.close()
+            engine.dispose()
+
+            os.environ['DATABASE_DIRECTORY'] = tmp_dir
+            try:
+                baseline, heavy_seconds, concurrent, blocked = asyncio.run(
+                    self._run_load(self._create_app(db_path), "database_benchmark.db")
+                )
+            finally:
+                del os.environ['DATABASE_DIRECTORY']
+                clear_engine_cache()
+                shutdown_pools()
+
+        self.results = {
+            'heavy_query_seconds': heavy_seconds,
+            'baseline_p50_ms': statistics.median(baseline) * 1000,
+            'pool_requests': len(concurrent),
+            'pool_p50_ms': statistics.median(concurrent) * 1000,
+            'pool_max_ms': max(concurrent) * 1000,
+            'event_loop_requests': len(blocked),
+            'event_loop_max_ms': max(blocked) * 1000,
+        }
+        self.save_results()
+        self.print_summary()
+
+    def save_results(self):
+        """Guarda resultados en archivo JSON"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        results_file = f"benchmark_async_dal_{timestamp}.json"
+
+        with open(results_file, 'w') as f:
+            json.dump({
+                'benchmark_type': 'async_dal',
+                'timestamp': datetime.now().isoformat(),
+                'heavy_rows': self.heavy_rows,
+                'results': self.results
+            }, f, indent=2)
+
+        print(f"\nResultados guardados en: {results_file}")
+
+    def print_summary(self):
+        """Imprime resumen de resultados"""
+        r = self.results
+        print(f"\nConsulta pesada: {r['heavy_query_seconds']:.2f} s")
+        print(f"/sessions sin carga: p50 {r['baseline_p50_ms']:.1f} ms")
+        print(f"/sessions con la consulta en el pool: {r['pool_requests']} peticiones, "
+              f"p50 {r['pool_p50_ms']:.1f} ms, máx {r['pool_max_ms']:.1f} ms")
+        print(f"/sessions con la consulta en el bucle: {r['event_loop_requests']} peticiones, "
+              f"máx {r['event_loop_max_ms']:.1f} ms")
+
+if __name__ == "__main__":
+    heavy_rows = 3_000_000
+    try:
+        if len(sys.argv) > 1:
+            heavy_rows = int(sys.argv[1])
+    except ValueError:
+        print("Uso: python benchmark_async_dal.py [filas_consulta_pesada]")
+        sys.exit(1)
+
+    benchmark = AsyncDALBenchmark(heavy_rows)
+    benchmark.run_benchmark()
@@ -0,0 +1,252 @@
+"""
+Filtros de captura BPF y longitud de captura (snaplen).
+
+El filtro de captura se compila en el kernel: los paquetes que no lo cumplen
+no llegan a dumpcap/tshark ni al disco. Antes de lanzar una captura el filtro
+se compila con `dumpcap -d` (que imprime el código BPF generado y termina) para
+devolver los errores de sintaxis en la propia petición en lugar de en una
+captura fallida; el resultado se guarda en caché por interfaz, filtro y snaplen.
+
+El esquema solo guarda cabeceras, así que un snaplen de unos cientos de bytes
+evita escribir cargas útiles que nunca se almacenan (CAPTURE_SNAPLEN fija el
+valor por defecto; 0 captura el paquete completo).
+
+Al terminar una captura se informa de lo ahorrado: los bytes recortados por el
+snaplen salen exactos de las cabeceras de registro del PCAP (longitud original
+frente a capturada) y lo descartado por el filtro se estima con los contadores
+de la interfaz (/sys/class/net, solo en Linux). pcap_volume solo lee las
+cabeceras de registro y salta los datos; con procesamiento la mide el propio
+trabajo de ingesta antes de borrar el archivo.
+"""
+import os
+import struct
+import subprocess
+from functools import lru_cache
+
+from capture.tshark_runtime import get_tshark_runtime, TSHARK_PROBE_TIMEOUT
+from database.frame_store import iter_capture_frames
+
+# snaplen por defecto de las capturas en bytes (0: paquete completo)
+CAPTURE_SNAPLEN = int(os.getenv('CAPTURE_SNAPLEN', 0))
+
+# snaplen máximo admitido por libpcap
+MAX_SNAPLEN = 262144
+
+# Filtros compilados que se conservan en caché
+CAPTURE_FILTER_CACHE = int(os.getenv('CAPTURE_FILTER_CACHE', 256))
+
+# Bytes de la cabecera de cada registro de un PCAP clásico
+PCAP_RECORD_HEADER = 16
+
+# Longitud máxima de CaptureSession.filter_applied
+FILTER_APPLIED_MAX = 255
+
+
+class CaptureFilterError(Exception):
+    """El filtro de captura no es válido para la interfaz"""
+    pass
+
+
+def default_snaplen(snaplen=None):
+    """snaplen pedido o el configurado por defecto (None: paquete completo)"""
+    snaplen = snaplen if snaplen is not None else CAPTURE_SNAPLEN
+    return snaplen or None
+
+
+def describe_capture_settings(capture_filter=None, snaplen=None):
+    """
+    Texto que se guarda en CaptureSession.filter_applied.
+
+    Returns:
+        str: p. ej. "tcp port 443; snaplen=128", o None sin filtro ni snaplen.
+    """
+    parts = []
+    if capture_filter:
+        parts.append(capture_filter)
+    if snaplen:
+        parts.append(f"snaplen={int(snaplen)}")
+    if not parts:
+        return None
+    return "; ".join(parts)[:FILTER_APPLIED_MAX]
+
+
+@lru_cache(maxsize=CAPTURE_FILTER_CACHE)
+def _compile(dumpcap_path, interface_id, capture_filter, snaplen):
+    command = [dumpcap_path, "-d", "-i", interface_id, "-f", capture_filter]
+    if snaplen:
+        command.extend(["-s", str(snaplen)])
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                text=True, timeout=TSHARK_PROBE_TIMEOUT)
+    except (OSError, subprocess.SubprocessError) as e:
+        raise CaptureFilterError(f"No se pudo compilar el filtro de captura: {e}")
+    instructions = tuple(line.strip() for line in result.stdout.splitlines() if line.strip().startswith("("))
+    if result.returncode != 0 or not instructions:
+        message = result.stderr.strip() or f"dumpcap terminó con código {result.returncode}"
+        raise CaptureFilterError(f"Filtro de captura no válido: {message[-1000:]}")
+    return instructions
+
+
+def compile_capture_filter(interface_id, capture_filter, snaplen=None, dumpcap_path=None):
+    """
+    Compila un filtro BPF para una interfaz.
+
+    Args:
+        interface_id (str): ID de la interfaz (el código depende de su tipo de enlace).
+        capture_filter (str): Filtro de captura en sintaxis BPF.
+        snaplen (int, opcional): Longitud de captura.
+        dumpcap_path (str, opcional): Ruta a dumpcap. Por defecto la del entorno de TShark.
+
+    Returns:
+        list: Instrucciones BPF generadas, o None si no hay filtro o dumpcap no está
+        disponible (el filtro se comprobará al iniciar la captura).
+
+    Raises:
+        CaptureFilterError: Si el filtro no compila.
+    """
+    if not capture_filter or not capture_filter.strip():
+        return None
+    dumpcap_path = dumpcap_path or get_tshark_runtime().dumpcap_path()
+    if not dumpcap_path:
+        print("dumpcap no está disponible: el filtro de captura no se valida de antemano")
+        return None
+    return list(_compile(dumpcap_path, str(interface_id), capture_filter.strip(), snaplen or None))
+
+
+def interface_counters(interface_id):
+    """
+    Bytes y paquetes recibidos y enviados por una interfaz desde el arranque.
+
+    Returns:
+        dict: {"bytes", "packets"}, o None si el sistema no expone los contadores
+        (fuera de Linux o con pseudo-interfaces como "any").
+    """
+    base = os.path.join("/sys/class/net", os.path.basename(str(interface_id)), "statistics")
+    try:
+        values = {}
+        for name in ("rx_bytes", "tx_bytes", "rx_packets", "tx_packets"):
+            with open(os.path.join(base, name)) as f:
+                values[name] = int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+    return {
+        "bytes": values["rx_bytes"] + values["tx_bytes"],
+        "packets": values["rx_packets"] + values["tx_packets"],
+    }
+
+
+def counters_delta(start, end):
+    """Tráfico de la interfaz entre dos lecturas de interface_counters (o None)"""
+    if not start or not end:
+        return None
+    return {key: max(0, end[key] - start[key]) for key in ("bytes", "packets")}
+
+
+# Orden de bytes de un PCAP clásico según su número mágico (µs y ns)
+_PCAP_ENDIAN = {
+    b'\xd4\xc3\xb2\xa1': '<', b'\x4d\x3c\xb2\xa1': '<',
+    b'\xa1\xb2\xc3\xd4': '>', b'\xa1\xb2\x3c\x4d': '>',
+}
+
+
+def pcap_volume(path):
+    """
+    Volumen de un archivo de captura leyendo solo las cabeceras de registro.
+
+    En un PCAP clásico sin comprimir se salta el contenido de cada paquete; en
+    PCAPNG o .zst se recorren los frames (capture_volume).
+    """
+    volume = {"packets": 0, "original_bytes": 0, "captured_bytes": 0}
+    with open(path, 'rb') as f:
+        endian = None if path.endswith('.zst') else _PCAP_ENDIAN.get(f.read(4))
+        if endian is None:
+            return capture_volume(path)
+        f.seek(24)
+        record = struct.Struct(endian + 'IIII')
+        size = os.fstat(f.fileno()).st_size
+        while True:
+            header = f.read(record.size)
+            if len(header) < record.size:
+                break
+            _, _, caplen, orig_len = record.unpack(header)
+            if f.tell() + caplen > size:
+                # Último registro a medio escribir
+                break
+            f.seek(caplen, os.SEEK_CUR)
+            volume["packets"] += 1
+            volume["original_bytes"] += orig_len
+            volume["captured_bytes"] += caplen
+    return volume
+
+
+def capture_volume(paths):
+    """
+    Volumen de uno o varios archivos de captura según sus cabeceras de registro.
+
+    Returns:
+        dict: packets, original_bytes (longitud en la red) y captured_bytes (escritos).
+    """
+    volume = {"packets": 0, "original_bytes": 0, "captured_bytes": 0}
+    for path in ([paths] if isinstance(paths, str) else paths):
+        frames = iter_capture_frames(path)
+        next(frames, None)
+        for _, orig_len, data in frames:
+            volume["packets"] += 1
+            volume["original_bytes"] += orig_len
+            volume["captured_bytes"] += len(data)
+    return volume
+
+
+def add_volume(total, volume):
+    """Acumula el volumen de un archivo en el total de la captura"""
+    for key, value in volume.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+
+def savings_report(volume, interface_traffic=None):
+    """
+    Volumen y disco ahorrados por el filtro y el snaplen.
+
+    Args:
+        volume (dict): Resultado de capture_volume (o acumulado con add_volume).
+        interface_traffic (dict, opcional): Tráfico de la interfaz durante la captura
+            (counters_delta). Sin él no se puede estimar lo descartado por el filtro.
+
+    Returns:
+        dict: snaplen_saved_bytes es exacto; filtered_packets y filtered_bytes son una
+        estimación (la interfaz también cuenta tráfico anterior o posterior a la captura
+        dentro del intervalo medido) y None sin contadores de la interfaz.
+    """
+    snaplen_saved = volume["original_bytes"] - volume["captured_bytes"]
+    report = {
+        **volume,
+        "snaplen_saved_bytes": snaplen_saved,
+        "interface_packets": None,
+        "interface_bytes": None,
+        "filtered_packets": None,
+        "filtered_bytes": None,
+        "disk_saved_bytes": snaplen_saved,
+        "saved_percent": None,
+    }
+    seen_bytes = volume["original_bytes"]
+    if interface_traffic:
+        filtered_packets = max(0, interface_traffic["packets"] - volume["packets"])
+        filtered_bytes = max(0, interface_traffic["bytes"] - volume["original_bytes"])
+        report.update({
+            "interface_packets": interface_traffic["packets"],
+            "interface_bytes": interface_traffic["bytes"],
+            "filtered_packets": filtered_packets,
+            "filtered_bytes": filtered_bytes,
+            # Los paquetes descartados tampoco escriben su cabecera de registro
+            "disk_saved_bytes": snaplen_saved + filtered_bytes + filtered_packets * PCAP_RECORD_HEADER,
+        })
+        seen_bytes = max(seen_bytes, interface_traffic["bytes"])
+    if seen_bytes:
+        report["saved_percent"] = round(100.0 * (seen_bytes - volume["captured_bytes"]) / seen_bytes, 2)
+    return report
+
+
+def clear_filter_cache():
+    """Descarta los filtros compilados (p. ej. tras cambiar de versión de dumpcap)"""
+    _compile.cache_clear()
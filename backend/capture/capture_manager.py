@@ -0,0 +1,438 @@
+"""
+Gestor de capturas asíncronas.
+
+Cada captura es un subproceso dumpcap (o tshark si dumpcap no está
+disponible, ver capture_binary) lanzado con asyncio: iniciar una
+captura devuelve su identificador en cuanto el proceso arranca, sin ocupar
+el bucle de eventos ni un hilo durante toda la duración. Una tarea por
+captura espera al proceso y registra el resultado; al terminar, si se pidió,
+el PCAP se encola en la cola de trabajos para su procesamiento.
+
+Se admiten varias capturas a la vez en interfaces distintas (como mucho
+CAPTURE_MAX_CONCURRENT); una segunda captura en una interfaz ocupada se
+rechaza. Detener una captura envía SIGINT al proceso, que cierra el archivo
+correctamente, y mata el proceso si no termina en CAPTURE_STOP_TIMEOUT.
+
+El estado de las capturas vive en memoria del proceso del servidor: se
+conservan las CAPTURE_HISTORY últimas capturas terminadas.
+
+Con búfer circular (ring_buffer: tamaño y/o duración por archivo y número
+máximo de archivos) la captura rota de archivo y cada archivo se entrega a la
+cola de procesamiento en cuanto se cierra, sin esperar al final de la
+captura: el archivo más reciente es el que se está escribiendo, así que los
+anteriores ya están cerrados. Con procesamiento, cada archivo se borra tras
+ingerirlo, de modo que una captura continua ocupa un disco acotado; el número
+máximo de archivos solo se admite sin procesamiento, porque dumpcap borraría
+archivos todavía en cola.
+
+El filtro de captura (BPF) se compila antes de lanzar el proceso, de modo que
+un filtro no válido se rechaza en la propia petición. Con filtro o snaplen se
+informa del volumen y el disco ahorrados (ver capture_filters) sin retrasar la
+entrega de los archivos: con procesamiento, el trabajo de ingesta mide cada
+archivo antes de borrarlo; sin él, se mide en segundo plano tras entregarlo.
+"""
+import os
+import re
+import sys
+import glob
+import uuid
+import signal
+import asyncio
+from datetime import datetime
+
+from capture.network_interfaces import capture_binary, build_capture_command, is_dumpcap
+from capture.capture_filters import (
+    compile_capture_filter, default_snaplen, describe_capture_settings, interface_counters,
+    counters_delta, pcap_volume, add_volume, savings_report
+)
+from database.dal import run_blocking, run_db
+
+# Capturas simultáneas como máximo
+CAPTURE_MAX_CONCURRENT = int(os.getenv('CAPTURE_MAX_CONCURRENT', 4))
+
+# Segundos de espera tras pedir al proceso de captura que termine antes de matarlo
+CAPTURE_STOP_TIMEOUT = float(os.getenv('CAPTURE_STOP_TIMEOUT', 10))
+
+# Capturas terminadas que se conservan para consultar su estado
+CAPTURE_HISTORY = int(os.getenv('CAPTURE_HISTORY', 100))
+
+# Segundos entre comprobaciones de los archivos cerrados del búfer circular
+CAPTURE_RING_POLL = float(os.getenv('CAPTURE_RING_POLL', 1.0))
+
+# Estados de una captura
+CAPTURE_STATUSES = ('running', 'completed', 'stopped', 'failed')
+
+
+class CaptureError(Exception):
+    """No se pudo iniciar o gestionar la captura"""
+    pass
+
+
+class CaptureNotFound(CaptureError):
+    """No existe una captura con ese identificador"""
+    pass
+
+
+class CaptureConflict(CaptureError):
+    """La interfaz ya está capturando o se alcanzó el máximo de capturas"""
+    pass
+
+
+def ring_files(output_file):
+    """
+    Archivos de un búfer circular en orden de creación.
+
+    dumpcap y tshark nombran cada archivo <base>_<número>_<fecha><extensión>.
+    """
+    stem, extension = os.path.splitext(output_file)
+    pattern = re.compile(r'_(\d+)_\d{14}' + re.escape(extension) + '$')
+    files = []
+    for path in glob.glob(f"{glob.escape(stem)}_*{extension}"):
+        match = pattern.search(path)
+        if match:
+            files.append((int(match.group(1)), path))
+    return [path for _, path in sorted(files)]
+
+
+class Capture:
+    """Captura en curso o terminada"""
+
+    def __init__(self, capture_id, interface_id, output_file, duration=None, packet_count=None,
+                 capture_filter=None, process=False, priority=0, ring_buffer=None, backend=None,
+                 snaplen=None, bpf=None):
+        self.id = capture_id
+        self.interface_id = interface_id
+        self.output_file = output_file
+        self.duration = duration
+        self.packet_count = packet_count
+        self.capture_filter = capture_filter
+        self.process = process
+        self.priority = priority
+        self.ring_buffer = ring_buffer
+        self.backend = backend
+        self.snaplen = snaplen
+        self.bpf = bpf
+        self.files = []
+        self.counters_start = None
+        self.counters_end = None
+        # Medición del volumen de cada archivo: {path, job_id, state, volume}
+        self.measurements = []
+        self.savings = None
+        self.status = 'running'
+        self.started_at = datetime.now()
+        self.finished_at = None
+        self.returncode = None
+        self.error = None
+        self.job_id = None
+        self.stop_requested = False
+        self.proc = None
+        self.task = None
+
+    @property
+    def filter_applied(self):
+        return describe_capture_settings(self.capture_filter, self.snaplen)
+
+    @property
+    def measure_savings(self):
+        """Solo se mide el ahorro si hay filtro o snaplen"""
+        return bool(self.capture_filter or self.snaplen)
+
+    def file_size(self):
+        paths = ring_files(self.output_file) if self.ring_buffer else [self.output_file]
+        size = 0
+        for path in paths:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "interface_id": self.interface_id,
+            "status": self.status,
+            "file_path": self.output_file,
+            "file_name": os.path.basename(self.output_file),
+            "size": self.file_size(),
+            "duration": self.duration,
+            "packet_count": self.packet_count,
+            "capture_filter": self.capture_filter,
+            "snaplen": self.snaplen,
+            "filter_applied": self.filter_applied,
+            # None: no se pudo compilar de antemano (sin dumpcap)
+            "bpf_instructions": len(self.bpf) if self.bpf is not None else None,
+            "savings": self.savings,
+            "process": self.process,
+            "backend": self.backend,
+            "ring_buffer": self.ring_buffer,
+            "files": self.files,
+            "job_id": self.job_id,
+            "pid": self.proc.pid if self.proc else None,
+            "returncode": self.returncode,
+            "error": self.error,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class CaptureManager:
+    """Lanza, sigue y detiene capturas dumpcap/tshark como subprocesos asyncio"""
+
+    def __init__(self, pcap_directory=None, binary_path=None, max_concurrent=None):
+        self.pcap_directory = pcap_directory or os.getenv("PCAP_DIRECTORY", "./data/pcap_files/")
+        self.binary_path = binary_path
+        self.max_concurrent = max_concurrent or CAPTURE_MAX_CONCURRENT
+        self.captures = {}
+
+    def running(self):
+        return [c for c in self.captures.values() if c.status == 'running']
+
+    def get(self, capture_id):
+        capture = self.captures.get(capture_id)
+        if capture is None:
+            raise CaptureNotFound(f"Captura {capture_id} no encontrada")
+        return capture
+
+    def list(self, status=None):
+        captures = sorted(self.captures.values(), key=lambda c: c.started_at, reverse=True)
+        return [c for c in captures if status is None or c.status == status]
+
+    async def _binary(self):
+        if self.binary_path is None:
+            self.binary_path = await run_blocking(capture_binary)
+            if not self.binary_path:
+                raise CaptureError("No se pudo encontrar TShark para la captura")
+        return self.binary_path
+
+    async def start(self, interface_id, duration=60, packet_count=None, capture_filter=None,
+                    process=False, priority=0, ring_buffer=None, snaplen=None):
+        """
+        Inicia una captura y la devuelve en cuanto el proceso de captura arranca.
+
+        Raises:
+            CaptureFilterError: Si el filtro de captura no compila.
+            CaptureConflict: Si la interfaz está ocupada o se alcanzó el máximo de capturas.
+        """
+        binary_path = await self._binary()
+        ring_buffer = {k: v for k, v in (ring_buffer or {}).items() if v} or None
+        snaplen = default_snaplen(snaplen)
+        # Se compila antes de comprobar la interfaz: entre la comprobación y el
+        # registro de la captura no debe haber esperas
+        bpf = await run_blocking(compile_capture_filter, interface_id, capture_filter, snaplen,
+                                 dumpcap_path=binary_path if is_dumpcap(binary_path) else None)
+        running = self.running()
+        if any(c.interface_id == interface_id for c in running):
+            raise CaptureConflict(f"La interfaz {interface_id} ya tiene una captura en curso")
+        if len(running) >= self.max_concurrent:
+            raise CaptureConflict(f"Se alcanzó el máximo de {self.max_concurrent} capturas simultáneas")
+
+        os.makedirs(self.pcap_directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        capture_id = str(uuid.uuid4())
+        # El identificador en el nombre evita colisiones entre capturas simultáneas
+        output_file = os.path.join(self.pcap_directory, f"capture_{timestamp}_{capture_id[:8]}.pcap")
+        backend = "dumpcap" if is_dumpcap(binary_path) else "tshark"
+        capture = Capture(capture_id, interface_id, output_file, duration, packet_count, capture_filter,
+                          process, priority, ring_buffer, backend, snaplen, bpf)
+
+        # Se registra antes de lanzar el proceso: otra petición ya ve la interfaz ocupada
+        self.captures[capture.id] = capture
+
+        command = build_capture_command(binary_path, interface_id, output_file, duration, packet_count,
+                                        capture_filter, ring_buffer=ring_buffer, snaplen=snaplen)
+        print(f"Ejecutando comando: {' '.join(command)}")
+        try:
+            capture.proc = await asyncio.create_subprocess_exec(
+                *command, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+            )
+        except OSError as e:
+            del self.captures[capture.id]
+            raise CaptureError(f"No se pudo iniciar {backend}: {e}")
+        capture.counters_start = interface_counters(interface_id)
+
+        capture.task = asyncio.create_task(self._watch(capture))
+        self._prune()
+        return capture
+
+    async def _watch(self, capture):
+        """Espera a que termine la captura y registra el resultado"""
+        poller = asyncio.create_task(self._poll_ring(capture)) if capture.ring_buffer else None
+        _, stderr = await capture.proc.communicate()
+        capture.returncode = capture.proc.returncode
+        capture.counters_end = interface_counters(capture.interface_id)
+        if poller is not None:
+            # Sin cancelarla: un encolado a medias quedaría sin registrar
+            await poller
+            await self._hand_off_ring_files(capture, final=True)
+        capture.finished_at = datetime.now()
+        has_file = bool(capture.files) if capture.ring_buffer else capture.file_size() > 0
+
+        if not has_file or (capture.returncode != 0 and not capture.stop_requested):
+            message = stderr.decode('utf-8', errors='replace').strip()
+            capture.error = message[-2000:] or "La captura no generó un archivo válido"
+            capture.status = 'failed'
+            print(f"Error durante la captura {capture.id}: {capture.error}")
+            return
+
+        # El estado final se publica con el trabajo ya encolado
+        if not capture.ring_buffer:
+            if capture.process:
+                capture.job_id = await self._enqueue(capture, capture.output_file)
+            self._track(capture, capture.output_file, capture.job_id)
+        await self.refresh_savings(capture)
+        capture.status = 'stopped' if capture.stop_requested else 'completed'
+        print(f"Captura {capture.id} terminada ({capture.status}): {capture.output_file}")
+
+    async def _poll_ring(self, capture):
+        """Entrega los archivos del búfer circular a medida que se cierran"""
+        while capture.proc.returncode is None:
+            await asyncio.sleep(CAPTURE_RING_POLL)
+            await self._hand_off_ring_files(capture, final=False)
+
+    async def _hand_off_ring_files(self, capture, final):
+        """Registra (y encola) los archivos cerrados: todos menos el último mientras se captura"""
+        known = {entry["path"] for entry in capture.files}
+        paths = ring_files(capture.output_file)
+        for path in (paths if final else paths[:-1]):
+            if path in known:
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                # dumpcap ya lo borró al superar el número máximo de archivos
+                continue
+            if size == 0:
+                continue
+            entry = {"path": path, "file_name": os.path.basename(path), "size": size, "job_id": None}
+            capture.files.append(entry)
+            if capture.process:
+                # Ingerido el archivo, se borra: el disco ocupado queda acotado
+                entry["job_id"] = await self._enqueue(capture, path, delete_source=True)
+            self._track(capture, path, entry["job_id"])
+
+    def _track(self, capture, pcap_file, job_id):
+        """
+        Registra un archivo entregado para medir su volumen sin retrasar la entrega:
+        lo mide su trabajo de ingesta o, sin procesamiento, una tarea en segundo plano.
+        """
+        if not capture.measure_savings:
+            return
+        measurement = {"path": pcap_file, "job_id": job_id, "state": 'pending', "volume": None}
+        capture.measurements.append(measurement)
+        if job_id is None:
+            measurement["task"] = asyncio.create_task(self._measure(measurement))
+
+    async def _measure(self, measurement):
+        try:
+            measurement["volume"] = await run_blocking(pcap_volume, measurement["path"])
+            measurement["state"] = 'measured'
+        except Exception as e:
+            # p. ej. dumpcap ya lo borró al superar el número máximo de archivos
+            measurement["state"] = 'unavailable'
+            print(f"No se pudo medir el volumen de {os.path.basename(measurement['path'])}: {e}")
+
+    async def refresh_savings(self, capture):
+        """
+        Actualiza el ahorro con las mediciones terminadas (las de los trabajos de
+        ingesta llegan en su resultado).
+        """
+        if not capture.measure_savings:
+            return capture.savings
+        from processing.jobs import get_job
+        for measurement in capture.measurements:
+            if measurement["state"] != 'pending' or measurement["job_id"] is None:
+                continue
+            try:
+                job = await run_db(get_job, measurement["job_id"])
+            except Exception:
+                measurement["state"] = 'unavailable'
+                continue
+            if job["status"] == 'completed':
+                volume = (job["result"] or {}).get("volume")
+                measurement["volume"] = volume
+                measurement["state"] = 'measured' if volume else 'unavailable'
+            elif job["status"] in ('failed', 'cancelled'):
+                measurement["state"] = 'unavailable'
+
+        states = [m["state"] for m in capture.measurements]
+        total = {"packets": 0, "original_bytes": 0, "captured_bytes": 0}
+        for measurement in capture.measurements:
+            if measurement["state"] == 'measured':
+                add_volume(total, measurement["volume"])
+        # Lo descartado por el filtro solo se estima con toda la captura medida
+        complete = capture.finished_at is not None and states.count('measured') == len(states)
+        interface_traffic = counters_delta(capture.counters_start, capture.counters_end) if complete else None
+        capture.savings = {
+            **savings_report(total, interface_traffic),
+            "files_measured": states.count('measured'),
+            "files_pending": states.count('pending'),
+            "files_unavailable": states.count('unavailable'),
+        }
+        return capture.savings
+
+    async def _enqueue(self, capture, pcap_file, delete_source=False):
+        """Encola el procesamiento de un archivo de la captura y devuelve el id del trabajo"""
+        from processing.jobs import enqueue_job
+        try:
+            job = await run_db(enqueue_job, 'process_pcap', {
+                "pcap_file": pcap_file,
+                "interface": capture.interface_id,
+                "filter_applied": capture.filter_applied,
+                # El trabajo mide el volumen del archivo antes de borrarlo
+                "measure_volume": capture.measure_savings,
+                # Sin búfer circular el PCAP capturado se conserva junto al resto de archivos
+                "delete_source": delete_source,
+            }, priority=capture.priority)
+            print(f"Procesamiento de {os.path.basename(pcap_file)} encolado: trabajo {job['id']}")
+            return job["id"]
+        except Exception as e:
+            capture.error = f"No se pudo encolar el procesamiento: {e}"
+            print(capture.error)
+            return None
+
+    async def stop(self, capture_id):
+        """Detiene una captura en curso y espera a que se cierre el archivo"""
+        capture = self.get(capture_id)
+        if capture.status != 'running' or capture.task is None:
+            raise CaptureConflict(f"La captura {capture_id} no está en curso ({capture.status})")
+        capture.stop_requested = True
+        try:
+            if sys.platform == "win32":
+                capture.proc.terminate()
+            else:
+                # SIGINT: dumpcap/tshark terminan de escribir el archivo antes de salir
+                capture.proc.send_signal(signal.SIGINT)
+        except ProcessLookupError:
+            pass
+        try:
+            await asyncio.wait_for(asyncio.shield(capture.task), CAPTURE_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"La captura {capture_id} no terminó a tiempo: se mata el proceso")
+            capture.proc.kill()
+            await capture.task
+        return capture
+
+    async def stop_all(self):
+        """Detiene todas las capturas en curso (al apagar el servidor)"""
+        for capture in self.running():
+            try:
+                await self.stop(capture.id)
+            except CaptureError:
+                pass
+
+    def _prune(self):
+        finished = [c for c in self.list() if c.status != 'running']
+        for capture in finished[CAPTURE_HISTORY:]:
+            del self.captures[capture.id]
+
+
+_manager = None
+
+
+def get_capture_manager():
+    """Gestor de capturas del proceso del servidor"""
+    global _manager
+    if _manager is None:
+        _manager = CaptureManager()
+    return _manager
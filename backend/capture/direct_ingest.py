@@ -0,0 +1,199 @@
+"""
+Captura directa a la base de datos, sin PCAP intermedio.
+
+dumpcap (o tshark) escribe la captura en formato PCAP por su salida estándar (`-w -`) y
+un hilo la reenvía a una tubería que lee el decodificador (pyshark
+PipeCapture): los paquetes se decodifican y se guardan por lotes mientras la
+captura sigue en marcha, sin escribir el archivo completo en disco para
+volver a leerlo después.
+
+Opcionalmente los mismos bytes se copian a un archivo comprimido con zstd
+(`.pcap.zst`) que conserva la captura original ocupando una fracción del
+espacio; el almacén de frames sabe leerlo directamente. Con filtro o snaplen,
+el archivo comprimido permite además medir el volumen ahorrado (ver
+capture_filters).
+"""
+import os
+import sys
+import signal
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+from capture.network_interfaces import capture_binary, build_capture_command
+from capture.capture_filters import interface_counters, counters_delta, capture_volume, savings_report
+from database.frame_store import zstd_available
+
+try:
+    import zstandard as zstd
+except ImportError:  # zstandard es una dependencia opcional
+    zstd = None
+
+# Nivel de compresión zstd del archivo de la captura
+CAPTURE_ARCHIVE_LEVEL = int(os.getenv('CAPTURE_ARCHIVE_LEVEL', 3))
+
+# Bytes leídos de tshark en cada lectura
+STREAM_READ_SIZE = 64 * 1024
+
+
+class CaptureStreamError(Exception):
+    """No se pudo iniciar la captura directa"""
+    pass
+
+
+def stream_base_name(interface_id):
+    """Nombre base de los archivos de una captura directa"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    safe_interface = "".join(c if c.isalnum() else "_" for c in str(interface_id))
+    return f"capture_{timestamp}_{safe_interface}"
+
+
+class CaptureStream:
+    """
+    Proceso tshark que escribe PCAP por su salida estándar, reenviada a una tubería.
+
+    read_fd es el extremo de lectura para el decodificador; se cierra el extremo de
+    escritura cuando tshark termina (fin de la captura) para que el decodificador
+    vea el final del flujo.
+    """
+
+    def __init__(self, interface_id, duration=None, packet_count=None, capture_filter=None,
+                 archive_path=None, tshark_path=None, snaplen=None):
+        self.interface_id = interface_id
+        self.duration = duration
+        self.packet_count = packet_count
+        self.capture_filter = capture_filter
+        self.archive_path = archive_path
+        self.tshark_path = tshark_path
+        self.snaplen = snaplen
+        self.proc = None
+        self.read_fd = None
+        self.bytes_captured = 0
+        self.archive_bytes = 0
+        self.stopped = False
+        self.error = None
+        self.finished = threading.Event()
+        self._thread = None
+        self._stderr = None
+        self._counters = None
+
+    def start(self):
+        tshark_path = self.tshark_path or capture_binary()
+        if not tshark_path:
+            raise CaptureStreamError("No se pudo encontrar TShark para la captura")
+        if self.archive_path and not zstd_available():
+            print("zstandard no está instalado: la captura directa no se archivará")
+            self.archive_path = None
+
+        # PCAP clásico por la salida estándar: lo leen tanto el decodificador como el almacén de frames
+        command = build_capture_command(tshark_path, self.interface_id, "-", self.duration,
+                                        self.packet_count, self.capture_filter, pcap_format=True,
+                                        snaplen=self.snaplen)
+        print(f"Ejecutando comando: {' '.join(command)}")
+        # stderr a un archivo temporal: en una captura larga los mensajes de tshark
+        # no deben llenar una tubería que nadie lee
+        self._stderr = tempfile.TemporaryFile()
+        try:
+            self.proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=self._stderr)
+        except OSError as e:
+            self._stderr.close()
+            raise CaptureStreamError(f"No se pudo iniciar tshark: {e}")
+        self._counters = interface_counters(self.interface_id)
+
+        self.read_fd, write_fd = os.pipe()
+        self._thread = threading.Thread(target=self._pump, args=(write_fd,), name="capture-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def _pump(self, write_fd):
+        """Copia la salida de tshark a la tubería y, si se pidió, al archivo comprimido"""
+        archive = writer = None
+        with os.fdopen(write_fd, 'wb', buffering=0) as pipe:
+            try:
+                if self.archive_path:
+                    archive = open(self.archive_path, 'wb')
+                    writer = zstd.ZstdCompressor(level=CAPTURE_ARCHIVE_LEVEL).stream_writer(archive, closefd=False)
+                while True:
+                    chunk = self.proc.stdout.read1(STREAM_READ_SIZE)
+                    if not chunk:
+                        break
+                    self.bytes_captured += len(chunk)
+                    if writer is not None:
+                        writer.write(chunk)
+                    try:
+                        pipe.write(chunk)
+                    except BrokenPipeError:
+                        # El decodificador terminó: se detiene la captura
+                        self.error = self.error or "El decodificador cerró la tubería"
+                        self.stop()
+                        break
+                # Registrar el resultado antes de cerrar la tubería: el decodificador lo
+                # consulta al ver el final del flujo
+                self._record_exit()
+            except Exception as e:
+                self.error = str(e)
+                self.stop()
+                self._record_exit()
+            finally:
+                if writer is not None:
+                    writer.close()
+                if archive is not None:
+                    archive.close()
+                    self.archive_bytes = os.path.getsize(self.archive_path)
+        self.finished.set()
+
+    def _record_exit(self):
+        # Tras un corte, tshark no debe quedarse bloqueado escribiendo en una salida que ya no se lee
+        self.proc.stdout.close()
+        returncode = self.proc.wait()
+        self._counters = counters_delta(self._counters, interface_counters(self.interface_id))
+        self._stderr.seek(0)
+        stderr = self._stderr.read()
+        self._stderr.close()
+        if returncode != 0 and not self.stopped and self.error is None:
+            message = stderr.decode('utf-8', errors='replace').strip()
+            self.error = message[-2000:] or f"tshark terminó con código {returncode}"
+
+    def stop(self):
+        """Detiene la captura; lo ya capturado sigue llegando al decodificador"""
+        self.stopped = True
+        if self.proc is not None and self.proc.poll() is None:
+            try:
+                if sys.platform == "win32":
+                    self.proc.terminate()
+                else:
+                    self.proc.send_signal(signal.SIGINT)
+            except ProcessLookupError:
+                pass
+
+    def wait(self, timeout=None):
+        """Espera a que termine tshark y se cierre la tubería"""
+        if not self.finished.wait(timeout):
+            self.proc.kill()
+            self.finished.wait(timeout)
+        return self
+
+    def stats(self):
+        stats = {
+            "bytes_captured": self.bytes_captured,
+            "stopped": self.stopped,
+            "archive_path": self.archive_path,
+        }
+        if self.archive_path:
+            stats["archive_bytes"] = self.archive_bytes
+        return stats
+
+    def savings(self):
+        """
+        Volumen ahorrado por el filtro y el snaplen (una vez terminada la captura).
+
+        Se mide sobre el archivo comprimido; sin él (o sin filtro ni snaplen) devuelve None.
+        """
+        if not self.archive_path or not (self.capture_filter or self.snaplen) or not self.finished.is_set():
+            return None
+        try:
+            return savings_report(capture_volume(self.archive_path), self._counters)
+        except Exception as e:
+            print(f"No se pudo medir el volumen de la captura directa: {e}")
+            return None
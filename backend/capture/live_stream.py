@@ -0,0 +1,279 @@
+"""
+Captura en vivo con estadísticas en tiempo real.
+
+Un subproceso tshark por interfaz escribe en su salida estándar una línea
+por paquete con los campos necesarios (`-l -T fields`), que se decodifica
+a medida que llega sin esperar a que termine la captura ni releer un PCAP.
+Cada segundo se publica un resumen (paquetes y bytes por segundo, reparto
+por protocolo y principales emisores) y, entre medias, una muestra de los
+paquetes.
+
+Varios clientes sobre la misma interfaz (y el mismo filtro) comparten el
+mismo proceso, que se detiene al irse el último. Cada cliente tiene una cola
+acotada (LIVE_QUEUE_SIZE) y un límite de paquetes de muestra por segundo
+(LIVE_MAX_SAMPLES_PER_SECOND): la lectura de tshark nunca espera a un
+cliente lento; si su cola está llena se descarta el mensaje más antiguo.
+"""
+import os
+import time
+import asyncio
+from collections import Counter
+
+from capture.network_interfaces import find_tshark_path
+from database.dal import run_blocking
+
+# Mensajes pendientes por cliente antes de descartar los más antiguos
+LIVE_QUEUE_SIZE = int(os.getenv('LIVE_QUEUE_SIZE', 100))
+
+# Paquetes de muestra por segundo como máximo para cada cliente
+LIVE_MAX_SAMPLES_PER_SECOND = int(os.getenv('LIVE_MAX_SAMPLES_PER_SECOND', 20))
+
+# Entradas del reparto por protocolo y de los principales emisores
+LIVE_TOP_N = int(os.getenv('LIVE_TOP_N', 10))
+
+# Segundos de espera tras pedir a tshark que termine antes de matarlo
+LIVE_STOP_TIMEOUT = float(os.getenv('LIVE_STOP_TIMEOUT', 5))
+
+# Campos que tshark escribe por paquete, en este orden
+LIVE_FIELDS = (
+    "frame.time_epoch", "frame.len", "ip.src", "ip.dst", "ipv6.src", "ipv6.dst",
+    "_ws.col.Protocol", "tcp.srcport", "tcp.dstport", "udp.srcport", "udp.dstport",
+)
+
+
+class LiveCaptureError(Exception):
+    """No se pudo iniciar la captura en vivo"""
+    pass
+
+
+def build_live_command(tshark_path, interface_id, capture_filter=None):
+    """Línea de comandos de tshark para la captura en vivo, una línea por paquete"""
+    command = [tshark_path, "-i", interface_id, "-l", "-n", "-T", "fields",
+               "-E", "separator=/t", "-E", "occurrence=f"]
+    for field in LIVE_FIELDS:
+        command.extend(["-e", field])
+    if capture_filter:
+        command.extend(["-f", capture_filter])
+    return command
+
+
+def parse_live_line(line):
+    """Convierte una línea de campos de tshark en un paquete o None si no es válida"""
+    values = line.rstrip("\r\n").split("\t")
+    if len(values) < len(LIVE_FIELDS):
+        return None
+    (epoch, length, ip_src, ip_dst, ip6_src, ip6_dst, protocol,
+     tcp_src, tcp_dst, udp_src, udp_dst) = values[:len(LIVE_FIELDS)]
+    try:
+        timestamp, length = float(epoch), int(length)
+    except ValueError:
+        return None
+    src_port, dst_port = tcp_src or udp_src, tcp_dst or udp_dst
+    return {
+        "timestamp": timestamp,
+        "length": length,
+        "src_ip": ip_src or ip6_src or None,
+        "dst_ip": ip_dst or ip6_dst or None,
+        "protocol": protocol or "UNKNOWN",
+        "src_port": int(src_port) if src_port.isdigit() else None,
+        "dst_port": int(dst_port) if dst_port.isdigit() else None,
+    }
+
+
+class LiveStats:
+    """Acumula los paquetes de la ventana de un segundo en curso y los totales"""
+
+    def __init__(self):
+        self.total_packets = 0
+        self.total_bytes = 0
+        self._reset()
+
+    def _reset(self):
+        self.packets = 0
+        self.bytes = 0
+        self.protocols = Counter()
+        self.talkers = Counter()
+        self.talker_packets = Counter()
+        self.window_start = time.monotonic()
+
+    def add(self, packet):
+        self.packets += 1
+        self.bytes += packet["length"]
+        self.protocols[packet["protocol"]] += 1
+        if packet["src_ip"]:
+            self.talkers[packet["src_ip"]] += packet["length"]
+            self.talker_packets[packet["src_ip"]] += 1
+
+    def snapshot(self):
+        """Resumen de la ventana que termina y comienzo de la siguiente"""
+        elapsed = max(time.monotonic() - self.window_start, 1e-6)
+        self.total_packets += self.packets
+        self.total_bytes += self.bytes
+        summary = {
+            "type": "stats",
+            "timestamp": time.time(),
+            "pps": round(self.packets / elapsed, 2),
+            "bytes_per_second": round(self.bytes / elapsed, 2),
+            "protocols": dict(self.protocols.most_common(LIVE_TOP_N)),
+            "top_talkers": [
+                {"ip": ip, "bytes": sent, "packets": self.talker_packets[ip]}
+                for ip, sent in self.talkers.most_common(LIVE_TOP_N)
+            ],
+            "total_packets": self.total_packets,
+            "total_bytes": self.total_bytes,
+        }
+        self._reset()
+        return summary
+
+
+class LiveSubscriber:
+    """Cliente de una captura en vivo con su cola acotada y su límite de muestras"""
+
+    def __init__(self, max_samples=None):
+        limit = LIVE_MAX_SAMPLES_PER_SECOND if max_samples is None else max_samples
+        self.max_samples = max(0, min(limit, LIVE_MAX_SAMPLES_PER_SECOND))
+        self.queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        self.samples_left = self.max_samples
+        self.dropped = 0
+
+    def offer(self, message):
+        """Encola sin esperar: con la cola llena se descarta el mensaje más antiguo"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    def offer_sample(self, packet):
+        if self.samples_left > 0:
+            self.samples_left -= 1
+            self.offer({"type": "packet", **packet})
+
+    def new_window(self):
+        self.samples_left = self.max_samples
+
+
+class LiveSession:
+    """Proceso tshark de una interfaz compartido por sus clientes"""
+
+    def __init__(self, key, command):
+        self.key = key
+        self.command = command
+        self.subscribers = set()
+        self.stats = LiveStats()
+        self.proc = None
+        self.tasks = []
+        self.error = None
+        self.stopping = False
+        self.finished = False
+
+    async def start(self):
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                *self.command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+        except OSError as e:
+            raise LiveCaptureError(f"No se pudo iniciar tshark: {e}")
+        self.tasks = [asyncio.create_task(self._read()), asyncio.create_task(self._tick())]
+
+    def _publish(self, message):
+        for subscriber in list(self.subscribers):
+            subscriber.offer(message)
+
+    async def _read(self):
+        """Decodifica la salida de tshark línea a línea"""
+        async for raw in self.proc.stdout:
+            packet = parse_live_line(raw.decode('utf-8', errors='replace'))
+            if packet is None:
+                continue
+            self.stats.add(packet)
+            for subscriber in list(self.subscribers):
+                subscriber.offer_sample(packet)
+            # Con la salida llena readline no cede el bucle: dejar paso al resumen y a los clientes
+            if self.stats.packets % 1000 == 0:
+                await asyncio.sleep(0)
+        stderr = await self.proc.stderr.read()
+        returncode = await self.proc.wait()
+        self.finished = True
+        self.tasks[1].cancel()
+        if returncode != 0 and not self.stopping:
+            self.error = stderr.decode('utf-8', errors='replace').strip()[-2000:] or f"tshark terminó con código {returncode}"
+            print(f"Error en la captura en vivo de {self.key[0]}: {self.error}")
+        self._publish(self.stats.snapshot())
+        self._publish({"type": "end", "error": self.error})
+
+    async def _tick(self):
+        """Publica el resumen de cada segundo y renueva el cupo de muestras"""
+        while True:
+            await asyncio.sleep(1)
+            self._publish(self.stats.snapshot())
+            for subscriber in list(self.subscribers):
+                subscriber.new_window()
+
+    async def stop(self):
+        """Termina tshark y espera a que se lea el final de su salida"""
+        self.stopping = True
+        if self.proc.returncode is None:
+            try:
+                self.proc.terminate()
+            except ProcessLookupError:
+                pass
+        try:
+            await asyncio.wait_for(asyncio.shield(self.tasks[0]), LIVE_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.proc.kill()
+            self.tasks[0].cancel()
+
+
+class LiveCaptureHub:
+    """Reparte las sesiones en vivo por interfaz y filtro"""
+
+    def __init__(self, tshark_path=None):
+        self.tshark_path = tshark_path
+        self.sessions = {}
+        self._lock = asyncio.Lock()
+
+    async def subscribe(self, interface_id, capture_filter=None, max_samples=None):
+        """Une un cliente a la sesión de la interfaz, arrancándola si no existe"""
+        key = (interface_id, capture_filter or None)
+        async with self._lock:
+            session = self.sessions.get(key)
+            # Una sesión cuyo tshark ya terminó no admite clientes nuevos
+            if session is None or session.finished:
+                if self.tshark_path is None:
+                    self.tshark_path = await run_blocking(find_tshark_path)
+                    if not self.tshark_path:
+                        raise LiveCaptureError("No se pudo encontrar TShark para la captura")
+                session = LiveSession(key, build_live_command(self.tshark_path, interface_id, capture_filter))
+                await session.start()
+                self.sessions[key] = session
+                print(f"Captura en vivo iniciada en {interface_id}")
+            subscriber = LiveSubscriber(max_samples)
+            session.subscribers.add(subscriber)
+            return session, subscriber
+
+    async def unsubscribe(self, session, subscriber):
+        """Retira un cliente y detiene la sesión si era el último"""
+        async with self._lock:
+            session.subscribers.discard(subscriber)
+            if session.subscribers or self.sessions.get(session.key) is not session:
+                return
+            del self.sessions[session.key]
+        await session.stop()
+        print(f"Captura en vivo detenida en {session.key[0]}")
+
+    async def stop_all(self):
+        async with self._lock:
+            sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            await session.stop()
+
+
+_hub = None
+
+
+def get_live_hub():
+    """Repartidor de capturas en vivo del proceso del servidor"""
+    global _hub
+    if _hub is None:
+        _hub = LiveCaptureHub()
+    return _hub
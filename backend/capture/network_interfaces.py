@@ -1,140 +1,118 @@
 import os
-import pyshark
-import json
 import subprocess
 from datetime import datetime
-import platform
-import sys
+
+from capture.tshark_runtime import get_tshark_runtime
+from capture.capture_filters import compile_capture_filter, default_snaplen, CaptureFilterError
 
 def find_tshark_path():
     """
-    Busca la ruta al ejecutable de TShark en ubicaciones comunes.
+    Ruta al ejecutable de TShark (resuelta una sola vez por proceso).
     
     Returns:
         str: Ruta al ejecutable de TShark o None si no se encuentra.
     """
-    # Comprobar si está en el PATH
-    tshark_command = "tshark.exe" if sys.platform == "win32" else "tshark"
-    
-    try:
-        # Intentar ejecutar tshark para ver si está en el PATH
-        subprocess.run([tshark_command, "-v"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        return tshark_command
-    except (subprocess.SubprocessError, FileNotFoundError):
-        # No está en el PATH, buscar en ubicaciones comunes
-        common_paths = []
-        
-        if sys.platform == "win32":
-            common_paths = [
-                r"C:\Program Files\Wireshark\tshark.exe",
-                r"C:\Program Files (x86)\Wireshark\tshark.exe",
-                # Añadir más rutas comunes de Windows si es necesario
-            ]
-        else:
-            common_paths = [
-                "/usr/bin/tshark",
-                "/usr/local/bin/tshark",
-                "/opt/wireshark/bin/tshark",
-                # Añadir más rutas comunes de Linux/Mac si es necesario
-            ]
-        
-        for path in common_paths:
-            if os.path.isfile(path):
-                return path
-                
-        return None
+    return get_tshark_runtime().tshark_path()
 
-def get_interfaces():
+def get_interfaces(refresh=False):
     """
     Obtiene una lista de interfaces de red disponibles en el sistema.
     
+    La lista se guarda en caché (ver capture.tshark_runtime).
+    
+    Args:
+        refresh (bool): Volver a listar las interfaces aunque la caché esté vigente.
+    
     Returns:
         list: Lista de diccionarios con información de las interfaces.
     """
     try:
-        # Buscar TShark
-        tshark_path = find_tshark_path()
-        if not tshark_path:
-            print("Error: No se pudo encontrar TShark. Asegúrate de que Wireshark esté instalado.")
-            print("Rutas comprobadas:")
-            for path in [r"C:\Program Files\Wireshark\tshark.exe", r"C:\Program Files (x86)\Wireshark\tshark.exe"]:
-                print(f"  - {path}: {'Existe' if os.path.isfile(path) else 'No existe'}")
+        if not find_tshark_path():
             return []
-        
-        # Detectar el sistema operativo para adaptar el comando
-        system = platform.system()
-        
-        if system == "Windows":
-            # En Windows, usamos el comando de tshark para listar interfaces
-            process = subprocess.Popen(
-                [tshark_path, "-D"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            stdout, stderr = process.communicate()
-            
-            if process.returncode != 0:
-                print(f"Error al ejecutar tshark: {stderr}")
-                return []
-            
-            interfaces = []
-            for line in stdout.splitlines():
-                if line.strip():
-                    parts = line.split('.')
-                    if len(parts) >= 2:
-                        index = parts[0].strip()
-                        name = '.'.join(parts[1:]).strip()
-                        interfaces.append({
-                            "id": index,
-                            "name": name
-                        })
-            return interfaces
-        
-        else:
-            # En Unix/Linux, podemos usar directamente pyshark
-            try:
-                interfaces = []
-                for iface in pyshark.LiveCapture().interfaces:
-                    interfaces.append({
-                        "id": iface,
-                        "name": iface
-                    })
-                return interfaces
-            except Exception as e:
-                print(f"Error al obtener interfaces con PyShark: {e}")
-                
-                # Intentar con tshark como respaldo
-                process = subprocess.Popen(
-                    [tshark_path, "-D"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                stdout, stderr = process.communicate()
-                
-                if process.returncode != 0:
-                    print(f"Error al ejecutar tshark: {stderr}")
-                    return []
-                
-                interfaces = []
-                for line in stdout.splitlines():
-                    if line.strip():
-                        parts = line.split('.')
-                        if len(parts) >= 2:
-                            index = parts[0].strip()
-                            name = '.'.join(parts[1:]).strip()
-                            interfaces.append({
-                                "id": index,
-                                "name": name
-                            })
-                return interfaces
-            
+        return get_tshark_runtime().interfaces(refresh=refresh)
     except Exception as e:
         print(f"Error al obtener interfaces de red: {e}")
         return []
 
-def capture_packets(interface_id, duration=60, output_file=None, packet_count=None, display_filter=None):
+# Opciones de búfer circular admitidas por tshark y dumpcap (-b clave:valor)
+RING_BUFFER_OPTIONS = ("filesize", "duration", "files")
+
+def capture_binary(backend=None):
+    """
+    Ejecutable con el que capturar.
+    
+    dumpcap captura sin cargar los disectores de tshark y pierde menos paquetes a
+    tasas altas; se usa si está disponible salvo CAPTURE_BACKEND=tshark.
+    
+    Args:
+        backend (str, opcional): 'auto', 'dumpcap' o 'tshark'. Por defecto CAPTURE_BACKEND.
+        
+    Returns:
+        str: Ruta al ejecutable o None si no se encuentra ninguno.
+    """
+    backend = (backend or os.getenv('CAPTURE_BACKEND', 'auto')).lower()
+    runtime = get_tshark_runtime()
+    if backend in ('auto', 'dumpcap'):
+        dumpcap_path = runtime.dumpcap_path()
+        if dumpcap_path:
+            return dumpcap_path
+        if backend == 'dumpcap':
+            print("dumpcap no está disponible: se captura con tshark")
+    return runtime.tshark_path()
+
+def is_dumpcap(binary_path):
+    """Indica si el ejecutable es dumpcap"""
+    return os.path.basename(binary_path).lower().startswith("dumpcap")
+
+def build_capture_command(binary_path, interface_id, output_file, duration=None, packet_count=None,
+                          capture_filter=None, ring_buffer=None, pcap_format=False, snaplen=None):
+    """
+    Construye la línea de comandos de tshark o dumpcap para capturar en un archivo.
+    
+    Args:
+        binary_path (str): Ruta al ejecutable de TShark o dumpcap.
+        interface_id (str): ID de la interfaz de red.
+        output_file (str): Ruta del archivo PCAP de salida ("-": salida estándar).
+        duration (int, opcional): Duración máxima de la captura en segundos.
+        packet_count (int, opcional): Número máximo de paquetes a capturar.
+        capture_filter (str, opcional): Filtro de captura (sintaxis BPF).
+        ring_buffer (dict, opcional): Búfer circular: filesize (kB), duration (s) y/o
+            files (máximo de archivos conservados). Cada archivo se nombra
+            <base>_<número>_<fecha><extensión>.
+        pcap_format (bool): Escribir PCAP clásico en lugar de PCAPNG.
+        snaplen (int, opcional): Bytes capturados de cada paquete (sin él, el paquete completo).
+        
+    Returns:
+        list: Argumentos del comando.
+    """
+    command = [binary_path, "-i", interface_id, "-w", output_file]
+    
+    if pcap_format:
+        command.extend(["-P"] if is_dumpcap(binary_path) else ["-F", "pcap"])
+    
+    if capture_filter:
+        command.extend(["-f", capture_filter])
+    
+    if snaplen:
+        command.extend(["-s", str(int(snaplen))])
+        
+    # Añadir límite de paquetes si se especifica
+    if packet_count:
+        command.extend(["-c", str(packet_count)])
+        
+    # Añadir límite de duración si se especifica y no hay límite de paquetes,
+    # o si se especifican ambos (tshark se detendrá con la primera condición)
+    if duration:
+        command.extend(["-a", f"duration:{duration}"])
+    
+    for option in RING_BUFFER_OPTIONS:
+        if ring_buffer and ring_buffer.get(option):
+            command.extend(["-b", f"{option}:{int(ring_buffer[option])}"])
+    
+    return command
+
+def capture_packets(interface_id, duration=60, output_file=None, packet_count=None, capture_filter=None,
+                    snaplen=None):
     """
     Captura paquetes de una interfaz de red específica.
     
@@ -143,14 +121,15 @@ def capture_packets(interface_id, duration=60, output_file=None, packet_count=No
         duration (int): Duración de la captura en segundos (por defecto: 60).
         output_file (str, opcional): Ruta del archivo donde guardar la captura.
         packet_count (int, opcional): Número máximo de paquetes a capturar.
-        display_filter (str, opcional): Filtro de visualización para la captura.
+        capture_filter (str, opcional): Filtro de captura (BPF), aplicado en el kernel.
+        snaplen (int, opcional): Bytes capturados de cada paquete. Por defecto CAPTURE_SNAPLEN.
         
     Returns:
         str: Ruta al archivo PCAP generado o None si hubo un error.
     """
     try:
-        # Buscar TShark
-        tshark_path = find_tshark_path()
+        # Buscar dumpcap o TShark
+        tshark_path = capture_binary()
         if not tshark_path:
             print("Error: No se pudo encontrar TShark para la captura.")
             return None
@@ -165,26 +144,23 @@ def capture_packets(interface_id, duration=60, output_file=None, packet_count=No
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             output_file = os.path.join(pcap_dir, f"capture_{timestamp}.pcap")
         
-        print(f"Usando TShark en: {tshark_path}")
+        print(f"Capturando con: {tshark_path}")
         
-        # Configurar opciones para la captura usando tshark directamente
-        command = [tshark_path, "-i", interface_id, "-w", output_file]
+        # Un filtro mal escrito se detecta antes de lanzar la captura
+        snaplen = default_snaplen(snaplen)
+        try:
+            compile_capture_filter(interface_id, capture_filter, snaplen)
+        except CaptureFilterError as e:
+            print(f"Error: {e}")
+            return None
         
-        if display_filter:
-            command.extend(["-f", display_filter])
-            
-        # Añadir límite de paquetes si se especifica
-        if packet_count:
-            command.extend(["-c", str(packet_count)])
-            
-        # Añadir límite de duración si se especifica y no hay límite de paquetes,
-        # o si se especifican ambos (tshark se detendrá con la primera condición)
-        if duration:
-             command.extend(["-a", f"duration:{duration}"])
+        # Configurar opciones para la captura
+        command = build_capture_command(tshark_path, interface_id, output_file, duration, packet_count,
+                                        capture_filter, snaplen=snaplen)
             
         print(f"Ejecutando comando: {' '.join(command)}")
         
-        # Iniciar la captura con tshark
+        # Iniciar la captura
         process = subprocess.Popen(
             command,
             stdout=subprocess.PIPE,
@@ -0,0 +1,276 @@
+"""
+Entorno de ejecución de TShark.
+
+Localiza una sola vez los ejecutables de Wireshark (tshark y dumpcap), comprueba
+su versión y guarda el resultado; antes cada listado de interfaces o captura
+volvía a lanzar `tshark -v` y, en Linux, pyshark lanzaba tshark otra vez para
+listar las interfaces.
+
+La lista de interfaces se guarda en caché durante TSHARK_INTERFACES_TTL
+segundos. Al caducar se sigue sirviendo la lista anterior mientras se
+actualiza en segundo plano, de modo que listar interfaces es inmediato salvo
+la primera vez (el servidor la precalienta al arrancar). Se lista con
+`dumpcap -D` si está disponible, que no carga los disectores de tshark.
+
+También expone las capacidades del entorno: disponibilidad y versión de
+dumpcap y los tipos de enlace que admite cada interfaz (`-L`, en caché).
+"""
+import os
+import re
+import sys
+import shutil
+import threading
+import subprocess
+import time
+
+# Segundos que se considera vigente la lista de interfaces
+TSHARK_INTERFACES_TTL = float(os.getenv('TSHARK_INTERFACES_TTL', 300))
+
+# Tiempo máximo de las consultas a tshark/dumpcap (versión, interfaces, tipos de enlace)
+TSHARK_PROBE_TIMEOUT = float(os.getenv('TSHARK_PROBE_TIMEOUT', 15))
+
+_WINDOWS_DIRS = [r"C:\Program Files\Wireshark", r"C:\Program Files (x86)\Wireshark"]
+_UNIX_DIRS = ["/usr/bin", "/usr/local/bin", "/opt/wireshark/bin", "/usr/sbin"]
+
+_VERSION_RE = re.compile(r'(\d+\.\d+\.\d+)')
+_INTERFACE_RE = re.compile(r'^(\d+)\.\s+(\S+)(?:\s+\((.*)\))?\s*$')
+_LINK_TYPE_RE = re.compile(r'^\s+(\S+)(?:\s+\((.*)\))?')
+
+
+class TsharkRuntimeError(Exception):
+    """No se pudo consultar tshark/dumpcap"""
+    pass
+
+
+def _executable(name):
+    return f"{name}.exe" if sys.platform == "win32" else name
+
+
+def _candidates(name, near=None):
+    """Rutas posibles de un ejecutable de Wireshark, en orden de preferencia"""
+    override = os.getenv(f"{name.upper()}_PATH")
+    if override:
+        return [override]
+    executable = _executable(name)
+    candidates = []
+    found = shutil.which(executable)
+    if found:
+        candidates.append(found)
+    if near:
+        candidates.append(os.path.join(os.path.dirname(near), executable))
+    for directory in (_WINDOWS_DIRS if sys.platform == "win32" else _UNIX_DIRS):
+        candidates.append(os.path.join(directory, executable))
+    return candidates
+
+
+def _run(command):
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, timeout=TSHARK_PROBE_TIMEOUT)
+    if result.returncode != 0:
+        raise TsharkRuntimeError(result.stderr.strip() or f"{command[0]} terminó con código {result.returncode}")
+    return result.stdout
+
+
+def _probe(name, near=None):
+    """Primera ruta del ejecutable que responde a -v, con su versión"""
+    for path in _candidates(name, near):
+        if not os.path.isfile(path):
+            continue
+        try:
+            output = _run([path, "-v"])
+        except (OSError, subprocess.SubprocessError, TsharkRuntimeError):
+            continue
+        match = _VERSION_RE.search(output.splitlines()[0] if output else "")
+        return {"path": path, "version": match.group(1) if match else None}
+    return None
+
+
+def parse_interfaces(output):
+    """
+    Interpreta la salida de `tshark -D` / `dumpcap -D`.
+
+    En Windows el identificador es el índice (como espera tshark -i) y el nombre el
+    dispositivo con su descripción; en el resto el identificador y el nombre son el
+    dispositivo, como los devolvía pyshark.
+    """
+    interfaces = []
+    for line in output.splitlines():
+        match = _INTERFACE_RE.match(line.strip())
+        if not match:
+            continue
+        index, device, description = match.groups()
+        if sys.platform == "win32":
+            name = f"{device} ({description})" if description else device
+            interfaces.append({"id": index, "name": name, "device": device, "description": description})
+        else:
+            interfaces.append({"id": device, "name": device, "device": device, "description": description})
+    return interfaces
+
+
+def parse_link_types(output):
+    """Interpreta la salida de `-L`: lista de {name, description}"""
+    link_types = []
+    for line in output.splitlines():
+        match = _LINK_TYPE_RE.match(line)
+        if match:
+            link_types.append({"name": match.group(1), "description": match.group(2)})
+    return link_types
+
+
+class TsharkRuntime:
+    """Ejecutables de Wireshark resueltos una vez y caché de interfaces"""
+
+    def __init__(self, interfaces_ttl=None):
+        self.interfaces_ttl = TSHARK_INTERFACES_TTL if interfaces_ttl is None else interfaces_ttl
+        self._lock = threading.Lock()
+        self._interfaces_lock = threading.Lock()
+        self._binaries = None
+        self._interfaces = None
+        self._interfaces_at = 0.0
+        self._refreshing = False
+        self._link_types = {}
+        self.stats = {"probes": 0, "interface_listings": 0}
+
+    # Ejecutables
+
+    def binaries(self):
+        """{"tshark": {path, version} | None, "dumpcap": {path, version} | None}"""
+        if self._binaries is None:
+            with self._lock:
+                if self._binaries is None:
+                    self.stats["probes"] += 1
+                    tshark = _probe("tshark")
+                    dumpcap = _probe("dumpcap", near=tshark["path"] if tshark else None)
+                    if tshark:
+                        print(f"TShark {tshark['version']} en: {tshark['path']}")
+                    else:
+                        print("Error: No se pudo encontrar TShark. Asegúrate de que Wireshark esté instalado.")
+                    self._binaries = {"tshark": tshark, "dumpcap": dumpcap}
+        return self._binaries
+
+    def tshark_path(self):
+        tshark = self.binaries()["tshark"]
+        return tshark["path"] if tshark else None
+
+    def dumpcap_path(self):
+        dumpcap = self.binaries()["dumpcap"]
+        return dumpcap["path"] if dumpcap else None
+
+    def _lister(self):
+        """dumpcap lista interfaces y tipos de enlace sin cargar los disectores"""
+        path = self.dumpcap_path() or self.tshark_path()
+        if not path:
+            raise TsharkRuntimeError("No se pudo encontrar TShark")
+        return path
+
+    # Interfaces
+
+    def refresh_interfaces(self):
+        """Vuelve a listar las interfaces y actualiza la caché"""
+        with self._interfaces_lock:
+            self.stats["interface_listings"] += 1
+            interfaces = parse_interfaces(_run([self._lister(), "-D"]))
+            self._interfaces, self._interfaces_at = interfaces, time.monotonic()
+            return interfaces
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.refresh_interfaces()
+            except Exception as e:
+                print(f"Error al actualizar las interfaces de red: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name="tshark-interfaces", daemon=True).start()
+
+    def interfaces(self, refresh=False, wait=True):
+        """
+        Interfaces de red disponibles.
+
+        Args:
+            refresh (bool): Volver a listarlas aunque la caché esté vigente.
+            wait (bool): Sin lista en caché, esperar a obtenerla (False: devuelve None
+                y la obtiene en segundo plano).
+        """
+        if refresh:
+            return self.refresh_interfaces()
+        if self._interfaces is None:
+            if not wait:
+                self._refresh_in_background()
+                return None
+            return self.refresh_interfaces()
+        if time.monotonic() - self._interfaces_at > self.interfaces_ttl:
+            # Caducada: se sirve la anterior mientras se actualiza
+            self._refresh_in_background()
+        return self._interfaces
+
+    def interface_name(self, interface_id):
+        """
+        Nombre de la interfaz con el id indicado (el de la lista en caché).
+
+        El id es el dispositivo en Linux y el número de `tshark -D` en Windows;
+        si no está en la lista se devuelve el propio id.
+        """
+        for interface in self.interfaces(wait=False) or []:
+            if str(interface.get('id')) == str(interface_id):
+                return interface.get('name')
+        return str(interface_id)
+
+    def link_types(self, interface_id, refresh=False):
+        """Tipos de enlace que admite una interfaz (en caché por interfaz)"""
+        if refresh or interface_id not in self._link_types:
+            self._link_types[interface_id] = parse_link_types(_run([self._lister(), "-L", "-i", interface_id]))
+        return self._link_types[interface_id]
+
+    # Capacidades
+
+    def capabilities(self):
+        binaries = self.binaries()
+        interfaces = self._interfaces or []
+        return {
+            "tshark": binaries["tshark"],
+            "dumpcap": binaries["dumpcap"],
+            "dumpcap_available": binaries["dumpcap"] is not None,
+            "interface_count": len(interfaces),
+            "interfaces_age": round(time.monotonic() - self._interfaces_at, 1) if self._interfaces is not None else None,
+            "interfaces_ttl": self.interfaces_ttl,
+            "link_types": {interface_id: [t["name"] for t in types] for interface_id, types in self._link_types.items()},
+        }
+
+    def warm(self):
+        """Resuelve los ejecutables y lista las interfaces en segundo plano"""
+        def run():
+            try:
+                if self.tshark_path():
+                    self.interfaces()
+            except Exception as e:
+                print(f"Error al precalentar el entorno de TShark: {e}")
+
+        threading.Thread(target=run, name="tshark-warmup", daemon=True).start()
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_tshark_runtime():
+    """Entorno de TShark del proceso"""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = TsharkRuntime()
+    return _runtime
+
+
+def reset_tshark_runtime():
+    """Descarta lo resuelto (p. ej. tras instalar Wireshark o cambiar TSHARK_PATH)"""
+    global _runtime
+    with _runtime_lock:
+        _runtime = None
@@ -0,0 +1,412 @@
+"""
+Backends de analítica para las agregaciones de una sesión de captura.
+
+Las mismas consultas SQL se ejecutan sobre SQLite (motor por filas) o sobre
+DuckDB (motor columnar embebido), que lee el archivo SQLite directamente o los
+archivos Parquet generados por database.parquet_export como sidecar. El backend
+se elige con la variable de entorno ANALYTICS_BACKEND (sqlite | duckdb) y, si hay
+estadísticas precalculadas (database.session_stats), se responde desde ellas.
+"""
+import os
+
+from database.parquet_export import sidecar_path
+from database.seal import connect_readonly
+from database.tcp_flags import flag_sql, FLAG_PATTERNS
+
+try:
+    import duckdb
+except ImportError:  # duckdb es una dependencia opcional
+    duckdb = None
+
+# Columnas sobre las que se permite calcular rankings (top-K)
+TOP_VALUE_COLUMNS = ('src_ip', 'dst_ip', 'src_port', 'dst_port')
+
+
+class AnalyticsBackendError(Exception):
+    """Error al inicializar o consultar un backend de analítica"""
+    pass
+
+
+class AnalyticsBackend:
+    """
+    Agregaciones de sesión expresadas en SQL portable entre SQLite y DuckDB.
+
+    Las subclases implementan _relation() para indicar de dónde leer cada tabla
+    y _fetchall() para ejecutar la consulta.
+    """
+
+    name = None
+
+    def _relation(self, session_id, table):
+        raise NotImplementedError
+
+    def _fetchall(self, sql, params):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Índice entero del intervalo de tiempo de un paquete (parámetros: inicio, tamaño)
+    bucket_sql = "CAST((timestamp - ?) / ? AS INTEGER)"
+
+    def _query(self, sql, session_id, params=None):
+        """
+        Sustituye las tablas {packets}/{anomalies} por su relación y {bucket} por la
+        expresión de intervalo del motor, y ejecuta la consulta.
+
+        Los parámetros por defecto son (session_id,); si se indican, se pasan tal cual.
+        """
+        substitutions = {
+            table: self._relation(session_id, table)
+            for table in ('packets', 'anomalies') if f"{{{table}}}" in sql
+        }
+        if '{bucket}' in sql:
+            substitutions['bucket'] = self.bucket_sql
+        sql = sql.format(**substitutions)
+        return self._fetchall(sql, (session_id,) if params is None else tuple(params))
+
+    def protocol_counts(self, session_id):
+        """Número de paquetes por protocolo de transporte"""
+        rows = self._query("""
+            SELECT transport_protocol, COUNT(*) AS count
+            FROM {packets}
+            WHERE session_id = ?
+            GROUP BY transport_protocol
+            ORDER BY count DESC, transport_protocol ASC NULLS FIRST
+        """, session_id)
+        return {protocol: count for protocol, count in rows}
+
+    def flag_pattern_counts(self, session_id):
+        """Paquetes TCP que cumplen cada patrón de FLAG_PATTERNS, en una sola pasada"""
+        columns = ",\n".join(
+            f"SUM(CASE WHEN {flag_sql(set_flags, clear_flags)} THEN 1 ELSE 0 END)"
+            for set_flags, clear_flags in FLAG_PATTERNS.values()
+        )
+        rows = self._query(f"""
+            SELECT {columns}
+            FROM {{packets}}
+            WHERE session_id = ? AND tcp_flags_raw IS NOT NULL
+        """, session_id)
+        values = rows[0] if rows else (None,) * len(FLAG_PATTERNS)
+        return {name: int(count or 0) for name, count in zip(FLAG_PATTERNS, values)}
+
+    def tcp_flag_counts(self, session_id):
+        """Paquetes TCP con SYN (sin ACK), RST y FIN"""
+        counts = self.flag_pattern_counts(session_id)
+        return {name: counts[name] for name in ('syn_packets', 'rst_packets', 'fin_packets')}
+
+    def top_values(self, session_id, column, limit=10, exclude_null=False):
+        """
+        Valores más frecuentes de una columna de paquetes.
+
+        Returns:
+            list: Tuplas (valor, conteo) ordenadas por conteo descendente.
+        """
+        if column not in TOP_VALUE_COLUMNS:
+            raise AnalyticsBackendError(f"Columna no permitida para ranking: {column}")
+        null_filter = f"AND {column} IS NOT NULL" if exclude_null else ""
+        rows = self._query(f"""
+            SELECT {column}, COUNT(*) AS count
+            FROM {{packets}}
+            WHERE session_id = ? {null_filter}
+            GROUP BY {column}
+            ORDER BY count DESC, {column} ASC NULLS FIRST
+            LIMIT ?
+        """, session_id, (session_id, limit))
+        return [(value, count) for value, count in rows]
+
+    def time_bounds(self, session_id):
+        """Timestamps del primer y último paquete, o None si la sesión está vacía"""
+        rows = self._query("""
+            SELECT MIN(timestamp), MAX(timestamp)
+            FROM {packets}
+            WHERE session_id = ?
+        """, session_id)
+        if not rows or rows[0][0] is None:
+            return None
+        return rows[0][0], rows[0][1]
+
+    def size_stats(self, session_id):
+        """Tamaño medio, máximo y mínimo de los paquetes"""
+        rows = self._query("""
+            SELECT AVG(packet_length), MAX(packet_length), MIN(packet_length)
+            FROM {packets}
+            WHERE session_id = ?
+        """, session_id)
+        return rows[0] if rows else (None, None, None)
+
+    def anomaly_counts(self, session_id):
+        """Número de anomalías por tipo"""
+        rows = self._query("""
+            SELECT type, COUNT(*) AS count
+            FROM {anomalies}
+            WHERE session_id = ?
+            GROUP BY type
+            ORDER BY count DESC, type ASC
+        """, session_id)
+        return [(anomaly_type, count) for anomaly_type, count in rows]
+
+    def length_histogram(self, session_id):
+        """Paquetes por tamaño, ordenados por tamaño (para calcular percentiles)"""
+        rows = self._query("""
+            SELECT packet_length, COUNT(*) AS count
+            FROM {packets}
+            WHERE session_id = ? AND packet_length IS NOT NULL
+            GROUP BY packet_length
+            ORDER BY packet_length
+        """, session_id)
+        return [(length, count) for length, count in rows]
+
+    def ttl_histogram(self, session_id):
+        """Paquetes por valor de TTL IP"""
+        rows = self._query("""
+            SELECT ip_ttl, COUNT(*) AS count
+            FROM {packets}
+            WHERE session_id = ? AND ip_ttl IS NOT NULL
+            GROUP BY ip_ttl
+            ORDER BY ip_ttl
+        """, session_id)
+        return [(ttl, count) for ttl, count in rows]
+
+    def fragmentation_counts(self, session_id):
+        """Paquetes fragmentados, diminutos (< 60 bytes) y jumbo (> 1500 bytes)"""
+        rows = self._query("""
+            SELECT
+                SUM(CASE WHEN ip_flag_mf = 1 OR ip_fragment_offset > 0 THEN 1 ELSE 0 END),
+                SUM(CASE WHEN packet_length < 60 THEN 1 ELSE 0 END),
+                SUM(CASE WHEN packet_length > 1500 THEN 1 ELSE 0 END)
+            FROM {packets}
+            WHERE session_id = ?
+        """, session_id)
+        fragmented, tiny, jumbo = rows[0] if rows else (None, None, None)
+        return {
+            "fragmented_packets": int(fragmented or 0),
+            "tiny_packets": int(tiny or 0),
+            "jumbo_packets": int(jumbo or 0),
+        }
+
+    def byte_count(self, session_id):
+        """Suma de los tamaños de los paquetes de la sesión"""
+        rows = self._query("""
+            SELECT SUM(packet_length)
+            FROM {packets}
+            WHERE session_id = ?
+        """, session_id)
+        return int(rows[0][0] or 0) if rows else 0
+
+    def distinct_count(self, session_id, column):
+        """Número de valores distintos (no nulos) de una columna de paquetes"""
+        if column not in TOP_VALUE_COLUMNS:
+            raise AnalyticsBackendError(f"Columna no permitida para conteo: {column}")
+        rows = self._query(f"""
+            SELECT COUNT(DISTINCT {column})
+            FROM {{packets}}
+            WHERE session_id = ?
+        """, session_id)
+        return int(rows[0][0] or 0) if rows else 0
+
+    def port_scanners(self, session_id, min_ports=50):
+        """
+        IPs origen que contactan más de min_ports puertos destino distintos.
+
+        Returns:
+            list: Tuplas (ip, puertos únicos, paquetes) ordenadas por IP.
+        """
+        rows = self._query("""
+            SELECT src_ip, COUNT(DISTINCT dst_port) AS unique_ports, COUNT(*) AS total_packets
+            FROM {packets}
+            WHERE session_id = ? AND dst_port IS NOT NULL AND src_ip IS NOT NULL
+            GROUP BY src_ip
+            HAVING COUNT(DISTINCT dst_port) > ?
+            ORDER BY src_ip
+        """, session_id, (session_id, min_ports))
+        return [(ip, unique_ports, packets) for ip, unique_ports, packets in rows]
+
+    def interval_counts(self, session_id, start, interval_size=10):
+        """
+        Paquetes por intervalo de interval_size segundos desde start.
+
+        Returns:
+            list: Conteos de los intervalos con tráfico, en orden temporal.
+        """
+        rows = self._query("""
+            SELECT {bucket} AS interval_key, COUNT(*) AS count
+            FROM {packets}
+            WHERE session_id = ?
+            GROUP BY interval_key
+            ORDER BY interval_key
+        """, session_id, (start, interval_size, session_id))
+        return [count for _, count in rows]
+
+    def interval_summary(self, session_id, interval_size=10):
+        """Número de intervalos con tráfico y máximo y media de paquetes por intervalo"""
+        bounds = self.time_bounds(session_id)
+        intervals = self.interval_counts(session_id, bounds[0], interval_size) if bounds else []
+        return {
+            "interval_seconds": interval_size,
+            "intervals": len(intervals),
+            "max_packets": max(intervals) if intervals else 0,
+            "average_packets": sum(intervals) / len(intervals) if intervals else 0,
+        }
+
+    def asymmetric_pairs(self, session_id, min_packets=100, min_ratio=50):
+        """
+        Pares (origen, destino) con mucho más tráfico de ida que de vuelta.
+
+        Returns:
+            list: Tuplas (src_ip, dst_ip, paquetes de ida, paquetes de vuelta).
+        """
+        rows = self._query("""
+            WITH pairs AS (
+                SELECT src_ip, dst_ip, COUNT(*) AS packets
+                FROM {packets}
+                WHERE session_id = ?
+                GROUP BY src_ip, dst_ip
+            )
+            SELECT a.src_ip, a.dst_ip, a.packets, COALESCE(b.packets, 0) AS inbound
+            FROM pairs a
+            LEFT JOIN pairs b ON b.src_ip = a.dst_ip AND b.dst_ip = a.src_ip
+            WHERE a.packets > ? AND (b.packets IS NULL OR a.packets > ? * b.packets)
+            ORDER BY a.packets DESC, a.src_ip ASC NULLS FIRST, a.dst_ip ASC NULLS FIRST
+        """, session_id, (session_id, min_packets, min_ratio))
+        return [(src, dst, outbound, inbound) for src, dst, outbound, inbound in rows]
+
+    def session_analytics(self, session_id):
+        """Resumen estadístico de la sesión tal y como lo devuelve /analytics/{session_id}"""
+        protocol_data = self.protocol_counts(session_id)
+        top_src_ips = self.top_values(session_id, 'src_ip', 10)
+        top_dst_ips = self.top_values(session_id, 'dst_ip', 10)
+        anomaly_distribution = self.anomaly_counts(session_id)
+        return {
+            "session_id": session_id,
+            "protocol_distribution": protocol_data,
+            "top_source_ips": [{"ip": ip, "count": count} for ip, count in top_src_ips],
+            "top_destination_ips": [{"ip": ip, "count": count} for ip, count in top_dst_ips],
+            "anomaly_distribution": [{"type": type_, "count": count} for type_, count in anomaly_distribution],
+            "total_packets": sum(protocol_data.values())
+        }
+
+
+class SQLiteAnalytics(AnalyticsBackend):
+    """Agregaciones ejecutadas directamente sobre el archivo SQLite de la captura"""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = connect_readonly(db_path)
+
+    def _relation(self, session_id, table):
+        return table
+
+    def _fetchall(self, sql, params):
+        return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+class DuckDBAnalytics(AnalyticsBackend):
+    """
+    Agregaciones ejecutadas con DuckDB.
+
+    Si existe un sidecar Parquet de la tabla para la sesión (o el archivo al que
+    la retención movió sus paquetes) se lee ese archivo; en caso contrario se
+    adjunta el archivo SQLite en modo solo lectura.
+    """
+
+    name = 'duckdb'
+
+    def __init__(self, db_path, sidecar_dir=None, archive_dir=None):
+        if duckdb is None:
+            raise AnalyticsBackendError("duckdb no está instalado (pip install duckdb)")
+        self.db_path = db_path
+        self.sidecar_dir = sidecar_dir or os.getenv('ANALYTICS_SIDECAR_DIRECTORY', os.getenv('EXPORT_DIRECTORY', './data/exports'))
+        self.archive_dir = archive_dir or os.getenv('ARCHIVE_DIRECTORY', './data/archive')
+        self.conn = duckdb.connect()
+        self._attached = False
+        self._attach_error = None
+        self._fallback = None
+
+    def _attach(self):
+        if self._attach_error:
+            raise AnalyticsBackendError(self._attach_error)
+        if not self._attached:
+            try:
+                self.conn.execute(f"ATTACH '{_quote(self.db_path)}' AS capture_db (TYPE sqlite, READ_ONLY)")
+            except Exception as e:
+                self._attach_error = f"DuckDB no pudo adjuntar la base de datos SQLite: {e}"
+                raise AnalyticsBackendError(self._attach_error)
+            self._attached = True
+
+    # CAST redondea en DuckDB; el intervalo debe truncarse como en SQLite
+    bucket_sql = "CAST(FLOOR((timestamp - ?) / ?) AS BIGINT)"
+
+    def _query(self, sql, session_id, params=None):
+        try:
+            return super()._query(sql, session_id, params)
+        except AnalyticsBackendError as e:
+            # Sin sidecar ni extensión sqlite de DuckDB: la consulta se resuelve con SQLite
+            if self._fallback is None:
+                print(f"{e}. Usando SQLite para las tablas sin sidecar Parquet.")
+                self._fallback = SQLiteAnalytics(self.db_path)
+            return self._fallback._query(sql, session_id, params)
+
+    def _relation(self, session_id, table):
+        # Sidecar de exportación o, si los paquetes se archivaron, el archivo de retención
+        for directory in (self.sidecar_dir, self.archive_dir):
+            path = sidecar_path(self.db_path, session_id, table, directory)
+            if os.path.exists(path):
+                return f"read_parquet('{_quote(path)}')"
+        self._attach()
+        return f"capture_db.{table}"
+
+    def _fetchall(self, sql, params):
+        return self.conn.execute(sql, list(params)).fetchall()
+
+    def close(self):
+        self.conn.close()
+        if self._fallback is not None:
+            self._fallback.close()
+
+
+def _quote(value):
+    """Escapa comillas simples para literales SQL"""
+    return value.replace("'", "''")
+
+
+def get_analytics_backend(db_path, backend=None, use_stats=None):
+    """
+    Crea el backend de analítica configurado para una base de datos.
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite de la captura.
+        backend (str, opcional): 'sqlite' o 'duckdb'. Por defecto ANALYTICS_BACKEND.
+        use_stats (bool, opcional): Responder desde la tabla session_stats cuando
+            existan estadísticas precalculadas. Por defecto USE_SESSION_STATS.
+
+    Returns:
+        AnalyticsBackend: Backend listo para consultar. Si DuckDB no está
+        disponible se usa SQLite.
+    """
+    from database.session_stats import StatsAnalytics, use_session_stats
+
+    backend = (backend or os.getenv('ANALYTICS_BACKEND', 'sqlite')).lower()
+    live = None
+    if backend == 'duckdb':
+        try:
+            live = DuckDBAnalytics(db_path)
+        except AnalyticsBackendError as e:
+            print(f"Backend de analítica DuckDB no disponible, usando SQLite: {e}")
+    if live is None:
+        live = SQLiteAnalytics(db_path)
+
+    if use_stats is None:
+        use_stats = use_session_stats()
+    return StatsAnalytics(db_path, live) if use_stats else live
@@ -0,0 +1,581 @@
+"""
+Catálogo de las bases de datos de captura de DATABASE_DIRECTORY.
+
+Cada archivo .db procesado se registra en una base de datos de catálogo
+independiente (CATALOG_PATH) con su tamaño, fecha de modificación, hash,
+rango temporal, conteos y el resumen de sus sesiones. Las API consultan el
+catálogo en lugar de recorrer el directorio y abrir cada archivo en cada
+petición. El catálogo se actualiza al terminar una ingesta y mediante un
+escaneo que reconcilia el directorio (archivos nuevos, modificados o borrados).
+Las bases de datos selladas (database.seal) se marcan como tales y su hash es
+el checksum registrado al sellarlas.
+"""
+import os
+import glob
+import time
+import hashlib
+import threading
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, inspect, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Index, or_
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+
+from database.engine_cache import invalidate_engine
+from database.frame_store import invalidate_frame_reader
+from database.seal import connect_readonly, read_seal
+
+CatalogBase = declarative_base()
+
+# Columnas por las que se puede ordenar el listado de bases de datos
+SORT_COLUMNS = {
+    'name': 'file_name',
+    'modified': 'mtime',
+    'size': 'size_bytes',
+    'packets': 'packet_count',
+    'sessions': 'session_count',
+    'anomalies': 'anomaly_count',
+    'first_timestamp': 'first_timestamp',
+    'last_timestamp': 'last_timestamp',
+}
+
+
+class CatalogDatabase(CatalogBase):
+    """Archivo de base de datos de captura registrado en el catálogo"""
+    __tablename__ = 'capture_databases'
+    __table_args__ = (
+        Index('ix_capture_databases_mtime', 'mtime'),
+        Index('ix_capture_databases_time_range', 'first_timestamp', 'last_timestamp'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    file_name = Column(String(255), nullable=False, unique=True)
+    path = Column(String(1024), nullable=False)
+    size_bytes = Column(Integer, default=0)
+    mtime = Column(Float, nullable=False)              # Fecha de modificación del archivo (epoch)
+    content_hash = Column(String(64), nullable=True)   # SHA-256 del archivo
+    session_count = Column(Integer, default=0)
+    packet_count = Column(Integer, default=0)
+    anomaly_count = Column(Integer, default=0)
+    first_timestamp = Column(Float, nullable=True)     # Primer paquete de todas las sesiones
+    last_timestamp = Column(Float, nullable=True)      # Último paquete de todas las sesiones
+    sealed = Column(Boolean, default=False)            # Archivo sellado (solo lectura, inmutable)
+    sealed_at = Column(DateTime, nullable=True)
+    indexed_at = Column(DateTime, default=datetime.now)
+
+    sessions = relationship("CatalogSession", back_populates="database", cascade="all, delete-orphan",
+                            order_by="CatalogSession.session_id")
+
+    def to_dict(self, include_sessions=False):
+        data = {
+            "name": self.file_name,
+            "path": self.path,
+            "size_bytes": self.size_bytes,
+            "size_kb": round(self.size_bytes / 1024, 2),
+            "modified": datetime.fromtimestamp(self.mtime).strftime("%Y-%m-%d %H:%M:%S"),
+            "content_hash": self.content_hash,
+            "session_count": self.session_count,
+            "packet_count": self.packet_count,
+            "anomaly_count": self.anomaly_count,
+            "first_timestamp": self.first_timestamp,
+            "last_timestamp": self.last_timestamp,
+            "sealed": bool(self.sealed),
+            "sealed_at": self.sealed_at.isoformat() if self.sealed_at else None,
+            "indexed_at": self.indexed_at.isoformat() if self.indexed_at else None,
+        }
+        if include_sessions:
+            data["sessions"] = [session.to_dict() for session in self.sessions]
+        return data
+
+    def __repr__(self):
+        return f"<CatalogDatabase(id={self.id}, file={self.file_name})>"
+
+
+class CatalogSession(CatalogBase):
+    """Resumen de una sesión de captura contenida en una base de datos del catálogo"""
+    __tablename__ = 'catalog_sessions'
+    __table_args__ = (
+        Index('ix_catalog_sessions_database', 'database_id', 'session_id'),
+        Index('ix_catalog_sessions_time_range', 'first_timestamp', 'last_timestamp'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    database_id = Column(Integer, ForeignKey('capture_databases.id'), nullable=False)
+    session_id = Column(Integer, nullable=False)
+    file_name = Column(String(255), nullable=True)     # Nombre del PCAP de origen
+    interface = Column(String(100), nullable=True)
+    capture_date = Column(DateTime, nullable=True)
+    status = Column(String(50), nullable=True)
+    packet_count = Column(Integer, default=0)
+    anomaly_count = Column(Integer, default=0)
+    first_timestamp = Column(Float, nullable=True)
+    last_timestamp = Column(Float, nullable=True)
+
+    database = relationship("CatalogDatabase", back_populates="sessions")
+
+    def to_dict(self):
+        return {
+            "db_file": self.database.file_name if self.database else None,
+            "session_id": self.session_id,
+            "file_name": self.file_name,
+            "interface": self.interface,
+            "capture_date": self.capture_date.isoformat() if self.capture_date else None,
+            "status": self.status,
+            "packet_count": self.packet_count,
+            "anomaly_count": self.anomaly_count,
+            "first_timestamp": self.first_timestamp,
+            "last_timestamp": self.last_timestamp,
+        }
+
+    def __repr__(self):
+        return f"<CatalogSession(database_id={self.database_id}, session_id={self.session_id})>"
+
+
+# Segundos durante los que latest_database_path no vuelve a reconciliar un directorio
+CATALOG_RECONCILE_MIN_INTERVAL = float(os.getenv('CATALOG_RECONCILE_MIN_INTERVAL', 60))
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+# Última reconciliación de cada (directorio, catálogo), en time.monotonic()
+_last_reconcile = {}
+
+
+def get_database_directory():
+    """Directorio de las bases de datos de captura"""
+    return os.getenv('DATABASE_DIRECTORY', './data/db_files')
+
+
+def get_catalog_path():
+    """Ruta del catálogo (fuera del patrón *.db para que no se catalogue a sí mismo)"""
+    return os.getenv('CATALOG_PATH', './data/catalog.sqlite')
+
+
+def hash_files_enabled():
+    """Indica si se calcula el SHA-256 de cada base de datos al catalogarla"""
+    return os.getenv('CATALOG_HASH_FILES', 'true').lower() == 'true'
+
+
+def get_catalog_engine(catalog_path=None):
+    """Motor SQLAlchemy del catálogo (uno por ruta y proceso), creando las tablas si faltan"""
+    catalog_path = os.path.abspath(catalog_path or get_catalog_path())
+    with _engines_lock:
+        engine = _engines.get(catalog_path)
+        if engine is None:
+            os.makedirs(os.path.dirname(catalog_path), exist_ok=True)
+            engine = create_engine(f'sqlite:///{catalog_path}', connect_args={'timeout': 30})
+
+            # WAL: la ingesta (otro proceso) puede escribir mientras las API leen
+            @event.listens_for(engine, "connect")
+            def _set_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA foreign_keys=ON")
+                cursor.close()
+
+            CatalogBase.metadata.create_all(engine)
+            _add_missing_columns(engine)
+            _engines[catalog_path] = engine
+    return engine
+
+
+def _add_missing_columns(engine):
+    """Añade a un catálogo existente las columnas nuevas (create_all no altera tablas)"""
+    inspector = inspect(engine)
+    for table in CatalogBase.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+
+def get_catalog_session(catalog_path=None):
+    """Crea una sesión SQLAlchemy sobre el catálogo"""
+    return sessionmaker(bind=get_catalog_engine(catalog_path))()
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-256 de un archivo leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _parse_datetime(value):
+    """Convierte un DATETIME de SQLite (texto) en datetime"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def read_database_summary(db_path):
+    """
+    Lee el resumen de las sesiones de una base de datos de captura.
+
+    Usa session_stats si existe y agrega los paquetes en vivo en caso contrario.
+
+    Returns:
+        list: Un diccionario por sesión con los campos de CatalogSession.
+    """
+    conn = connect_readonly(db_path)
+    try:
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'capture_sessions' not in tables:
+            return []
+
+        stats = {}
+        if 'session_stats' in tables:
+            for session_id, first_ts, last_ts, packets in conn.execute(
+                "SELECT session_id, first_timestamp, last_timestamp, packet_count FROM session_stats"
+            ):
+                stats[session_id] = (first_ts, last_ts, packets)
+
+        anomalies = {}
+        if 'anomalies' in tables:
+            anomalies = dict(conn.execute(
+                "SELECT session_id, COUNT(*) FROM anomalies WHERE session_id IS NOT NULL GROUP BY session_id"
+            ).fetchall())
+
+        sessions = []
+        for session_id, file_name, interface, capture_date, status, packet_count in conn.execute(
+            "SELECT id, file_name, interface, capture_date, status, packet_count FROM capture_sessions ORDER BY id"
+        ).fetchall():
+            if session_id in stats:
+                first_ts, last_ts, packets = stats[session_id]
+            else:
+                first_ts, last_ts, packets = conn.execute(
+                    "SELECT MIN(timestamp), MAX(timestamp), COUNT(*) FROM packets WHERE session_id = ?",
+                    (session_id,)
+                ).fetchone()
+            sessions.append({
+                "session_id": session_id,
+                "file_name": file_name,
+                "interface": interface,
+                "capture_date": _parse_datetime(capture_date),
+                "status": status,
+                "packet_count": packets if packets is not None else (packet_count or 0),
+                "anomaly_count": anomalies.get(session_id, 0),
+                "first_timestamp": first_ts,
+                "last_timestamp": last_ts,
+            })
+        return sessions
+    finally:
+        conn.close()
+
+
+def index_database(db_path, catalog_path=None, compute_hash=None):
+    """
+    Registra (o actualiza) una base de datos de captura en el catálogo.
+
+    Args:
+        db_path (str): Ruta al archivo .db de la captura.
+        catalog_path (str, opcional): Ruta del catálogo. Por defecto CATALOG_PATH.
+        compute_hash (bool, opcional): Calcular el SHA-256. Por defecto CATALOG_HASH_FILES.
+
+    Returns:
+        dict: Entrada del catálogo con el resumen de sus sesiones.
+    """
+    if compute_hash is None:
+        compute_hash = hash_files_enabled()
+    stat = os.stat(db_path)
+    seal = read_seal(db_path)
+    sessions = read_database_summary(db_path)
+    first_timestamps = [s["first_timestamp"] for s in sessions if s["first_timestamp"] is not None]
+    last_timestamps = [s["last_timestamp"] for s in sessions if s["last_timestamp"] is not None]
+
+    db_session = get_catalog_session(catalog_path)
+    try:
+        file_name = os.path.basename(db_path)
+        entry = db_session.query(CatalogDatabase).filter(CatalogDatabase.file_name == file_name).first()
+        if entry is None:
+            entry = CatalogDatabase(file_name=file_name)
+            db_session.add(entry)
+        entry.path = os.path.abspath(db_path)
+        entry.size_bytes = stat.st_size
+        entry.mtime = stat.st_mtime
+        if seal is not None:
+            # El checksum del sellado ya es el SHA-256 del archivo
+            entry.content_hash = seal.get("checksum")
+        else:
+            entry.content_hash = file_hash(db_path) if compute_hash else None
+        entry.sealed = seal is not None
+        entry.sealed_at = _parse_datetime(seal.get("sealed_at")) if seal else None
+        entry.session_count = len(sessions)
+        entry.packet_count = sum(s["packet_count"] for s in sessions)
+        entry.anomaly_count = sum(s["anomaly_count"] for s in sessions)
+        entry.first_timestamp = min(first_timestamps) if first_timestamps else None
+        entry.last_timestamp = max(last_timestamps) if last_timestamps else None
+        entry.indexed_at = datetime.now()
+        entry.sessions = [CatalogSession(**session) for session in sessions]
+        db_session.commit()
+        return entry.to_dict(include_sessions=True)
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+
+def remove_database(file_name, catalog_path=None):
+    """Elimina una base de datos del catálogo. Devuelve True si existía"""
+    db_session = get_catalog_session(catalog_path)
+    try:
+        entry = db_session.query(CatalogDatabase).filter(CatalogDatabase.file_name == file_name).first()
+        if entry is None:
+            return False
+        db_session.delete(entry)
+        db_session.commit()
+        return True
+    finally:
+        db_session.close()
+
+
+def reconcile_catalog(db_dir=None, catalog_path=None):
+    """
+    Sincroniza el catálogo con el contenido del directorio de bases de datos.
+
+    Cataloga los archivos nuevos o cuyo tamaño/fecha han cambiado y elimina las
+    entradas de archivos que ya no existen.
+
+    Returns:
+        dict: Nombres de los archivos añadidos, actualizados, eliminados y con error.
+    """
+    db_dir = db_dir or get_database_directory()
+    summary = {"added": [], "updated": [], "removed": [], "errors": []}
+    on_disk = {}
+    if os.path.isdir(db_dir):
+        for entry in os.scandir(db_dir):
+            if entry.is_file() and entry.name.endswith('.db'):
+                on_disk[entry.name] = entry
+
+    db_session = get_catalog_session(catalog_path)
+    try:
+        known = {
+            file_name: (size, mtime)
+            for file_name, size, mtime in db_session.query(
+                CatalogDatabase.file_name, CatalogDatabase.size_bytes, CatalogDatabase.mtime
+            )
+        }
+    finally:
+        db_session.close()
+
+    for file_name, entry in sorted(on_disk.items()):
+        stat = entry.stat()
+        if file_name in known and known[file_name] == (stat.st_size, stat.st_mtime):
+            continue
+        try:
+            index_database(entry.path, catalog_path)
+            summary["updated" if file_name in known else "added"].append(file_name)
+        except Exception as e:
+            print(f"Error al catalogar {entry.path}: {e}")
+            summary["errors"].append(file_name)
+
+    for file_name in sorted(set(known) - set(on_disk)):
+        remove_database(file_name, catalog_path)
+        # Liberar las conexiones abiertas al archivo borrado
+        invalidate_engine(os.path.join(db_dir, file_name))
+        invalidate_frame_reader(os.path.join(db_dir, file_name))
+        summary["removed"].append(file_name)
+
+    _last_reconcile[_reconcile_key(db_dir, catalog_path)] = time.monotonic()
+    return summary
+
+
+def _reconcile_key(db_dir, catalog_path):
+    return os.path.abspath(db_dir), os.path.abspath(catalog_path or get_catalog_path())
+
+
+def _reconciled_recently(db_dir, catalog_path):
+    """Indica si el directorio se reconcilió (escáner o petición) hace menos de CATALOG_RECONCILE_MIN_INTERVAL"""
+    last = _last_reconcile.get(_reconcile_key(db_dir, catalog_path))
+    return last is not None and time.monotonic() - last < CATALOG_RECONCILE_MIN_INTERVAL
+
+
+def start_catalog_scanner(interval=None, db_dir=None, catalog_path=None):
+    """
+    Lanza un hilo en segundo plano que reconcilia el catálogo al arrancar y
+    después cada `interval` segundos (CATALOG_SCAN_INTERVAL; 0 = solo al arrancar).
+
+    Returns:
+        threading.Thread: Hilo del escáner (daemon).
+    """
+    if interval is None:
+        interval = float(os.getenv('CATALOG_SCAN_INTERVAL', 300))
+
+    def _scan_loop():
+        while True:
+            try:
+                summary = reconcile_catalog(db_dir, catalog_path)
+                changes = sum(len(summary[key]) for key in ('added', 'updated', 'removed'))
+                if changes:
+                    print(f"Catálogo reconciliado: {len(summary['added'])} añadidas, "
+                          f"{len(summary['updated'])} actualizadas, {len(summary['removed'])} eliminadas")
+            except Exception as e:
+                print(f"Error al reconciliar el catálogo: {e}")
+            if not interval:
+                break
+            time.sleep(interval)
+
+    thread = threading.Thread(target=_scan_loop, name="catalog-scanner", daemon=True)
+    thread.start()
+    return thread
+
+
+def list_databases(offset=0, limit=50, sort='modified', order='desc', search=None,
+                   min_packets=None, start_time=None, end_time=None, catalog_path=None):
+    """
+    Lista paginada de las bases de datos catalogadas.
+
+    Args:
+        offset (int): Número de entradas a omitir.
+        limit (int): Número máximo de entradas (None para todas).
+        sort (str): Una de SORT_COLUMNS.
+        order (str): 'asc' o 'desc'.
+        search (str, opcional): Texto contenido en el nombre del archivo o de un PCAP.
+        min_packets (int, opcional): Mínimo de paquetes.
+        start_time, end_time (float, opcional): Solo capturas que solapan el intervalo (epoch).
+
+    Returns:
+        tuple: (lista de entradas, total de entradas que cumplen los filtros)
+    """
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Orden no válido: {sort}")
+    column = getattr(CatalogDatabase, SORT_COLUMNS[sort])
+
+    db_session = get_catalog_session(catalog_path)
+    try:
+        query = db_session.query(CatalogDatabase)
+        if search:
+            pattern = f"%{search}%"
+            query = query.filter(or_(
+                CatalogDatabase.file_name.like(pattern),
+                CatalogDatabase.sessions.any(CatalogSession.file_name.like(pattern))
+            ))
+        if min_packets is not None:
+            query = query.filter(CatalogDatabase.packet_count >= min_packets)
+        if start_time is not None:
+            query = query.filter(CatalogDatabase.last_timestamp >= start_time)
+        if end_time is not None:
+            query = query.filter(CatalogDatabase.first_timestamp <= end_time)
+
+        total = query.count()
+        ordering = column.asc() if order == 'asc' else column.desc()
+        query = query.order_by(ordering, CatalogDatabase.file_name.asc()).offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        return [entry.to_dict() for entry in query], total
+    finally:
+        db_session.close()
+
+
+def list_sessions(offset=0, limit=50, search=None, start_time=None, end_time=None, catalog_path=None):
+    """
+    Lista paginada de las sesiones de todas las bases de datos catalogadas,
+    de la más reciente a la más antigua.
+
+    Returns:
+        tuple: (lista de sesiones, total de sesiones que cumplen los filtros)
+    """
+    db_session = get_catalog_session(catalog_path)
+    try:
+        query = db_session.query(CatalogSession).join(CatalogDatabase)
+        if search:
+            pattern = f"%{search}%"
+            query = query.filter(or_(CatalogSession.file_name.like(pattern), CatalogDatabase.file_name.like(pattern)))
+        if start_time is not None:
+            query = query.filter(CatalogSession.last_timestamp >= start_time)
+        if end_time is not None:
+            query = query.filter(CatalogSession.first_timestamp <= end_time)
+
+        total = query.count()
+        query = query.order_by(
+            CatalogSession.first_timestamp.desc(), CatalogDatabase.file_name.asc(), CatalogSession.session_id.asc()
+        ).offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        return [session.to_dict() for session in query], total
+    finally:
+        db_session.close()
+
+
+def candidate_database_paths(start_time=None, end_time=None, catalog_path=None):
+    """
+    Rutas de las bases de datos catalogadas cuyo rango temporal solapa el intervalo,
+    de la más reciente a la más antigua.
+    """
+    db_session = get_catalog_session(catalog_path)
+    try:
+        query = db_session.query(CatalogDatabase.path)
+        if start_time is not None:
+            query = query.filter(CatalogDatabase.last_timestamp >= start_time)
+        if end_time is not None:
+            query = query.filter(CatalogDatabase.first_timestamp <= end_time)
+        return [path for (path,) in query.order_by(CatalogDatabase.mtime.desc())]
+    finally:
+        db_session.close()
+
+
+def get_database_entry(file_name, catalog_path=None):
+    """Entrada del catálogo con sus sesiones, o None si no está catalogada"""
+    db_session = get_catalog_session(catalog_path)
+    try:
+        entry = db_session.query(CatalogDatabase).filter(CatalogDatabase.file_name == file_name).first()
+        return entry.to_dict(include_sessions=True) if entry else None
+    finally:
+        db_session.close()
+
+
+def _latest_catalog_path(prefix, db_dir, catalog_path):
+    """Entrada más reciente del catálogo en db_dir; las de archivos borrados se retiran"""
+    directory = os.path.join(os.path.abspath(db_dir), '')
+    while True:
+        db_session = get_catalog_session(catalog_path)
+        try:
+            entry = db_session.query(CatalogDatabase.file_name, CatalogDatabase.path).filter(
+                CatalogDatabase.path.startswith(directory, autoescape=True),
+                CatalogDatabase.file_name.startswith(prefix, autoescape=True),
+                CatalogDatabase.file_name.endswith('.db')
+            ).order_by(CatalogDatabase.mtime.desc()).first()
+        finally:
+            db_session.close()
+        if entry is None or os.path.exists(entry.path):
+            return entry.path if entry else None
+        # Archivo borrado: se retira solo su entrada, sin reconciliar todo el directorio
+        remove_database(entry.file_name, catalog_path)
+        invalidate_engine(entry.path)
+        invalidate_frame_reader(entry.path)
+
+
+def latest_database_path(prefix='database_', db_dir=None, catalog_path=None):
+    """
+    Ruta de la base de datos más reciente (por fecha de modificación) de db_dir
+    cuyo nombre empieza por prefix.
+
+    Consulta el catálogo; si no tiene ninguna, se reconcilia el directorio salvo
+    que se haya hecho hace poco (el escáner en segundo plano lo mantiene al día)
+    y, si sigue sin haberla, se recorre el directorio.
+
+    Returns:
+        str: Ruta del archivo, o None si no hay ninguna base de datos.
+    """
+    db_dir = db_dir or get_database_directory()
+    try:
+        path = _latest_catalog_path(prefix, db_dir, catalog_path)
+        if path is None and not _reconciled_recently(db_dir, catalog_path):
+            reconcile_catalog(db_dir, catalog_path)
+            path = _latest_catalog_path(prefix, db_dir, catalog_path)
+        if path is not None:
+            return path
+    except Exception as e:
+        print(f"Catálogo no disponible, se recorre el directorio: {e}")
+
+    # Último recurso: recorrer el directorio
+    db_files = glob.glob(os.path.join(db_dir, f'{prefix}*.db'))
+    return max(db_files, key=os.path.getmtime) if db_files else None
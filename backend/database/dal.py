@@ -0,0 +1,103 @@
+"""
+Capa de acceso a datos no bloqueante para los handlers async de FastAPI.
+
+Un handler `async def` se ejecuta en el bucle de eventos: una consulta
+SQLAlchemy, un subproceso o un future.result() dentro de él detiene todas
+las demás peticiones mientras dura. Los handlers async esperan el trabajo
+bloqueante con:
+
+- run_db(): consultas a las bases de datos de captura, en un pool de hilos
+  acotado (DB_POOL_SIZE) para no abrir más conexiones SQLite que las que el
+  disco puede atender. sqlite3 libera el GIL durante la consulta, de modo que
+  el bucle sigue atendiendo peticiones mientras tanto.
+- run_blocking(): trabajo bloqueante que no es de base de datos (subprocesos,
+  llamadas a la API de IA, E/S de archivos), en un pool separado
+  (BLOCKING_POOL_SIZE) para que una captura larga no ocupe los hilos de consulta.
+
+Los handlers síncronos (`def`) no necesitan esta capa: Starlette ya los
+ejecuta fuera del bucle.
+"""
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Hilos dedicados a consultas de base de datos
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))
+
+# Hilos para el resto del trabajo bloqueante
+BLOCKING_POOL_SIZE = int(os.getenv('BLOCKING_POOL_SIZE', 4))
+
+_pools = {}
+_lock = threading.Lock()
+_stats = {}
+
+
+def _pool_size(name):
+    return max(1, DB_POOL_SIZE if name == 'db' else BLOCKING_POOL_SIZE)
+
+
+def _get_pool(name):
+    with _lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=_pool_size(name), thread_name_prefix=f'{name}-pool')
+            _pools[name] = pool
+            _stats.setdefault(name, {"submitted": 0, "completed": 0, "failed": 0, "active": 0})
+        return pool
+
+
+def _track(name, func):
+    """Envuelve la función para contar las tareas en curso y terminadas del pool"""
+    def call():
+        with _lock:
+            _stats[name]["active"] += 1
+        try:
+            result = func()
+        except BaseException:
+            with _lock:
+                _stats[name]["failed"] += 1
+            raise
+        finally:
+            with _lock:
+                _stats[name]["active"] -= 1
+                _stats[name]["completed"] += 1
+        return result
+    return call
+
+
+async def _run(name, func, args, kwargs):
+    pool = _get_pool(name)
+    with _lock:
+        _stats[name]["submitted"] += 1
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, _track(name, functools.partial(func, *args, **kwargs)))
+
+
+async def run_db(func, *args, **kwargs):
+    """Ejecuta una función de acceso a datos en el pool de base de datos y espera su resultado"""
+    return await _run('db', func, args, kwargs)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Ejecuta una función bloqueante (subprocesos, red, archivos) fuera del bucle de eventos"""
+    return await _run('blocking', func, args, kwargs)
+
+
+def dal_stats():
+    """Tamaño de cada pool y tareas enviadas, en curso, terminadas y fallidas"""
+    with _lock:
+        return {
+            name: {"size": _pool_size(name), "queued": stats["submitted"] - stats["completed"] - stats["active"], **stats}
+            for name, stats in _stats.items()
+        }
+
+
+def shutdown_pools(wait=True):
+    """Cierra los pools (al apagar la aplicación)"""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait)
@@ -0,0 +1,146 @@
+"""
+Caché de engines SQLAlchemy por base de datos de captura.
+
+Crear un engine, verificar el esquema con create_all y crear un sessionmaker
+en cada petición impide reutilizar el pool de conexiones. Este módulo guarda
+un engine por archivo (clave: ruta absoluta) en una caché LRU de tamaño
+ENGINE_CACHE_SIZE compartida por todo el proceso:
+
+- El esquema se verifica una sola vez, al crear el engine del archivo.
+- Al expulsar un engine de la caché se libera su pool (dispose).
+- Si el archivo se borra o se reemplaza por otro (cambia el inodo), la
+  entrada se invalida y la siguiente petición crea un engine nuevo.
+- Los archivos sellados (database.seal) se abren en solo lectura con
+  immutable=1 y mmap, sin verificar el esquema; al sellar o desprecintar un
+  archivo cambia su identidad y el engine anterior se descarta.
+
+Con la caché caliente, el coste por petición es un os.stat y la obtención de
+una conexión del pool.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Base
+from database.seal import database_identity, sqlite_uri, SEALED_MMAP_SIZE
+
+# Número máximo de bases de datos con engine abierto
+ENGINE_CACHE_SIZE = int(os.getenv('ENGINE_CACHE_SIZE', 16))
+
+_engines = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+
+class _CachedEngine:
+    """Engine, sessionmaker e identidad del archivo para el que se creó"""
+
+    def __init__(self, db_path, identity):
+        self.identity = identity
+        self.sealed = identity[2]
+        if self.sealed:
+            self.engine = create_engine(f'sqlite:///{sqlite_uri(db_path, sealed=True)}&uri=true')
+
+            @event.listens_for(self.engine, "connect")
+            def _set_mmap(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute(f"PRAGMA mmap_size={SEALED_MMAP_SIZE}")
+                cursor.close()
+        else:
+            self.engine = create_engine(f'sqlite:///{db_path}', connect_args={'timeout': 30})
+            # Verificación del esquema: una vez por archivo
+            Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+
+    def dispose(self):
+        self.engine.dispose()
+
+
+def get_engine(db_path):
+    """
+    Engine compartido de una base de datos existente.
+
+    Raises:
+        FileNotFoundError: Si el archivo no existe (no se crean bases de datos nuevas).
+    """
+    return _get_entry(db_path).engine
+
+
+def get_session(db_path):
+    """Sesión ORM sobre el engine compartido (quien la usa debe cerrarla)"""
+    return _get_entry(db_path).Session()
+
+
+def _get_entry(db_path):
+    key = os.path.abspath(db_path)
+    try:
+        identity = database_identity(key)
+    except FileNotFoundError:
+        invalidate_engine(key)
+        raise
+
+    stale = None
+    with _lock:
+        entry = _engines.get(key)
+        if entry is not None and entry.identity == identity:
+            _engines.move_to_end(key)
+            _stats["hits"] += 1
+            return entry
+        if entry is not None:
+            # Archivo reemplazado: el engine apunta al archivo anterior
+            stale = _engines.pop(key)
+            _stats["invalidations"] += 1
+    if stale is not None:
+        stale.dispose()
+
+    # El engine se crea fuera del cerrojo: create_all puede tardar en bases de datos grandes
+    created = _CachedEngine(key, identity)
+    to_dispose = []
+    with _lock:
+        entry = _engines.get(key)
+        if entry is not None and entry.identity == identity:
+            # Otro hilo lo creó mientras tanto
+            _engines.move_to_end(key)
+            _stats["hits"] += 1
+            to_dispose.append(created)
+        else:
+            if entry is not None:
+                to_dispose.append(_engines.pop(key))
+            _engines[key] = created
+            _stats["misses"] += 1
+            entry = created
+            while len(_engines) > ENGINE_CACHE_SIZE:
+                _, old = _engines.popitem(last=False)
+                to_dispose.append(old)
+                _stats["evictions"] += 1
+    for old in to_dispose:
+        old.dispose()
+    return entry
+
+
+def invalidate_engine(db_path):
+    """Libera el engine de una base de datos (tras borrarla, reemplazarla o reconstruirla)"""
+    with _lock:
+        entry = _engines.pop(os.path.abspath(db_path), None)
+        if entry is not None:
+            _stats["invalidations"] += 1
+    if entry is not None:
+        entry.dispose()
+
+
+def clear_engine_cache():
+    """Libera todos los engines de la caché"""
+    with _lock:
+        entries = list(_engines.values())
+        _engines.clear()
+    for entry in entries:
+        entry.dispose()
+
+
+def engine_cache_stats():
+    """Tamaño, capacidad y contadores de aciertos, fallos, expulsiones e invalidaciones"""
+    with _lock:
+        return {"size": len(_engines), "capacity": ENGINE_CACHE_SIZE, **_stats}
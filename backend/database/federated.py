@@ -0,0 +1,221 @@
+"""
+Consultas federadas sobre varias bases de datos de captura.
+
+Cada PCAP procesado tiene su propio archivo SQLite. Para buscar una IP, un
+puerto o un intervalo de tiempo en todo el archivo histórico, las bases de
+datos candidatas (preseleccionadas por rango temporal en el catálogo) se
+adjuntan por lotes con ATTACH, dentro del límite de SQLite, a conexiones en
+memoria. Cada lote ejecuta una única consulta UNION ALL en un hilo del pool y
+los resultados se combinan a medida que terminan los lotes.
+"""
+import os
+import heapq
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from database.catalog import candidate_database_paths
+from database.seal import is_sealed, sqlite_uri, SEALED_MMAP_SIZE
+
+# Columnas de paquetes devueltas por las búsquedas federadas
+PACKET_COLUMNS = (
+    'session_id', 'packet_number', 'timestamp', 'src_ip', 'dst_ip', 'src_port', 'dst_port',
+    'transport_protocol', 'packet_length', 'info_text',
+)
+
+# Límite de ATTACH por defecto de SQLite (SQLITE_MAX_ATTACHED)
+DEFAULT_ATTACH_BATCH = 10
+
+
+class FederatedQueryError(Exception):
+    """Error en una consulta federada"""
+    pass
+
+
+def attach_batch_size():
+    """Bases de datos por lote, acotado por el límite de ATTACH de la conexión"""
+    requested = int(os.getenv('FEDERATED_ATTACH_BATCH', DEFAULT_ATTACH_BATCH))
+    conn = sqlite3.connect(':memory:')
+    try:
+        limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    except AttributeError:  # Python < 3.11
+        limit = DEFAULT_ATTACH_BATCH
+    finally:
+        conn.close()
+    return max(1, min(requested, limit))
+
+
+def federated_workers():
+    """Número de hilos que ejecutan lotes en paralelo"""
+    return max(1, int(os.getenv('FEDERATED_WORKERS', 4)))
+
+
+def build_filters(ip=None, src_ip=None, dst_ip=None, port=None, src_port=None, dst_port=None,
+                  protocol=None, start_time=None, end_time=None):
+    """
+    Construye la cláusula WHERE de una búsqueda de paquetes.
+
+    Returns:
+        tuple: (texto SQL, lista de parámetros)
+    """
+    clauses = []
+    params = []
+    if ip:
+        clauses.append("(src_ip = ? OR dst_ip = ?)")
+        params += [ip, ip]
+    if src_ip:
+        clauses.append("src_ip = ?")
+        params.append(src_ip)
+    if dst_ip:
+        clauses.append("dst_ip = ?")
+        params.append(dst_ip)
+    if port is not None:
+        clauses.append("(src_port = ? OR dst_port = ?)")
+        params += [port, port]
+    if src_port is not None:
+        clauses.append("src_port = ?")
+        params.append(src_port)
+    if dst_port is not None:
+        clauses.append("dst_port = ?")
+        params.append(dst_port)
+    if protocol:
+        clauses.append("transport_protocol = ?")
+        params.append(protocol.upper())
+    if start_time is not None:
+        clauses.append("timestamp >= ?")
+        params.append(start_time)
+    if end_time is not None:
+        clauses.append("timestamp <= ?")
+        params.append(end_time)
+    if not clauses:
+        raise FederatedQueryError("Indica al menos un filtro (IP, puerto, protocolo o intervalo de tiempo)")
+    return " AND ".join(clauses), params
+
+
+def _attach(conn, paths):
+    """Adjunta las bases de datos en solo lectura. Devuelve [(alias, nombre del archivo)]"""
+    attached = []
+    for index, path in enumerate(paths):
+        alias = f"capture{index}"
+        sealed = is_sealed(path)
+        try:
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (sqlite_uri(path, sealed),))
+            if sealed:
+                conn.execute(f"PRAGMA {alias}.mmap_size={SEALED_MMAP_SIZE}")
+        except sqlite3.Error as e:
+            print(f"No se pudo adjuntar {path}: {e}")
+            continue
+        attached.append((alias, os.path.basename(path)))
+    return attached
+
+
+def _run_batch(paths, select_sql, where, params, suffix='', suffix_params=()):
+    """
+    Ejecuta una consulta UNION ALL sobre un lote de bases de datos adjuntas.
+
+    select_sql es una plantilla con {alias} para la tabla packets de cada base de datos.
+    """
+    conn = sqlite3.connect('file::memory:', uri=True)
+    try:
+        attached = _attach(conn, paths)
+        if not attached:
+            return []
+        parts = []
+        all_params = []
+        for alias, file_name in attached:
+            parts.append(f"{select_sql.format(alias=alias)} WHERE {where}")
+            all_params += [file_name] + list(params)
+        sql = " UNION ALL ".join(parts) + suffix
+        return conn.execute(sql, all_params + list(suffix_params)).fetchall()
+    except sqlite3.Error as e:
+        raise FederatedQueryError(f"Error en la consulta federada: {e}")
+    finally:
+        conn.close()
+
+
+def _batches(paths, batch_size):
+    return [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+
+
+def _fan_out(paths, run, ordered_key=None):
+    """
+    Ejecuta run(lote) para cada lote en el pool de hilos.
+
+    Sin ordered_key, las filas se entregan en cuanto termina cada lote; con
+    ordered_key, los resultados (ordenados por lote) se combinan con heapq.merge.
+    """
+    batches = _batches(paths, attach_batch_size())
+    if not batches:
+        return
+    with ThreadPoolExecutor(max_workers=min(federated_workers(), len(batches))) as executor:
+        futures = [executor.submit(run, batch) for batch in batches]
+        if ordered_key is None:
+            for future in as_completed(futures):
+                yield from future.result()
+        else:
+            yield from heapq.merge(*(future.result() for future in futures), key=ordered_key)
+
+
+def search_packets(limit=1000, ordered=True, db_paths=None, catalog_path=None, **filters):
+    """
+    Busca paquetes en todas las capturas del archivo histórico.
+
+    Args:
+        limit (int): Número máximo de paquetes devueltos.
+        ordered (bool): Entregar los paquetes en orden temporal global. Si es
+            False se entregan por lotes según terminan (menor latencia).
+        db_paths (list, opcional): Bases de datos a consultar. Por defecto las del
+            catálogo que solapan el intervalo de tiempo.
+        **filters: ip, src_ip, dst_ip, port, src_port, dst_port, protocol,
+            start_time, end_time.
+
+    Yields:
+        dict: Un paquete con el nombre de su base de datos (db_file).
+    """
+    where, params = build_filters(**filters)
+    if db_paths is None:
+        db_paths = candidate_database_paths(filters.get('start_time'), filters.get('end_time'), catalog_path)
+
+    select_sql = "SELECT ? AS db_file, " + ", ".join(PACKET_COLUMNS) + " FROM {alias}.packets"
+    # Cada lote devuelve como mucho `limit` paquetes, ordenados si hace falta combinarlos
+    suffix = " ORDER BY timestamp, db_file, session_id, packet_number LIMIT ?"
+    columns = ('db_file',) + PACKET_COLUMNS
+
+    def run(batch):
+        return _run_batch(batch, select_sql, where, params, suffix, (limit,))
+
+    key = (lambda row: (row[3], row[0], row[1], row[2])) if ordered else None
+    for count, row in enumerate(_fan_out(db_paths, run, key)):
+        if count >= limit:
+            break
+        yield dict(zip(columns, row))
+
+
+def count_matches(db_paths=None, catalog_path=None, **filters):
+    """
+    Cuenta los paquetes que cumplen los filtros en cada captura.
+
+    Returns:
+        list: Por base de datos y sesión con coincidencias: paquetes, primer y
+        último timestamp; ordenada por primer timestamp.
+    """
+    where, params = build_filters(**filters)
+    if db_paths is None:
+        db_paths = candidate_database_paths(filters.get('start_time'), filters.get('end_time'), catalog_path)
+
+    select_sql = (
+        "SELECT ? AS db_file, session_id, COUNT(*) AS packets, MIN(timestamp) AS first_seen, "
+        "MAX(timestamp) AS last_seen FROM {alias}.packets"
+    )
+
+    def run(batch):
+        # GROUP BY por base de datos: se añade a cada parte de la unión
+        rows = _run_batch(batch, select_sql, where + " GROUP BY session_id", params)
+        return [row for row in rows if row[2]]
+
+    matches = [
+        {"db_file": db_file, "session_id": session_id, "packets": packets,
+         "first_seen": first_seen, "last_seen": last_seen}
+        for db_file, session_id, packets, first_seen, last_seen in _fan_out(db_paths, run)
+    ]
+    matches.sort(key=lambda match: (match["first_seen"], match["db_file"], match["session_id"]))
+    return matches
@@ -0,0 +1,83 @@
+"""
+Flujos (5-tupla) de las sesiones de captura.
+
+Los flujos se materializan en la tabla flows al terminar la ingesta, de modo
+que sobreviven al archivado de los paquetes en bruto (database.retention).
+"""
+from sqlalchemy import select, delete, insert, func, literal
+
+from database.models import Packet, Flow
+
+# Columnas de un flujo en el orden de flow_aggregation()
+FLOW_COLUMNS = (
+    'transport_protocol', 'src_ip', 'src_port', 'dst_ip', 'dst_port',
+    'first_seen', 'last_seen', 'packet_count', 'byte_count',
+)
+
+
+def flow_aggregation(session_id):
+    """
+    Agrega los paquetes de la sesión por 5-tupla para obtener los flujos.
+
+    Returns:
+        Select: Consulta ordenada por el instante del primer paquete del flujo.
+    """
+    first_seen = func.min(Packet.timestamp).label('first_seen')
+    return select(
+        Packet.transport_protocol,
+        Packet.src_ip,
+        Packet.src_port,
+        Packet.dst_ip,
+        Packet.dst_port,
+        first_seen,
+        func.max(Packet.timestamp).label('last_seen'),
+        func.count(Packet.id).label('packet_count'),
+        func.sum(Packet.packet_length).label('byte_count'),
+    ).where(
+        Packet.session_id == session_id
+    ).group_by(
+        Packet.transport_protocol, Packet.src_ip, Packet.src_port, Packet.dst_ip, Packet.dst_port
+    ).order_by(first_seen)
+
+
+def stored_flows(session_id):
+    """Consulta de los flujos materializados de la sesión, con las columnas de flow_aggregation()"""
+    return select(
+        *(getattr(Flow, column) for column in FLOW_COLUMNS)
+    ).where(
+        Flow.session_id == session_id
+    ).order_by(Flow.first_seen, Flow.id)
+
+
+def has_stored_flows(conn, session_id):
+    """Indica si la sesión tiene flujos materializados"""
+    return conn.execute(
+        select(Flow.id).where(Flow.session_id == session_id).limit(1)
+    ).first() is not None
+
+
+def flows_statement(conn, session_id):
+    """Flujos materializados si existen; agregación de los paquetes en caso contrario"""
+    return stored_flows(session_id) if has_stored_flows(conn, session_id) else flow_aggregation(session_id)
+
+
+def materialize_flows(conn, session_id):
+    """
+    (Re)calcula los flujos de una sesión en la tabla flows con un único INSERT ... SELECT.
+
+    Args:
+        conn: Conexión SQLAlchemy (la transacción la gestiona quien llama).
+        session_id (int): ID de la sesión.
+
+    Returns:
+        int: Número de flujos guardados.
+    """
+    aggregation = flow_aggregation(session_id).order_by(None).subquery()
+    conn.execute(delete(Flow).where(Flow.session_id == session_id))
+    result = conn.execute(
+        insert(Flow).from_select(
+            ('session_id',) + FLOW_COLUMNS,
+            select(literal(session_id), *(aggregation.c[column] for column in FLOW_COLUMNS))
+        )
+    )
+    return result.rowcount
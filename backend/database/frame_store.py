@@ -0,0 +1,485 @@
+"""
+Almacén comprimido de los frames en bruto de las sesiones de captura.
+
+Tras procesar un PCAP el archivo original se borra, así que sin este almacén
+no es posible volver a diseccionar ni exportar un paquete. Los frames se
+agrupan por orden de llegada en bloques pequeños (FRAME_CHUNK_FRAMES frames o
+FRAME_CHUNK_SECONDS segundos) que se comprimen con zstd usando un diccionario
+entrenado con los primeros frames de la sesión: con el diccionario los bloques
+pequeños comprimen casi tan bien como el archivo completo y recuperar un frame
+solo requiere descomprimir su bloque. Los bloques se guardan en la tabla
+frame_chunks, indexados por el primer packet_number de cada bloque.
+
+Formato de un bloque descomprimido:
+    <I n> + n * <d timestamp, I caplen, I origlen> + frames concatenados
+"""
+import io
+import os
+import struct
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import create_engine, delete
+
+from database.models import Base, FrameStore, FrameChunk
+from database.seal import connect_readonly, database_identity, ensure_writable
+
+try:
+    import zstandard as zstd
+except ImportError:  # zstandard es una dependencia opcional
+    zstd = None
+
+# Frames por bloque y duración máxima de un bloque (segundos)
+CHUNK_FRAMES = int(os.getenv('FRAME_CHUNK_FRAMES', 64))
+CHUNK_SECONDS = float(os.getenv('FRAME_CHUNK_SECONDS', 1.0))
+
+# Nivel de compresión zstd y tamaño del diccionario entrenado por sesión
+COMPRESSION_LEVEL = int(os.getenv('FRAME_COMPRESSION_LEVEL', 9))
+DICTIONARY_SIZE = int(os.getenv('FRAME_DICTIONARY_SIZE', 64 * 1024))
+DICTIONARY_SAMPLES = int(os.getenv('FRAME_DICTIONARY_SAMPLES', 4000))
+
+# Bloques insertados por transacción al construir el almacén
+INSERT_BATCH = 200
+
+# Bloques descomprimidos en caché por lector
+CHUNK_CACHE_SIZE = int(os.getenv('FRAME_CHUNK_CACHE', 64))
+
+_CHUNK_COUNT = struct.Struct('<I')
+_FRAME_ENTRY = struct.Struct('<dII')
+
+Frame = namedtuple('Frame', ['packet_number', 'timestamp', 'orig_len', 'data'])
+
+
+class FrameStoreError(Exception):
+    """Error al construir o leer el almacén de frames"""
+    pass
+
+
+def zstd_available():
+    """Indica si zstandard está instalado"""
+    return zstd is not None
+
+
+def store_raw_frames():
+    """Indica si la ingesta debe guardar los frames en bruto"""
+    return os.getenv('STORE_RAW_FRAMES', 'false').lower() == 'true'
+
+
+# Lectura de archivos PCAP / PCAPNG
+
+_PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+_PCAPNG_SHB = b'\x0a\x0d\x0d\x0a'
+
+
+def _iter_pcap(f, magic):
+    endian, resolution = _PCAP_MAGIC[magic]
+    header = f.read(20)
+    if len(header) < 20:
+        raise FrameStoreError("Cabecera PCAP incompleta")
+    _, _, _, _, snaplen, link_type = struct.unpack(endian + 'HHiIII', header)
+    record = struct.Struct(endian + 'IIII')
+    yield link_type, snaplen
+    while True:
+        data = f.read(record.size)
+        if len(data) < record.size:
+            return
+        ts_sec, ts_frac, caplen, orig_len = record.unpack(data)
+        frame = f.read(caplen)
+        if len(frame) < caplen:
+            return
+        yield ts_sec + ts_frac * resolution, orig_len, frame
+
+
+def _tsresol(options, endian):
+    """Resolución de los timestamps de una interfaz (opción if_tsresol)"""
+    offset = 0
+    while offset + 4 <= len(options):
+        code, length = struct.unpack_from(endian + 'HH', options, offset)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = options[offset + 4]
+            return 2.0 ** -(value & 0x7f) if value & 0x80 else 10.0 ** -value
+        offset += 4 + length + (-length % 4)
+    return 1e-6
+
+
+def _iter_pcapng(f):
+    endian = '<'
+    interfaces = []
+    first = True
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            return
+        if head[:4] == _PCAPNG_SHB:
+            bom = f.read(4)
+            endian = '<' if bom == b'\x4d\x3c\x2b\x1a' else '>'
+            block_length = struct.unpack(endian + 'I', head[4:])[0]
+            f.read(block_length - 12)
+            interfaces = []
+            continue
+        block_type, block_length = struct.unpack(endian + 'II', head)
+        if block_length < 12:
+            raise FrameStoreError("Bloque PCAPNG no válido")
+        body = f.read(block_length - 8)[:-4]
+        if block_type == 1:  # Interface Description Block
+            link_type, _, snaplen = struct.unpack_from(endian + 'HHI', body)
+            interfaces.append((link_type, snaplen, _tsresol(body[8:], endian)))
+            if first:
+                yield link_type, snaplen or 262144
+                first = False
+        elif block_type == 6:  # Enhanced Packet Block
+            interface_id, ts_high, ts_low, caplen, orig_len = struct.unpack_from(endian + 'IIIII', body)
+            resolution = interfaces[interface_id][2] if interface_id < len(interfaces) else 1e-6
+            yield ((ts_high << 32) | ts_low) * resolution, orig_len, body[20:20 + caplen]
+        elif block_type == 3:  # Simple Packet Block
+            orig_len = struct.unpack_from(endian + 'I', body)[0]
+            snaplen = interfaces[0][1] if interfaces else 0
+            caplen = min(orig_len, snaplen) if snaplen else orig_len
+            yield 0.0, orig_len, body[4:4 + caplen]
+
+
+def iter_capture_frames(pcap_path):
+    """
+    Recorre los frames de un archivo PCAP o PCAPNG (también comprimido con zstd, .zst).
+
+    El primer elemento es (link_type, snaplen); después (timestamp, orig_len, datos)
+    por frame, en el orden del archivo (packet_number = posición + 1).
+    """
+    with _open_capture(pcap_path) as f:
+        magic = f.peek(4)[:4]
+        if magic in _PCAP_MAGIC:
+            f.read(4)
+            yield from _iter_pcap(f, magic)
+        elif magic == _PCAPNG_SHB:
+            yield from _iter_pcapng(f)
+        else:
+            raise FrameStoreError(f"Formato de captura no reconocido: {pcap_path}")
+
+
+def _open_capture(pcap_path):
+    """Abre un PCAP, descomprimiéndolo al vuelo si es un archivo .zst"""
+    if not pcap_path.endswith('.zst'):
+        return open(pcap_path, 'rb')
+    if not zstd_available():
+        raise FrameStoreError("Leer una captura comprimida requiere zstandard")
+    raw = open(pcap_path, 'rb')
+    return io.BufferedReader(zstd.ZstdDecompressor().stream_reader(raw, closefd=True))
+
+
+# Construcción del almacén
+
+def _encode_chunk(frames):
+    parts = [_CHUNK_COUNT.pack(len(frames))]
+    parts += [_FRAME_ENTRY.pack(ts, len(data), orig_len) for ts, orig_len, data in frames]
+    parts += [data for _, _, data in frames]
+    return b''.join(parts)
+
+
+def _train_dictionary(pcap_path):
+    """Diccionario zstd entrenado con los primeros frames (None si no hay muestras suficientes)"""
+    samples = []
+    frames = iter_capture_frames(pcap_path)
+    next(frames)
+    for _, _, data in frames:
+        samples.append(bytes(data))
+        if len(samples) >= DICTIONARY_SAMPLES:
+            break
+    try:
+        return zstd.train_dictionary(DICTIONARY_SIZE, samples)
+    except zstd.ZstdError:
+        return None
+
+
+def build_frame_store(db_path, session_id, pcap_path, level=None):
+    """
+    Guarda los frames de un PCAP en el almacén comprimido de la sesión (lo reemplaza si existe).
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite de la captura.
+        session_id (int): ID de la sesión.
+        pcap_path (str): PCAP original de la sesión.
+        level (int, opcional): Nivel de compresión zstd. Por defecto FRAME_COMPRESSION_LEVEL.
+
+    Returns:
+        dict: Estadísticas de almacenamiento (ver frame_store_stats).
+    """
+    if not zstd_available():
+        raise FrameStoreError("El almacén de frames requiere zstandard")
+    ensure_writable(db_path)
+    level = COMPRESSION_LEVEL if level is None else level
+
+    dictionary = _train_dictionary(pcap_path)
+    compressor = zstd.ZstdCompressor(level=level, dict_data=dictionary, write_content_size=True)
+
+    engine = create_engine(f'sqlite:///{db_path}', connect_args={'timeout': 30})
+    Base.metadata.create_all(engine, tables=[FrameStore.__table__, FrameChunk.__table__])
+    totals = {"frames": 0, "chunks": 0, "raw": 0, "stored": 0}
+    try:
+        with engine.begin() as conn:
+            conn.execute(delete(FrameChunk).where(FrameChunk.session_id == session_id))
+            conn.execute(delete(FrameStore).where(FrameStore.session_id == session_id))
+
+        pending = []
+
+        def flush_rows():
+            if pending:
+                with engine.begin() as conn:
+                    conn.execute(FrameChunk.__table__.insert(), pending)
+                pending.clear()
+
+        def add_chunk(first_packet, frames):
+            raw = _encode_chunk(frames)
+            data = compressor.compress(raw)
+            pending.append({
+                "session_id": session_id, "first_packet": first_packet,
+                "last_packet": first_packet + len(frames) - 1,
+                "first_timestamp": frames[0][0], "last_timestamp": frames[-1][0],
+                "raw_size": len(raw), "data": data,
+            })
+            totals["chunks"] += 1
+            totals["raw"] += sum(len(frame[2]) for frame in frames)
+            totals["stored"] += len(data)
+            if len(pending) >= INSERT_BATCH:
+                flush_rows()
+
+        frames = iter_capture_frames(pcap_path)
+        link_type, snaplen = next(frames)
+        chunk, chunk_start = [], 1
+        for packet_number, frame in enumerate(frames, start=1):
+            if chunk and (len(chunk) >= CHUNK_FRAMES or frame[0] - chunk[0][0] > CHUNK_SECONDS):
+                add_chunk(chunk_start, chunk)
+                chunk, chunk_start = [], packet_number
+            chunk.append(frame)
+            totals["frames"] = packet_number
+        if chunk:
+            add_chunk(chunk_start, chunk)
+        flush_rows()
+
+        dictionary_bytes = dictionary.as_bytes() if dictionary is not None else None
+        with engine.begin() as conn:
+            conn.execute(FrameStore.__table__.insert().values(
+                session_id=session_id, link_type=link_type, snaplen=snaplen,
+                dictionary=dictionary_bytes, compression_level=level,
+                frame_count=totals["frames"], chunk_count=totals["chunks"], raw_bytes=totals["raw"],
+                stored_bytes=totals["stored"] + len(dictionary_bytes or b''),
+                pcap_bytes=os.path.getsize(pcap_path),
+            ))
+    finally:
+        engine.dispose()
+
+    invalidate_frame_reader(db_path)
+    return frame_store_stats(db_path, session_id)
+
+
+# Lectura
+
+class FrameStoreReader:
+    """
+    Lector del almacén de frames de una base de datos.
+
+    Mantiene abierta la conexión, un descompresor por sesión y una caché LRU
+    de bloques descomprimidos, de modo que leer frames cercanos no vuelve a
+    descomprimir. Es seguro compartirlo entre hilos.
+    """
+
+    def __init__(self, db_path):
+        if not zstd_available():
+            raise FrameStoreError("El almacén de frames requiere zstandard")
+        self.db_path = db_path
+        # Identidad con la que se abrió: al sellar o reemplazar el archivo se reabre
+        self.identity = database_identity(db_path)
+        self.conn = connect_readonly(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._stores = {}
+        self._chunks = OrderedDict()
+
+    def store_info(self, session_id):
+        """Metadatos del almacén de la sesión (None si no existe)"""
+        with self._lock:
+            return self._store(session_id)
+
+    def _store(self, session_id):
+        if session_id not in self._stores:
+            try:
+                row = self.conn.execute(
+                    "SELECT link_type, snaplen, dictionary, frame_count FROM frame_stores WHERE session_id = ?",
+                    (session_id,)
+                ).fetchone()
+            except sqlite3.OperationalError:
+                # Base de datos sin almacén de frames
+                row = None
+            if row is None:
+                return None
+            link_type, snaplen, dictionary, frame_count = row
+            dict_data = zstd.ZstdCompressionDict(dictionary) if dictionary else None
+            self._stores[session_id] = {
+                "link_type": link_type,
+                "snaplen": snaplen,
+                "frame_count": frame_count,
+                "decompressor": zstd.ZstdDecompressor(dict_data=dict_data),
+            }
+        return self._stores[session_id]
+
+    def _chunk(self, session_id, packet_number):
+        """Bloque descomprimido que contiene el frame: (primer packet_number, entradas, offsets, datos)"""
+        store = self._store(session_id)
+        if store is None:
+            return None
+        row = self.conn.execute(
+            "SELECT id, first_packet, last_packet FROM frame_chunks "
+            "WHERE session_id = ? AND first_packet <= ? ORDER BY first_packet DESC LIMIT 1",
+            (session_id, packet_number)
+        ).fetchone()
+        if row is None or row[2] < packet_number:
+            return None
+        chunk_id, first_packet, last_packet = row
+        cached = self._chunks.get(chunk_id)
+        if cached is not None:
+            self._chunks.move_to_end(chunk_id)
+            return cached
+
+        data = self.conn.execute("SELECT data FROM frame_chunks WHERE id = ?", (chunk_id,)).fetchone()[0]
+        try:
+            raw = store["decompressor"].decompress(data)
+            count = _CHUNK_COUNT.unpack_from(raw)[0]
+            entries = list(_FRAME_ENTRY.iter_unpack(raw[_CHUNK_COUNT.size:_CHUNK_COUNT.size + count * _FRAME_ENTRY.size]))
+        except (zstd.ZstdError, struct.error) as e:
+            raise FrameStoreError(f"Bloque {chunk_id} de la sesión {session_id} dañado: {e}")
+        offsets = []
+        offset = _CHUNK_COUNT.size + count * _FRAME_ENTRY.size
+        for _, caplen, _ in entries:
+            offsets.append(offset)
+            offset += caplen
+        if len(entries) != last_packet - first_packet + 1 or offset > len(raw):
+            raise FrameStoreError(f"Bloque {chunk_id} de la sesión {session_id} dañado: contenido incompleto")
+        cached = (first_packet, entries, offsets, memoryview(raw))
+        self._chunks[chunk_id] = cached
+        if len(self._chunks) > CHUNK_CACHE_SIZE:
+            self._chunks.popitem(last=False)
+        return cached
+
+    def get_frame(self, session_id, packet_number):
+        """
+        Frame de un paquete.
+
+        Returns:
+            Frame: (packet_number, timestamp, orig_len, bytes), o None si no existe.
+        """
+        with self._lock:
+            chunk = self._chunk(session_id, packet_number)
+        if chunk is None:
+            return None
+        first_packet, entries, offsets, raw = chunk
+        index = packet_number - first_packet
+        timestamp, caplen, orig_len = entries[index]
+        return Frame(packet_number, timestamp, orig_len, bytes(raw[offsets[index]:offsets[index] + caplen]))
+
+    def iter_frames(self, session_id, start=1, end=None):
+        """Frames de los paquetes start..end (inclusive), bloque a bloque"""
+        packet_number = max(1, start)
+        while end is None or packet_number <= end:
+            with self._lock:
+                chunk = self._chunk(session_id, packet_number)
+            if chunk is None:
+                return
+            first_packet, entries, offsets, raw = chunk
+            last = first_packet + len(entries) - 1
+            stop = last if end is None else min(last, end)
+            for number in range(packet_number, stop + 1):
+                index = number - first_packet
+                timestamp, caplen, orig_len = entries[index]
+                yield Frame(number, timestamp, orig_len, bytes(raw[offsets[index]:offsets[index] + caplen]))
+            packet_number = stop + 1
+
+    def iter_pcap(self, session_id, start=1, end=None):
+        """Archivo PCAP (bloques de bytes) con los frames start..end"""
+        store = self.store_info(session_id)
+        if store is None:
+            raise FrameStoreError(f"La sesión {session_id} no tiene almacén de frames")
+        yield struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, store["snaplen"], store["link_type"])
+        record = struct.Struct('<IIII')
+        for frame in self.iter_frames(session_id, start, end):
+            ts_sec = int(frame.timestamp)
+            ts_usec = int(round((frame.timestamp - ts_sec) * 1e6))
+            if ts_usec >= 1000000:
+                ts_sec, ts_usec = ts_sec + 1, ts_usec - 1000000
+            yield record.pack(ts_sec, ts_usec, len(frame.data), frame.orig_len) + frame.data
+
+    def close(self):
+        self.conn.close()
+
+
+# Lectores abiertos por base de datos
+_readers = OrderedDict()
+_readers_lock = threading.Lock()
+READER_CACHE_SIZE = int(os.getenv('FRAME_READER_CACHE', 8))
+
+
+def get_frame_reader(db_path):
+    """Lector compartido del almacén de frames de una base de datos"""
+    key = os.path.abspath(db_path)
+    identity = database_identity(key)
+    with _readers_lock:
+        reader = _readers.get(key)
+        if reader is not None and reader.identity == identity:
+            _readers.move_to_end(key)
+            return reader
+        if reader is not None:
+            _readers.pop(key).close()
+        reader = FrameStoreReader(db_path)
+        _readers[key] = reader
+        if len(_readers) > READER_CACHE_SIZE:
+            _, evicted = _readers.popitem(last=False)
+            evicted.close()
+        return reader
+
+
+def invalidate_frame_reader(db_path):
+    """Cierra el lector compartido de una base de datos (tras reconstruir o borrar el almacén)"""
+    with _readers_lock:
+        reader = _readers.pop(os.path.abspath(db_path), None)
+    if reader is not None:
+        reader.close()
+
+
+def frame_store_stats(db_path, session_id):
+    """
+    Coste de almacenamiento del almacén de frames de la sesión frente al PCAP original.
+
+    Returns:
+        dict: Frames, bloques, bytes sin comprimir, almacenados y del PCAP, o None si no existe.
+    """
+    conn = connect_readonly(db_path)
+    try:
+        row = conn.execute(
+            "SELECT frame_count, chunk_count, raw_bytes, stored_bytes, pcap_bytes, LENGTH(dictionary), "
+            "compression_level, created_at FROM frame_stores WHERE session_id = ?", (session_id,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    frame_count, chunk_count, raw_bytes, stored_bytes, pcap_bytes, dictionary_bytes, level, created_at = row
+    return {
+        "session_id": session_id,
+        "frame_count": frame_count,
+        "chunk_count": chunk_count,
+        "raw_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+        "dictionary_bytes": dictionary_bytes or 0,
+        "pcap_bytes": pcap_bytes,
+        "compression_level": level,
+        "compression_ratio": round(raw_bytes / stored_bytes, 2) if stored_bytes else None,
+        "pcap_percent": round(100.0 * stored_bytes / pcap_bytes, 2) if pcap_bytes else None,
+        "created_at": created_at,
+    }
@@ -0,0 +1,245 @@
+"""
+Búsqueda de texto completo sobre info_text y protocol_stack de los paquetes.
+
+La tabla virtual FTS5 packets_fts usa packets como contenido externo (solo
+guarda el índice invertido, no una copia del texto) y se rellena al terminar
+la ingesta de cada sesión con un único INSERT ... SELECT. La tabla
+packet_text_index registra qué sesiones están indexadas; las bases de datos
+anteriores se indexan con la migración correspondiente (database.migrations).
+
+Sintaxis de búsqueda (parse_search_query):
+    retransmission                términos sueltos (deben aparecer todos)
+    "destination unreachable"     frase exacta
+    exam*  "www.exa"*             prefijo
+    stack:dns  info:"bad checksum"  restringir a una columna
+    OR / NOT                      operadores de FTS5
+"""
+import os
+import re
+import html
+import sqlite3
+
+from sqlalchemy import select, delete, func
+
+from database.models import Packet, PacketTextIndex
+
+FTS_TABLE = 'packets_fts'
+
+# Alias de columnas aceptados en las búsquedas
+SEARCH_COLUMNS = {
+    'info': 'info_text',
+    'info_text': 'info_text',
+    'stack': 'protocol_stack',
+    'protocol_stack': 'protocol_stack',
+}
+
+# Columnas de paquete devueltas por las búsquedas
+RESULT_COLUMNS = (
+    'id', 'session_id', 'packet_number', 'timestamp', 'src_ip', 'dst_ip', 'src_port', 'dst_port',
+    'transport_protocol', 'packet_length', 'info_text', 'protocol_stack',
+)
+
+# Marcas de las coincidencias en info_text
+HIGHLIGHT_OPEN = '<mark>'
+HIGHLIGHT_CLOSE = '</mark>'
+
+# highlight() marca con caracteres de uso privado: el texto (DNS, URIs, rutas SMB...)
+# viene de la red y se escapa como HTML antes de convertirlos en las marcas
+_SENTINEL_OPEN = '\ue000'
+_SENTINEL_CLOSE = '\ue001'
+
+_TOKEN = re.compile(r'(?:(\w+):)?(?:"([^"]*)"|([^\s"]+))(\*?)')
+
+
+class FullTextSearchError(Exception):
+    """Búsqueda de texto completo no válida"""
+    pass
+
+
+def fulltext_enabled():
+    """Indica si la ingesta debe indexar el texto de los paquetes"""
+    return os.getenv('FULLTEXT_INDEX', 'true').lower() == 'true'
+
+
+def fts5_available():
+    """Indica si el SQLite enlazado incluye FTS5"""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute("CREATE VIRTUAL TABLE fts_check USING fts5(content)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+def has_fulltext_table(conn):
+    """Indica si la base de datos tiene la tabla packets_fts"""
+    return conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).first() is not None
+
+
+def ensure_fulltext_table(conn):
+    """Crea la tabla FTS5 (contenido externo: packets) y la de sesiones indexadas si no existen"""
+    PacketTextIndex.__table__.create(conn, checkfirst=True)
+    if has_fulltext_table(conn):
+        return
+    conn.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        "info_text, protocol_stack, content='packets', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    # info_text pesa más que la pila de protocolos en la relevancia
+    conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25(1.0, 0.5)')")
+
+
+def is_session_indexed(conn, session_id):
+    return conn.execute(
+        select(PacketTextIndex.session_id).where(PacketTextIndex.session_id == session_id)
+    ).first() is not None
+
+
+def unindex_packets(conn, packet_ids):
+    """Quita del índice los paquetes indicados (antes de borrarlos de packets)"""
+    if not packet_ids or not has_fulltext_table(conn):
+        return
+    placeholders = ", ".join("?" for _ in packet_ids)
+    conn.exec_driver_sql(
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, info_text, protocol_stack) "
+        f"SELECT 'delete', id, info_text, protocol_stack FROM packets WHERE id IN ({placeholders})",
+        tuple(packet_ids)
+    )
+
+
+def unindex_session_text(conn, session_id):
+    """Quita del índice todos los paquetes de la sesión"""
+    if has_fulltext_table(conn) and is_session_indexed(conn, session_id):
+        conn.exec_driver_sql(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, info_text, protocol_stack) "
+            "SELECT 'delete', id, info_text, protocol_stack FROM packets WHERE session_id = ?",
+            (session_id,)
+        )
+    conn.execute(delete(PacketTextIndex).where(PacketTextIndex.session_id == session_id))
+
+
+def index_session_text(conn, session_id):
+    """
+    Indexa el texto de los paquetes de una sesión (reemplaza el índice anterior).
+
+    Args:
+        conn: Conexión SQLAlchemy (la transacción la gestiona quien llama).
+        session_id (int): ID de la sesión.
+
+    Returns:
+        int: Paquetes indexados.
+    """
+    ensure_fulltext_table(conn)
+    unindex_session_text(conn, session_id)
+    conn.exec_driver_sql(
+        f"INSERT INTO {FTS_TABLE}(rowid, info_text, protocol_stack) "
+        "SELECT id, info_text, protocol_stack FROM packets WHERE session_id = ?",
+        (session_id,)
+    )
+    rows = conn.execute(select(func.count()).where(Packet.session_id == session_id)).scalar()
+    conn.execute(PacketTextIndex.__table__.insert().values(session_id=session_id, row_count=rows))
+    return rows
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def parse_search_query(text):
+    """
+    Traduce una búsqueda a una expresión MATCH de FTS5.
+
+    Cada término o frase se entrecomilla, de modo que la puntuación de nombres
+    DNS, IPs o mensajes no se interpreta como sintaxis de FTS5.
+    """
+    parts = []
+    for column, phrase, term, star in _TOKEN.findall(text or ''):
+        if phrase == '' and term in ('OR', 'NOT', 'AND') and not column:
+            parts.append(term)
+            continue
+        if term.endswith('*'):
+            term, star = term.rstrip('*'), '*'
+        value = phrase if phrase else term
+        if not re.search(r'\w', value):
+            continue
+        expression = _quote(value) + star
+        if column:
+            if column.lower() not in SEARCH_COLUMNS:
+                raise FullTextSearchError(
+                    f"Columna de búsqueda no válida: {column}. Opciones: {', '.join(sorted(SEARCH_COLUMNS))}"
+                )
+            expression = f"{SEARCH_COLUMNS[column.lower()]} : {expression}"
+        parts.append(expression)
+    # Los operadores no pueden quedar en los extremos
+    while parts and parts[0] in ('OR', 'NOT', 'AND'):
+        parts.pop(0)
+    while parts and parts[-1] in ('OR', 'NOT', 'AND'):
+        parts.pop()
+    if not parts:
+        raise FullTextSearchError("La búsqueda está vacía")
+    return " ".join(parts)
+
+
+def _highlight_html(text):
+    """Fragmento HTML seguro: texto escapado con las coincidencias entre <mark>"""
+    if text is None:
+        return None
+    return (html.escape(text)
+            .replace(_SENTINEL_OPEN, HIGHLIGHT_OPEN)
+            .replace(_SENTINEL_CLOSE, HIGHLIGHT_CLOSE))
+
+
+def search_packets(conn, query, session_id=None, limit=50, offset=0, order='rank'):
+    """
+    Busca paquetes por texto.
+
+    Args:
+        conn: Conexión SQLAlchemy a la base de datos de la captura.
+        query (str): Búsqueda (ver parse_search_query).
+        session_id (int, opcional): Limitar a una sesión.
+        limit (int): Resultados por página.
+        offset (int): Resultados a saltar.
+        order (str): 'rank' (relevancia) o 'time' (timestamp).
+
+    Returns:
+        tuple: (lista de paquetes con rank e info_highlight, total de coincidencias)
+    """
+    if not has_fulltext_table(conn):
+        raise FullTextSearchError("La base de datos no tiene índice de texto completo")
+    match = parse_search_query(query)
+
+    where = f"{FTS_TABLE} MATCH ?"
+    params = [match]
+    if session_id is not None:
+        where += " AND p.session_id = ?"
+        params.append(session_id)
+    order_by = f"{FTS_TABLE}.rank, p.id" if order == 'rank' else "p.timestamp, p.id"
+    columns = ", ".join(f"p.{column}" for column in RESULT_COLUMNS)
+
+    try:
+        rows = conn.exec_driver_sql(
+            f"SELECT {columns}, {FTS_TABLE}.rank, highlight({FTS_TABLE}, 0, ?, ?) "
+            f"FROM {FTS_TABLE} JOIN packets p ON p.id = {FTS_TABLE}.rowid "
+            f"WHERE {where} ORDER BY {order_by} LIMIT ? OFFSET ?",
+            tuple([_SENTINEL_OPEN, _SENTINEL_CLOSE] + params + [limit, offset])
+        ).all()
+        # Sin filtro de sesión el total se cuenta solo en el índice (sin leer packets)
+        count_from = FTS_TABLE if session_id is None else f"{FTS_TABLE} JOIN packets p ON p.id = {FTS_TABLE}.rowid"
+        total = conn.exec_driver_sql(
+            f"SELECT COUNT(*) FROM {count_from} WHERE {where}", tuple(params)
+        ).scalar()
+    except Exception as e:
+        raise FullTextSearchError(f"Búsqueda no válida: {e}")
+
+    results = []
+    for row in rows:
+        packet = dict(zip(RESULT_COLUMNS, row[:len(RESULT_COLUMNS)]))
+        packet["rank"] = row[len(RESULT_COLUMNS)]
+        packet["info_highlight"] = _highlight_html(row[len(RESULT_COLUMNS) + 1])
+        results.append(packet)
+    return results, total
@@ -0,0 +1,430 @@
+"""
+Migraciones de esquema versionadas de las bases de datos de captura.
+
+`Base.metadata.create_all` solo crea las tablas que faltan: las bases de datos
+existentes no reciben los índices nuevos ni las estructuras derivadas. Cada
+base de datos guarda su versión de esquema en PRAGMA user_version y el
+progreso de cada migración en la tabla schema_migrations, de modo que un
+relleno interrumpido se reanuda donde se quedó. Las bases de datos selladas
+(database.seal) se desprecintan mientras se migran y se vuelven a sellar.
+
+Los rellenos trabajan por bloques (MIGRATION_CHUNK_SIZE filas o una sesión)
+con una transacción corta por bloque, para no bloquear a los lectores más que
+el tiempo de cada commit. start_migration_runner() migra todo
+DATABASE_DIRECTORY en segundo plano con varios hilos en paralelo.
+
+Las migraciones de índices no se pueden trocear: CREATE INDEX recorre la tabla
+entera dentro de una única transacción de escritura. Con WAL los lectores no se
+bloquean, pero cualquier escritura en ese archivo (retención, sellado) espera a
+que termine, lo que en capturas de millones de paquetes puede llevar minutos.
+Cada versión declara su propia lista de índices, fija aunque los modelos cambien.
+"""
+import os
+import json
+import glob
+import time
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from sqlalchemy import create_engine, select, text, func
+
+from database.models import Base, CaptureSession, Packet, SessionStats, ArchiveSegment, SchemaMigration
+from database.tcp_flags import FLAG_BITS
+from database.flows import has_stored_flows, materialize_flows
+from database.fulltext import ensure_fulltext_table, index_session_text, is_session_indexed, fts5_available
+from database.analytics import get_analytics_backend
+from database.session_stats import compute_session_stats, JSON_COLUMNS
+from database.catalog import index_database
+from database.seal import connect_readonly, unsealed
+
+# Filas actualizadas por transacción en los rellenos por rangos de id
+CHUNK_SIZE = int(os.getenv('MIGRATION_CHUNK_SIZE', 5000))
+
+# Pausa (segundos) entre bloques para ceder la base de datos a los lectores
+CHUNK_PAUSE = float(os.getenv('MIGRATION_CHUNK_PAUSE', 0))
+
+# Bases de datos en migración en este proceso (evita dos migraciones simultáneas del mismo archivo)
+_running = set()
+_running_lock = threading.Lock()
+
+# Estado de la última ejecución del migrador en segundo plano
+_runner_status = {"running": False, "started_at": None, "finished_at": None, "results": {}}
+
+
+class MigrationError(Exception):
+    """Error al migrar una base de datos"""
+    pass
+
+
+class MigrationInterrupted(MigrationError):
+    """La migración se detuvo a petición; el progreso queda guardado"""
+    pass
+
+
+class MigrationProgress:
+    """Cursor de una migración guardado en schema_migrations"""
+
+    def __init__(self, engine, version, stop_event=None):
+        self.engine = engine
+        self.version = version
+        self.stop_event = stop_event
+        with engine.connect() as conn:
+            raw = conn.execute(
+                select(SchemaMigration.progress).where(SchemaMigration.version == version)
+            ).scalar()
+        self.cursor = json.loads(raw) if raw else None
+
+    def save(self, cursor, conn):
+        """Guarda el cursor en la misma transacción que el bloque procesado"""
+        conn.execute(
+            SchemaMigration.__table__.update().where(SchemaMigration.version == self.version)
+            .values(progress=json.dumps(cursor))
+        )
+        self.cursor = cursor
+
+    def checkpoint(self):
+        """Punto entre bloques: cede la base de datos y atiende las peticiones de parada"""
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise MigrationInterrupted(f"Migración {self.version} detenida")
+        if CHUNK_PAUSE:
+            time.sleep(CHUNK_PAUSE)
+
+
+def _create_tables(engine, db_path, progress):
+    """Tablas nuevas (flows, session_stats, archive_segments, ...)"""
+    Base.metadata.create_all(engine)
+
+
+def _index_migration(*indexes):
+    """
+    Migración que crea los índices indicados: (nombre, tabla, columnas).
+
+    Cada índice usa su propia transacción y entre uno y otro se atienden las
+    peticiones de parada, pero cada CREATE INDEX bloquea las escrituras en la
+    base de datos hasta terminar (ver la cabecera del módulo).
+    """
+    def _create_indexes(engine, db_path, progress):
+        for name, table_name, columns in indexes:
+            with engine.connect() as conn:
+                exists = conn.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)
+                ).first()
+            if exists:
+                continue
+            print(f"Creando índice {name} en {db_path}...")
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON {table_name} ({', '.join(columns)})")
+            progress.checkpoint()
+    _create_indexes.indexes = indexes
+    return _create_indexes
+
+
+def _backfill_tcp_flags_raw(engine, db_path, progress):
+    """tcp_flags_raw a partir de las columnas booleanas, por rangos de id"""
+    packed = " | ".join(
+        f"(CASE WHEN tcp_flag_{name} THEN {bit} ELSE 0 END)" for name, bit in FLAG_BITS.items()
+    )
+    any_flag = " OR ".join(f"tcp_flag_{name}" for name in FLAG_BITS)
+    with engine.connect() as conn:
+        max_id = conn.execute(select(func.max(Packet.id))).scalar() or 0
+    last_id = progress.cursor or 0
+    while last_id < max_id:
+        upper = last_id + CHUNK_SIZE
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"UPDATE packets SET tcp_flags_raw = {packed} "
+                f"WHERE id > :lower AND id <= :upper AND tcp_flags_raw IS NULL AND ({any_flag})"
+            ), {"lower": last_id, "upper": upper})
+            progress.save(upper, conn)
+        last_id = upper
+        progress.checkpoint()
+
+
+def _session_ids(engine, after):
+    with engine.connect() as conn:
+        return [
+            sid for (sid,) in conn.execute(
+                select(CaptureSession.id).where(CaptureSession.id > after).order_by(CaptureSession.id)
+            )
+        ]
+
+
+def _packets_archived(conn, session_id):
+    """Los paquetes de la sesión se movieron al archivo (database.retention)"""
+    return conn.execute(
+        select(ArchiveSegment.id).where(
+            ArchiveSegment.session_id == session_id, ArchiveSegment.table_name == 'packets'
+        )
+    ).first() is not None
+
+
+def _backfill_flows(engine, db_path, progress):
+    """Flujos materializados de las sesiones que no los tienen, una sesión por transacción"""
+    for session_id in _session_ids(engine, progress.cursor or 0):
+        with engine.begin() as conn:
+            if not has_stored_flows(conn, session_id) and not _packets_archived(conn, session_id):
+                materialize_flows(conn, session_id)
+            progress.save(session_id, conn)
+        progress.checkpoint()
+
+
+def _backfill_session_stats(engine, db_path, progress):
+    """Estadísticas precalculadas de las sesiones que no las tienen"""
+    session_ids = _session_ids(engine, progress.cursor or 0)
+    if not session_ids:
+        return
+    with get_analytics_backend(db_path, use_stats=False) as analytics:
+        for session_id in session_ids:
+            with engine.connect() as conn:
+                missing = conn.execute(
+                    select(SessionStats.session_id).where(SessionStats.session_id == session_id)
+                ).first() is None and not _packets_archived(conn, session_id)
+            # Las agregaciones se calculan fuera de la transacción de escritura
+            values = compute_session_stats(analytics, session_id) if missing else None
+            with engine.begin() as conn:
+                if values is not None:
+                    for column in JSON_COLUMNS:
+                        values[column] = json.dumps(values[column])
+                    conn.execute(SessionStats.__table__.insert().prefix_with("OR REPLACE").values(**values))
+                progress.save(session_id, conn)
+            progress.checkpoint()
+
+
+def _backfill_fulltext(engine, db_path, progress):
+    """Índice de texto completo de info_text y protocol_stack, una sesión por transacción"""
+    if not fts5_available():
+        print(f"SQLite sin FTS5: se omite el índice de texto completo de {db_path}")
+        return
+    with engine.begin() as conn:
+        ensure_fulltext_table(conn)
+    for session_id in _session_ids(engine, progress.cursor or 0):
+        with engine.begin() as conn:
+            if not is_session_indexed(conn, session_id) and not _packets_archived(conn, session_id):
+                index_session_text(conn, session_id)
+            progress.save(session_id, conn)
+        progress.checkpoint()
+
+
+# Migraciones en orden: (versión, nombre, función(engine, db_path, progreso))
+MIGRATIONS = (
+    (1, 'tablas_nuevas', _create_tables),
+    (2, 'indices', _index_migration(
+        ('ix_packets_session_tcp_flags', 'packets', ('session_id', 'tcp_flags_raw')),
+        ('ix_packets_src_ip_timestamp', 'packets', ('src_ip', 'timestamp')),
+        ('ix_packets_dst_ip_timestamp', 'packets', ('dst_ip', 'timestamp')),
+        ('ix_flows_session_first_seen', 'flows', ('session_id', 'first_seen')),
+    )),
+    (3, 'tcp_flags_raw', _backfill_tcp_flags_raw),
+    (4, 'flujos', _backfill_flows),
+    (5, 'estadisticas_sesion', _backfill_session_stats),
+    (6, 'texto_completo', _backfill_fulltext),
+    (7, 'indices_paginacion', _index_migration(
+        ('ix_packets_session_number', 'packets', ('session_id', 'packet_number')),
+        ('ix_packets_session_src_ip_number', 'packets', ('session_id', 'src_ip', 'packet_number')),
+        ('ix_packets_session_dst_ip_number', 'packets', ('session_id', 'dst_ip', 'packet_number')),
+        ('ix_packets_session_protocol_number', 'packets', ('session_id', 'transport_protocol', 'packet_number')),
+        ('ix_anomalies_packet_id', 'anomalies', ('packet_id',)),
+    )),
+    (8, 'indices_anomalias', _index_migration(
+        ('ix_anomalies_session_severity_type_time', 'anomalies', ('session_id', 'severity', 'type', 'detection_time')),
+        ('ix_anomalies_session_time', 'anomalies', ('session_id', 'detection_time')),
+    )),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _engine(db_path):
+    return create_engine(f'sqlite:///{db_path}', connect_args={'timeout': 30})
+
+
+def get_schema_version(conn):
+    """Versión de esquema de la base de datos (PRAGMA user_version)"""
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def _set_schema_version(conn, version):
+    conn.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+
+
+def stamp_schema_version(engine, version=SCHEMA_VERSION):
+    """Marca una base de datos recién creada con la versión actual (no necesita migraciones)"""
+    with engine.begin() as conn:
+        _set_schema_version(conn, version)
+
+
+def database_schema_version(db_path):
+    """Versión de esquema de un archivo de base de datos"""
+    conn = connect_readonly(db_path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def pending_migrations(db_path):
+    """Migraciones pendientes de una base de datos: [(versión, nombre)]"""
+    current = database_schema_version(db_path)
+    return [(version, name) for version, name, _ in MIGRATIONS if version > current]
+
+
+def migrate_database(db_path, target=None, stop_event=None):
+    """
+    Aplica las migraciones pendientes de una base de datos.
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite de la captura.
+        target (int, opcional): Versión final. Por defecto SCHEMA_VERSION.
+        stop_event (threading.Event, opcional): Detiene la migración entre bloques.
+
+    Returns:
+        dict: Versión inicial, versión final y migraciones aplicadas.
+    """
+    target = SCHEMA_VERSION if target is None else target
+    path_key = os.path.abspath(db_path)
+    with _running_lock:
+        if path_key in _running:
+            raise MigrationError(f"La base de datos {db_path} ya se está migrando")
+        _running.add(path_key)
+    try:
+        initial = database_schema_version(db_path)
+        if initial >= target:
+            return {"db_path": db_path, "from_version": initial, "to_version": initial, "applied": []}
+        with unsealed(db_path):
+            return _migrate(db_path, target, stop_event)
+    finally:
+        with _running_lock:
+            _running.discard(path_key)
+
+
+def _migrate(db_path, target, stop_event):
+    engine = _engine(db_path)
+    try:
+        SchemaMigration.__table__.create(engine, checkfirst=True)
+        with engine.connect() as conn:
+            initial = get_schema_version(conn)
+        applied = []
+        for version, name, migration in MIGRATIONS:
+            if version <= initial or version > target:
+                continue
+            start_time = time.time()
+            with engine.begin() as conn:
+                exists = conn.execute(
+                    select(SchemaMigration.version).where(SchemaMigration.version == version)
+                ).first()
+                if not exists:
+                    conn.execute(SchemaMigration.__table__.insert().values(version=version, name=name))
+            try:
+                migration(engine, db_path, MigrationProgress(engine, version, stop_event))
+            except MigrationInterrupted:
+                raise
+            except Exception as e:
+                raise MigrationError(f"Error en la migración {version} ({name}) de {db_path}: {e}")
+            with engine.begin() as conn:
+                conn.execute(
+                    SchemaMigration.__table__.update().where(SchemaMigration.version == version)
+                    .values(completed_at=datetime.now(), progress=None)
+                )
+                _set_schema_version(conn, version)
+            applied.append({"version": version, "name": name, "seconds": round(time.time() - start_time, 3)})
+        with engine.connect() as conn:
+            final = get_schema_version(conn)
+    finally:
+        engine.dispose()
+
+    return {"db_path": db_path, "from_version": initial, "to_version": final, "applied": applied}
+
+
+def migration_workers():
+    """Número de bases de datos migradas en paralelo"""
+    return max(1, int(os.getenv('MIGRATION_WORKERS', 2)))
+
+
+def migrate_directory(db_dir=None, workers=None, stop_event=None):
+    """
+    Migra en paralelo todas las bases de datos de un directorio.
+
+    Returns:
+        dict: Resultado (o error) por nombre de archivo.
+    """
+    db_dir = db_dir or os.getenv('DATABASE_DIRECTORY', './data/db_files')
+    db_paths = sorted(glob.glob(os.path.join(db_dir, '*.db')))
+    pending = [path for path in db_paths if pending_migrations(path)]
+    results = {}
+    if not pending:
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(workers or migration_workers(), len(pending))) as executor:
+        futures = {executor.submit(migrate_database, path, None, stop_event): path for path in pending}
+        for future in as_completed(futures):
+            db_file = os.path.basename(futures[future])
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error al migrar {db_file}: {e}")
+                results[db_file] = {"error": str(e)}
+                continue
+            results[db_file] = result
+            _refresh_catalog(futures[future])
+    return results
+
+
+def _refresh_catalog(db_path):
+    """Actualiza la entrada del catálogo tras añadir estadísticas o flujos"""
+    try:
+        index_database(db_path)
+    except Exception as e:
+        print(f"Error al actualizar el catálogo de {db_path}: {e}")
+
+
+def start_migration_runner(db_dir=None, workers=None):
+    """
+    Lanza en segundo plano la migración de todas las bases de datos.
+
+    Las lecturas siguen funcionando mientras tanto: cada bloque usa una
+    transacción corta y las consultas no dependen de la versión del esquema.
+
+    Returns:
+        threading.Thread: Hilo del migrador, o None si ya hay uno en marcha.
+    """
+    with _running_lock:
+        if _runner_status["running"]:
+            return None
+        _runner_status.update(running=True, started_at=datetime.now().isoformat(), finished_at=None, results={})
+
+    def _run():
+        try:
+            results = migrate_directory(db_dir, workers)
+            _runner_status["results"] = results
+            if results:
+                print(f"Migración de esquema completada: {len(results)} bases de datos")
+        except Exception as e:
+            print(f"Error en el migrador de esquema: {e}")
+            _runner_status["results"] = {"error": str(e)}
+        finally:
+            _runner_status.update(running=False, finished_at=datetime.now().isoformat())
+
+    thread = threading.Thread(target=_run, name="schema-migrator", daemon=True)
+    thread.start()
+    return thread
+
+
+def migration_status(db_dir=None):
+    """
+    Versión de esquema de cada base de datos y estado del migrador en segundo plano.
+    """
+    db_dir = db_dir or os.getenv('DATABASE_DIRECTORY', './data/db_files')
+    databases = []
+    for db_path in sorted(glob.glob(os.path.join(db_dir, '*.db'))):
+        try:
+            version = database_schema_version(db_path)
+        except Exception as e:
+            databases.append({"db_file": os.path.basename(db_path), "error": str(e)})
+            continue
+        databases.append({
+            "db_file": os.path.basename(db_path),
+            "version": version,
+            "pending": [name for number, name, _ in MIGRATIONS if number > version],
+        })
+    return {"schema_version": SCHEMA_VERSION, "runner": dict(_runner_status), "databases": databases}
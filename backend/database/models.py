@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text
+from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import os
@@ -31,6 +31,18 @@ class CaptureSession(Base):
 class Packet(Base):
     """Modelo para almacenar información detallada de paquetes"""
     __tablename__ = 'packets'
+    __table_args__ = (
+        # Sirve a cualquier consulta por patrón de flags: (tcp_flags_raw & mask) = value
+        Index('ix_packets_session_tcp_flags', 'session_id', 'tcp_flags_raw'),
+        # Búsquedas por IP entre capturas (database.federated)
+        Index('ix_packets_src_ip_timestamp', 'src_ip', 'timestamp'),
+        Index('ix_packets_dst_ip_timestamp', 'dst_ip', 'timestamp'),
+        # Paginación por clave (session_id, packet_number) y filtros de la tabla de paquetes
+        Index('ix_packets_session_number', 'session_id', 'packet_number'),
+        Index('ix_packets_session_src_ip_number', 'session_id', 'src_ip', 'packet_number'),
+        Index('ix_packets_session_dst_ip_number', 'session_id', 'dst_ip', 'packet_number'),
+        Index('ix_packets_session_protocol_number', 'session_id', 'transport_protocol', 'packet_number'),
+    )
     
     id = Column(Integer, primary_key=True)
     session_id = Column(Integer, ForeignKey('capture_sessions.id'), nullable=False)
@@ -100,18 +112,18 @@ class Packet(Base):
     tcp_seq_number = Column(Integer, nullable=True)   # Sequence Number
     tcp_ack_number = Column(Integer, nullable=True)   # Acknowledgment Number
     tcp_header_length = Column(Integer, nullable=True) # Data Offset en bytes
-    tcp_flags_raw = Column(Integer, nullable=True)    # Flags como valor entero
-    
-    # TCP Flags individuales
-    tcp_flag_ns = Column(Boolean, default=False)      # ECN-nonce
-    tcp_flag_cwr = Column(Boolean, default=False)     # Congestion Window Reduced
-    tcp_flag_ece = Column(Boolean, default=False)     # ECN-Echo
-    tcp_flag_urg = Column(Boolean, default=False)     # Urgent
-    tcp_flag_ack = Column(Boolean, default=False)     # Acknowledgment
-    tcp_flag_psh = Column(Boolean, default=False)     # Push
-    tcp_flag_rst = Column(Boolean, default=False)     # Reset
-    tcp_flag_syn = Column(Boolean, default=False)     # Synchronize
-    tcp_flag_fin = Column(Boolean, default=False)     # Finish
+    tcp_flags_raw = Column(Integer, nullable=True)    # Flags como valor entero (ver database.tcp_flags)
+    
+    # TCP Flags individuales (opcionales, derivables de tcp_flags_raw; ver STORE_TCP_FLAG_COLUMNS)
+    tcp_flag_ns = Column(Boolean, nullable=True)      # ECN-nonce
+    tcp_flag_cwr = Column(Boolean, nullable=True)     # Congestion Window Reduced
+    tcp_flag_ece = Column(Boolean, nullable=True)     # ECN-Echo
+    tcp_flag_urg = Column(Boolean, nullable=True)     # Urgent
+    tcp_flag_ack = Column(Boolean, nullable=True)     # Acknowledgment
+    tcp_flag_psh = Column(Boolean, nullable=True)     # Push
+    tcp_flag_rst = Column(Boolean, nullable=True)     # Reset
+    tcp_flag_syn = Column(Boolean, nullable=True)     # Synchronize
+    tcp_flag_fin = Column(Boolean, nullable=True)     # Finish
     
     tcp_window_size = Column(Integer, nullable=True)  # Window Size
     tcp_window_size_scalefactor = Column(Integer, nullable=True)  # Window Scale Factor
@@ -181,7 +193,7 @@ class Packet(Base):
     anomalies = relationship("Anomaly", back_populates="packet", cascade="all, delete-orphan")
     
     def __repr__(self):
-        return f"<Packet(id={self.id}, src={self.src_ip}, dst={self.dst_ip}, proto={self.protocol})>"
+        return f"<Packet(id={self.id}, src={self.src_ip}, dst={self.dst_ip}, proto={self.transport_protocol})>"
 
 class TCPInfo(Base):
     """Información adicional para paquetes TCP"""
@@ -195,14 +207,14 @@ class TCPInfo(Base):
     ack_number = Column(Integer, nullable=True)
     window_size = Column(Integer, nullable=True)
     header_length = Column(Integer, nullable=True)
-    flag_syn = Column(Boolean, default=False)
-    flag_ack = Column(Boolean, default=False)
-    flag_fin = Column(Boolean, default=False)
-    flag_rst = Column(Boolean, default=False)
-    flag_psh = Column(Boolean, default=False)
-    flag_urg = Column(Boolean, default=False)
-    flag_ece = Column(Boolean, default=False)
-    flag_cwr = Column(Boolean, default=False)
+    flag_syn = Column(Boolean, nullable=True)
+    flag_ack = Column(Boolean, nullable=True)
+    flag_fin = Column(Boolean, nullable=True)
+    flag_rst = Column(Boolean, nullable=True)
+    flag_psh = Column(Boolean, nullable=True)
+    flag_urg = Column(Boolean, nullable=True)
+    flag_ece = Column(Boolean, nullable=True)
+    flag_cwr = Column(Boolean, nullable=True)
     has_timestamp = Column(Boolean, default=False)
     timestamp_value = Column(Integer, nullable=True)
     timestamp_echo = Column(Integer, nullable=True)
@@ -250,6 +262,13 @@ class ICMPInfo(Base):
 class Anomaly(Base):
     """Modelo para almacenar anomalías detectadas en los paquetes"""
     __tablename__ = 'anomalies'
+    __table_args__ = (
+        # Anomalías de una página de paquetes
+        Index('ix_anomalies_packet_id', 'packet_id'),
+        # Filtros, facetas y paginación por clave de la tabla de anomalías
+        Index('ix_anomalies_session_severity_type_time', 'session_id', 'severity', 'type', 'detection_time'),
+        Index('ix_anomalies_session_time', 'session_id', 'detection_time'),
+    )
     
     id = Column(Integer, primary_key=True)
     packet_id = Column(Integer, ForeignKey('packets.id'), nullable=False)
@@ -265,6 +284,132 @@ class Anomaly(Base):
     def __repr__(self):
         return f"<Anomaly(id={self.id}, type={self.type}, severity={self.severity})>"
 
+class Flow(Base):
+    """Flujo (5-tupla) agregado de una sesión, materializado al terminar la ingesta"""
+    __tablename__ = 'flows'
+    __table_args__ = (
+        Index('ix_flows_session_first_seen', 'session_id', 'first_seen'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey('capture_sessions.id'), nullable=False)
+    transport_protocol = Column(String(20), nullable=True)
+    src_ip = Column(String(45), nullable=True)
+    src_port = Column(Integer, nullable=True)
+    dst_ip = Column(String(45), nullable=True)
+    dst_port = Column(Integer, nullable=True)
+    first_seen = Column(Float, nullable=True)        # Timestamp del primer paquete
+    last_seen = Column(Float, nullable=True)         # Timestamp del último paquete
+    packet_count = Column(Integer, default=0)
+    byte_count = Column(Integer, default=0)
+    
+    def __repr__(self):
+        return f"<Flow(id={self.id}, {self.src_ip}:{self.src_port} -> {self.dst_ip}:{self.dst_port})>"
+
+class ArchiveSegment(Base):
+    """Tabla de una sesión movida a almacenamiento frío (archivo Parquet comprimido)"""
+    __tablename__ = 'archive_segments'
+    
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey('capture_sessions.id'), nullable=False)
+    table_name = Column(String(50), nullable=False)  # packets, tcp_info, udp_info, icmp_info, flows
+    path = Column(String(1024), nullable=False)
+    row_count = Column(Integer, default=0)
+    size_bytes = Column(Integer, default=0)
+    archived_at = Column(DateTime, default=datetime.now)
+    
+    def __repr__(self):
+        return f"<ArchiveSegment(session_id={self.session_id}, table={self.table_name}, rows={self.row_count})>"
+
+class SessionStats(Base):
+    """Estadísticas precalculadas de una sesión de captura (una fila por sesión)"""
+    __tablename__ = 'session_stats'
+    
+    session_id = Column(Integer, ForeignKey('capture_sessions.id'), primary_key=True)
+    computed_at = Column(DateTime, default=datetime.now)
+    packet_count = Column(Integer, default=0)
+    byte_count = Column(Integer, default=0)
+    first_timestamp = Column(Float, nullable=True)
+    last_timestamp = Column(Float, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    packets_per_second = Column(Float, nullable=True)
+    unique_dst_ports = Column(Integer, default=0)
+    protocol_counts = Column(Text, nullable=True)    # Paquetes por protocolo de transporte (JSON)
+    size_stats = Column(Text, nullable=True)         # Media, mínimo, máximo y percentiles de tamaño (JSON)
+    tcp_flag_counts = Column(Text, nullable=True)    # Paquetes por patrón de flags TCP (JSON)
+    ttl_histogram = Column(Text, nullable=True)      # Paquetes por valor de TTL (JSON)
+    fragmentation = Column(Text, nullable=True)      # Paquetes fragmentados, diminutos y jumbo (JSON)
+    top_values = Column(Text, nullable=True)         # Top-K de IPs y puertos (JSON)
+    port_scanners = Column(Text, nullable=True)      # IPs origen con muchos puertos destino (JSON)
+    traffic_intervals = Column(Text, nullable=True)  # Máximo y media de paquetes por intervalo (JSON)
+    asymmetric_pairs = Column(Text, nullable=True)   # Pares de IPs con tráfico muy asimétrico (JSON)
+    anomaly_counts = Column(Text, nullable=True)     # Anomalías por tipo (JSON)
+    
+    def __repr__(self):
+        return f"<SessionStats(session_id={self.session_id}, packets={self.packet_count})>"
+
+class FrameStore(Base):
+    """Almacén comprimido de los frames en bruto de una sesión (database.frame_store)"""
+    __tablename__ = 'frame_stores'
+    
+    session_id = Column(Integer, ForeignKey('capture_sessions.id'), primary_key=True)
+    created_at = Column(DateTime, default=datetime.now)
+    link_type = Column(Integer, default=1)            # LINKTYPE del PCAP original (1 = Ethernet)
+    snaplen = Column(Integer, default=65535)
+    dictionary = Column(LargeBinary, nullable=True)  # Diccionario zstd entrenado con la sesión
+    compression_level = Column(Integer, default=3)
+    frame_count = Column(Integer, default=0)
+    chunk_count = Column(Integer, default=0)
+    raw_bytes = Column(Integer, default=0)           # Bytes de los frames sin comprimir
+    stored_bytes = Column(Integer, default=0)        # Bytes de los bloques comprimidos y el diccionario
+    pcap_bytes = Column(Integer, nullable=True)      # Tamaño del PCAP original
+    
+    def __repr__(self):
+        return f"<FrameStore(session_id={self.session_id}, frames={self.frame_count})>"
+
+class FrameChunk(Base):
+    """Bloque de frames consecutivos de una sesión comprimido con zstd"""
+    __tablename__ = 'frame_chunks'
+    __table_args__ = (
+        Index('ix_frame_chunks_session_first_packet', 'session_id', 'first_packet'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey('capture_sessions.id'), nullable=False)
+    first_packet = Column(Integer, nullable=False)   # packet_number del primer frame
+    last_packet = Column(Integer, nullable=False)
+    first_timestamp = Column(Float, nullable=True)
+    last_timestamp = Column(Float, nullable=True)
+    raw_size = Column(Integer, default=0)
+    data = Column(LargeBinary, nullable=False)
+    
+    def __repr__(self):
+        return f"<FrameChunk(session_id={self.session_id}, packets={self.first_packet}-{self.last_packet})>"
+
+class PacketTextIndex(Base):
+    """Sesión indexada en la tabla de texto completo packets_fts (database.fulltext)"""
+    __tablename__ = 'packet_text_index'
+    
+    session_id = Column(Integer, ForeignKey('capture_sessions.id'), primary_key=True)
+    indexed_at = Column(DateTime, default=datetime.now)
+    row_count = Column(Integer, default=0)
+    
+    def __repr__(self):
+        return f"<PacketTextIndex(session_id={self.session_id}, rows={self.row_count})>"
+
+class SchemaMigration(Base):
+    """Migración de esquema aplicada (o en curso) en la base de datos, con su progreso"""
+    __tablename__ = 'schema_migrations'
+    
+    version = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    started_at = Column(DateTime, default=datetime.now)
+    completed_at = Column(DateTime, nullable=True)
+    progress = Column(Text, nullable=True)           # Cursor para reanudar el relleno (JSON)
+    
+    def __repr__(self):
+        return f"<SchemaMigration(version={self.version}, name={self.name})>"
+
 def init_db(db_path=None, force_new=False):
     """
     Inicializa la base de datos. Busca la más reciente o crea una nueva.
@@ -0,0 +1,209 @@
+"""
+Exportación columnar (Parquet) de las sesiones de captura.
+
+Los datos se leen directamente del cursor de la base de datos en bloques de
+tamaño acotado y cada bloque se escribe como un row group independiente, de
+modo que nunca se materializa la tabla completa en memoria.
+
+Las filas salen en el orden de un índice de la tabla (los paquetes por
+(session_id, packet_number)), sin ordenar en SQLite, y ese orden se declara en
+los metadatos de cada row group (sorting_columns). El orden de captura no es
+estrictamente temporal: quien necesite los paquetes por timestamp los ordena
+al leerlos.
+"""
+import os
+from sqlalchemy import create_engine, select, Integer, Float, Boolean, DateTime
+
+from database.models import Packet, Anomaly, TCPInfo, UDPInfo, ICMPInfo
+from database.flows import flows_statement
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es una dependencia opcional
+    pa = None
+    pq = None
+
+# Número máximo de filas por row group (y por lectura del cursor)
+DEFAULT_ROW_GROUP_SIZE = int(os.getenv('PARQUET_ROW_GROUP_SIZE', 65536))
+
+# Tablas exportables para una sesión
+EXPORT_TABLES = ('packets', 'flows', 'anomalies')
+
+# Tablas de detalle por paquete (1:1 con packets), exportables para el archivado
+PACKET_DETAIL_TABLES = {
+    'tcp_info': TCPInfo,
+    'udp_info': UDPInfo,
+    'icmp_info': ICMPInfo,
+}
+
+
+class ParquetExportError(Exception):
+    """Error durante la exportación a Parquet"""
+    pass
+
+
+def pyarrow_available():
+    """Indica si pyarrow está instalado"""
+    return pa is not None
+
+
+def sidecar_path(db_path, session_id, table, output_dir):
+    """Ruta del archivo Parquet de una tabla de la sesión dentro de output_dir"""
+    base = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(output_dir, f"{base}_session{session_id}_{table}.parquet")
+
+
+def _arrow_type(sql_type):
+    """Traduce un tipo de columna SQLAlchemy a su tipo Arrow equivalente"""
+    if isinstance(sql_type, Boolean):
+        return pa.bool_()
+    if isinstance(sql_type, Integer):
+        return pa.int64()
+    if isinstance(sql_type, Float):
+        return pa.float64()
+    if isinstance(sql_type, DateTime):
+        return pa.timestamp('us')
+    return pa.string()
+
+
+def _export_statement(conn, table, session_id):
+    """
+    Construye la consulta y el esquema Arrow de una tabla exportable.
+
+    Returns:
+        tuple: (consulta SQLAlchemy, pyarrow.Schema, columnas por las que sale ordenada)
+    """
+    sort_columns = []
+    if table == 'packets':
+        columns = list(Packet.__table__.columns)
+        # Orden del índice ix_packets_session_number
+        stmt = select(*columns).where(
+            Packet.session_id == session_id
+        ).order_by(Packet.packet_number)
+        fields = [pa.field(c.name, _arrow_type(c.type)) for c in columns]
+        sort_columns = ['packet_number']
+
+    elif table == 'anomalies':
+        columns = list(Anomaly.__table__.columns)
+        stmt = select(
+            *columns, Packet.timestamp.label('packet_timestamp')
+        ).outerjoin(
+            Packet, Packet.id == Anomaly.packet_id
+        ).where(
+            Anomaly.session_id == session_id
+        ).order_by(Anomaly.detection_time, Anomaly.id)
+        fields = [pa.field(c.name, _arrow_type(c.type)) for c in columns]
+        fields.append(pa.field('packet_timestamp', pa.float64()))
+        # Orden del índice ix_anomalies_session_time
+        sort_columns = ['detection_time', 'id']
+
+    elif table in PACKET_DETAIL_TABLES:
+        model = PACKET_DETAIL_TABLES[table]
+        columns = list(model.__table__.columns)
+        stmt = select(*columns).join(
+            Packet, Packet.id == model.packet_id
+        ).where(
+            Packet.session_id == session_id
+        ).order_by(model.packet_id)
+        fields = [pa.field(c.name, _arrow_type(c.type)) for c in columns]
+        sort_columns = ['packet_id']
+
+    elif table == 'flows':
+        stmt = flows_statement(conn, session_id)
+        fields = [
+            pa.field('transport_protocol', pa.string()),
+            pa.field('src_ip', pa.string()),
+            pa.field('src_port', pa.int64()),
+            pa.field('dst_ip', pa.string()),
+            pa.field('dst_port', pa.int64()),
+            pa.field('first_seen', pa.float64()),
+            pa.field('last_seen', pa.float64()),
+            pa.field('packet_count', pa.int64()),
+            pa.field('byte_count', pa.int64()),
+        ]
+
+    else:
+        raise ParquetExportError(f"Tabla no exportable: {table}")
+
+    return stmt, pa.schema(fields), sort_columns
+
+
+def export_table(engine, session_id, table, output_path, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Exporta una tabla de una sesión a un archivo Parquet.
+
+    Args:
+        engine: Motor SQLAlchemy de la base de datos de captura.
+        session_id (int): ID de la sesión a exportar.
+        table (str): Una de EXPORT_TABLES o PACKET_DETAIL_TABLES.
+        output_path (str): Ruta del archivo Parquet a generar.
+        row_group_size (int): Filas por row group.
+
+    Returns:
+        int: Número de filas escritas.
+    """
+    if not pyarrow_available():
+        raise ParquetExportError("pyarrow no está instalado (pip install pyarrow)")
+
+    rows_written = 0
+
+    with engine.connect() as conn:
+        stmt, schema, sort_columns = _export_statement(conn, table, session_id)
+        string_columns = [f.name for f in schema if pa.types.is_string(f.type)]
+        result = conn.execution_options(yield_per=row_group_size).execute(stmt)
+        with pq.ParquetWriter(
+            output_path,
+            schema,
+            compression='zstd',
+            use_dictionary=string_columns,
+            sorting_columns=[pq.SortingColumn(schema.get_field_index(name)) for name in sort_columns] or None,
+        ) as writer:
+            for rows in result.partitions():
+                columns = list(zip(*rows))
+                batch = pa.record_batch(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                    schema=schema,
+                )
+                writer.write_batch(batch, row_group_size=row_group_size)
+                rows_written += len(rows)
+
+            # Un archivo sin row groups sigue siendo válido, pero conviene que tenga el esquema
+            if rows_written == 0:
+                writer.write_table(schema.empty_table())
+
+    return rows_written
+
+
+def export_session(db_path, session_id, output_dir, tables=EXPORT_TABLES, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Exporta las tablas de una sesión a archivos Parquet en un directorio.
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite de la captura.
+        session_id (int): ID de la sesión a exportar.
+        output_dir (str): Directorio de salida.
+        tables (iterable): Tablas a exportar.
+        row_group_size (int): Filas por row group.
+
+    Returns:
+        dict: Por tabla, ruta del archivo, filas escritas y tamaño en bytes.
+    """
+    if not os.path.exists(db_path):
+        raise ParquetExportError(f"La base de datos '{db_path}' no existe")
+
+    os.makedirs(output_dir, exist_ok=True)
+    engine = create_engine(f'sqlite:///{db_path}')
+    summary = {}
+    try:
+        for table in tables:
+            output_path = sidecar_path(db_path, session_id, table, output_dir)
+            rows = export_table(engine, session_id, table, output_path, row_group_size)
+            summary[table] = {
+                "path": output_path,
+                "rows": rows,
+                "size_bytes": os.path.getsize(output_path),
+            }
+    finally:
+        engine.dispose()
+    return summary
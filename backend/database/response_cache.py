@@ -0,0 +1,164 @@
+"""
+Caché de respuestas de las vistas de análisis (sesiones, detalles y analítica).
+
+Una captura procesada no cambia, pero AnalysisPage vuelve a pedir las mismas
+agregaciones cada vez que se monta. Las respuestas se guardan ya
+serializadas en una caché LRU acotada en bytes (RESPONSE_CACHE_MAX_BYTES) y
+con la clave:
+
+    (ruta, identidad del contenido, endpoint, parámetros)
+
+La identidad del contenido (content_identity) incluye el inodo, el estado de
+sellado y el mtime y tamaño del archivo y de su -wal: si la base de datos se
+modifica, se reemplaza, se sella o se desprecinta, la clave cambia y las
+entradas anteriores del archivo se descartan.
+
+El ETag se deriva de la clave, de modo que una petición con If-None-Match
+vigente se responde con 304 sin consultar la base de datos ni la caché.
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from database.seal import database_identity
+
+# Activar la caché de respuestas
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Tamaño máximo de la caché (bytes de las respuestas serializadas)
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+_entries = OrderedDict()
+_identities = {}
+_lock = threading.Lock()
+_size = 0
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "not_modified": 0}
+
+
+def content_identity(db_path):
+    """
+    Identidad del contenido de una base de datos de captura.
+
+    A diferencia de database_identity (que solo distingue el archivo y su
+    modo de apertura), cambia con cualquier escritura: el mtime y el tamaño
+    del archivo principal y del -wal, si existe.
+
+    Raises:
+        FileNotFoundError: Si el archivo no existe.
+    """
+    st = os.stat(db_path)
+    identity = database_identity(db_path) + (st.st_mtime_ns, st.st_size)
+    try:
+        wal = os.stat(f"{db_path}-wal")
+        identity += (wal.st_mtime_ns, wal.st_size)
+    except FileNotFoundError:
+        pass
+    return identity
+
+
+def cache_key(db_path, endpoint, params=None):
+    """Clave de la respuesta: (ruta, identidad del contenido, endpoint, parámetros ordenados)"""
+    path = os.path.abspath(db_path)
+    return path, content_identity(path), endpoint, tuple(sorted((params or {}).items()))
+
+
+def etag_for(key):
+    """ETag fuerte derivado de la clave"""
+    return '"' + hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Comprueba la cabecera If-None-Match (lista de ETags, débiles o '*')"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate == etag:
+            return True
+    return False
+
+
+def _invalidate_path(path, identity):
+    """Descarta las entradas de un archivo cuya identidad ya no es la actual (con el lock tomado)"""
+    global _size
+    if _identities.get(path) == identity:
+        return
+    stale = [key for key in _entries if key[0] == path and key[1] != identity]
+    for key in stale:
+        _size -= len(_entries.pop(key))
+    if stale:
+        _stats["invalidations"] += len(stale)
+    _identities[path] = identity
+
+
+def _store(key, body):
+    global _size
+    if len(body) > RESPONSE_CACHE_MAX_BYTES:
+        return
+    with _lock:
+        _invalidate_path(key[0], key[1])
+        previous = _entries.pop(key, None)
+        if previous is not None:
+            _size -= len(previous)
+        _entries[key] = body
+        _size += len(body)
+        while _size > RESPONSE_CACHE_MAX_BYTES:
+            _, evicted = _entries.popitem(last=False)
+            _size -= len(evicted)
+            _stats["evictions"] += 1
+
+
+def cached_json(db_path, endpoint, params, compute, if_none_match=None):
+    """
+    Respuesta JSON cacheada de una vista.
+
+    Args:
+        db_path (str): Base de datos de la captura.
+        endpoint (str): Nombre de la vista.
+        params (dict): Parámetros que determinan la respuesta.
+        compute (callable): Calcula la respuesta (objeto serializable) si no está en caché.
+        if_none_match (str, opcional): Cabecera If-None-Match de la petición.
+
+    Returns:
+        tuple: (etag, cuerpo en bytes o None si el cliente ya tiene la versión vigente).
+    """
+    key = cache_key(db_path, endpoint, params)
+    etag = etag_for(key)
+    if etag_matches(if_none_match, etag):
+        with _lock:
+            _stats["not_modified"] += 1
+        return etag, None
+
+    if RESPONSE_CACHE_ENABLED:
+        with _lock:
+            _invalidate_path(key[0], key[1])
+            body = _entries.get(key)
+            if body is not None:
+                _entries.move_to_end(key)
+                _stats["hits"] += 1
+                return etag, body
+            _stats["misses"] += 1
+
+    body = json.dumps(compute(), default=str, ensure_ascii=False).encode('utf-8')
+    if RESPONSE_CACHE_ENABLED:
+        _store(key, body)
+    return etag, body
+
+
+def clear_response_cache():
+    """Vacía la caché (pruebas y mantenimiento)"""
+    global _size
+    with _lock:
+        _entries.clear()
+        _identities.clear()
+        _size = 0
+
+
+def response_cache_stats():
+    """Entradas, bytes ocupados y contadores de aciertos, fallos, expulsiones e invalidaciones"""
+    with _lock:
+        return {"entries": len(_entries), "bytes": _size, "max_bytes": RESPONSE_CACHE_MAX_BYTES, **_stats}
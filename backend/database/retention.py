@@ -0,0 +1,455 @@
+"""
+Retención por niveles de los datos de captura.
+
+- Paquetes en bruto (packets y sus tablas de detalle): se conservan
+  RETENTION_RAW_DAYS días en SQLite.
+- Flujos (tabla flows): se conservan RETENTION_FLOW_DAYS días.
+- Agregados (session_stats, anomalías, sesiones): se conservan siempre.
+
+Los datos caducados se mueven a archivos Parquet comprimidos (zstd) en
+ARCHIVE_DIRECTORY, se registran en archive_segments y se borran de la base de
+datos por bloques; el espacio se recupera con vacuum incremental. Las bases de
+datos sin auto_vacuum=INCREMENTAL (anteriores a ese ajuste) solo se señalan: la
+conversión exige un VACUUM completo que reescribe el archivo y se hace aparte
+con convert_to_incremental() (db_retention.py --convert-incremental). La analítica
+sigue funcionando sobre las sesiones archivadas porque se responde desde
+session_stats (y DuckDB puede leer los archivos archivados), y los datos
+pueden rehidratarse bajo demanda con rehydrate_session().
+"""
+import os
+import time
+import sqlite3
+
+from sqlalchemy import create_engine, select, delete, func
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Base, CaptureSession, Packet, Flow, SessionStats, ArchiveSegment, PacketTextIndex
+from database.parquet_export import export_table, sidecar_path, pyarrow_available, PACKET_DETAIL_TABLES, pq
+from database.flows import has_stored_flows, materialize_flows
+from database.fulltext import unindex_packets, index_session_text, has_fulltext_table
+from database.session_stats import save_session_stats
+from database.analytics import get_analytics_backend
+from database.catalog import index_database
+from database.seal import is_sealed, unsealed
+
+# Tablas que forman los paquetes en bruto (packets debe rehidratarse primero)
+RAW_TABLES = ('packets',) + tuple(PACKET_DETAIL_TABLES)
+
+# Filas borradas o reinsertadas por transacción
+CHUNK_SIZE = int(os.getenv('RETENTION_CHUNK_SIZE', 10000))
+
+SECONDS_PER_DAY = 86400
+
+
+class RetentionError(Exception):
+    """Error al aplicar la retención o al rehidratar una sesión"""
+    pass
+
+
+class RetentionPolicy:
+    """Días que se conserva cada nivel en SQLite (None = para siempre)"""
+
+    def __init__(self, raw_days=7, flow_days=90):
+        self.raw_days = raw_days
+        self.flow_days = flow_days
+
+    @classmethod
+    def from_env(cls):
+        """Política configurada con RETENTION_RAW_DAYS y RETENTION_FLOW_DAYS"""
+        return cls(
+            raw_days=_days(os.getenv('RETENTION_RAW_DAYS', '7')),
+            flow_days=_days(os.getenv('RETENTION_FLOW_DAYS', '90')),
+        )
+
+    def to_dict(self):
+        return {"raw_days": self.raw_days, "flow_days": self.flow_days, "rollup_days": None}
+
+
+def _days(value):
+    """Convierte el valor de una variable de entorno en días ('' o 'forever' = None)"""
+    if value is None or value.strip().lower() in ('', 'none', 'forever'):
+        return None
+    return float(value)
+
+
+def get_archive_directory():
+    """Directorio de los archivos Parquet archivados"""
+    return os.getenv('ARCHIVE_DIRECTORY', './data/archive')
+
+
+def _table(name):
+    return Base.metadata.tables[name]
+
+
+def _session_end(conn, session_id):
+    """Timestamp del último paquete de la sesión (o de la fecha de captura)"""
+    last_ts = conn.execute(
+        select(SessionStats.last_timestamp).where(SessionStats.session_id == session_id)
+    ).scalar()
+    if last_ts is None:
+        last_ts = conn.execute(
+            select(func.max(Packet.timestamp)).where(Packet.session_id == session_id)
+        ).scalar()
+    if last_ts is None:
+        capture_date = conn.execute(
+            select(CaptureSession.capture_date).where(CaptureSession.id == session_id)
+        ).scalar()
+        last_ts = capture_date.timestamp() if capture_date else None
+    return last_ts
+
+
+def _archived_tables(conn, session_id):
+    return {
+        table for (table,) in conn.execute(
+            select(ArchiveSegment.table_name).where(ArchiveSegment.session_id == session_id)
+        )
+    }
+
+
+def _count_rows(conn, table, session_id):
+    """Filas de una tabla pertenecientes a la sesión"""
+    if table == 'packets':
+        return conn.execute(select(func.count()).where(Packet.session_id == session_id)).scalar()
+    if table == 'flows':
+        return conn.execute(select(func.count()).where(Flow.session_id == session_id)).scalar()
+    detail = _table(table)
+    return conn.execute(
+        select(func.count()).select_from(detail).join(Packet, Packet.id == detail.c.packet_id)
+        .where(Packet.session_id == session_id)
+    ).scalar()
+
+
+def _delete_chunked(engine, table, session_id):
+    """Borra las filas de la sesión en transacciones de CHUNK_SIZE filas"""
+    deleted = 0
+    while True:
+        with engine.begin() as conn:
+            if table == 'packets':
+                ids = [pid for (pid,) in conn.execute(
+                    select(Packet.id).where(Packet.session_id == session_id).limit(CHUNK_SIZE)
+                )]
+                # El índice de texto completo usa packets como contenido externo
+                unindex_packets(conn, ids)
+                result = conn.execute(delete(Packet).where(Packet.id.in_(ids)))
+            elif table == 'flows':
+                ids = select(Flow.id).where(Flow.session_id == session_id).limit(CHUNK_SIZE)
+                result = conn.execute(delete(Flow).where(Flow.id.in_(ids)))
+            else:
+                detail = _table(table)
+                ids = select(detail.c.id).join(Packet, Packet.id == detail.c.packet_id).where(
+                    Packet.session_id == session_id
+                ).limit(CHUNK_SIZE)
+                result = conn.execute(delete(detail).where(detail.c.id.in_(ids)))
+        deleted += result.rowcount
+        if result.rowcount < CHUNK_SIZE:
+            return deleted
+
+
+def _archive_tables(engine, db_path, session_id, tables, archive_dir):
+    """
+    Exporta las tablas de la sesión a Parquet, registra los segmentos y borra las filas.
+
+    Las tablas de detalle se borran antes que packets. Si el proceso se
+    interrumpe, el segmento ya registrado permite completar el borrado en la
+    siguiente ejecución.
+
+    Returns:
+        dict: Filas archivadas por tabla.
+    """
+    archived = {}
+    with engine.connect() as conn:
+        already = _archived_tables(conn, session_id)
+
+    for table in tables:
+        if table in already:
+            continue
+        with engine.connect() as conn:
+            expected = _count_rows(conn, table, session_id)
+        path = sidecar_path(db_path, session_id, table, archive_dir)
+        rows = export_table(engine, session_id, table, path)
+        if rows != expected:
+            os.remove(path)
+            raise RetentionError(f"Exportación incompleta de {table} (sesión {session_id}): {rows} de {expected} filas")
+        with engine.begin() as conn:
+            conn.execute(ArchiveSegment.__table__.insert().values(
+                session_id=session_id, table_name=table, path=os.path.abspath(path),
+                row_count=rows, size_bytes=os.path.getsize(path)
+            ))
+        archived[table] = rows
+
+    # Borrado (también completa archivados interrumpidos)
+    for table in sorted(tables, key=lambda name: name == 'packets'):
+        _delete_chunked(engine, table, session_id)
+    if 'packets' in tables:
+        with engine.begin() as conn:
+            conn.execute(delete(PacketTextIndex).where(PacketTextIndex.session_id == session_id))
+    return archived
+
+
+def is_incremental(db_path):
+    """Indica si la base de datos tiene auto_vacuum=INCREMENTAL"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    finally:
+        conn.close()
+
+
+def reclaim_space(db_path, pages=None):
+    """
+    Recupera el espacio libre de la base de datos con vacuum incremental.
+
+    Sin auto_vacuum=INCREMENTAL no se recupera nada: las páginas libres se
+    reutilizan en las siguientes escrituras (ver convert_to_incremental).
+
+    Returns:
+        int: Bytes recuperados.
+    """
+    if pages is None:
+        pages = int(os.getenv('RETENTION_VACUUM_PAGES', 0))
+    if not is_incremental(db_path):
+        print(f"{db_path} no tiene auto_vacuum=INCREMENTAL: no se recupera el espacio "
+              f"(db_retention.py --convert-incremental)")
+        return 0
+    size_before = os.path.getsize(db_path)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        # incremental_vacuum libera páginas mientras se recorre el resultado
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})" if pages else "PRAGMA incremental_vacuum").fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+    return size_before - os.path.getsize(db_path)
+
+
+def convert_to_incremental(db_path):
+    """
+    Convierte una base de datos a auto_vacuum=INCREMENTAL (paso único y explícito).
+
+    Requiere un VACUUM completo, que reescribe el archivo entero (necesita otro
+    tanto de espacio libre) y bloquea la base de datos mientras dura.
+
+    Returns:
+        int: Bytes recuperados, o None si ya era incremental.
+    """
+    if is_incremental(db_path):
+        return None
+    with unsealed(db_path):
+        size_before = os.path.getsize(db_path)
+        print(f"Convirtiendo {db_path} a auto_vacuum=INCREMENTAL (VACUUM completo)...")
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        reclaimed = size_before - os.path.getsize(db_path)
+    try:
+        index_database(db_path)
+    except Exception as e:
+        print(f"Error al actualizar el catálogo tras la conversión: {e}")
+    return reclaimed
+
+
+def apply_retention(db_path, policy=None, now=None, archive_dir=None, dry_run=False):
+    """
+    Aplica la política de retención a una base de datos de captura.
+
+    Una base de datos sellada solo se desprecinta si hay algo que archivar, y
+    se vuelve a sellar al terminar.
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite de la captura.
+        policy (RetentionPolicy, opcional): Por defecto RetentionPolicy.from_env().
+        now (float, opcional): Instante de referencia (epoch). Por defecto ahora.
+        archive_dir (str, opcional): Directorio de archivado. Por defecto ARCHIVE_DIRECTORY.
+        dry_run (bool): Solo indicar qué se archivaría.
+
+    Returns:
+        dict: Sesiones y filas archivadas por nivel, bytes recuperados y si la base
+        de datos admite vacuum incremental (incremental_vacuum).
+    """
+    if not pyarrow_available():
+        raise RetentionError("La retención requiere pyarrow para escribir los archivos Parquet")
+    policy = policy or RetentionPolicy.from_env()
+    now = time.time() if now is None else now
+    archive_dir = archive_dir or get_archive_directory()
+    os.makedirs(archive_dir, exist_ok=True)
+
+    if dry_run:
+        return _apply_retention(db_path, policy, now, archive_dir, dry_run=True)
+    if is_sealed(db_path):
+        planned = _apply_retention(db_path, policy, now, archive_dir, dry_run=True)
+        if not planned["raw"] and not planned["flows"]:
+            return {**planned, "dry_run": False}
+
+    with unsealed(db_path):
+        summary = _apply_retention(db_path, policy, now, archive_dir, dry_run=False)
+        if summary["raw"] or summary["flows"]:
+            summary["reclaimed_bytes"] = reclaim_space(db_path)
+    if summary["raw"] or summary["flows"]:
+        try:
+            index_database(db_path)
+        except Exception as e:
+            print(f"Error al actualizar el catálogo tras la retención: {e}")
+    return summary
+
+
+def _apply_retention(db_path, policy, now, archive_dir, dry_run):
+    engine = create_engine(f'sqlite:///{db_path}', connect_args={'timeout': 30})
+    Base.metadata.create_all(engine)
+    summary = {"db_path": db_path, "policy": policy.to_dict(), "raw": {}, "flows": {},
+               "dry_run": dry_run, "reclaimed_bytes": 0, "incremental_vacuum": is_incremental(db_path)}
+    try:
+        with engine.connect() as conn:
+            session_ids = [sid for (sid,) in conn.execute(select(CaptureSession.id).order_by(CaptureSession.id))]
+
+        for session_id in session_ids:
+            with engine.connect() as conn:
+                session_end = _session_end(conn, session_id)
+                archived = _archived_tables(conn, session_id)
+                has_packets = conn.execute(
+                    select(Packet.id).where(Packet.session_id == session_id).limit(1)
+                ).first() is not None
+                has_flows = has_stored_flows(conn, session_id)
+            if session_end is None:
+                continue
+            age_days = (now - session_end) / SECONDS_PER_DAY
+
+            raw_expired = policy.raw_days is not None and age_days > policy.raw_days and has_packets
+            flows_expired = policy.flow_days is not None and age_days > policy.flow_days and \
+                (has_flows or has_packets) and 'flows' not in archived
+
+            if dry_run:
+                if raw_expired:
+                    summary["raw"][session_id] = round(age_days, 2)
+                if flows_expired:
+                    summary["flows"][session_id] = round(age_days, 2)
+                continue
+
+            if raw_expired:
+                # Antes de archivar los paquetes, asegurar los niveles que se quedan en caliente
+                with engine.connect() as conn:
+                    has_stats = conn.execute(
+                        select(SessionStats.session_id).where(SessionStats.session_id == session_id)
+                    ).first() is not None
+                if not has_stats:
+                    db_session = sessionmaker(bind=engine)()
+                    try:
+                        with get_analytics_backend(db_path, use_stats=False) as analytics:
+                            save_session_stats(db_session, analytics, session_id)
+                    finally:
+                        db_session.close()
+                if not has_flows:
+                    with engine.begin() as conn:
+                        materialize_flows(conn, session_id)
+                    has_flows = True
+                summary["raw"][session_id] = _archive_tables(engine, db_path, session_id, RAW_TABLES, archive_dir)
+
+            if flows_expired:
+                if not has_flows:
+                    with engine.begin() as conn:
+                        materialize_flows(conn, session_id)
+                summary["flows"][session_id] = _archive_tables(engine, db_path, session_id, ('flows',), archive_dir)
+    finally:
+        engine.dispose()
+
+    return summary
+
+
+def archive_status(db_path, session_id):
+    """
+    Segmentos archivados de una sesión.
+
+    Returns:
+        list: Tabla, ruta, filas, tamaño y fecha de cada segmento.
+    """
+    engine = create_engine(f'sqlite:///{db_path}')
+    try:
+        Base.metadata.create_all(engine)
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(ArchiveSegment.__table__).where(ArchiveSegment.session_id == session_id).order_by(ArchiveSegment.id)
+            ).mappings().all()
+    finally:
+        engine.dispose()
+    return [
+        {
+            "table": row["table_name"],
+            "path": row["path"],
+            "rows": row["row_count"],
+            "size_bytes": row["size_bytes"],
+            "archived_at": row["archived_at"].isoformat() if row["archived_at"] else None,
+            "available": os.path.exists(row["path"]),
+        }
+        for row in rows
+    ]
+
+
+def rehydrate_session(db_path, session_id, tables=None, keep_archive=False):
+    """
+    Devuelve a SQLite las tablas archivadas de una sesión.
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite de la captura.
+        session_id (int): ID de la sesión.
+        tables (iterable, opcional): Tablas a rehidratar. Por defecto todas las archivadas.
+        keep_archive (bool): Conservar los archivos Parquet tras rehidratar.
+
+    Returns:
+        dict: Filas reinsertadas por tabla.
+    """
+    if not pyarrow_available():
+        raise RetentionError("La rehidratación requiere pyarrow para leer los archivos Parquet")
+
+    with unsealed(db_path):
+        return _rehydrate_session(db_path, session_id, tables, keep_archive)
+
+
+def _rehydrate_session(db_path, session_id, tables, keep_archive):
+    engine = create_engine(f'sqlite:///{db_path}', connect_args={'timeout': 30})
+    Base.metadata.create_all(engine)
+    restored = {}
+    try:
+        with engine.connect() as conn:
+            segments = conn.execute(
+                select(ArchiveSegment.id, ArchiveSegment.table_name, ArchiveSegment.path)
+                .where(ArchiveSegment.session_id == session_id)
+            ).all()
+        # packets antes que sus tablas de detalle
+        order = {table: index for index, table in enumerate(RAW_TABLES + ('flows',))}
+        segments = sorted(segments, key=lambda segment: order.get(segment.table_name, len(order)))
+
+        for segment_id, table, path in segments:
+            if tables is not None and table not in tables:
+                continue
+            if not os.path.exists(path):
+                raise RetentionError(f"No se encuentra el archivo archivado: {path}")
+            target = _table(table)
+            columns = set(target.c.keys())
+            rows = 0
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=CHUNK_SIZE):
+                records = [
+                    {key: value for key, value in record.items() if key in columns}
+                    for record in batch.to_pylist()
+                ]
+                if table == 'flows':
+                    for record in records:
+                        record['session_id'] = session_id
+                if records:
+                    with engine.begin() as conn:
+                        conn.execute(target.insert(), records)
+                rows += len(records)
+            with engine.begin() as conn:
+                conn.execute(delete(ArchiveSegment).where(ArchiveSegment.id == segment_id))
+            if not keep_archive:
+                os.remove(path)
+            restored[table] = rows
+
+        if 'packets' in restored:
+            with engine.begin() as conn:
+                if has_fulltext_table(conn):
+                    index_session_text(conn, session_id)
+    finally:
+        engine.dispose()
+    return restored
@@ -0,0 +1,229 @@
+"""
+Sellado de bases de datos de captura finalizadas.
+
+Al terminar la ingesta (y el resto del postproceso) la base de datos se sella:
+
+1. Se consolida en un único archivo (journal_mode=DELETE), se actualizan las
+   estadísticas del planificador (ANALYZE) y se calculan las estadísticas
+   finales (sesiones, paquetes, anomalías y rango temporal).
+2. Se calcula el SHA-256 del archivo y se escribe, junto con lo anterior, en
+   un sidecar <archivo>.db.seal. La presencia del sidecar marca el archivo
+   como sellado.
+3. El archivo pasa a solo lectura (0444).
+
+Los lectores de un archivo sellado lo abren con mode=ro&immutable=1: SQLite no
+toma bloqueos ni comprueba el journal, y con mmap_size (SEALED_MMAP_SIZE) las
+páginas se leen directamente del mapa en memoria. Las escrituras se rechazan
+(ensure_writable, DatabaseSealedError); los procesos de mantenimiento que
+deben modificar un archivo sellado (retención, migraciones, reingesta) lo
+desprecintan con unsealed(), que lo vuelve a sellar al terminar.
+"""
+import os
+import json
+import stat
+import sqlite3
+import hashlib
+import urllib.parse
+from contextlib import contextmanager
+from datetime import datetime
+
+SEAL_SUFFIX = '.seal'
+SEAL_FORMAT_VERSION = 1
+
+# Tamaño del mapa en memoria de las conexiones a archivos sellados
+SEALED_MMAP_SIZE = int(os.getenv('SEALED_MMAP_SIZE', 256 * 1024 * 1024))
+
+
+class DatabaseSealedError(Exception):
+    """Escritura sobre una base de datos sellada"""
+    pass
+
+
+def seal_enabled():
+    """Indica si la ingesta sella las bases de datos al terminar"""
+    return os.getenv('SEAL_DATABASES', 'true').lower() == 'true'
+
+
+def seal_path(db_path):
+    """Ruta del sidecar de sellado de una base de datos"""
+    return os.path.abspath(db_path) + SEAL_SUFFIX
+
+
+def read_seal(db_path):
+    """Datos del sellado (None si la base de datos no está sellada)"""
+    try:
+        with open(seal_path(db_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Sidecar de sellado ilegible para {db_path}: {e}")
+        return None
+
+
+def is_sealed(db_path):
+    return os.path.exists(seal_path(db_path))
+
+
+def database_identity(db_path):
+    """
+    Identidad del archivo para las cachés de conexiones.
+
+    Cambia si el archivo se reemplaza (inodo) y al sellarlo o desprecintarlo,
+    de modo que las conexiones abiertas en otro modo se descartan.
+
+    Raises:
+        FileNotFoundError: Si el archivo no existe.
+    """
+    st = os.stat(db_path)
+    sealed = is_sealed(db_path)
+    return st.st_dev, st.st_ino, sealed, st.st_mtime_ns if sealed else None
+
+
+def sqlite_uri(db_path, sealed=None):
+    """URI de solo lectura de la base de datos (inmutable si está sellada)"""
+    if sealed is None:
+        sealed = is_sealed(db_path)
+    uri = f"file:{urllib.parse.quote(os.path.abspath(db_path))}?mode=ro"
+    return uri + "&immutable=1" if sealed else uri
+
+
+def connect_readonly(db_path, check_same_thread=True):
+    """Conexión sqlite3 de solo lectura; en archivos sellados, inmutable y con mmap"""
+    sealed = is_sealed(db_path)
+    conn = sqlite3.connect(sqlite_uri(db_path, sealed), uri=True, check_same_thread=check_same_thread)
+    if sealed:
+        conn.execute(f"PRAGMA mmap_size={SEALED_MMAP_SIZE}")
+    return conn
+
+
+def ensure_writable(db_path):
+    """
+    Raises:
+        DatabaseSealedError: Si la base de datos está sellada.
+    """
+    if is_sealed(db_path):
+        raise DatabaseSealedError(
+            f"La base de datos {os.path.basename(db_path)} está sellada (solo lectura)"
+        )
+
+
+def _file_checksum(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _final_stats(conn):
+    """Estadísticas finales de la base de datos"""
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    def count(table):
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] if table in tables else 0
+
+    bounds = []
+    if 'packets' in tables:
+        bounds.append(conn.execute("SELECT MIN(timestamp), MAX(timestamp) FROM packets").fetchone())
+    if 'session_stats' in tables:
+        # Incluye las sesiones cuyos paquetes la retención movió al archivo frío
+        bounds.append(conn.execute("SELECT MIN(first_timestamp), MAX(last_timestamp) FROM session_stats").fetchone())
+    firsts = [first for first, _ in bounds if first is not None]
+    lasts = [last for _, last in bounds if last is not None]
+    first_ts = min(firsts) if firsts else None
+    last_ts = max(lasts) if lasts else None
+    return {
+        "schema_version": conn.execute("PRAGMA user_version").fetchone()[0],
+        "sessions": count('capture_sessions'),
+        "packets": count('packets'),
+        "anomalies": count('anomalies'),
+        "flows": count('flows'),
+        "first_timestamp": first_ts,
+        "last_timestamp": last_ts,
+    }
+
+
+def seal_database(db_path):
+    """
+    Sella una base de datos de captura (no hace nada si ya lo está).
+
+    Returns:
+        dict: Datos del sellado (checksum, tamaño, fecha y estadísticas finales).
+    """
+    existing = read_seal(db_path)
+    if existing is not None:
+        return existing
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        # Un solo archivo: sin -wal ni -shm que un lector inmutable ignoraría
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+        stats = _final_stats(conn)
+    finally:
+        conn.close()
+
+    st = os.stat(db_path)
+    seal = {
+        "format": SEAL_FORMAT_VERSION,
+        "file_name": os.path.basename(db_path),
+        "sealed_at": datetime.now().isoformat(),
+        "checksum": _file_checksum(db_path),
+        "size_bytes": st.st_size,
+        "mtime": st.st_mtime,
+        "stats": stats,
+    }
+    os.chmod(db_path, stat.S_IMODE(st.st_mode) & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+    # El sidecar se escribe al final: un sellado interrumpido deja el archivo sin sellar
+    tmp_path = seal_path(db_path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(seal, f, indent=2)
+    os.replace(tmp_path, seal_path(db_path))
+    print(f"Base de datos sellada: {db_path} (sha256 {seal['checksum'][:12]}…)")
+    return seal
+
+
+def unseal_database(db_path):
+    """Quita el sellado y devuelve los permisos de escritura. Devuelve True si estaba sellada"""
+    path = seal_path(db_path)
+    if not os.path.exists(path):
+        return False
+    os.remove(path)
+    mode = stat.S_IMODE(os.stat(db_path).st_mode)
+    os.chmod(db_path, mode | stat.S_IWUSR)
+    print(f"Base de datos desprecintada: {db_path}")
+    return True
+
+
+@contextmanager
+def unsealed(db_path):
+    """Permite modificar una base de datos sellada y la vuelve a sellar al terminar"""
+    was_sealed = unseal_database(db_path)
+    try:
+        yield
+    finally:
+        if was_sealed and os.path.exists(db_path):
+            seal_database(db_path)
+
+
+def verify_seal(db_path):
+    """
+    Comprueba que el archivo no ha cambiado desde el sellado.
+
+    Returns:
+        dict: sealed, valid, checksum esperado y calculado (None si no está sellada).
+    """
+    seal = read_seal(db_path)
+    if seal is None:
+        return {"sealed": False, "valid": None, "expected": None, "checksum": None}
+    checksum = _file_checksum(db_path)
+    return {
+        "sealed": True,
+        "valid": checksum == seal.get("checksum"),
+        "expected": seal.get("checksum"),
+        "checksum": checksum,
+    }
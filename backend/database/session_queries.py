@@ -0,0 +1,413 @@
+"""
+Consultas paginadas de las tablas de una sesión para las vistas del frontend.
+
+Las páginas se recorren por clave (seek) sobre (session_id, packet_number):
+cada página continúa desde el último packet_number de la anterior (cursor
+`after`), de modo que la página 10.000 cuesta lo mismo que la primera. Para
+los clientes que paginan con offset, el offset se resuelve primero sobre el
+índice (sin leer las filas) y la página se lee después por clave.
+
+Los filtros por IP y protocolo usan índices (session_id, columna,
+packet_number) que devuelven las filas ya ordenadas, y las filas se leen
+como tuplas con solo las columnas pedidas (fields=), sin objetos ORM ni
+relaciones cargadas de forma perezosa.
+
+Las anomalías se paginan por clave sobre (detection_time, id) con el cursor
+del id de la última anomalía, y las facetas por severidad y tipo salen de un
+único GROUP BY sobre el índice (session_id, severity, type, detection_time).
+"""
+from sqlalchemy import select, func, tuple_, and_, or_, literal, type_coerce, String
+
+from database.models import CaptureSession, Packet, Anomaly
+from database.tcp_flags import flags_to_text
+
+# Tamaño máximo de página
+MAX_PAGE_SIZE = 1000
+
+_packets = Packet.__table__
+
+# Campos calculados: nombre -> columnas de packets que necesitan
+PACKET_ALIASES = {
+    'protocol': 'transport_protocol',
+    'length': 'packet_length',
+}
+PACKET_DERIVED_FIELDS = {
+    'details': ('transport_protocol', 'src_port', 'dst_port', 'tcp_flags_raw', 'icmp_type', 'icmp_code'),
+    'anomalies': ('id',),
+}
+
+# Campos que devuelve la tabla de paquetes si no se indica fields=
+DEFAULT_PACKET_FIELDS = (
+    'id', 'packet_number', 'timestamp', 'src_ip', 'dst_ip', 'protocol', 'length', 'details', 'anomalies',
+)
+
+# Filtros admitidos: parámetro -> columna indexada junto a session_id
+PACKET_FILTERS = {
+    'src_ip': 'src_ip',
+    'dst_ip': 'dst_ip',
+    'protocol': 'transport_protocol',
+}
+
+# Protocolos guardados con mayúsculas y minúsculas (el resto se normaliza a mayúsculas)
+_PROTOCOL_NAMES = {'ICMPV6': 'ICMPv6'}
+
+ICMP_TYPE_NAMES = {
+    0: 'Echo Reply', 3: 'Destination Unreachable', 4: 'Source Quench', 5: 'Redirect',
+    8: 'Echo Request', 9: 'Router Advertisement', 10: 'Router Solicitation', 11: 'Time Exceeded',
+    12: 'Parameter Problem', 13: 'Timestamp', 14: 'Timestamp Reply',
+}
+ICMPV6_TYPE_NAMES = {
+    1: 'Destination Unreachable', 2: 'Packet Too Big', 3: 'Time Exceeded', 4: 'Parameter Problem',
+    128: 'Echo Request', 129: 'Echo Reply', 133: 'Router Solicitation', 134: 'Router Advertisement',
+    135: 'Neighbor Solicitation', 136: 'Neighbor Advertisement', 137: 'Redirect',
+}
+
+
+class SessionQueryError(Exception):
+    """Parámetros de consulta no válidos"""
+    pass
+
+
+def session_exists(conn, session_id):
+    return conn.execute(
+        select(CaptureSession.id).where(CaptureSession.id == session_id)
+    ).first() is not None
+
+
+def normalize_protocol(value):
+    upper = value.strip().upper()
+    return _PROTOCOL_NAMES.get(upper, upper)
+
+
+def parse_packet_fields(fields):
+    """
+    Valida la proyección pedida (lista separada por comas).
+
+    Returns:
+        tuple: Campos en el orden pedido (DEFAULT_PACKET_FIELDS si no se indica).
+    """
+    if not fields:
+        return DEFAULT_PACKET_FIELDS
+    requested = []
+    for name in (field.strip() for field in fields.split(',')):
+        if not name or name in requested:
+            continue
+        if name not in PACKET_ALIASES and name not in PACKET_DERIVED_FIELDS and name not in _packets.c:
+            raise SessionQueryError(f"Campo no válido: {name}")
+        requested.append(name)
+    if not requested:
+        raise SessionQueryError("La proyección está vacía")
+    return tuple(requested)
+
+
+def _packet_columns(fields):
+    """Columnas de packets a leer para la proyección (packet_number siempre, para el cursor)"""
+    columns = ['packet_number']
+    for name in fields:
+        needed = PACKET_DERIVED_FIELDS.get(name, (PACKET_ALIASES.get(name, name),))
+        for column in needed:
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def _packet_details(row):
+    protocol = row['transport_protocol']
+    if protocol in ('TCP', 'UDP'):
+        details = {"src_port": row['src_port'], "dst_port": row['dst_port']}
+        if protocol == 'TCP':
+            details["flags"] = flags_to_text(row['tcp_flags_raw'])
+        return details
+    if protocol in ('ICMP', 'ICMPv6'):
+        names = ICMP_TYPE_NAMES if protocol == 'ICMP' else ICMPV6_TYPE_NAMES
+        return {
+            "type": row['icmp_type'],
+            "code": row['icmp_code'],
+            "type_name": names.get(row['icmp_type'], 'Unknown'),
+        }
+    return None
+
+
+def _packet_anomalies(conn, packet_ids):
+    """Anomalías de los paquetes de la página: {packet_id: [...]}"""
+    anomalies = {}
+    if not packet_ids:
+        return anomalies
+    rows = conn.execute(
+        select(Anomaly.packet_id, Anomaly.id, Anomaly.type, Anomaly.severity, Anomaly.description)
+        .where(Anomaly.packet_id.in_(packet_ids))
+        .order_by(Anomaly.packet_id, Anomaly.id)
+    ).all()
+    for packet_id, anomaly_id, anomaly_type, severity, description in rows:
+        anomalies.setdefault(packet_id, []).append(
+            {"id": anomaly_id, "type": anomaly_type, "severity": severity, "description": description}
+        )
+    return anomalies
+
+
+def _packet_conditions(session_id, filters):
+    """Condiciones WHERE de la sesión y los filtros de igualdad (src_ip, dst_ip, protocol)"""
+    conditions = [_packets.c.session_id == session_id]
+    for name, value in (filters or {}).items():
+        if value in (None, ''):
+            continue
+        if name not in PACKET_FILTERS:
+            raise SessionQueryError(f"Filtro no válido: {name}")
+        if name == 'protocol':
+            value = normalize_protocol(value)
+        conditions.append(_packets.c[PACKET_FILTERS[name]] == value)
+    return conditions
+
+
+def _build_packets(conn, rows, fields):
+    """Filas leídas -> paquetes con la proyección pedida (y sus anomalías si se piden)"""
+    anomalies = _packet_anomalies(conn, [row['id'] for row in rows]) if 'anomalies' in fields else {}
+    packets = []
+    for row in rows:
+        packet = {}
+        for name in fields:
+            if name == 'details':
+                packet[name] = _packet_details(row)
+            elif name == 'anomalies':
+                packet[name] = anomalies.get(row['id'], [])
+            else:
+                packet[name] = row[PACKET_ALIASES.get(name, name)]
+        packets.append(packet)
+    return packets
+
+
+def list_session_packets(conn, session_id, limit=50, after=None, offset=0, filters=None,
+                         fields=None, with_total=True):
+    """
+    Página de paquetes de una sesión ordenada por packet_number.
+
+    Args:
+        conn: Conexión SQLAlchemy a la base de datos de la captura.
+        session_id (int): ID de la sesión.
+        limit (int): Paquetes por página (máximo MAX_PAGE_SIZE).
+        after (int, opcional): Cursor: devolver los paquetes con packet_number mayor.
+        offset (int): Paquetes a saltar (si no se indica cursor).
+        filters (dict, opcional): src_ip, dst_ip y/o protocol (igualdad).
+        fields (str, opcional): Proyección separada por comas (ver DEFAULT_PACKET_FIELDS).
+        with_total (bool): Contar los paquetes que cumplen los filtros.
+
+    Returns:
+        dict: packets, total (o None), limit, next_cursor y fields.
+    """
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise SessionQueryError(f"limit debe estar entre 1 y {MAX_PAGE_SIZE}")
+    fields = parse_packet_fields(fields)
+
+    conditions = _packet_conditions(session_id, filters)
+    number = _packets.c.packet_number
+
+    total = None
+    if with_total:
+        total = conn.execute(select(func.count()).select_from(_packets).where(*conditions)).scalar()
+
+    page_conditions = list(conditions)
+    if after is not None:
+        page_conditions.append(number > after)
+    elif offset:
+        # El offset se resuelve solo sobre el índice; la página se lee por clave
+        start = conn.execute(
+            select(number).where(*conditions).order_by(number).limit(1).offset(offset)
+        ).scalar()
+        if start is None:
+            return {"packets": [], "total": total, "limit": limit, "next_cursor": None, "fields": list(fields)}
+        page_conditions.append(number >= start)
+
+    columns = _packet_columns(fields)
+    rows = conn.execute(
+        select(*(_packets.c[column] for column in columns))
+        .where(*page_conditions).order_by(number).limit(limit + 1)
+    ).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        "packets": _build_packets(conn, rows, fields),
+        "total": total,
+        "limit": limit,
+        "next_cursor": rows[-1]['packet_number'] if has_more and rows else None,
+        "fields": list(fields),
+    }
+
+
+def iter_packet_batches(engine, session_id, filters=None, fields=None, batch_size=5000):
+    """
+    Recorre todos los paquetes de una sesión en bloques ordenados por packet_number.
+
+    Cada bloque es una lectura por clave independiente (packet_number > último
+    leído) con su propia conexión, de modo que la memoria solo depende de
+    batch_size y no se mantiene abierta una transacción de lectura mientras el
+    cliente consume el resultado.
+
+    Yields:
+        list: Paquetes del bloque con la proyección pedida.
+    """
+    fields = parse_packet_fields(fields)
+    conditions = _packet_conditions(session_id, filters)
+    number = _packets.c.packet_number
+    stmt = select(*(_packets.c[column] for column in _packet_columns(fields)))
+    after = None
+    while True:
+        batch_conditions = conditions if after is None else conditions + [number > after]
+        with engine.connect() as conn:
+            rows = conn.execute(
+                stmt.where(*batch_conditions).order_by(number).limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                return
+            packets = _build_packets(conn, rows, fields)
+        yield packets
+        if len(rows) < batch_size:
+            return
+        after = rows[-1]['packet_number']
+
+
+# Anomalías
+
+_anomalies = Anomaly.__table__
+
+ANOMALY_COLUMNS = ('id', 'packet_id', 'type', 'description', 'severity', 'detection_method', 'detection_time')
+
+# Proyección reducida del paquete de cada anomalía
+ANOMALY_PACKET_COLUMNS = ('id', 'packet_number', 'timestamp', 'src_ip', 'dst_ip', 'transport_protocol')
+
+# Fecha de detección sin convertir: el cursor se compara con el texto guardado en SQLite
+_raw_detection_time = type_coerce(_anomalies.c.detection_time, String)
+
+
+def _anomaly_facets(conn, session_id):
+    """Anomalías de la sesión por (severidad, tipo), contadas sobre el índice"""
+    return conn.execute(
+        select(_anomalies.c.severity, _anomalies.c.type, func.count())
+        .where(_anomalies.c.session_id == session_id)
+        .group_by(_anomalies.c.severity, _anomalies.c.type)
+    ).all()
+
+
+def _matching_values(value, known):
+    """Valores guardados que coinciden con el filtro sin distinguir mayúsculas"""
+    wanted = value.strip().lower()
+    return sorted(v for v in known if v is not None and v.lower() == wanted)
+
+
+def _anomaly_seek(conn, after):
+    """Condición para continuar después de la anomalía `after` en el orden (detection_time, id)"""
+    row = conn.execute(select(_raw_detection_time).where(_anomalies.c.id == after)).first()
+    if row is None:
+        raise SessionQueryError(f"Cursor no válido: {after}")
+    return _after_key(row[0], after)
+
+
+def _after_key(detection_time, anomaly_id, inclusive=False):
+    """Anomalías posteriores a (detection_time, id) en el orden de la paginación (fecha tal como se guardó)"""
+    if detection_time is None:
+        # Las anomalías sin fecha van primero
+        same_time = _anomalies.c.id >= anomaly_id if inclusive else _anomalies.c.id > anomaly_id
+        return or_(
+            and_(_anomalies.c.detection_time.is_(None), same_time),
+            _anomalies.c.detection_time.isnot(None),
+        )
+    key = tuple_(_anomalies.c.detection_time, _anomalies.c.id)
+    start = tuple_(literal(detection_time, String), anomaly_id)
+    return key >= start if inclusive else key > start
+
+
+def list_session_anomalies(conn, session_id, limit=50, after=None, offset=0, severity=None, anomaly_type=None,
+                           include_packet=True, with_facets=True):
+    """
+    Página de anomalías de una sesión ordenada por (detection_time, id).
+
+    Args:
+        conn: Conexión SQLAlchemy a la base de datos de la captura.
+        session_id (int): ID de la sesión.
+        limit (int): Anomalías por página (máximo MAX_PAGE_SIZE).
+        after (int, opcional): Cursor: id de la última anomalía de la página anterior.
+        offset (int): Anomalías a saltar (si no se indica cursor).
+        severity (str, opcional): Severidad (sin distinguir mayúsculas).
+        anomaly_type (str, opcional): Tipo de anomalía (sin distinguir mayúsculas).
+        include_packet (bool): Añadir la proyección reducida del paquete de cada anomalía.
+        with_facets (bool): Devolver los conteos por severidad y tipo.
+
+    Returns:
+        dict: anomalies, total, limit, next_cursor y facets (o None).
+    """
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise SessionQueryError(f"limit debe estar entre 1 y {MAX_PAGE_SIZE}")
+
+    groups = _anomaly_facets(conn, session_id)
+    conditions = [_anomalies.c.session_id == session_id]
+    severities = types = None
+    if severity:
+        severities = _matching_values(severity, {group[0] for group in groups})
+        conditions.append(_anomalies.c.severity.in_(severities))
+    if anomaly_type:
+        types = _matching_values(anomaly_type, {group[1] for group in groups})
+        conditions.append(_anomalies.c.type.in_(types))
+
+    # Total y facetas a partir de los grupos: cada faceta respeta el filtro de la otra
+    total = 0
+    severity_facets, type_facets = {}, {}
+    for group_severity, group_type, count in groups:
+        severity_match = severities is None or group_severity in severities
+        type_match = types is None or group_type in types
+        if severity_match and type_match:
+            total += count
+        if type_match:
+            severity_facets[group_severity] = severity_facets.get(group_severity, 0) + count
+        if severity_match:
+            type_facets[group_type] = type_facets.get(group_type, 0) + count
+
+    result = {
+        "anomalies": [],
+        "total": total,
+        "limit": limit,
+        "next_cursor": None,
+        "facets": {"severity": severity_facets, "type": type_facets} if with_facets else None,
+    }
+    if total == 0:
+        return result
+
+    order = (_anomalies.c.detection_time, _anomalies.c.id)
+    page_conditions = list(conditions)
+    if after is not None:
+        page_conditions.append(_anomaly_seek(conn, after))
+    elif offset:
+        # El offset se resuelve sobre el índice; la página se lee por clave
+        start = conn.execute(
+            select(_raw_detection_time, _anomalies.c.id).where(*conditions).order_by(*order).limit(1).offset(offset)
+        ).first()
+        if start is None:
+            return result
+        page_conditions.append(_after_key(start[0], start[1], inclusive=True))
+
+    rows = conn.execute(
+        select(*(_anomalies.c[column] for column in ANOMALY_COLUMNS))
+        .where(*page_conditions).order_by(*order).limit(limit + 1)
+    ).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    packets = {}
+    if include_packet and rows:
+        packet_rows = conn.execute(
+            select(*(_packets.c[column] for column in ANOMALY_PACKET_COLUMNS))
+            .where(_packets.c.id.in_({row['packet_id'] for row in rows}))
+        ).mappings().all()
+        for packet in packet_rows:
+            packet = dict(packet)
+            packet['protocol'] = packet.pop('transport_protocol')
+            packets[packet['id']] = packet
+
+    for row in rows:
+        anomaly = dict(row)
+        anomaly['detection_time'] = row['detection_time'].isoformat() if row['detection_time'] else None
+        if include_packet:
+            # Paquetes archivados por la retención: sin proyección
+            anomaly['packet'] = packets.get(row['packet_id'])
+        result["anomalies"].append(anomaly)
+    result["next_cursor"] = rows[-1]['id'] if has_more and rows else None
+    return result
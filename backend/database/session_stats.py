@@ -0,0 +1,300 @@
+"""
+Estadísticas precalculadas por sesión de captura (tabla session_stats).
+
+Las agregaciones que consultan /analytics y el chat de IA se calculan una sola
+vez al terminar la ingesta y se guardan en una fila por sesión. StatsAnalytics
+expone esa fila con la misma interfaz que los backends de database.analytics y
+recurre a las consultas en vivo solo cuando la sesión no tiene estadísticas.
+"""
+import os
+import json
+import sqlite3
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Base, CaptureSession, SessionStats
+from database.analytics import AnalyticsBackend, get_analytics_backend
+from database.seal import connect_readonly, unsealed
+
+# Tamaño de los rankings guardados (las consultas piden como máximo 15)
+STATS_TOP_K = int(os.getenv('SESSION_STATS_TOP_K', 25))
+
+# Percentiles de tamaño de paquete guardados
+SIZE_PERCENTILES = (50, 90, 99)
+
+# Intervalo (segundos) para el análisis de ráfagas
+INTERVAL_SIZE = 10
+
+# Rankings guardados: (columna, excluir nulos) -> clave en top_values
+TOP_VALUE_KEYS = {
+    ('src_ip', False): 'src_ip',
+    ('dst_ip', False): 'dst_ip',
+    ('dst_port', True): 'dst_port',
+}
+
+# Columnas de SessionStats serializadas como JSON
+JSON_COLUMNS = (
+    'protocol_counts', 'size_stats', 'tcp_flag_counts', 'ttl_histogram', 'fragmentation',
+    'top_values', 'port_scanners', 'traffic_intervals', 'asymmetric_pairs', 'anomaly_counts',
+)
+
+
+def use_session_stats():
+    """Indica si las consultas deben leer la tabla session_stats"""
+    return os.getenv('USE_SESSION_STATS', 'true').lower() == 'true'
+
+
+def _percentiles(histogram, percentiles=SIZE_PERCENTILES):
+    """Percentiles (rango más cercano) a partir de un histograma ordenado [(valor, conteo)]"""
+    total = sum(count for _, count in histogram)
+    result = {}
+    if total == 0:
+        return {f"p{p}": None for p in percentiles}
+    for p in percentiles:
+        # Rango más cercano: el menor valor cuya frecuencia acumulada alcanza p% del total
+        rank = max(1, -(-p * total // 100))
+        cumulative = 0
+        for value, count in histogram:
+            cumulative += count
+            if cumulative >= rank:
+                result[f"p{p}"] = value
+                break
+    return result
+
+
+def compute_session_stats(analytics, session_id):
+    """
+    Calcula las estadísticas de una sesión con un backend de analítica.
+
+    Args:
+        analytics: Backend de database.analytics sobre la base de datos de la captura.
+        session_id (int): ID de la sesión.
+
+    Returns:
+        dict: Valores de las columnas de SessionStats (sin serializar).
+    """
+    protocol_counts = analytics.protocol_counts(session_id)
+    packet_count = sum(protocol_counts.values())
+    bounds = analytics.time_bounds(session_id)
+    first_ts, last_ts = bounds if bounds else (None, None)
+    duration = last_ts - first_ts if bounds else None
+
+    average, maximum, minimum = analytics.size_stats(session_id)
+    size_stats = {"average": average, "maximum": maximum, "minimum": minimum}
+    size_stats.update(_percentiles(analytics.length_histogram(session_id)))
+
+    return {
+        "session_id": session_id,
+        "computed_at": datetime.now(),
+        "packet_count": packet_count,
+        "byte_count": analytics.byte_count(session_id),
+        "first_timestamp": first_ts,
+        "last_timestamp": last_ts,
+        "duration_seconds": duration,
+        "packets_per_second": packet_count / duration if duration else 0,
+        "unique_dst_ports": analytics.distinct_count(session_id, 'dst_port'),
+        # Listas de pares para conservar las claves nulas y el orden al serializar
+        "protocol_counts": list(protocol_counts.items()),
+        "size_stats": size_stats,
+        "tcp_flag_counts": analytics.flag_pattern_counts(session_id),
+        "ttl_histogram": analytics.ttl_histogram(session_id),
+        "fragmentation": analytics.fragmentation_counts(session_id),
+        "top_values": {
+            key: analytics.top_values(session_id, column, STATS_TOP_K, exclude_null=exclude_null)
+            for (column, exclude_null), key in TOP_VALUE_KEYS.items()
+        },
+        "port_scanners": analytics.port_scanners(session_id),
+        "traffic_intervals": analytics.interval_summary(session_id, INTERVAL_SIZE),
+        "asymmetric_pairs": analytics.asymmetric_pairs(session_id),
+        "anomaly_counts": analytics.anomaly_counts(session_id),
+    }
+
+
+def save_session_stats(db_session, analytics, session_id):
+    """
+    Calcula y guarda (o reemplaza) las estadísticas de una sesión.
+
+    Returns:
+        SessionStats: Fila guardada.
+    """
+    values = compute_session_stats(analytics, session_id)
+    for column in JSON_COLUMNS:
+        values[column] = json.dumps(values[column])
+    stats = db_session.get(SessionStats, session_id) or SessionStats(session_id=session_id)
+    for column, value in values.items():
+        setattr(stats, column, value)
+    db_session.add(stats)
+    db_session.commit()
+    return stats
+
+
+def refresh_session_stats(db_path, session_ids=None, force=False):
+    """
+    Calcula las estadísticas de las sesiones de una base de datos (relleno de BDs existentes).
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite de la captura.
+        session_ids (iterable, opcional): Sesiones a procesar. Por defecto todas.
+        force (bool): Recalcular también las sesiones que ya tienen estadísticas.
+
+    Returns:
+        list: IDs de las sesiones calculadas.
+    """
+    with unsealed(db_path):
+        engine = create_engine(f'sqlite:///{db_path}')
+        Base.metadata.create_all(engine)
+        db_session = sessionmaker(bind=engine)()
+        computed = []
+        try:
+            if session_ids is None:
+                session_ids = [sid for (sid,) in db_session.query(CaptureSession.id).order_by(CaptureSession.id)]
+            with get_analytics_backend(db_path, use_stats=False) as analytics:
+                for session_id in session_ids:
+                    if not force and db_session.get(SessionStats, session_id) is not None:
+                        continue
+                    save_session_stats(db_session, analytics, session_id)
+                    computed.append(session_id)
+        finally:
+            db_session.close()
+            engine.dispose()
+    return computed
+
+
+def load_session_stats(conn, session_id):
+    """
+    Lee las estadísticas guardadas de una sesión.
+
+    Args:
+        conn: Conexión sqlite3 a la base de datos de la captura.
+        session_id (int): ID de la sesión.
+
+    Returns:
+        dict: Columnas de SessionStats deserializadas, o None si no existen.
+    """
+    columns = [c.name for c in SessionStats.__table__.columns]
+    try:
+        row = conn.execute(
+            f"SELECT {', '.join(columns)} FROM session_stats WHERE session_id = ?", (session_id,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # Base de datos anterior a la tabla session_stats
+        return None
+    if row is None:
+        return None
+    stats = dict(zip(columns, row))
+    for column in JSON_COLUMNS:
+        stats[column] = json.loads(stats[column]) if stats[column] else None
+    return stats
+
+
+class StatsAnalytics(AnalyticsBackend):
+    """
+    Backend que responde desde session_stats y delega en un backend en vivo
+    para las sesiones sin estadísticas o las consultas no precalculadas.
+    """
+
+    name = 'session_stats'
+
+    def __init__(self, db_path, live):
+        self.db_path = db_path
+        self.live = live
+        self.conn = connect_readonly(db_path)
+        self._cache = {}
+
+    def stats(self, session_id):
+        """Estadísticas guardadas de la sesión (None si no existen)"""
+        if session_id not in self._cache:
+            self._cache[session_id] = load_session_stats(self.conn, session_id)
+        return self._cache[session_id]
+
+    def protocol_counts(self, session_id):
+        stats = self.stats(session_id)
+        if stats is None:
+            return self.live.protocol_counts(session_id)
+        return {protocol: count for protocol, count in stats['protocol_counts']}
+
+    def flag_pattern_counts(self, session_id):
+        stats = self.stats(session_id)
+        if stats is None:
+            return self.live.flag_pattern_counts(session_id)
+        return dict(stats['tcp_flag_counts'])
+
+    def top_values(self, session_id, column, limit=10, exclude_null=False):
+        stats = self.stats(session_id)
+        key = TOP_VALUE_KEYS.get((column, exclude_null))
+        if stats is None or key is None or limit > STATS_TOP_K:
+            return self.live.top_values(session_id, column, limit, exclude_null)
+        return [tuple(item) for item in stats['top_values'][key][:limit]]
+
+    def time_bounds(self, session_id):
+        stats = self.stats(session_id)
+        if stats is None:
+            return self.live.time_bounds(session_id)
+        if stats['first_timestamp'] is None:
+            return None
+        return stats['first_timestamp'], stats['last_timestamp']
+
+    def size_stats(self, session_id):
+        stats = self.stats(session_id)
+        if stats is None:
+            return self.live.size_stats(session_id)
+        sizes = stats['size_stats']
+        return sizes['average'], sizes['maximum'], sizes['minimum']
+
+    def anomaly_counts(self, session_id):
+        stats = self.stats(session_id)
+        if stats is None:
+            return self.live.anomaly_counts(session_id)
+        return [tuple(item) for item in stats['anomaly_counts']]
+
+    def ttl_histogram(self, session_id):
+        stats = self.stats(session_id)
+        if stats is None:
+            return self.live.ttl_histogram(session_id)
+        return [tuple(item) for item in stats['ttl_histogram']]
+
+    def fragmentation_counts(self, session_id):
+        stats = self.stats(session_id)
+        if stats is None:
+            return self.live.fragmentation_counts(session_id)
+        return dict(stats['fragmentation'])
+
+    def byte_count(self, session_id):
+        stats = self.stats(session_id)
+        if stats is None:
+            return self.live.byte_count(session_id)
+        return stats['byte_count']
+
+    def distinct_count(self, session_id, column):
+        stats = self.stats(session_id)
+        if stats is None or column != 'dst_port':
+            return self.live.distinct_count(session_id, column)
+        return stats['unique_dst_ports']
+
+    def port_scanners(self, session_id, min_ports=50):
+        stats = self.stats(session_id)
+        if stats is None or min_ports != 50:
+            return self.live.port_scanners(session_id, min_ports)
+        return [tuple(item) for item in stats['port_scanners']]
+
+    def asymmetric_pairs(self, session_id, min_packets=100, min_ratio=50):
+        stats = self.stats(session_id)
+        if stats is None or (min_packets, min_ratio) != (100, 50):
+            return self.live.asymmetric_pairs(session_id, min_packets, min_ratio)
+        return [tuple(item) for item in stats['asymmetric_pairs']]
+
+    def interval_summary(self, session_id, interval_size=INTERVAL_SIZE):
+        stats = self.stats(session_id)
+        if stats is None or interval_size != stats['traffic_intervals']['interval_seconds']:
+            return self.live.interval_summary(session_id, interval_size)
+        return dict(stats['traffic_intervals'])
+
+    def _query(self, sql, session_id, params=None):
+        # Las agregaciones no precalculadas se ejecutan en el backend en vivo
+        return self.live._query(sql, session_id, params)
+
+    def close(self):
+        self.conn.close()
+        self.live.close()
@@ -0,0 +1,186 @@
+"""
+Exportación en streaming de los paquetes de una sesión (NDJSON, CSV o Arrow IPC).
+
+Los paquetes se leen por bloques (session_queries.iter_packet_batches) y cada
+bloque se codifica y, opcionalmente, se comprime (gzip o zstd) antes de
+pasar al siguiente: la memoria del servidor depende del tamaño del bloque y
+no del número de paquetes de la sesión.
+
+Los campos anidados (details, anomalies) se escriben como objetos en NDJSON
+y como texto JSON en CSV y Arrow.
+"""
+import io
+import os
+import csv
+import json
+import zlib
+
+from database.models import Packet
+from database.session_queries import iter_packet_batches, parse_packet_fields, PACKET_ALIASES, PACKET_DERIVED_FIELDS
+from database.parquet_export import pyarrow_available, _arrow_type
+from database.frame_store import zstd_available
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow es una dependencia opcional
+    pa = None
+
+try:
+    import zstandard as zstd
+except ImportError:  # zstandard es una dependencia opcional
+    zstd = None
+
+# Paquetes leídos y codificados por bloque
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 5000))
+
+# Formatos: nombre -> (media type, extensión)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+# Compresiones: nombre -> (media type, extensión)
+EXPORT_COMPRESSIONS = {
+    'none': (None, None),
+    'gzip': ('application/gzip', 'gz'),
+    'zstd': ('application/zstd', 'zst'),
+}
+
+
+class StreamExportError(Exception):
+    """Parámetros de exportación no válidos o dependencia no disponible"""
+    pass
+
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def _nested_text(value):
+    return None if value is None else json.dumps(value, default=_json_default, ensure_ascii=False)
+
+
+def _encode_ndjson(batches, fields):
+    for packets in batches:
+        yield "".join(
+            json.dumps(packet, default=_json_default, ensure_ascii=False) + "\n" for packet in packets
+        ).encode('utf-8')
+
+
+def _encode_csv(batches, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for packets in batches:
+        for packet in packets:
+            writer.writerow([
+                _nested_text(packet[name]) if name in PACKET_DERIVED_FIELDS else packet[name]
+                for name in fields
+            ])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def arrow_schema(fields):
+    """Esquema Arrow de la proyección (los campos anidados como texto JSON)"""
+    columns = Packet.__table__.c
+    return pa.schema([
+        pa.field(name, pa.string() if name in PACKET_DERIVED_FIELDS
+                 else _arrow_type(columns[PACKET_ALIASES.get(name, name)].type))
+        for name in fields
+    ])
+
+
+def _encode_arrow(batches, fields):
+    schema = arrow_schema(fields)
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+    for packets in batches:
+        arrays = {
+            name: [_nested_text(packet[name]) if name in PACKET_DERIVED_FIELDS else packet[name] for packet in packets]
+            for name in fields
+        }
+        writer.write_batch(pa.RecordBatch.from_pydict(arrays, schema=schema))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    writer.close()
+    yield sink.getvalue()
+
+
+_ENCODERS = {
+    'ndjson': _encode_ndjson,
+    'csv': _encode_csv,
+    'arrow': _encode_arrow,
+}
+
+
+def _compress(chunks, compression):
+    """Comprime el flujo de bytes bloque a bloque"""
+    if compression == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    else:
+        compressor = zstd.ZstdCompressor(level=3).compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def check_export_options(export_format, compression, fields=None):
+    """
+    Valida el formato, la compresión y la proyección antes de empezar a enviar.
+
+    Returns:
+        tuple: Campos de la proyección.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise StreamExportError(f"Formato no válido. Opciones: {', '.join(EXPORT_FORMATS)}")
+    if compression not in EXPORT_COMPRESSIONS:
+        raise StreamExportError(f"Compresión no válida. Opciones: {', '.join(EXPORT_COMPRESSIONS)}")
+    if export_format == 'arrow' and not pyarrow_available():
+        raise StreamExportError("La exportación a Arrow requiere pyarrow")
+    if compression == 'zstd' and not zstd_available():
+        raise StreamExportError("La compresión zstd requiere zstandard")
+    return parse_packet_fields(fields)
+
+
+def export_media_type(export_format, compression):
+    """Media type de la respuesta (el de la compresión si se comprime)"""
+    return EXPORT_COMPRESSIONS[compression][0] or EXPORT_FORMATS[export_format][0]
+
+
+def export_file_name(base, session_id, export_format, compression):
+    name = f"{base}_session{session_id}_packets.{EXPORT_FORMATS[export_format][1]}"
+    suffix = EXPORT_COMPRESSIONS[compression][1]
+    return f"{name}.{suffix}" if suffix else name
+
+
+def stream_session_packets(engine, session_id, export_format='ndjson', compression='none', filters=None,
+                           fields=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Generador con los bytes de la exportación de los paquetes de una sesión.
+
+    Args:
+        engine: Engine SQLAlchemy de la base de datos de la captura.
+        session_id (int): ID de la sesión.
+        export_format (str): ndjson, csv o arrow.
+        compression (str): none, gzip o zstd.
+        filters (dict, opcional): src_ip, dst_ip y/o protocol (como en la paginación).
+        fields (str, opcional): Proyección separada por comas.
+        batch_size (int): Paquetes por bloque.
+
+    Yields:
+        bytes: Fragmentos del archivo exportado.
+    """
+    projection = check_export_options(export_format, compression, fields)
+    batches = iter_packet_batches(engine, session_id, filters=filters, fields=fields, batch_size=batch_size)
+    chunks = _ENCODERS[export_format](batches, list(projection))
+    if compression != 'none':
+        chunks = _compress(chunks, compression)
+    for chunk in chunks:
+        if chunk:
+            yield chunk
@@ -0,0 +1,141 @@
+"""
+Consultas de flags TCP sobre la columna empaquetada `tcp_flags_raw`.
+
+Cualquier combinación de flags se expresa como un predicado de máscara de bits
+`(tcp_flags_raw & mask) = value`, de modo que un único índice sobre
+(session_id, tcp_flags_raw) sirve para todos los patrones sin depender de las
+columnas booleanas `tcp_flag_*`, que son opcionales.
+"""
+import os
+from sqlalchemy import func, case
+
+# Bits del campo de flags de la cabecera TCP
+FIN = 0x001
+SYN = 0x002
+RST = 0x004
+PSH = 0x008
+ACK = 0x010
+URG = 0x020
+ECE = 0x040
+CWR = 0x080
+NS = 0x100
+
+FLAG_BITS = {
+    'fin': FIN,
+    'syn': SYN,
+    'rst': RST,
+    'psh': PSH,
+    'ack': ACK,
+    'urg': URG,
+    'ece': ECE,
+    'cwr': CWR,
+    'ns': NS,
+}
+
+# Orden de presentación de los flags en texto
+FLAG_DISPLAY_ORDER = ('syn', 'ack', 'fin', 'rst', 'psh', 'urg', 'ece', 'cwr', 'ns')
+
+# Patrones de flags usados en el análisis: (flags activos, flags inactivos)
+FLAG_PATTERNS = {
+    'syn_packets': (('syn',), ('ack',)),
+    'rst_packets': (('rst',), ()),
+    'fin_packets': (('fin',), ()),
+    'christmas_tree': (('syn', 'fin', 'rst', 'psh', 'urg'), ()),
+    'null_scan': ((), ('syn', 'fin', 'rst', 'psh', 'urg', 'ack')),
+    'fin_scan': (('fin',), ('syn', 'ack')),
+}
+
+
+def store_flag_columns():
+    """Indica si la ingesta debe seguir rellenando las columnas booleanas tcp_flag_*"""
+    return os.getenv('STORE_TCP_FLAG_COLUMNS', 'true').lower() == 'true'
+
+
+def flags_mask(flags):
+    """Máscara de bits de una lista de nombres de flags"""
+    mask = 0
+    for flag in flags:
+        try:
+            mask |= FLAG_BITS[flag.lower()]
+        except KeyError:
+            raise ValueError(f"Flag TCP desconocido: {flag}")
+    return mask
+
+
+def _mask_and_value(set_flags, clear_flags):
+    """Máscara (flags a comprobar) y valor esperado (flags que deben estar activos)"""
+    value = flags_mask(set_flags)
+    return value | flags_mask(clear_flags), value
+
+
+def flag_predicate(column, set_flags=(), clear_flags=()):
+    """
+    Predicado SQLAlchemy para una combinación de flags.
+
+    Args:
+        column: Columna con los flags empaquetados (p. ej. Packet.tcp_flags_raw).
+        set_flags (iterable): Flags que deben estar activos.
+        clear_flags (iterable): Flags que deben estar inactivos.
+
+    Returns:
+        ColumnElement: `(column & mask) = value`
+    """
+    mask, value = _mask_and_value(set_flags, clear_flags)
+    return column.op('&')(mask) == value
+
+
+def flag_sql(set_flags=(), clear_flags=(), column='tcp_flags_raw'):
+    """Predicado equivalente a flag_predicate() como texto SQL"""
+    mask, value = _mask_and_value(set_flags, clear_flags)
+    return f"({column} & {mask}) = {value}"
+
+
+def pattern_count_columns(column, patterns=None):
+    """
+    Columnas SUM(CASE ...) para contar varios patrones de flags en una sola pasada.
+
+    Returns:
+        list: Expresiones etiquetadas con el nombre de cada patrón.
+    """
+    patterns = patterns or FLAG_PATTERNS
+    return [
+        func.coalesce(func.sum(case((flag_predicate(column, set_flags, clear_flags), 1), else_=0)), 0).label(name)
+        for name, (set_flags, clear_flags) in patterns.items()
+    ]
+
+
+def count_flag_patterns(db_session, column, *filters, patterns=None):
+    """
+    Cuenta los paquetes que cumplen cada patrón de flags con una única consulta.
+
+    Args:
+        db_session: Sesión SQLAlchemy.
+        column: Columna con los flags empaquetados.
+        *filters: Condiciones adicionales (p. ej. la sesión de captura).
+        patterns (dict, opcional): Patrones a contar. Por defecto FLAG_PATTERNS.
+
+    Returns:
+        dict: Conteo por nombre de patrón.
+    """
+    patterns = patterns or FLAG_PATTERNS
+    row = db_session.query(*pattern_count_columns(column, patterns)).filter(*filters).one()
+    return {name: int(count or 0) for name, count in zip(patterns, row)}
+
+
+def flags_from_raw(raw):
+    """Diccionario flag -> bool a partir del valor empaquetado (None si no hay flags)"""
+    if raw is None:
+        return None
+    return {name: bool(raw & bit) for name, bit in FLAG_BITS.items()}
+
+
+def raw_from_flags(**flags):
+    """Valor empaquetado a partir de flags individuales (syn=True, ack=False, ...)"""
+    return flags_mask(name for name, active in flags.items() if active)
+
+
+def flags_to_text(raw):
+    """Representación legible de los flags ("SYN, ACK")"""
+    if not raw:
+        return "None"
+    return ", ".join(name.upper() for name in FLAG_DISPLAY_ORDER if raw & FLAG_BITS[name])
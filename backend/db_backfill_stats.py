@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Script para calcular las estadísticas precalculadas (tabla session_stats) de
+bases de datos creadas antes de que existiera la tabla.
+Uso: python db_backfill_stats.py [ruta_de_la_base_de_datos ...] [opciones]
+
+Sin rutas se procesan todas las bases de datos de DATABASE_DIRECTORY.
+
+Opciones:
+  -s, --session ID  Sesión a procesar (por defecto: todas)
+  -f, --force       Recalcular también las sesiones que ya tienen estadísticas
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+from database.session_stats import refresh_session_stats
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Calcula las estadísticas por sesión del Network Analyzer")
+    parser.add_argument("db_paths", nargs="*", help="Bases de datos a procesar (por defecto: todas)")
+    parser.add_argument("-s", "--session", type=int, help="ID de la sesión a procesar")
+    parser.add_argument("-f", "--force", action="store_true", help="Recalcular las estadísticas existentes")
+
+    args = parser.parse_args()
+
+    db_paths = args.db_paths
+    if not db_paths:
+        db_dir = os.getenv('DATABASE_DIRECTORY', './data/db_files')
+        db_paths = sorted(glob.glob(os.path.join(db_dir, '*.db')))
+        if not db_paths:
+            print(f"No se encontraron bases de datos en {db_dir}")
+            return 1
+
+    errors = 0
+    for db_path in db_paths:
+        if not os.path.exists(db_path):
+            print(f"Error: La base de datos '{db_path}' no existe")
+            errors += 1
+            continue
+        start_time = time.time()
+        try:
+            session_ids = [args.session] if args.session is not None else None
+            computed = refresh_session_stats(db_path, session_ids, force=args.force)
+        except Exception as e:
+            print(f"Error al procesar {db_path}: {e}")
+            errors += 1
+            continue
+        print(f"{db_path}: {len(computed)} sesiones calculadas en {time.time() - start_time:.2f} segundos")
+
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Script para exportar sesiones de captura del Network Analyzer a Parquet.
+Uso: python db_export.py <ruta_de_la_base_de_datos> -s ID [opciones]
+
+Opciones:
+  -s, --session ID        Sesión a exportar (obligatorio)
+  -o, --output DIR        Directorio de salida (por defecto: ./data/exports)
+  -t, --tables T [T ...]  Tablas a exportar: packets, flows, anomalies (por defecto: todas)
+  --row-group-size N      Filas por row group (por defecto: 65536)
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from database.parquet_export import (
+    export_session, pyarrow_available, ParquetExportError,
+    EXPORT_TABLES, DEFAULT_ROW_GROUP_SIZE
+)
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Exporta sesiones del Network Analyzer a Parquet")
+    parser.add_argument("db_path", help="Ruta de la base de datos a exportar")
+    parser.add_argument("-s", "--session", type=int, required=True, help="ID de la sesión a exportar")
+    parser.add_argument("-o", "--output", default=os.getenv('EXPORT_DIRECTORY', './data/exports'),
+                        help="Directorio de salida (por defecto: ./data/exports)")
+    parser.add_argument("-t", "--tables", nargs="+", choices=EXPORT_TABLES, default=list(EXPORT_TABLES),
+                        help="Tablas a exportar (por defecto: todas)")
+    parser.add_argument("--row-group-size", type=int, default=DEFAULT_ROW_GROUP_SIZE,
+                        help=f"Filas por row group (por defecto: {DEFAULT_ROW_GROUP_SIZE})")
+
+    args = parser.parse_args()
+
+    if not pyarrow_available():
+        print("Error: pyarrow no está instalado. Instálalo con 'pip install pyarrow'.")
+        return 1
+
+    start_time = time.time()
+    try:
+        summary = export_session(
+            args.db_path,
+            args.session,
+            args.output,
+            tables=args.tables,
+            row_group_size=args.row_group_size
+        )
+    except ParquetExportError as e:
+        print(f"Error: {e}")
+        return 1
+
+    db_size = os.path.getsize(args.db_path)
+    total_size = 0
+    print(f"\nExportación de la sesión {args.session} de {args.db_path}:")
+    for table, info in summary.items():
+        total_size += info["size_bytes"]
+        print(f"  - {table}: {info['rows']} filas, {info['size_bytes'] / 1024:.2f} KB -> {info['path']}")
+
+    print(f"\nTamaño de la base de datos: {db_size / 1024:.2f} KB")
+    print(f"Tamaño total exportado: {total_size / 1024:.2f} KB")
+    if total_size > 0:
+        print(f"Ratio de compresión: {db_size / total_size:.1f}x")
+    print(f"Tiempo de exportación: {time.time() - start_time:.2f} segundos")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Script para migrar las bases de datos del Network Analyzer al esquema actual.
+Uso: python db_migrate.py [ruta_de_la_base_de_datos ...] [opciones]
+
+Sin rutas se migran en paralelo todas las bases de datos de DATABASE_DIRECTORY.
+Las migraciones interrumpidas se reanudan desde el último bloque guardado.
+
+Opciones:
+  -w, --workers N   Bases de datos migradas en paralelo (por defecto: MIGRATION_WORKERS o 2)
+  -t, --target V    Versión de esquema final (por defecto: la más reciente)
+  --status          Mostrar la versión de cada base de datos sin migrar
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from database.migrations import (
+    migrate_database, migrate_directory, migration_status, SCHEMA_VERSION, MigrationError
+)
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Migraciones de esquema del Network Analyzer")
+    parser.add_argument("db_paths", nargs="*", help="Bases de datos a migrar (por defecto: todas)")
+    parser.add_argument("-w", "--workers", type=int, help="Bases de datos migradas en paralelo")
+    parser.add_argument("-t", "--target", type=int, help=f"Versión final (por defecto: {SCHEMA_VERSION})")
+    parser.add_argument("--status", action="store_true", help="Mostrar la versión de cada base de datos")
+
+    args = parser.parse_args()
+
+    if args.status:
+        status = migration_status()
+        print(f"Versión de esquema actual: {status['schema_version']}")
+        for entry in status["databases"]:
+            if "error" in entry:
+                print(f"  - {entry['db_file']}: error: {entry['error']}")
+            else:
+                pending = ", ".join(entry["pending"]) or "al día"
+                print(f"  - {entry['db_file']}: versión {entry['version']} ({pending})")
+        return 0
+
+    start_time = time.time()
+    if args.db_paths:
+        results = {}
+        for db_path in args.db_paths:
+            if not os.path.exists(db_path):
+                print(f"Error: La base de datos '{db_path}' no existe")
+                results[db_path] = {"error": "no existe"}
+                continue
+            try:
+                results[db_path] = migrate_database(db_path, args.target)
+            except MigrationError as e:
+                print(f"Error: {e}")
+                results[db_path] = {"error": str(e)}
+    else:
+        results = migrate_directory(workers=args.workers)
+
+    errors = 0
+    for db_file, result in results.items():
+        if "error" in result:
+            errors += 1
+            continue
+        applied = ", ".join(f"{m['version']} {m['name']} ({m['seconds']:.2f} s)" for m in result["applied"]) or "ninguna"
+        print(f"{db_file}: versión {result['from_version']} -> {result['to_version']}: {applied}")
+
+    print(f"Migración completada en {time.time() - start_time:.2f} segundos "
+          f"({len(results)} bases de datos, {errors} errores)")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,15 +10,19 @@ Opciones:
   -p, --packet ID    Muestra información completa de un paquete específico
   -a, --anomalies    Muestra solo paquetes con anomalías detectadas
   --raw-sql QUERY    Ejecuta una consulta SQL personalizada
+  --search TEXTO     Busca en info_text y protocol_stack con el índice de texto completo
 """
 
 import os
 import sys
+import time
 import sqlite3
 from prettytable import PrettyTable, SINGLE_BORDER
 from datetime import datetime
 import argparse
 import json
+from sqlalchemy import create_engine
+from database.fulltext import search_packets, FullTextSearchError
 
 def print_header(text):
     """Imprime un encabezado formateado"""
@@ -521,6 +525,39 @@ def show_packet_detail(cursor, packet_id):
         print(f"Error al obtener detalles del paquete: {e}")
         return False
 
+def search_database(db_path, query, session_id=None, limit=10):
+    """Busca paquetes por texto con el índice de texto completo"""
+    if not os.path.exists(db_path):
+        print(f"Error: La base de datos '{db_path}' no existe.")
+        return False
+    
+    engine = create_engine(f'sqlite:///{db_path}')
+    try:
+        with engine.connect() as conn:
+            start_time = time.time()
+            packets, total = search_packets(conn, query, session_id, limit)
+            elapsed = time.time() - start_time
+    except FullTextSearchError as e:
+        print(f"Error en la búsqueda: {e}")
+        return False
+    finally:
+        engine.dispose()
+    
+    print_header("BÚSQUEDA DE TEXTO COMPLETO")
+    print(f"Búsqueda: {query} ({total} coincidencias, {elapsed * 1000:.1f} ms)")
+    if not packets:
+        return True
+    result_table = PrettyTable()
+    result_table.field_names = ["Sesión", "#", "Tiempo", "Origen", "Destino", "Protocolo", "Info"]
+    for packet in packets:
+        result_table.add_row([
+            packet["session_id"], packet["packet_number"], format_value(packet["timestamp"]),
+            packet["src_ip"], packet["dst_ip"], packet["transport_protocol"],
+            format_value(packet["info_text"])
+        ])
+    print(result_table)
+    return True
+
 def main():
     """Función principal"""
     parser = argparse.ArgumentParser(description="Consulta información de bases de datos del Network Analyzer")
@@ -531,6 +568,7 @@ def main():
     parser.add_argument("-p", "--packet", type=int, help="ID del paquete específico a mostrar en detalle")
     parser.add_argument("-a", "--anomalies", action="store_true", help="Mostrar solo paquetes con anomalías")
     parser.add_argument("--raw-sql", type=str, help="Ejecutar una consulta SQL personalizada en la base de datos")
+    parser.add_argument("--search", type=str, help='Buscar en info_text y protocol_stack (índice de texto completo): términos, "frases", prefijos*')
     
     args = parser.parse_args()
     
@@ -581,6 +619,9 @@ def main():
             print("Uso: python db_query.py [ruta_de_la_base_de_datos] [opciones]")
             return 1
     
+    if args.search:
+        return 0 if search_database(args.db_path, args.search, args.session, args.limit) else 1
+    
     success = query_database(
         args.db_path, 
         args.detailed, 
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Script para aplicar la política de retención a las bases de datos del Network Analyzer.
+Uso: python db_retention.py [ruta_de_la_base_de_datos ...] [opciones]
+
+Sin rutas se procesan todas las bases de datos de DATABASE_DIRECTORY.
+
+Opciones:
+  --raw-days N        Días que se conservan los paquetes en bruto (por defecto: RETENTION_RAW_DAYS o 7)
+  --flow-days N       Días que se conservan los flujos (por defecto: RETENTION_FLOW_DAYS o 90)
+  -n, --dry-run       Mostrar qué se archivaría sin modificar nada
+  --rehydrate ID      Rehidratar la sesión indicada (requiere una única base de datos)
+  --convert-incremental
+                      Convertir las bases de datos a auto_vacuum=INCREMENTAL (VACUUM completo,
+                      una sola vez) para que la retención recupere espacio
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+from database.retention import (
+    apply_retention, rehydrate_session, convert_to_incremental, RetentionPolicy, RetentionError, _days
+)
+
+
+def main():
+    """Función principal"""
+    policy = RetentionPolicy.from_env()
+    parser = argparse.ArgumentParser(description="Retención por niveles del Network Analyzer")
+    parser.add_argument("db_paths", nargs="*", help="Bases de datos a procesar (por defecto: todas)")
+    parser.add_argument("--raw-days", default=None, help=f"Días de paquetes en bruto (por defecto: {policy.raw_days})")
+    parser.add_argument("--flow-days", default=None, help=f"Días de flujos (por defecto: {policy.flow_days})")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="No modificar nada")
+    parser.add_argument("--rehydrate", type=int, metavar="ID", help="Rehidratar una sesión archivada")
+    parser.add_argument("--convert-incremental", action="store_true",
+                        help="Convertir a auto_vacuum=INCREMENTAL (VACUUM completo)")
+
+    args = parser.parse_args()
+
+    if args.raw_days is not None:
+        policy.raw_days = _days(args.raw_days)
+    if args.flow_days is not None:
+        policy.flow_days = _days(args.flow_days)
+
+    db_paths = args.db_paths
+    if not db_paths:
+        db_dir = os.getenv('DATABASE_DIRECTORY', './data/db_files')
+        db_paths = sorted(glob.glob(os.path.join(db_dir, '*.db')))
+
+    if args.rehydrate is not None:
+        if len(db_paths) != 1:
+            print("Error: --rehydrate requiere indicar una única base de datos")
+            return 1
+        try:
+            restored = rehydrate_session(db_paths[0], args.rehydrate)
+        except RetentionError as e:
+            print(f"Error: {e}")
+            return 1
+        for table, rows in restored.items():
+            print(f"  - {table}: {rows} filas rehidratadas")
+        return 0
+
+    errors = 0
+    if args.convert_incremental:
+        for db_path in db_paths:
+            start_time = time.time()
+            try:
+                reclaimed = convert_to_incremental(db_path)
+            except Exception as e:
+                print(f"Error al convertir {db_path}: {e}")
+                errors += 1
+                continue
+            if reclaimed is None:
+                print(f"{db_path}: ya tiene auto_vacuum=INCREMENTAL")
+            else:
+                print(f"{db_path}: convertida, espacio recuperado: {reclaimed / 1024:.2f} KB "
+                      f"({time.time() - start_time:.2f} s)")
+        return 1 if errors else 0
+
+    for db_path in db_paths:
+        start_time = time.time()
+        try:
+            summary = apply_retention(db_path, policy, dry_run=args.dry_run)
+        except Exception as e:
+            print(f"Error al procesar {db_path}: {e}")
+            errors += 1
+            continue
+        action = "se archivarían" if args.dry_run else "archivadas"
+        print(f"{db_path}: sesiones con paquetes {action}: {len(summary['raw'])}, "
+              f"con flujos {action}: {len(summary['flows'])}, "
+              f"espacio recuperado: {summary['reclaimed_bytes'] / 1024:.2f} KB "
+              f"({time.time() - start_time:.2f} s)")
+        if not summary["incremental_vacuum"]:
+            print("  Sin auto_vacuum=INCREMENTAL: ejecute --convert-incremental para recuperar espacio")
+
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
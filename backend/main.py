@@ -9,6 +9,13 @@ from api.capture_api import router as capture_router
 from api.processing_api import router as processing_router
 from api.database_api import router as database_router
 from api.ai_api import router as ai_router
+from database.catalog import start_catalog_scanner
+from database.migrations import start_migration_runner
+from database.dal import shutdown_pools
+from processing.jobs import start_job_manager, stop_job_manager
+from capture.capture_manager import get_capture_manager
+from capture.live_stream import get_live_hub
+from capture.tshark_runtime import get_tshark_runtime
 
 # Cargar variables de entorno
 load_dotenv()
@@ -27,6 +34,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cabeceras de las subidas por bloques y de la caché de respuestas
+    expose_headers=["Upload-Offset", "Upload-Length", "Location", "ETag"],
 )
 
 # Incluir routers
@@ -35,6 +44,43 @@ app.include_router(processing_router)
 app.include_router(database_router)
 app.include_router(ai_router)
 
+@app.on_event("startup")
+def start_catalog():
+    # Reconciliar el catálogo de bases de datos con el directorio en segundo plano
+    start_catalog_scanner()
+
+@app.on_event("startup")
+def start_schema_migrations():
+    # Migrar en segundo plano las bases de datos con un esquema anterior
+    if os.getenv("MIGRATE_ON_STARTUP", "true").lower() == "true":
+        start_migration_runner()
+
+@app.on_event("startup")
+def warm_tshark_runtime():
+    # Resolver tshark/dumpcap y listar las interfaces antes de la primera petición
+    get_tshark_runtime().warm()
+
+@app.on_event("startup")
+def start_jobs():
+    # Pool de procesos precalentado y despachador de la cola de trabajos
+    start_job_manager()
+
+@app.on_event("shutdown")
+async def stop_captures():
+    # Cerrar correctamente las capturas en curso y detener las capturas en vivo
+    await get_capture_manager().stop_all()
+    await get_live_hub().stop_all()
+
+@app.on_event("shutdown")
+def stop_jobs():
+    # Los trabajos en curso se vuelven a encolar en el siguiente arranque
+    stop_job_manager(wait=False)
+
+@app.on_event("shutdown")
+def stop_executor_pools():
+    # Liberar los hilos de la capa de acceso a datos
+    shutdown_pools(wait=False)
+
 @app.get("/")
 async def root():
     return {"mensaje": "API de Network Analyzer", "estado": "funcionando"}
@@ -0,0 +1,740 @@
+"""
+Trabajos en segundo plano del procesamiento de capturas.
+
+La cola es duradera: cada trabajo es una fila de una base de datos SQLite
+propia (JOBS_PATH, en WAL) con su estado, prioridad, parámetros y resultado,
+de modo que los trabajos pendientes sobreviven a un reinicio del servidor y
+los que estaban en curso se vuelven a encolar al arrancar (salvo las capturas
+directas, que fallan: ver requeue_interrupted_jobs). Cada ingesta anota
+en su fila (partial) la base de datos y la sesión que está escribiendo: antes
+de repetirla se descarta lo que dejó a medias el intento anterior, de modo que
+un reintento no duplica la sesión.
+
+Los trabajos se ejecutan en un pool de procesos de larga duración
+(JOB_WORKERS) que se precalienta al arrancar: cada proceso importa pyshark y
+el procesador una sola vez y los procesos se crean antes de la primera
+subida. Un hilo despachador reclama los trabajos por prioridad (mayor
+primero) y antigüedad, con como mucho JOB_CONCURRENCY en curso.
+
+Los trabajos en streaming (STREAMING_KINDS: ingesta de una subida mientras se
+recibe y captura directa) ocupan su proceso mientras dura la subida o la
+captura, que puede ser mucho tiempo. Se ejecutan en un pool propio
+(JOB_STREAM_WORKERS procesos, uno por trabajo) para que no dejen sin
+procesos al resto de trabajos.
+
+La cancelación de un trabajo en curso es cooperativa: el trabajo consulta
+periódicamente su marca cancel_requested y se detiene entre paquetes.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from concurrent.futures.process import BrokenProcessPool
+
+from sqlalchemy import create_engine, event, inspect, text, bindparam, Column, Integer, String, Text, Boolean, DateTime, Index
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+JobBase = declarative_base()
+
+# Estados de un trabajo
+JOB_STATUSES = ('queued', 'running', 'completed', 'failed', 'cancelled')
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+# Segundos entre comprobaciones de la cola (trabajos encolados por otros procesos)
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+
+# Segundos entre consultas de la marca de cancelación desde el trabajo
+JOB_CANCEL_CHECK_INTERVAL = float(os.getenv('JOB_CANCEL_CHECK_INTERVAL', 1.0))
+
+
+class JobError(Exception):
+    """Trabajo inexistente o en un estado que no admite la operación"""
+    pass
+
+
+class JobCancelled(Exception):
+    """El trabajo se detuvo porque se solicitó su cancelación"""
+    pass
+
+
+class Job(JobBase):
+    """Trabajo de la cola duradera"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        Index('ix_jobs_queue', 'status', 'priority', 'created_at'),
+        Index('ix_jobs_created_at', 'created_at'),
+    )
+
+    id = Column(String(36), primary_key=True)
+    kind = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default='queued')
+    priority = Column(Integer, nullable=False, default=0)      # Mayor primero
+    payload = Column(Text, nullable=True)                       # Parámetros (JSON)
+    result = Column(Text, nullable=True)                        # Resultado (JSON)
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_pid = Column(Integer, nullable=True)
+    # Base de datos y sesión escritas por el intento en curso o por el que falló (JSON)
+    partial = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "payload": json.loads(self.payload) if self.payload else None,
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "cancel_requested": bool(self.cancel_requested),
+            "attempts": self.attempts,
+            "worker_pid": self.worker_pid,
+            "partial": json.loads(self.partial) if self.partial else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f"<Job(id={self.id}, kind={self.kind}, status={self.status})>"
+
+
+def get_jobs_path():
+    """Ruta de la base de datos de la cola (fuera del patrón *.db para que no se catalogue)"""
+    return os.getenv('JOBS_PATH', './data/jobs.sqlite')
+
+
+def job_workers():
+    """Procesos del pool de trabajos"""
+    return max(1, int(os.getenv('JOB_WORKERS', 2)))
+
+
+def job_stream_workers():
+    """Procesos del pool de los trabajos en streaming (un trabajo por proceso)"""
+    return max(1, int(os.getenv('JOB_STREAM_WORKERS', 2)))
+
+
+def job_concurrency():
+    """Trabajos en curso a la vez (por defecto, uno por proceso del pool)"""
+    return max(1, int(os.getenv('JOB_CONCURRENCY', job_workers())))
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_jobs_engine(jobs_path=None):
+    """Motor SQLAlchemy de la cola (uno por ruta y proceso), creando las tablas si faltan"""
+    jobs_path = os.path.abspath(jobs_path or get_jobs_path())
+    with _engines_lock:
+        engine = _engines.get(jobs_path)
+        if engine is None:
+            os.makedirs(os.path.dirname(jobs_path), exist_ok=True)
+            engine = create_engine(f'sqlite:///{jobs_path}', connect_args={'timeout': 30})
+
+            # WAL: los procesos del pool actualizan sus trabajos mientras las API leen
+            @event.listens_for(engine, "connect")
+            def _set_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.close()
+
+            JobBase.metadata.create_all(engine)
+            _add_missing_columns(engine)
+            _engines[jobs_path] = engine
+    return engine
+
+
+def _add_missing_columns(engine):
+    """Añade a una cola existente las columnas nuevas (create_all no altera tablas)"""
+    inspector = inspect(engine)
+    for table in JobBase.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+
+def get_jobs_session(jobs_path=None):
+    """Crea una sesión SQLAlchemy sobre la cola"""
+    return sessionmaker(bind=get_jobs_engine(jobs_path))()
+
+
+# Operaciones sobre la cola
+
+def enqueue_job(kind, payload=None, priority=0, jobs_path=None, partial=None):
+    """
+    Encola un trabajo y avisa al despachador.
+
+    Args:
+        partial (dict, opcional): Lo que dejó a medias un trabajo fallido al que este
+            sustituye; se descarta antes de ejecutarlo.
+
+    Returns:
+        dict: El trabajo encolado.
+    """
+    if kind not in JOB_HANDLERS:
+        raise JobError(f"Tipo de trabajo no válido: {kind}")
+    db = get_jobs_session(jobs_path)
+    try:
+        job = Job(id=str(uuid.uuid4()), kind=kind, status='queued', priority=priority,
+                  payload=json.dumps(payload or {}), created_at=datetime.now(),
+                  partial=json.dumps(partial) if partial else None)
+        db.add(job)
+        db.commit()
+        result = job.to_dict()
+    finally:
+        db.close()
+    manager = _manager
+    if manager is not None:
+        manager.wake()
+    return result
+
+
+def get_job(job_id, jobs_path=None):
+    """Trabajo por id (JobError si no existe)"""
+    db = get_jobs_session(jobs_path)
+    try:
+        job = db.get(Job, job_id)
+        if job is None:
+            raise JobError(f"Trabajo no encontrado: {job_id}")
+        return job.to_dict()
+    finally:
+        db.close()
+
+
+def list_jobs(status=None, kind=None, limit=100, jobs_path=None):
+    """Trabajos más recientes primero, opcionalmente filtrados por estado y tipo"""
+    if status is not None and status not in JOB_STATUSES:
+        raise JobError(f"Estado no válido. Opciones: {', '.join(JOB_STATUSES)}")
+    db = get_jobs_session(jobs_path)
+    try:
+        query = db.query(Job)
+        if status:
+            query = query.filter(Job.status == status)
+        if kind:
+            query = query.filter(Job.kind == kind)
+        return [job.to_dict() for job in query.order_by(Job.created_at.desc()).limit(limit)]
+    finally:
+        db.close()
+
+
+def cancel_job(job_id, jobs_path=None):
+    """
+    Cancela un trabajo.
+
+    Un trabajo encolado se cancela de inmediato; uno en curso queda marcado y
+    se detiene en la siguiente comprobación.
+
+    Returns:
+        dict: El trabajo tras la solicitud.
+    """
+    # Actualización condicional: el despachador puede reclamar el trabajo a la vez
+    with get_jobs_engine(jobs_path).begin() as conn:
+        updated = conn.execute(text(
+            "UPDATE jobs SET cancel_requested = 1, "
+            "status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END, "
+            "finished_at = CASE WHEN status = 'queued' THEN :now ELSE finished_at END "
+            "WHERE id = :id AND status IN ('queued', 'running')"
+        ), {"id": job_id, "now": datetime.now()}).rowcount
+    job = get_job(job_id, jobs_path)
+    if not updated:
+        raise JobError(f"El trabajo ya ha terminado ({job['status']})")
+    return job
+
+
+def requeue_interrupted_jobs(jobs_path=None):
+    """
+    Vuelve a encolar los trabajos que estaban en curso cuando se detuvo el servidor.
+
+    Las capturas directas (capture_to_db) no se repiten: volver a capturar horas
+    después no recupera lo perdido, así que fallan conservando lo ingerido.
+    """
+    with get_jobs_engine(jobs_path).begin() as conn:
+        cancelled = conn.execute(text(
+            "UPDATE jobs SET status = 'cancelled', finished_at = :now "
+            "WHERE status = 'running' AND cancel_requested = 1"
+        ), {"now": datetime.now()}).rowcount
+        failed = conn.execute(text(
+            "UPDATE jobs SET status = 'failed', finished_at = :now, partial = NULL, error = :error "
+            "WHERE status = 'running' AND kind IN :kinds"
+        ).bindparams(bindparam("kinds", expanding=True)), {
+            "now": datetime.now(), "kinds": sorted(NON_RESUMABLE_KINDS),
+            "error": "Interrumpido por el reinicio del servidor",
+        }).rowcount
+        requeued = conn.execute(text(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, worker_pid = NULL WHERE status = 'running'"
+        )).rowcount
+    if requeued or cancelled or failed:
+        print(f"Trabajos interrumpidos: {requeued} reencolados, {cancelled} cancelados, {failed} fallidos")
+    return requeued
+
+
+def _requeue_job(job_id, jobs_path=None):
+    """Devuelve a la cola un trabajo reclamado que no llegó a ejecutarse"""
+    with get_jobs_engine(jobs_path).begin() as conn:
+        conn.execute(text(
+            "UPDATE jobs SET "
+            "status = CASE WHEN cancel_requested = 1 THEN 'cancelled' ELSE 'queued' END, "
+            "finished_at = CASE WHEN cancel_requested = 1 THEN :now ELSE NULL END, "
+            "started_at = NULL, worker_pid = NULL, attempts = MAX(attempts - 1, 0) "
+            "WHERE id = :id AND status = 'running'"
+        ), {"id": job_id, "now": datetime.now()})
+
+
+def _claim_next_job(jobs_path=None, streaming=None):
+    """
+    Reclama de forma atómica el siguiente trabajo encolado (prioridad y antigüedad).
+
+    Args:
+        streaming (bool, opcional): True: solo trabajos en streaming; False: solo el resto.
+    """
+    kind_filter = ""
+    params = {"now": datetime.now()}
+    if streaming is not None:
+        kind_filter = f"AND kind {'IN' if streaming else 'NOT IN'} :kinds "
+        params["kinds"] = sorted(STREAMING_KINDS)
+    statement = text(
+        "UPDATE jobs SET status = 'running', started_at = :now, attempts = attempts + 1 "
+        "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' " + kind_filter +
+        "            ORDER BY priority DESC, created_at, rowid LIMIT 1) "
+        "RETURNING id, kind, payload"
+    )
+    if streaming is not None:
+        statement = statement.bindparams(bindparam("kinds", expanding=True))
+    with get_jobs_engine(jobs_path).begin() as conn:
+        row = conn.execute(statement, params).first()
+    if row is None:
+        return None
+    return row[0], row[1], json.loads(row[2]) if row[2] else {}
+
+
+def _finish_job(job_id, status, result=None, error=None, jobs_path=None):
+    db = get_jobs_session(jobs_path)
+    try:
+        job = db.get(Job, job_id)
+        if job is None:
+            return
+        job.status = status
+        if status != 'failed':
+            # Lo escrito es definitivo; un trabajo fallido lo conserva para quien lo reintente
+            job.partial = None
+        job.result = json.dumps(result) if result is not None else None
+        job.error = error
+        job.finished_at = datetime.now()
+        db.commit()
+    finally:
+        db.close()
+
+
+# Ejecución en los procesos del pool
+
+def _cancel_checker(jobs_path, job_id):
+    """Función que indica si se ha solicitado la cancelación (consulta la cola como mucho cada intervalo)"""
+    state = {"checked": 0.0, "cancelled": False}
+
+    def should_stop():
+        now = time.monotonic()
+        if not state["cancelled"] and now - state["checked"] >= JOB_CANCEL_CHECK_INTERVAL:
+            state["checked"] = now
+            conn = sqlite3.connect(jobs_path, timeout=30)
+            try:
+                row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            finally:
+                conn.close()
+            state["cancelled"] = bool(row and row[0])
+        return state["cancelled"]
+
+    return should_stop
+
+
+# Cola y trabajo en curso en este proceso del pool (cada proceso ejecuta un trabajo a la vez)
+_current_jobs_path = None
+_current_job_id = None
+
+
+def current_jobs_path():
+    """Base de datos de la cola desde la que se lanzó el trabajo en curso"""
+    return _current_jobs_path or get_jobs_path()
+
+
+def _set_partial(jobs_path, job_id, partial):
+    conn = sqlite3.connect(jobs_path, timeout=30)
+    try:
+        conn.execute("UPDATE jobs SET partial = ? WHERE id = ?",
+                     (json.dumps(partial) if partial is not None else None, job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _record_partial(**state):
+    """Anota en el trabajo en curso la base de datos y la sesión que está escribiendo"""
+    if _current_job_id is None:
+        return
+    conn = sqlite3.connect(current_jobs_path(), timeout=30)
+    try:
+        row = conn.execute("SELECT partial FROM jobs WHERE id = ?", (_current_job_id,)).fetchone()
+    finally:
+        conn.close()
+    partial = json.loads(row[0]) if row and row[0] else {}
+    partial.update(state)
+    _set_partial(current_jobs_path(), _current_job_id, partial)
+
+
+def _discard_partial(jobs_path, job_id):
+    """Descarta lo que dejó a medias un intento anterior del trabajo (o el trabajo fallido al que sustituye)"""
+    conn = sqlite3.connect(jobs_path, timeout=30)
+    try:
+        row = conn.execute("SELECT partial FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if not row or not row[0]:
+        return
+    from processing.pcap_processor import discard_partial_ingest
+    partial = json.loads(row[0])
+    print(f"Trabajo {job_id}: se descarta lo que dejó a medias el intento anterior en {partial['db_path']}")
+    discard_partial_ingest(partial["db_path"], partial.get("session_id"), partial.get("new_database", False))
+    _set_partial(jobs_path, job_id, None)
+
+
+def _process_pcap_job(payload, should_stop, capture=None):
+    """Procesa un PCAP en su base de datos y, si termina bien y se pide, borra el PCAP"""
+    from processing.pcap_processor import PCAPProcessor, ProcessingCancelled
+
+    pcap_file = payload["pcap_file"]
+    processor = PCAPProcessor(db_path=payload.get("db_path"), pcap_file=pcap_file)
+    _record_partial(db_path=processor.db_path, new_database=processor.is_new_database)
+    try:
+        session_id = processor.process_pcap_file(
+            pcap_file, payload.get("interface"), payload.get("filter_applied"),
+            should_stop=should_stop, capture=capture,
+            on_session=lambda created: _record_partial(session_id=created)
+        )
+    except ProcessingCancelled:
+        # Una base de datos creada por este trabajo no se conserva a medias
+        processor.engine.dispose()
+        if processor.is_new_database:
+            for path in (processor.db_path, f"{processor.db_path}-journal", f"{processor.db_path}-wal"):
+                if os.path.exists(path):
+                    os.remove(path)
+        raise JobCancelled()
+    # Sesión completa: un reintento tras este punto no la descarta (el PCAP puede borrarse ya)
+    if _current_job_id is not None:
+        _set_partial(current_jobs_path(), _current_job_id, None)
+    volume = None
+    if payload.get("measure_volume"):
+        # Lo mide aquí, antes de borrarlo, para el ahorro del filtro y el snaplen
+        from capture.capture_filters import pcap_volume
+        try:
+            volume = pcap_volume(pcap_file)
+        except Exception as e:
+            print(f"No se pudo medir el volumen de '{os.path.basename(pcap_file)}': {e}")
+    if payload.get("delete_source"):
+        try:
+            os.remove(pcap_file)
+            print(f"Archivo PCAP original '{os.path.basename(pcap_file)}' eliminado después del procesamiento.")
+        except OSError as e:
+            print(f"Error al eliminar el archivo PCAP '{pcap_file}': {e}")
+    return {
+        "db_path": processor.db_path,
+        "db_file": os.path.basename(processor.db_path),
+        "session_id": session_id,
+        "volume": volume,
+    }
+
+
+def _process_pcap_upload_job(payload, should_stop):
+    """
+    Procesa una subida por bloques mientras se recibe.
+
+    Un hilo sigue el archivo parcial (follow_upload) y escribe sus bytes en una
+    tubería que tshark lee como PCAP (PipeCapture): los paquetes se decodifican
+    a medida que llegan los bloques.
+    """
+    import pyshark
+    from processing.uploads import follow_upload
+
+    read_fd, write_fd = os.pipe()
+    feeder = {"error": None}
+
+    def feed():
+        try:
+            with os.fdopen(write_fd, 'wb') as pipe:
+                for chunk in follow_upload(payload["upload_id"], current_jobs_path(), should_stop=should_stop):
+                    pipe.write(chunk)
+        except BrokenPipeError:
+            # tshark terminó antes de leerlo todo (PCAP no válido o captura cerrada)
+            pass
+        except Exception as e:
+            feeder["error"] = str(e)
+
+    thread = threading.Thread(target=feed, name="upload-feeder", daemon=True)
+    thread.start()
+    try:
+        return _process_pcap_job(
+            payload, lambda: feeder["error"] is not None or should_stop(),
+            capture=pyshark.PipeCapture(pipe=read_fd)
+        )
+    except JobCancelled:
+        # Sin cancelación solicitada, la subida se interrumpió: el trabajo falla
+        if feeder["error"] is not None and not should_stop():
+            raise JobError(feeder["error"])
+        raise
+    finally:
+        thread.join(timeout=5)
+
+
+def _capture_to_db_job(payload, should_stop):
+    """
+    Captura de una interfaz directamente a su base de datos.
+
+    La salida PCAP de tshark se decodifica a medida que llega (CaptureStream +
+    PipeCapture), con commits periódicos, de modo que la sesión se puede consultar
+    mientras dura la captura. Cancelar el trabajo detiene la captura y conserva lo
+    capturado hasta ese momento. Ocupa un proceso del pool mientras dura.
+    """
+    import pyshark
+    from capture.direct_ingest import CaptureStream, stream_base_name
+    from capture.capture_filters import describe_capture_settings
+
+    base = stream_base_name(payload["interface"])
+    pcap_directory = os.getenv("PCAP_DIRECTORY", "./data/pcap_files/")
+    os.makedirs(pcap_directory, exist_ok=True)
+    archive_path = os.path.join(pcap_directory, f"{base}.pcap.zst") if payload.get("archive") else None
+    db_path = payload.get("db_path") or os.path.join(os.getenv('DATABASE_DIRECTORY', './data/db_files'), f"{base}.db")
+
+    stream = CaptureStream(
+        payload["interface"], payload.get("duration"), payload.get("packet_count"),
+        payload.get("capture_filter"), archive_path=archive_path, snaplen=payload.get("snaplen")
+    ).start()
+
+    def watch_cancel():
+        while not stream.finished.wait(0.5):
+            if should_stop():
+                print(f"Captura directa en {payload['interface']} detenida a petición")
+                stream.stop()
+                return
+
+    watcher = threading.Thread(target=watch_cancel, name="capture-cancel", daemon=True)
+    watcher.start()
+    try:
+        result = _process_pcap_job({
+            "pcap_file": archive_path or os.path.join(pcap_directory, f"{base}.pcap"),
+            "db_path": db_path,
+            "interface": payload["interface"],
+            "filter_applied": describe_capture_settings(payload.get("capture_filter"), payload.get("snaplen")),
+            "delete_source": False,
+        }, lambda: stream.error is not None, capture=pyshark.PipeCapture(pipe=stream.read_fd))
+    except JobCancelled:
+        # Solo se interrumpe la ingesta si falló la captura
+        raise JobError(stream.error)
+    finally:
+        stream.stop()
+        stream.wait(timeout=10)
+        watcher.join(timeout=1)
+    result.update(stream.stats())
+    result["savings"] = stream.savings()
+    return result
+
+
+# Tipos de trabajo: nombre -> función (payload, should_stop) ejecutada en el pool
+JOB_HANDLERS = {
+    'process_pcap': _process_pcap_job,
+    'process_pcap_upload': _process_pcap_upload_job,
+    'capture_to_db': _capture_to_db_job,
+}
+
+# Trabajos que ocupan su proceso mientras dura la subida o la captura (pool propio)
+STREAMING_KINDS = {'process_pcap_upload', 'capture_to_db'}
+
+# Trabajos que no se repiten si el servidor se detiene mientras están en curso
+NON_RESUMABLE_KINDS = {'capture_to_db'}
+
+
+def _warm_worker():
+    """Inicializador de los procesos del pool: importa una vez los módulos del procesamiento"""
+    import pyshark  # noqa: F401
+    import processing.pcap_processor  # noqa: F401
+
+
+def _ping():
+    return os.getpid()
+
+
+def _execute_job(jobs_path, job_id, kind, payload):
+    """
+    Ejecuta un trabajo en un proceso del pool.
+
+    Returns:
+        tuple: (estado final, resultado, error)
+    """
+    global _current_jobs_path, _current_job_id
+    _current_jobs_path = jobs_path
+    _current_job_id = job_id
+    conn = sqlite3.connect(jobs_path, timeout=30)
+    try:
+        conn.execute("UPDATE jobs SET worker_pid = ? WHERE id = ?", (os.getpid(), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+    should_stop = _cancel_checker(jobs_path, job_id)
+    try:
+        _discard_partial(jobs_path, job_id)
+        return 'completed', JOB_HANDLERS[kind](payload, should_stop), None
+    except JobCancelled:
+        return 'cancelled', None, None
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return 'failed', None, str(e)
+
+
+# Gestor: pool precalentado y despachador
+
+class JobManager:
+    """Pool de procesos de larga duración y despachador de la cola duradera"""
+
+    def __init__(self, jobs_path=None, workers=None, concurrency=None, stream_workers=None):
+        self.jobs_path = os.path.abspath(jobs_path or get_jobs_path())
+        self.workers = workers or job_workers()
+        self.concurrency = concurrency or job_concurrency()
+        self.stream_workers = stream_workers or job_stream_workers()
+        self.pool = None
+        self.stream_pool = None
+        # id -> (future, en streaming)
+        self.running = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _create_pool(self, streaming=False):
+        workers = self.stream_workers if streaming else self.workers
+        context = multiprocessing.get_context(os.getenv('JOB_START_METHOD', 'spawn'))
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_warm_worker)
+        # Precalentar: crear todos los procesos (y sus imports) antes del primer trabajo
+        pids = {future.result() for future in [pool.submit(_ping) for _ in range(workers)]}
+        print(f"Pool de trabajos{' en streaming' if streaming else ''} listo: {len(pids)} procesos")
+        return pool
+
+    def _running_count(self, streaming):
+        with self._lock:
+            return sum(1 for _, is_streaming in self.running.values() if is_streaming == streaming)
+
+    def start(self):
+        get_jobs_engine(self.jobs_path)
+        requeue_interrupted_jobs(self.jobs_path)
+        self.pool = self._create_pool()
+        self.stream_pool = self._create_pool(streaming=True)
+        self._thread = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    def _dispatch_loop(self):
+        while not self._stop.is_set():
+            # Cada pool con su límite: los trabajos en streaming no ocupan los procesos del resto
+            for streaming, limit in ((False, self.concurrency), (True, self.stream_workers)):
+                while self._running_count(streaming) < limit and not self._stop.is_set():
+                    claimed = _claim_next_job(self.jobs_path, streaming=streaming)
+                    if claimed is None:
+                        break
+                    self._submit(*claimed)
+            self._wake.wait(JOB_POLL_INTERVAL)
+            self._wake.clear()
+
+    def _submit(self, job_id, kind, payload):
+        print(f"Iniciando trabajo {job_id} ({kind})")
+        streaming = kind in STREAMING_KINDS
+        pool = self.stream_pool if streaming else self.pool
+        try:
+            future = pool.submit(_execute_job, self.jobs_path, job_id, kind, payload)
+        except BrokenProcessPool as e:
+            # Un proceso del pool murió: se recrea y se le envía de nuevo el trabajo
+            print(f"Pool de trabajos roto, recreándolo: {e}")
+            pool = self._create_pool(streaming)
+            if streaming:
+                self.stream_pool = pool
+            else:
+                self.pool = pool
+            future = pool.submit(_execute_job, self.jobs_path, job_id, kind, payload)
+        with self._lock:
+            self.running[job_id] = (future, streaming)
+        future.add_done_callback(lambda done, job_id=job_id: self._on_done(job_id, done))
+
+    def _on_done(self, job_id, future):
+        try:
+            status, result, error = future.result()
+        except CancelledError:
+            # Enviado pero sin empezar al apagar el pool (JOB_CONCURRENCY > JOB_WORKERS):
+            # vuelve a la cola en lugar de darse por fallido
+            _requeue_job(job_id, jobs_path=self.jobs_path)
+            print(f"Trabajo {job_id}: reencolado (no llegó a empezar)")
+            status = None
+        except Exception as e:
+            status, result, error = 'failed', None, f"El proceso del trabajo terminó de forma inesperada: {e}"
+        if status is not None:
+            _finish_job(job_id, status, result, error, jobs_path=self.jobs_path)
+            print(f"Trabajo {job_id}: {status}")
+        with self._lock:
+            self.running.pop(job_id, None)
+        self.wake()
+
+    def stats(self):
+        with self._lock:
+            running = list(self.running)
+            streaming = [job_id for job_id, (_, is_streaming) in self.running.items() if is_streaming]
+        return {"workers": self.workers, "concurrency": self.concurrency, "stream_workers": self.stream_workers,
+                "running": running, "streaming": streaming}
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self.wake()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        for pool in (self.pool, self.stream_pool):
+            if pool is not None:
+                pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def start_job_manager(jobs_path=None, workers=None, concurrency=None):
+    """Arranca (una vez por proceso) el pool de trabajos y su despachador"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(jobs_path, workers, concurrency).start()
+        return _manager
+
+
+def get_job_manager():
+    """Gestor en marcha o None"""
+    return _manager
+
+
+def stop_job_manager(wait=True):
+    """Detiene el despachador y el pool (los trabajos en curso se reencolan al arrancar de nuevo)"""
+    global _manager
+    with _manager_lock:
+        manager, _manager = _manager, None
+    if manager is not None:
+        manager.stop(wait=wait)
@@ -2,9 +2,75 @@ import pyshark
 import os
 import json
 from datetime import datetime
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, select, delete, or_
 from sqlalchemy.orm import sessionmaker
-from database.models import Base, CaptureSession, Packet, TCPInfo, UDPInfo, ICMPInfo, Anomaly
+from database.models import (
+    Base, CaptureSession, Packet, TCPInfo, UDPInfo, ICMPInfo, Anomaly,
+    Flow, SessionStats, ArchiveSegment, FrameStore, FrameChunk
+)
+from database.tcp_flags import raw_from_flags, store_flag_columns
+from database.analytics import get_analytics_backend
+from database.session_stats import save_session_stats
+from database.flows import materialize_flows
+from database.catalog import index_database, remove_database
+from database.engine_cache import invalidate_engine
+from database.migrations import stamp_schema_version
+from database.frame_store import build_frame_store, store_raw_frames, invalidate_frame_reader
+from database.fulltext import index_session_text, unindex_session_text, fulltext_enabled
+from database.seal import seal_database, unseal_database, seal_enabled, is_sealed, unsealed
+
+def _enable_incremental_vacuum(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.close()
+
+def discard_partial_ingest(db_path, session_id=None, new_database=False):
+    """
+    Descarta lo que dejó a medias una ingesta interrumpida antes de repetirla: la
+    base de datos entera si la creó esa ingesta o, si no, solo su sesión.
+    """
+    if not os.path.exists(db_path):
+        return
+    invalidate_engine(db_path)
+    invalidate_frame_reader(db_path)
+    if new_database:
+        for path in (db_path, f"{db_path}-journal", f"{db_path}-wal", f"{db_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        try:
+            remove_database(os.path.basename(db_path))
+        except Exception as e:
+            print(f"Error al quitar {db_path} del catálogo: {e}")
+        print(f"Base de datos a medias eliminada: {db_path}")
+        return
+    if session_id is None:
+        return
+
+    with unsealed(db_path):
+        engine = create_engine(f'sqlite:///{db_path}')
+        try:
+            with engine.begin() as conn:
+                packet_ids = select(Packet.id).where(Packet.session_id == session_id)
+                unindex_session_text(conn, session_id)
+                for model in (TCPInfo, UDPInfo, ICMPInfo):
+                    conn.execute(delete(model).where(model.packet_id.in_(packet_ids)))
+                conn.execute(delete(Anomaly).where(
+                    or_(Anomaly.session_id == session_id, Anomaly.packet_id.in_(packet_ids))
+                ))
+                for model in (Flow, SessionStats, ArchiveSegment, FrameChunk, FrameStore, Packet):
+                    conn.execute(delete(model).where(model.session_id == session_id))
+                conn.execute(delete(CaptureSession).where(CaptureSession.id == session_id))
+        finally:
+            engine.dispose()
+    print(f"Sesión a medias {session_id} eliminada de {db_path}")
+    try:
+        index_database(db_path)
+    except Exception as e:
+        print(f"Error al actualizar el catálogo tras descartar la sesión: {e}")
+
+class ProcessingCancelled(Exception):
+    """El procesamiento se detuvo a petición (should_stop)"""
+    pass
 
 class PCAPProcessor:
     """Clase para procesar archivos PCAP y almacenar datos en la base de datos"""
@@ -31,16 +97,29 @@ class PCAPProcessor:
         # Asegurar que el directorio de la base de datos existe
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         
+        is_new_database = not os.path.exists(db_path)
+        
         # Crear el motor de la base de datos y sesión
         self.engine = create_engine(f'sqlite:///{db_path}')
         
+        # Vacuum incremental para poder recuperar espacio tras archivar paquetes
+        # (solo tiene efecto mientras la base de datos está vacía)
+        event.listen(self.engine, "connect", _enable_incremental_vacuum)
+        
         # Asegura que las tablas existen antes de operar
         Base.metadata.create_all(self.engine)
         
+        # Una base de datos nueva ya tiene el esquema actual; las existentes las migra database.migrations
+        if is_new_database:
+            stamp_schema_version(self.engine)
+        
         self.Session = sessionmaker(bind=self.engine)
         self.db_path = db_path
+        self.is_new_database = is_new_database
+        self.store_flag_columns = store_flag_columns()
     
-    def process_pcap_file(self, pcap_file, interface=None, filter_applied=None):
+    def process_pcap_file(self, pcap_file, interface=None, filter_applied=None, should_stop=None, capture=None,
+                          on_session=None):
         """
         Procesa un archivo PCAP y almacena los datos en la base de datos.
         
@@ -48,11 +127,22 @@ class PCAPProcessor:
             pcap_file (str): Ruta al archivo PCAP
             interface (str, opcional): Nombre de la interfaz de captura
             filter_applied (str, opcional): Filtro utilizado durante la captura
+            should_stop (callable, opcional): Se consulta entre paquetes; si devuelve True
+              se lanza ProcessingCancelled
+            capture (pyshark.Capture, opcional): Captura ya abierta (p. ej. PipeCapture sobre
+              una subida en curso); pcap_file debe existir cuando termine la captura
+            on_session (callable, opcional): Recibe el ID de la sesión en cuanto se crea
+              (p. ej. para descartarla si la ingesta se interrumpe)
               Returns:
             int: ID de la sesión de captura creada
         """
-        if not os.path.exists(pcap_file):
+        if capture is None and not os.path.exists(pcap_file):
             raise FileNotFoundError(f"No se encontró el archivo PCAP: {pcap_file}")
+        
+        # Añadir una sesión a una base de datos sellada: se vuelve a sellar al terminar,
+        # también si la ingesta falla o se cancela
+        was_sealed = unseal_database(self.db_path)
+        db_session = self.Session()
             
         try:
             # Capturar tiempo de inicio para calcular duración
@@ -62,12 +152,12 @@ class PCAPProcessor:
             # Registro adicional para depuración
             print(f"\n===== INICIO PROCESAMIENTO DE PCAP =====")
             print(f"Archivo: {pcap_file}")
-            print(f"Tamaño del archivo: {os.path.getsize(pcap_file) / 1024:.2f} KB")
+            if capture is None:
+                print(f"Tamaño del archivo: {os.path.getsize(pcap_file) / 1024:.2f} KB")
             print(f"Interfaz: {interface}")
             print(f"Base de datos: {self.db_path}")
             
             # Crear una sesión de captura en la base de datos
-            db_session = self.Session()
             capture_session = CaptureSession(
                 file_name=os.path.basename(pcap_file),
                 file_path=pcap_file,
@@ -79,10 +169,15 @@ class PCAPProcessor:
             db_session.commit()
             
             print(f"Sesión de captura creada con ID: {capture_session.id}")
+            if on_session is not None:
+                on_session(capture_session.id)
             
-            # Cargar el archivo PCAP con pyshark
-            print(f"Cargando archivo PCAP con pyshark...")
-            cap = pyshark.FileCapture(pcap_file)
+            # Cargar el archivo PCAP con pyshark (o leer la captura recibida)
+            if capture is None:
+                print(f"Cargando archivo PCAP con pyshark...")
+                cap = pyshark.FileCapture(pcap_file)
+            else:
+                cap = capture
             
             # Procesar cada paquete
             packet_count = 0
@@ -96,9 +191,16 @@ class PCAPProcessor:
             
             # Realizar commits más frecuentemente para reducir el riesgo de perder datos
             commit_frequency = 100  # Hacer commit cada 100 paquetes
+            # ... o cada INGEST_COMMIT_INTERVAL segundos: con una captura en curso los datos
+            # llegan despacio y deben poder consultarse mientras tanto
+            commit_interval = float(os.getenv('INGEST_COMMIT_INTERVAL', 2.0))
+            last_commit = time.monotonic()
             pending_packet_count = 0
 
             while True:
+                if should_stop is not None and should_stop():
+                    cap.close()
+                    raise ProcessingCancelled(f"Procesamiento cancelado tras {packet_number_counter} paquetes")
                 try:
                     packet = next(packet_iterator)
                     packet_number_counter += 1
@@ -126,9 +228,12 @@ class PCAPProcessor:
                         # No hacer rollback aquí, solo continuamos con el siguiente paquete
 
                     # Hacer commit más frecuentemente
-                    if pending_packet_count >= commit_frequency:
+                    if pending_packet_count >= commit_frequency or (
+                            pending_packet_count and time.monotonic() - last_commit >= commit_interval):
                         try:
+                            capture_session.packet_count = packet_count
                             db_session.commit()
+                            last_commit = time.monotonic()
                             if packet_number % 1000 == 0:  # Solo imprimimos cada 1000 para no llenar la consola
                                 print(f"Commit realizado tras procesar {packet_number} paquetes ({packet_count} exitosos)")
                             pending_packet_count = 0  # Reiniciar contador
@@ -139,6 +244,10 @@ class PCAPProcessor:
 
                 except StopIteration:
                     print("Fin de la iteración de paquetes.")
+                    # El origen pudo cerrarse por una cancelación
+                    if should_stop is not None and should_stop():
+                        cap.close()
+                        raise ProcessingCancelled(f"Procesamiento cancelado tras {packet_number_counter} paquetes")
                     break
                 except Exception as e:
                     error_packets += 1
@@ -168,6 +277,55 @@ class PCAPProcessor:
             
             cap.close()
             
+            # Materializar los flujos (se conservan aunque se archiven los paquetes)
+            try:
+                with self.engine.begin() as conn:
+                    flow_total = materialize_flows(conn, capture_session.id)
+                print(f"Flujos de la sesión {capture_session.id} guardados: {flow_total}")
+            except Exception as e:
+                print(f"Error al materializar los flujos de la sesión: {e}")
+            
+            # Indexar info_text y protocol_stack para la búsqueda de texto completo
+            if fulltext_enabled():
+                try:
+                    with self.engine.begin() as conn:
+                        text_rows = index_session_text(conn, capture_session.id)
+                    print(f"Texto de la sesión {capture_session.id} indexado: {text_rows} paquetes")
+                except Exception as e:
+                    print(f"Error al indexar el texto de la sesión: {e}")
+            
+            # Guardar los frames en bruto comprimidos (el PCAP original puede borrarse después)
+            if store_raw_frames() and os.path.exists(pcap_file):
+                try:
+                    frame_stats = build_frame_store(self.db_path, capture_session.id, pcap_file)
+                    print(f"Frames de la sesión {capture_session.id} guardados: {frame_stats['frame_count']} "
+                          f"({frame_stats['stored_bytes'] / 1024:.2f} KB, {frame_stats['pcap_percent']}% del PCAP)")
+                except Exception as e:
+                    print(f"Error al guardar los frames de la sesión: {e}")
+            
+            # Precalcular las estadísticas de la sesión para analítica y chat
+            try:
+                with get_analytics_backend(self.db_path, use_stats=False) as analytics:
+                    save_session_stats(db_session, analytics, capture_session.id)
+                print(f"Estadísticas de la sesión {capture_session.id} guardadas")
+            except Exception as e:
+                db_session.rollback()
+                print(f"Error al calcular las estadísticas de la sesión: {e}")
+            
+            # Sellar la base de datos finalizada (checksum, estadísticas finales y solo lectura)
+            if seal_enabled() or was_sealed:
+                try:
+                    seal_database(self.db_path)
+                except Exception as e:
+                    print(f"Error al sellar la base de datos: {e}")
+            
+            # Registrar la base de datos en el catálogo
+            try:
+                index_database(self.db_path)
+                print(f"Base de datos registrada en el catálogo: {self.db_path}")
+            except Exception as e:
+                print(f"Error al registrar la base de datos en el catálogo: {e}")
+            
             # Calcular tiempo total de procesamiento
             end_time = time.time()
             processing_duration = end_time - start_time
@@ -182,6 +340,11 @@ class PCAPProcessor:
             
             return capture_session.id
             
+        except ProcessingCancelled as e:
+            db_session.rollback()
+            print(f"⚠️ {e}")
+            raise
+            
         except Exception as e:
             db_session.rollback()
             print(f"ERROR CRÍTICO durante el procesamiento: {e}")
@@ -191,6 +354,11 @@ class PCAPProcessor:
             
         finally:
             db_session.close()
+            if was_sealed and not is_sealed(self.db_path):
+                try:
+                    seal_database(self.db_path)
+                except Exception as e:
+                    print(f"Error al volver a sellar la base de datos: {e}")
     
     def _process_packet(self, db_session, capture_session, packet_number, packet):
         """
@@ -415,6 +583,13 @@ class PCAPProcessor:
                 tcp_flag_syn = bool(safe_int_convert(getattr(tcp, 'flags_syn', None)))
                 tcp_flag_fin = bool(safe_int_convert(getattr(tcp, 'flags_fin', None)))
                 
+                # Las consultas de flags usan la máscara empaquetada; reconstruirla si no vino en el paquete
+                if tcp_flags_raw is None:
+                    tcp_flags_raw = raw_from_flags(
+                        ns=tcp_flag_ns, cwr=tcp_flag_cwr, ece=tcp_flag_ece, urg=tcp_flag_urg,
+                        ack=tcp_flag_ack, psh=tcp_flag_psh, rst=tcp_flag_rst, syn=tcp_flag_syn, fin=tcp_flag_fin
+                    )
+                
                 # Window y otros campos
                 tcp_window_size = safe_int_convert(getattr(tcp, 'window_size', None))
                 tcp_window_size_value = safe_int_convert(getattr(tcp, 'window_size_value', None))
@@ -491,6 +666,11 @@ class PCAPProcessor:
             info_text = f"Error de procesamiento: {e}"
             is_error = True
         
+        # Las columnas booleanas de flags son opcionales: tcp_flags_raw contiene la misma información
+        if not self.store_flag_columns:
+            tcp_flag_ns = tcp_flag_cwr = tcp_flag_ece = tcp_flag_urg = None
+            tcp_flag_ack = tcp_flag_psh = tcp_flag_rst = tcp_flag_syn = tcp_flag_fin = None
+        
         # Crear un nuevo objeto Packet
         try:
             new_packet = Packet(
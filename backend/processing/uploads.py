@@ -0,0 +1,383 @@
+"""
+Subidas por bloques reanudables (protocolo tipo tus) con ingesta simultánea.
+
+Una subida se crea con su nombre y tamaño total y después se envía en
+bloques PATCH con la cabecera Upload-Offset: cada bloque se escribe en
+`<archivo>.part` en el offset indicado y se añade al SHA-256 incremental de
+la subida. Si la conexión se corta, el cliente consulta el offset guardado
+(HEAD) y continúa desde ahí; se conserva todo lo que llegó a escribirse.
+
+El estado de cada subida se guarda en la base de datos de la cola de
+trabajos (tabla uploads), de modo que sobrevive a un reinicio; el hash
+incremental se mantiene en memoria y, si falta, se recalcula una vez sobre
+lo ya recibido.
+
+Si se pide procesar la subida, el trabajo de procesamiento se encola al
+crearla: follow_upload() sigue el archivo a medida que crece y el procesador
+decodifica los paquetes ya recibidos mientras llegan los siguientes, de modo
+que la ingesta termina poco después del último byte. Si el cliente deja de
+enviar bloques durante UPLOAD_STALL_TIMEOUT, la ingesta se abandona para
+liberar su proceso; cuando la subida se complete, el archivo se procesa
+entero con un trabajo process_pcap normal.
+"""
+import os
+import time
+import hashlib
+import threading
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime, Index
+
+from processing.jobs import (
+    JobBase, get_jobs_session, get_jobs_engine, enqueue_job, cancel_job, get_job, JobError
+)
+
+# Tamaño de lectura al seguir una subida en curso
+UPLOAD_FOLLOW_CHUNK = int(os.getenv('UPLOAD_FOLLOW_CHUNK', 256 * 1024))
+
+# Segundos entre comprobaciones de una subida en curso cuando no hay datos nuevos
+UPLOAD_FOLLOW_INTERVAL = float(os.getenv('UPLOAD_FOLLOW_INTERVAL', 0.2))
+
+# Segundos sin datos nuevos tras los que se abandona la ingesta de una subida
+UPLOAD_STALL_TIMEOUT = float(os.getenv('UPLOAD_STALL_TIMEOUT', 120))
+
+PART_SUFFIX = '.part'
+
+
+class UploadError(Exception):
+    """Parámetros de subida no válidos"""
+    pass
+
+
+class UploadNotFound(UploadError):
+    """La subida no existe"""
+    pass
+
+
+class UploadConflict(UploadError):
+    """El offset no coincide, la subida ya terminó o hay otro bloque en curso"""
+    pass
+
+
+class Upload(JobBase):
+    """Subida por bloques (en la base de datos de la cola de trabajos)"""
+    __tablename__ = 'uploads'
+    __table_args__ = (
+        Index('ix_uploads_status', 'status', 'created_at'),
+    )
+
+    id = Column(String(36), primary_key=True)
+    file_name = Column(String(255), nullable=False)
+    path = Column(String(1024), nullable=False)         # Ruta final (la parcial lleva PART_SUFFIX)
+    size = Column(Integer, nullable=False)              # Upload-Length
+    offset = Column(Integer, nullable=False, default=0)  # Bytes recibidos
+    status = Column(String(20), nullable=False, default='uploading')  # uploading, completed, aborted
+    sha256 = Column(String(64), nullable=True)
+    job_id = Column(String(36), nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now)
+    completed_at = Column(DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "file_name": self.file_name,
+            "path": self.path,
+            "size": self.size,
+            "offset": self.offset,
+            "progress": round(self.offset * 100 / self.size, 2) if self.size else 100.0,
+            "status": self.status,
+            "sha256": self.sha256,
+            "job_id": self.job_id,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+        }
+
+
+# Hash incremental por subida: id -> (offset hasheado, objeto sha256)
+_hashers = {}
+# Subidas con un bloque en curso
+_active = set()
+_lock = threading.Lock()
+# Bases de datos de la cola en las que ya existe la tabla uploads
+_tables_ready = set()
+
+
+def _engine(jobs_path=None):
+    """Motor de la cola, con la tabla uploads creada (JobBase la crea solo si ya estaba importada)"""
+    engine = get_jobs_engine(jobs_path)
+    if engine.url.database not in _tables_ready:
+        Upload.__table__.create(engine, checkfirst=True)
+        _tables_ready.add(engine.url.database)
+    return engine
+
+
+def _session(jobs_path=None):
+    _engine(jobs_path)
+    return get_jobs_session(jobs_path)
+
+
+def part_path(path):
+    return path + PART_SUFFIX
+
+
+def create_upload(file_name, size, directory, process=True, interface=None, priority=0, jobs_path=None):
+    """
+    Registra una subida nueva y, si se pide, encola su procesamiento en streaming.
+
+    Returns:
+        dict: La subida (con job_id si se procesa).
+    """
+    if not file_name.lower().endswith('.pcap') or os.path.basename(file_name) != file_name:
+        raise UploadError("Solo se permiten archivos PCAP")
+    if size <= 0:
+        raise UploadError("El tamaño de la subida debe ser mayor que cero")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.abspath(os.path.join(directory, file_name))
+    if os.path.exists(path) or os.path.exists(part_path(path)):
+        raise UploadConflict(f"Ya existe un archivo con el nombre '{file_name}'. Por favor, elige otro nombre.")
+
+    open(part_path(path), 'wb').close()
+    upload_id = str(uuid.uuid4())
+    with _lock:
+        _hashers[upload_id] = (0, hashlib.sha256())
+    db = _session(jobs_path)
+    try:
+        upload = Upload(id=upload_id, file_name=file_name, path=path, size=size, offset=0, status='uploading',
+                        created_at=datetime.now(), updated_at=datetime.now())
+        db.add(upload)
+        db.commit()
+        if process:
+            # El trabajo empieza a decodificar mientras llegan los bloques
+            job = enqueue_job('process_pcap_upload', {
+                "upload_id": upload_id,
+                "pcap_file": path,
+                "interface": interface,
+                "filter_applied": None,
+                "delete_source": True,
+            }, priority=priority, jobs_path=jobs_path)
+            upload.job_id = job["id"]
+            db.commit()
+        return upload.to_dict()
+    finally:
+        db.close()
+
+
+def get_upload(upload_id, jobs_path=None):
+    """Subida por id (UploadNotFound si no existe)"""
+    db = _session(jobs_path)
+    try:
+        upload = db.get(Upload, upload_id)
+        if upload is None:
+            raise UploadNotFound(f"Subida no encontrada: {upload_id}")
+        return upload.to_dict()
+    finally:
+        db.close()
+
+
+def _hasher_at(upload_id, path, offset):
+    """Hash de los primeros `offset` bytes (recalculado desde el archivo si no está en memoria)"""
+    with _lock:
+        state = _hashers.get(upload_id)
+    if state is not None and state[0] == offset:
+        return state[1]
+    hasher = hashlib.sha256()
+    remaining = offset
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            hasher.update(chunk)
+            remaining -= len(chunk)
+    return hasher
+
+
+class UploadWriter:
+    """Escritura de un bloque PATCH: valida el offset, escribe, hashea y guarda el avance al cerrar"""
+
+    def __init__(self, upload, jobs_path=None):
+        self.upload_id = upload["id"]
+        self.path = upload["path"]
+        self.size = upload["size"]
+        self.offset = upload["offset"]
+        self.jobs_path = jobs_path
+        self.hasher = _hasher_at(self.upload_id, part_path(self.path), self.offset)
+        self.file = open(part_path(self.path), 'r+b')
+        self.file.seek(self.offset)
+
+    def write(self, data):
+        if self.offset + len(data) > self.size:
+            raise UploadError(f"El bloque supera el tamaño declarado de la subida ({self.size} bytes)")
+        self.file.write(data)
+        # Visible de inmediato para la ingesta que sigue el archivo
+        self.file.flush()
+        self.hasher.update(data)
+        self.offset += len(data)
+
+    def close(self):
+        """
+        Guarda el offset alcanzado (aunque el bloque se cortara) y, si la
+        subida está completa, renombra el archivo y registra su SHA-256.
+
+        Returns:
+            dict: La subida actualizada.
+        """
+        try:
+            self.file.close()
+            completed = self.offset == self.size
+            if completed:
+                os.replace(part_path(self.path), self.path)
+            db = _session(self.jobs_path)
+            try:
+                upload = db.get(Upload, self.upload_id)
+                upload.offset = self.offset
+                upload.updated_at = datetime.now()
+                if completed:
+                    upload.status = 'completed'
+                    upload.sha256 = self.hasher.hexdigest()
+                    upload.completed_at = datetime.now()
+                    upload.job_id = _resume_processing(upload, self.jobs_path)
+                db.commit()
+                result = upload.to_dict()
+            finally:
+                db.close()
+            with _lock:
+                if completed:
+                    _hashers.pop(self.upload_id, None)
+                else:
+                    _hashers[self.upload_id] = (self.offset, self.hasher)
+            if completed:
+                print(f"Subida completada: {result['file_name']} ({self.size} bytes, sha256 {result['sha256'][:12]}…)")
+            return result
+        finally:
+            with _lock:
+                _active.discard(self.upload_id)
+
+
+def _resume_processing(upload, jobs_path=None):
+    """
+    Si la ingesta en streaming de la subida falló (p. ej. se abandonó por falta de
+    datos), encola el procesamiento del archivo completo, que antes descarta la
+    sesión a medias del trabajo fallido. Devuelve el job_id vigente.
+    """
+    if not upload.job_id:
+        return None
+    try:
+        job = get_job(upload.job_id, jobs_path)
+    except JobError:
+        return upload.job_id
+    if job["status"] != 'failed':
+        return upload.job_id
+    payload = job["payload"]
+    retry = enqueue_job('process_pcap', {
+        "pcap_file": upload.path,
+        "interface": payload.get("interface"),
+        "filter_applied": payload.get("filter_applied"),
+        "delete_source": payload.get("delete_source", True),
+    }, priority=job["priority"], jobs_path=jobs_path, partial=job["partial"])
+    print(f"La ingesta en streaming de {upload.file_name} no terminó: trabajo {retry['id']} con el archivo completo")
+    return retry["id"]
+
+
+def open_upload_writer(upload_id, offset, jobs_path=None):
+    """
+    Prepara la escritura de un bloque en el offset indicado.
+
+    Raises:
+        UploadNotFound: Si la subida no existe.
+        UploadConflict: Si el offset no es el guardado, la subida no está en curso
+            o ya se está recibiendo otro bloque.
+    """
+    upload = get_upload(upload_id, jobs_path)
+    if upload["status"] != 'uploading':
+        raise UploadConflict(f"La subida no está en curso ({upload['status']})")
+    if offset != upload["offset"]:
+        raise UploadConflict(f"Upload-Offset {offset} no coincide con el offset actual {upload['offset']}")
+    with _lock:
+        if upload_id in _active:
+            raise UploadConflict("Ya se está recibiendo otro bloque de esta subida")
+        _active.add(upload_id)
+    try:
+        return UploadWriter(upload, jobs_path)
+    except Exception:
+        with _lock:
+            _active.discard(upload_id)
+        raise
+
+
+def abort_upload(upload_id, jobs_path=None):
+    """Cancela una subida en curso, borra lo recibido y cancela su procesamiento"""
+    db = _session(jobs_path)
+    try:
+        upload = db.get(Upload, upload_id)
+        if upload is None:
+            raise UploadNotFound(f"Subida no encontrada: {upload_id}")
+        if upload.status != 'uploading':
+            raise UploadConflict(f"La subida no está en curso ({upload.status})")
+        upload.status = 'aborted'
+        upload.updated_at = datetime.now()
+        db.commit()
+        result = upload.to_dict()
+    finally:
+        db.close()
+    with _lock:
+        _hashers.pop(upload_id, None)
+    if os.path.exists(part_path(result["path"])):
+        os.remove(part_path(result["path"]))
+    if result["job_id"]:
+        try:
+            cancel_job(result["job_id"], jobs_path)
+        except JobError:
+            pass
+    return result
+
+
+def _upload_state(upload_id, jobs_path):
+    with _engine(jobs_path).connect() as conn:
+        row = conn.exec_driver_sql("SELECT status, size FROM uploads WHERE id = ?", (upload_id,)).first()
+    if row is None:
+        raise UploadNotFound(f"Subida no encontrada: {upload_id}")
+    return row[0], row[1]
+
+
+def follow_upload(upload_id, jobs_path=None, should_stop=None, chunk_size=None):
+    """
+    Lee una subida a medida que se recibe, hasta su último byte.
+
+    Yields:
+        bytes: Bloques del archivo en orden.
+
+    Raises:
+        UploadError: Si la subida se cancela o deja de recibir datos durante UPLOAD_STALL_TIMEOUT.
+    """
+    chunk_size = chunk_size or UPLOAD_FOLLOW_CHUNK
+    upload = get_upload(upload_id, jobs_path)
+    try:
+        f = open(part_path(upload["path"]), 'rb')
+    except FileNotFoundError:
+        # Ya se completó (y se renombró) antes de empezar a seguirla
+        f = open(upload["path"], 'rb')
+    read = 0
+    last_data = time.monotonic()
+    with f:
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                read += len(chunk)
+                last_data = time.monotonic()
+                yield chunk
+                continue
+            status, size = _upload_state(upload_id, jobs_path)
+            if status == 'completed' and read >= size:
+                return
+            if status == 'aborted':
+                raise UploadError("La subida se canceló")
+            if should_stop is not None and should_stop():
+                raise UploadError("La ingesta de la subida se detuvo")
+            if time.monotonic() - last_data > UPLOAD_STALL_TIMEOUT:
+                raise UploadError(f"La subida no recibe datos desde hace {UPLOAD_STALL_TIMEOUT:.0f} s")
+            if status != 'completed':
+                time.sleep(UPLOAD_FOLLOW_INTERVAL)
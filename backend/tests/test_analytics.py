@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.analytics import SQLiteAnalytics, DuckDBAnalytics, duckdb
+from database.parquet_export import export_session, pyarrow_available
+from database.session_stats import compute_session_stats
+from test_parquet_export import _create_sample_db
+
+def test_backends_return_identical_results():
+    """Prueba que SQLite y DuckDB (sidecar Parquet) devuelven la misma analítica"""
+    print("\n--- Test: Backends de analítica ---")
+
+    if duckdb is None or not pyarrow_available():
+        print("⚠️ duckdb o pyarrow no están instalados, se omite la prueba")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "database_test.db")
+        session_id = _create_sample_db(db_path)
+        export_session(db_path, session_id, tmp_dir, tables=("packets", "anomalies"))
+
+        with SQLiteAnalytics(db_path) as sqlite_backend:
+            expected = sqlite_backend.session_analytics(session_id)
+            expected_ports = sqlite_backend.top_values(session_id, 'dst_port', 15, exclude_null=True)
+            expected_stats = compute_session_stats(sqlite_backend, session_id)
+
+        with DuckDBAnalytics(db_path, sidecar_dir=tmp_dir) as duckdb_backend:
+            assert duckdb_backend.session_analytics(session_id) == expected
+            assert duckdb_backend.top_values(session_id, 'dst_port', 15, exclude_null=True) == expected_ports
+            stats = compute_session_stats(duckdb_backend, session_id)
+            stats.pop('computed_at'), expected_stats.pop('computed_at')
+            assert stats == expected_stats
+
+        assert expected["total_packets"] == 250
+        assert expected["protocol_distribution"] == {"TCP": 125, "UDP": 125}
+        print(f"✅ Resultados idénticos: {expected['protocol_distribution']}")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE BACKENDS DE ANALÍTICA ===")
+    test_backends_return_identical_results()
@@ -0,0 +1,77 @@
+import os
+import sys
+import asyncio
+import tempfile
+import threading
+
+import httpx
+from fastapi import FastAPI
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.database_api import router as database_router
+from database.dal import run_db, dal_stats, shutdown_pools
+from database.engine_cache import clear_engine_cache
+from test_parquet_export import _create_sample_db
+
+# Límite de seguridad para que un bucle bloqueado haga fallar la prueba en lugar de colgarla
+WAIT_TIMEOUT = 30
+
+def _held_query(release):
+    """Consulta que ocupa un hilo del pool hasta que se libera"""
+    release.wait(WAIT_TIMEOUT)
+    return 1
+
+def _create_app(release):
+    app = FastAPI()
+    app.include_router(database_router)
+
+    @app.get("/held")
+    async def held():
+        return {"result": await run_db(_held_query, release)}
+
+    return app
+
+async def _serve_while_held(app, db_file, release):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        held = asyncio.create_task(client.get("/held"))
+        while not any(stats["active"] for stats in dal_stats().values()):
+            await asyncio.sleep(0.01)
+
+        # Con la consulta ocupando el pool, el bucle sigue atendiendo peticiones
+        for _ in range(10):
+            response = await asyncio.wait_for(
+                client.get("/api/database/sessions", params={"db_file": db_file}), WAIT_TIMEOUT
+            )
+            assert response.status_code == 200 and response.json()["total"] == 1
+        assert not held.done()
+
+        release.set()
+        response = await asyncio.wait_for(held, WAIT_TIMEOUT)
+        assert response.status_code == 200 and response.json()["result"] == 1
+
+def test_async_dal_responsive_while_query_runs():
+    """Las peticiones se atienden mientras otra consulta ocupa el pool de base de datos"""
+    print("\n--- Test: Capa de acceso a datos no bloqueante ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "database_test.db")
+        _create_sample_db(db_path)
+        os.environ['DATABASE_DIRECTORY'] = tmp_dir
+        release = threading.Event()
+        try:
+            asyncio.run(_serve_while_held(_create_app(release), "database_test.db", release))
+        finally:
+            release.set()
+            del os.environ['DATABASE_DIRECTORY']
+            clear_engine_cache()
+            shutdown_pools()
+
+    assert dal_stats() == {} or all(stats["active"] == 0 for stats in dal_stats().values())
+    print("✅ El bucle de eventos atiende /sessions con la consulta en el pool de base de datos")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE LA CAPA DE ACCESO A DATOS ===")
+    test_async_dal_responsive_while_query_runs()
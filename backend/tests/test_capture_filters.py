@@ -0,0 +1,189 @@
+import os
+import sys
+import time
+import struct
+import tempfile
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.capture_api import router as capture_router
+from capture import capture_manager, tshark_runtime, live_stream
+from capture.capture_manager import CaptureManager
+from capture.capture_filters import (
+    describe_capture_settings, savings_report, clear_filter_cache, interface_counters,
+    pcap_volume, capture_volume
+)
+from capture.network_interfaces import build_capture_command
+from capture.tshark_runtime import TsharkRuntime
+from processing.jobs import get_job, list_jobs, _finish_job
+
+# dumpcap simulado: -d compila el filtro (y anota cada compilación); al capturar
+# escribe 20 paquetes de 1000 bytes recortados al snaplen (-s)
+FAKE_DUMPCAP = '''#!{python}
+import os, sys, time, signal, struct
+args = sys.argv[1:]
+if "-v" in args:
+    print("Dumpcap (Wireshark) 4.0.11")
+    sys.exit(0)
+snaplen = int(args[args.index("-s") + 1]) if "-s" in args else 262144
+if "-d" in args:
+    with open({compiled!r}, "a") as log:
+        log.write("compilado\\n")
+    capture_filter = args[args.index("-f") + 1]
+    if "bogus" in capture_filter:
+        sys.stderr.write("dumpcap: Invalid capture filter \\"%s\\" for interface 'lo'.\\n" % capture_filter)
+        sys.exit(1)
+    print("(000) ldh      [12]")
+    print("(001) ret      #%d" % snaplen)
+    sys.exit(0)
+output = args[args.index("-w") + 1]
+duration = float(args[args.index("-a") + 1].split(":")[1]) if "-a" in args else 30
+stop = []
+signal.signal(signal.SIGINT, lambda *a: stop.append(True))
+with open(output, "wb") as f:
+    f.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, snaplen, 1))
+    caplen = min(1000, snaplen)
+    for i in range(20):
+        f.write(struct.pack("<IIII", 1700000000 + i, 0, caplen, 1000) + bytes(caplen))
+deadline = time.monotonic() + duration
+while not stop and time.monotonic() < deadline:
+    time.sleep(0.02)
+'''
+
+def test_capture_filter_helpers():
+    """snaplen en el comando, texto de filter_applied y cálculo del ahorro"""
+    print("\n--- Test: Utilidades de filtros de captura ---")
+    command = build_capture_command("/usr/bin/dumpcap", "eth0", "/tmp/c.pcap", 10, None, "udp port 53", snaplen=128)
+    assert command == ["/usr/bin/dumpcap", "-i", "eth0", "-w", "/tmp/c.pcap", "-f", "udp port 53",
+                       "-s", "128", "-a", "duration:10"]
+    assert describe_capture_settings("tcp port 443", 128) == "tcp port 443; snaplen=128"
+    assert describe_capture_settings(None, 96) == "snaplen=96"
+    assert describe_capture_settings(None, None) is None
+    assert len(describe_capture_settings("host 10.0.0.1 or " * 30, 128)) == 255
+
+    volume = {"packets": 10, "original_bytes": 10000, "captured_bytes": 1280}
+    report = savings_report(volume)
+    assert report["snaplen_saved_bytes"] == report["disk_saved_bytes"] == 8720
+    assert report["filtered_bytes"] is None and report["saved_percent"] == 87.2
+    report = savings_report(volume, {"packets": 50, "bytes": 40000})
+    assert report["filtered_packets"] == 40 and report["filtered_bytes"] == 30000
+    assert report["disk_saved_bytes"] == 8720 + 30000 + 40 * 16
+    assert report["saved_percent"] == 96.8
+
+    # pcap_volume salta los datos y descarta el último registro a medio escribir
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "recortado.pcap")
+        with open(path, "wb") as f:
+            f.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 128, 1))
+            for i in range(5):
+                f.write(struct.pack("<IIII", 1700000000 + i, 0, 128, 1500) + bytes(128))
+            f.write(struct.pack("<IIII", 1700000005, 0, 128, 1500) + bytes(40))
+        assert pcap_volume(path) == {"packets": 5, "original_bytes": 7500, "captured_bytes": 640}
+        assert pcap_volume(path) == capture_volume(path)
+    print("✅ Utilidades de filtros: snaplen, filter_applied y ahorro")
+
+def test_capture_filter_api():
+    """Un filtro no válido se rechaza antes de capturar; el ahorro se informa al terminar"""
+    print("\n--- Test: Filtros de captura en la API ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        compiled = os.path.join(tmp_dir, "compilados.log")
+        dumpcap_path = os.path.join(tmp_dir, "dumpcap")
+        with open(dumpcap_path, "w") as f:
+            f.write(FAKE_DUMPCAP.format(python=sys.executable, compiled=compiled))
+        os.chmod(dumpcap_path, 0o755)
+        os.environ['JOBS_PATH'] = os.path.join(tmp_dir, "jobs.sqlite")
+        os.environ['DUMPCAP_PATH'] = dumpcap_path
+        os.environ['TSHARK_PATH'] = os.path.join(tmp_dir, "no-existe")
+        tshark_runtime._runtime = TsharkRuntime()
+        clear_filter_cache()
+        capture_manager._manager = CaptureManager(pcap_directory=tmp_dir)
+
+        def compilations():
+            with open(compiled) as f:
+                return len(f.readlines())
+
+        app = FastAPI()
+        app.include_router(capture_router)
+        try:
+            with TestClient(app) as client:
+                # Compilación previa con el código BPF generado, en caché
+                params = {"interface_id": "lo", "capture_filter": "tcp port 443", "snaplen": 128}
+                result = client.get("/api/capture/filters/compile", params=params).json()
+                assert result["validated"] and result["instructions"][-1].endswith("#128")
+                client.get("/api/capture/filters/compile", params=params)
+                assert compilations() == 1
+
+                # Un filtro que no compila se rechaza sin iniciar la captura ni encolar nada
+                bad = {"interface_id": "lo", "capture_filter": "tcp port bogus"}
+                error = client.get("/api/capture/filters/compile", params=bad)
+                assert error.status_code == 400 and "Invalid capture filter" in error.json()["detail"]
+                assert client.post("/api/capture/start", params=bad).status_code == 400
+                assert client.post("/api/capture/ingest", params=bad).status_code == 400
+                assert client.get("/api/capture/captures").json()["total"] == 0
+                assert list_jobs() == []
+                assert client.post("/api/capture/start", params={"interface_id": "lo", "snaplen": 0}).status_code == 422
+
+                # La captura reutiliza el filtro ya compilado
+                before = compilations()
+                capture = client.post("/api/capture/start", params={**params, "duration": 1, "process": True}).json()
+                assert capture["snaplen"] == 128 and capture["bpf_instructions"] == 2
+                assert compilations() == before
+                deadline = time.monotonic() + 10
+                while capture["status"] == 'running' and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    capture = client.get(f"/api/capture/captures/{capture['id']}").json()
+                assert capture["status"] == 'completed'
+
+                # La entrega no espera a medir el archivo: lo mide el trabajo de ingesta
+                job = get_job(capture["job_id"])
+                assert job["payload"]["filter_applied"] == capture["filter_applied"] == "tcp port 443; snaplen=128"
+                assert job["payload"]["measure_volume"]
+                assert capture["savings"]["files_pending"] == 1 and capture["savings"]["packets"] == 0
+                # Resultado del trabajo tal como lo deja el proceso de ingesta
+                _finish_job(job["id"], 'completed', {"volume": pcap_volume(capture["file_path"])})
+                capture = client.get(f"/api/capture/captures/{capture['id']}").json()
+
+                # El filtro y el snaplen quedan en la sesión; el ahorro del snaplen es exacto
+                savings = capture["savings"]
+                assert savings["files_measured"] == 1 and savings["files_pending"] == 0
+                assert savings["packets"] == 20 and savings["original_bytes"] == 20000
+                assert savings["captured_bytes"] == 20 * 128 and savings["snaplen_saved_bytes"] == 20 * 872
+                if interface_counters("lo") is not None:
+                    assert savings["interface_bytes"] is not None and savings["filtered_bytes"] >= 0
+
+                # Sin procesamiento el archivo se mide en segundo plano tras entregarlo
+                capture = client.post("/api/capture/start", params={**params, "duration": 1}).json()
+                deadline = time.monotonic() + 10
+                while (capture["status"] == 'running' or capture["savings"]["files_pending"]) \
+                        and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    capture = client.get(f"/api/capture/captures/{capture['id']}").json()
+                assert capture["job_id"] is None and capture["savings"]["captured_bytes"] == 20 * 128
+
+                # Captura directa: el snaplen viaja en el trabajo
+                job = client.post("/api/capture/ingest", params={**params, "duration": 1}).json()
+                assert job["payload"]["snaplen"] == 128 and job["payload"]["capture_filter"] == "tcp port 443"
+                print(f"✅ Filtros de captura: {savings['disk_saved_bytes']} bytes de disco ahorrados "
+                      f"({savings['saved_percent']}%)")
+
+                # La captura en vivo también rechaza el filtro antes de lanzar tshark
+                with client.websocket_connect("/api/capture/live/lo?capture_filter=tcp%20port%20bogus") as ws:
+                    end = ws.receive_json()
+                    assert end["type"] == "end" and "Invalid capture filter" in end["error"]
+                assert live_stream._hub is None or live_stream._hub.sessions == {}
+        finally:
+            capture_manager._manager = None
+            tshark_runtime._runtime = None
+            clear_filter_cache()
+            for name in ('JOBS_PATH', 'DUMPCAP_PATH', 'TSHARK_PATH'):
+                del os.environ[name]
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE FILTROS DE CAPTURA ===")
+    test_capture_filter_helpers()
+    test_capture_filter_api()
@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import tempfile
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.capture_api import router as capture_router
+from capture import capture_manager
+from capture.capture_manager import CaptureManager
+from processing.jobs import get_job
+
+# tshark simulado: escribe la cabecera PCAP y espera la duración pedida o SIGINT
+FAKE_TSHARK = '''#!{python}
+import sys, time, signal, struct
+args = sys.argv[1:]
+interface = args[args.index("-i") + 1]
+output = args[args.index("-w") + 1]
+duration = 30
+if "-a" in args:
+    duration = float(args[args.index("-a") + 1].split(":")[1])
+if interface == "fallo":
+    sys.stderr.write("tshark: interfaz no disponible\\n")
+    sys.exit(1)
+stop = []
+signal.signal(signal.SIGINT, lambda *a: stop.append(True))
+with open(output, "wb") as f:
+    f.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+deadline = time.monotonic() + duration
+while not stop and time.monotonic() < deadline:
+    time.sleep(0.02)
+'''
+
+def _wait_for(client, capture_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        capture = client.get(f"/api/capture/captures/{capture_id}").json()
+        if capture["status"] != 'running':
+            return capture
+        time.sleep(0.05)
+    raise AssertionError(f"La captura {capture_id} no terminó")
+
+def test_capture_manager():
+    """Prueba las capturas asíncronas: inicio inmediato, concurrencia, parada y encolado"""
+    print("\n--- Test: Gestor de capturas ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tshark_path = os.path.join(tmp_dir, "tshark")
+        with open(tshark_path, "w") as f:
+            f.write(FAKE_TSHARK.format(python=sys.executable))
+        os.chmod(tshark_path, 0o755)
+        os.environ['JOBS_PATH'] = os.path.join(tmp_dir, "jobs.sqlite")
+        capture_manager._manager = CaptureManager(pcap_directory=tmp_dir, binary_path=tshark_path, max_concurrent=2)
+
+        app = FastAPI()
+        app.include_router(capture_router)
+        try:
+            with TestClient(app) as client:
+                # La respuesta llega en cuanto arranca tshark, no al terminar la captura
+                started = time.monotonic()
+                short = client.post("/api/capture/start", params={"interface_id": "eth0", "duration": 1, "process": True})
+                long = client.post("/api/capture/start", params={"interface_id": "eth1", "duration": 30})
+                assert short.status_code == 202 and long.status_code == 202
+                assert time.monotonic() - started < 1
+                short, long = short.json(), long.json()
+                assert short["status"] == long["status"] == 'running' and short["file_path"] != long["file_path"]
+
+                # Interfaz ocupada y máximo de capturas simultáneas
+                assert client.post("/api/capture/start", params={"interface_id": "eth0"}).status_code == 409
+                assert client.post("/api/capture/start", params={"interface_id": "eth2"}).status_code == 409
+                assert client.get("/api/capture/captures", params={"status": "running"}).json()["total"] == 2
+
+                # Al terminar, el PCAP se encola para su procesamiento
+                done = _wait_for(client, short["id"])
+                assert done["status"] == 'completed' and done["size"] == 24
+                job = get_job(done["job_id"])
+                assert job["kind"] == 'process_pcap' and job["payload"]["pcap_file"] == done["file_path"]
+
+                # Detener una captura conserva el archivo
+                stopped = client.post(f"/api/capture/captures/{long['id']}/stop").json()
+                assert stopped["status"] == 'stopped' and stopped["job_id"] is None
+                assert os.path.getsize(stopped["file_path"]) == 24
+                assert client.post(f"/api/capture/captures/{long['id']}/stop").status_code == 409
+
+                failed = client.post("/api/capture/start", params={"interface_id": "fallo"}).json()
+                failed = _wait_for(client, failed["id"])
+                assert failed["status"] == 'failed' and "interfaz no disponible" in failed["error"]
+
+                assert client.get("/api/capture/captures/no-existe").status_code == 404
+                assert client.get("/api/capture/captures", params={"status": "nope"}).status_code == 400
+                assert client.get("/api/capture/captures").json()["total"] == 3
+                print(f"✅ Gestor de capturas: captura encolada como trabajo {job['id']}")
+        finally:
+            capture_manager._manager = None
+            del os.environ['JOBS_PATH']
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DEL GESTOR DE CAPTURAS ===")
+    test_capture_manager()
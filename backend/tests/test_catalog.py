@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import tempfile
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.catalog import (
+    reconcile_catalog, list_databases, list_sessions, get_database_entry, latest_database_path, file_hash
+)
+from database import catalog
+from test_parquet_export import _create_sample_db
+
+def test_catalog_reconcile_and_listing():
+    """Prueba el catálogo: escaneo del directorio, listado paginado y borrado de archivos"""
+    print("\n--- Test: Catálogo de bases de datos ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_dir = os.path.join(tmp_dir, "db_files")
+        os.makedirs(db_dir)
+        catalog_path = os.path.join(tmp_dir, "catalog.sqlite")
+
+        for index, packets in enumerate((120, 250, 80)):
+            db_path = os.path.join(db_dir, f"database_2024010{index}_000000.db")
+            _create_sample_db(db_path, packet_total=packets)
+            os.utime(db_path, (time.time() + index, time.time() + index))
+
+        summary = reconcile_catalog(db_dir, catalog_path)
+        assert len(summary["added"]) == 3
+        assert reconcile_catalog(db_dir, catalog_path)["added"] == []
+
+        databases, total = list_databases(limit=2, sort='packets', order='desc', catalog_path=catalog_path)
+        assert total == 3
+        assert [db["packet_count"] for db in databases] == [250, 120]
+
+        databases, total = list_databases(offset=2, limit=2, sort='packets', order='desc', catalog_path=catalog_path)
+        assert [db["packet_count"] for db in databases] == [80]
+
+        _, total = list_databases(min_packets=100, catalog_path=catalog_path)
+        assert total == 2
+
+        entry = get_database_entry("database_20240101_000000.db", catalog_path)
+        assert entry["sessions"][0]["packet_count"] == 250
+        assert entry["sessions"][0]["anomaly_count"] == 5
+        assert entry["content_hash"] == file_hash(os.path.join(db_dir, "database_20240101_000000.db"))
+
+        sessions, total = list_sessions(catalog_path=catalog_path)
+        assert total == 3 and sessions[0]["db_file"]
+
+        latest = latest_database_path(db_dir=db_dir, catalog_path=catalog_path)
+        assert os.path.basename(latest) == "database_20240102_000000.db"
+
+        # Al borrar el archivo, el catálogo se reconcilia y apunta al siguiente más reciente
+        os.remove(latest)
+        latest = latest_database_path(db_dir=db_dir, catalog_path=catalog_path)
+        assert os.path.basename(latest) == "database_20240101_000000.db"
+        _, total = list_databases(catalog_path=catalog_path)
+        assert total == 2
+
+        # Otro directorio con el mismo catálogo: no se mezclan sus bases de datos
+        other_dir = os.path.join(tmp_dir, "otras")
+        os.makedirs(other_dir)
+        assert latest_database_path(db_dir=other_dir, catalog_path=catalog_path) is None
+        _create_sample_db(os.path.join(other_dir, "database_20240105_000000.db"), packet_total=10)
+        assert latest_database_path(db_dir=db_dir, catalog_path=catalog_path) == os.path.abspath(
+            os.path.join(db_dir, "database_20240101_000000.db"))
+
+        # Reconciliado hace poco: no se vuelve a reconciliar y se recorre el directorio
+        reconciles = []
+        original = catalog.reconcile_catalog
+        catalog.reconcile_catalog = lambda *args: reconciles.append(args) or original(*args)
+        try:
+            latest = latest_database_path(db_dir=other_dir, catalog_path=catalog_path)
+            assert os.path.basename(latest) == "database_20240105_000000.db" and reconciles == []
+        finally:
+            catalog.reconcile_catalog = original
+
+        print(f"✅ Catálogo reconciliado con {total} bases de datos")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DEL CATÁLOGO ===")
+    test_catalog_reconcile_and_listing()
@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import hashlib
+import sqlite3
+import tempfile
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing import uploads
+from capture import tshark_runtime
+from capture.tshark_runtime import TsharkRuntime
+from processing.jobs import get_job
+from processing.uploads import create_upload, open_upload_writer, follow_upload, UploadError
+
+CHUNK = 64 * 1024
+
+def _client():
+    from api import processing_api
+    app = FastAPI()
+    app.include_router(processing_api.router)
+    return TestClient(app), processing_api
+
+def _patch(client, upload_id, offset, data):
+    return client.patch(f"/api/processing/uploads/{upload_id}", content=data,
+                        headers={"Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"})
+
+def test_chunked_upload():
+    """Prueba la subida por bloques: offsets, reanudación, hash incremental y seguimiento del archivo"""
+    print("\n--- Test: Subida por bloques reanudable ---")
+
+    payload = os.urandom(5 * CHUNK + 1234)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ['JOBS_PATH'] = os.path.join(tmp_dir, "jobs.sqlite")
+        client, processing_api = _client()
+        pcap_directory, processing_api.PCAP_DIRECTORY = processing_api.PCAP_DIRECTORY, tmp_dir
+        try:
+            response = client.post("/api/processing/uploads", json={
+                "file_name": "bloques.pcap", "size": len(payload), "process_immediately": False
+            })
+            assert response.status_code == 201 and response.headers["upload-offset"] == "0"
+            upload = response.json()
+            url = response.headers["location"]
+
+            # Primer bloque y un bloque con el offset equivocado
+            assert _patch(client, upload["id"], 0, payload[:CHUNK]).headers["upload-offset"] == str(CHUNK)
+            assert _patch(client, upload["id"], 0, payload[:CHUNK]).status_code == 409
+
+            # Conexión cortada a mitad de bloque: se conserva lo escrito y se reanuda desde HEAD
+            writer = open_upload_writer(upload["id"], CHUNK)
+            writer.write(payload[CHUNK:CHUNK + 1000])
+            writer.close()
+            offset = int(client.head(url).headers["upload-offset"])
+            assert offset == CHUNK + 1000
+
+            # Tras un reinicio el hash incremental se reconstruye a partir de lo recibido
+            uploads._hashers.clear()
+            while offset < len(payload):
+                response = _patch(client, upload["id"], offset, payload[offset:offset + 2 * CHUNK])
+                assert response.status_code == 200
+                offset = int(response.headers["upload-offset"])
+
+            done = client.get(url).json()
+            assert done["status"] == 'completed' and done["progress"] == 100.0
+            assert done["sha256"] == hashlib.sha256(payload).hexdigest()
+            with open(os.path.join(tmp_dir, "bloques.pcap"), 'rb') as f:
+                assert f.read() == payload
+            assert not os.path.exists(os.path.join(tmp_dir, "bloques.pcap.part"))
+            assert _patch(client, upload["id"], offset, b"x").status_code == 409
+            assert _patch(client, "no-existe", 0, b"x").status_code == 404
+
+            # Bloque que supera el tamaño declarado
+            small = client.post("/api/processing/uploads", json={
+                "file_name": "pequeno.pcap", "size": 10, "process_immediately": False
+            }).json()
+            assert _patch(client, small["id"], 0, b"x" * 11).status_code == 400
+            assert client.post("/api/processing/uploads", json={"file_name": "bloques.pcap", "size": 1}).status_code == 409
+            assert client.post("/api/processing/uploads", json={"file_name": "otro.txt", "size": 1}).status_code == 400
+
+            # Con procesamiento: el trabajo se encola al crear la subida; cancelar la subida lo cancela.
+            # La interfaz se busca por su id (en Windows, el número de `tshark -D`)
+            runtime = tshark_runtime._runtime = TsharkRuntime(interfaces_ttl=3600)
+            runtime._interfaces, runtime._interfaces_at = [
+                {"id": "1", "name": "Ethernet (LAN)"}, {"id": "2", "name": "Wi-Fi (WLAN)"}
+            ], time.monotonic()
+            streamed = client.post("/api/processing/uploads", json={
+                "file_name": "ingesta.pcap", "size": 100, "interface_id": "2"
+            }).json()
+            job = get_job(streamed["job_id"])
+            assert job["kind"] == 'process_pcap_upload' and job["payload"]["upload_id"] == streamed["id"]
+            assert job["payload"]["interface"] == "Wi-Fi (WLAN)"
+            aborted = client.delete(f"/api/processing/uploads/{streamed['id']}").json()
+            assert aborted["status"] == 'aborted' and get_job(streamed["job_id"])["status"] == 'cancelled'
+
+            # Ingesta abandonada por falta de datos: al completarse, se procesa el archivo entero
+            stalled = client.post("/api/processing/uploads", json={"file_name": "pausada.pcap", "size": 10}).json()
+            conn = sqlite3.connect(os.environ['JOBS_PATH'])
+            conn.execute("UPDATE jobs SET status = 'failed' WHERE id = ?", (stalled["job_id"],))
+            conn.commit()
+            conn.close()
+            done = _patch(client, stalled["id"], 0, b"x" * 10).json()
+            retry = get_job(done["job_id"])
+            assert done["job_id"] != stalled["job_id"] and retry["kind"] == 'process_pcap'
+            assert retry["payload"]["pcap_file"] == done["path"] and retry["payload"]["delete_source"]
+        finally:
+            processing_api.PCAP_DIRECTORY = pcap_directory
+            tshark_runtime._runtime = None
+
+        # La ingesta lee los bloques recibidos mientras llegan los siguientes
+        follow_interval, uploads.UPLOAD_FOLLOW_INTERVAL = uploads.UPLOAD_FOLLOW_INTERVAL, 0.01
+        try:
+            upload = create_upload("seguida.pcap", len(payload), tmp_dir, process=False)
+            received, first_seen = [], {}
+
+            def consume():
+                for chunk in follow_upload(upload["id"], chunk_size=CHUNK):
+                    first_seen.setdefault("at", time.monotonic())
+                    received.append(chunk)
+
+            reader = threading.Thread(target=consume)
+            reader.start()
+            for offset in range(0, len(payload), CHUNK):
+                writer = open_upload_writer(upload["id"], offset)
+                writer.write(payload[offset:offset + CHUNK])
+                writer.close()
+                time.sleep(0.05)
+            completed_at = time.monotonic()
+            reader.join(timeout=10)
+            assert b"".join(received) == payload
+            assert first_seen["at"] < completed_at - 0.2
+
+            # Una subida cancelada interrumpe su seguimiento
+            cancelled = create_upload("cancelada.pcap", 100, tmp_dir, process=False)
+            errors = []
+
+            def follow_cancelled():
+                try:
+                    list(follow_upload(cancelled["id"]))
+                except UploadError as e:
+                    errors.append(str(e))
+
+            reader = threading.Thread(target=follow_cancelled)
+            reader.start()
+            uploads.abort_upload(cancelled["id"])
+            reader.join(timeout=10)
+            assert errors == ["La subida se canceló"]
+        finally:
+            uploads.UPLOAD_FOLLOW_INTERVAL = follow_interval
+            del os.environ['JOBS_PATH']
+        print(f"✅ Subida por bloques: {len(payload)} bytes, lectura en streaming desde el primer bloque")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE LA SUBIDA POR BLOQUES ===")
+    test_chunked_upload()
@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import zstandard as zstd
+
+from api.capture_api import router as capture_router
+from capture.direct_ingest import CaptureStream
+from database.frame_store import iter_capture_frames
+from processing.jobs import get_job
+
+# tshark simulado: escribe un PCAP por la salida estándar (-w -) hasta -c paquetes o SIGINT
+FAKE_TSHARK = '''#!{python}
+import sys, time, signal, struct
+args = sys.argv[1:]
+assert args[args.index("-w") + 1] == "-" and args[args.index("-F") + 1] == "pcap"
+if args[args.index("-i") + 1] == "fallo":
+    sys.stderr.write("tshark: interfaz no disponible\\n")
+    sys.exit(1)
+count = int(args[args.index("-c") + 1]) if "-c" in args else None
+stop = []
+signal.signal(signal.SIGINT, lambda *a: stop.append(True))
+out = sys.stdout.buffer
+out.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+n = 0
+while not stop and (count is None or n < count):
+    n += 1
+    frame = bytes([n % 256]) * 60
+    out.write(struct.pack("<IIII", 1700000000 + n, 0, len(frame), len(frame)) + frame)
+    out.flush()
+    time.sleep(0.001)
+'''
+
+def _read_all(fd, received):
+    with os.fdopen(fd, 'rb') as pipe:
+        while True:
+            data = pipe.read(4096)
+            if not data:
+                return
+            received.append((time.monotonic(), data))
+
+def _fake_tshark(tmp_dir):
+    tshark_path = os.path.join(tmp_dir, "tshark")
+    with open(tshark_path, "w") as f:
+        f.write(FAKE_TSHARK.format(python=sys.executable))
+    os.chmod(tshark_path, 0o755)
+    return tshark_path
+
+def test_capture_stream():
+    """La salida de tshark llega al decodificador por la tubería y se archiva comprimida"""
+    print("\n--- Test: Captura directa ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tshark_path = _fake_tshark(tmp_dir)
+
+        # Captura con límite de paquetes y archivo .pcap.zst
+        archive_path = os.path.join(tmp_dir, "captura.pcap.zst")
+        stream = CaptureStream("eth0", packet_count=500, archive_path=archive_path, tshark_path=tshark_path).start()
+        received = []
+        _read_all(stream.read_fd, received)
+        stream.wait(timeout=10)
+        data = b"".join(chunk for _, chunk in received)
+        assert stream.error is None and not stream.stopped
+        assert len(data) == 24 + 500 * 76 == stream.bytes_captured
+        with open(archive_path, 'rb') as f:
+            assert zstd.ZstdDecompressor().stream_reader(f).read() == data
+        assert stream.archive_bytes < len(data) // 5
+
+        # El almacén de frames lee el archivo comprimido directamente
+        frames = iter_capture_frames(archive_path)
+        assert next(frames) == (1, 65535)
+        frames = list(frames)
+        assert len(frames) == 500 and frames[0][2] == bytes([1]) * 60
+
+        # Sin límite: los datos llegan mientras dura la captura y stop() la cierra limpiamente
+        stream = CaptureStream("eth0", tshark_path=tshark_path).start()
+        received = []
+        reader = threading.Thread(target=_read_all, args=(stream.read_fd, received))
+        reader.start()
+        time.sleep(0.5)
+        stopped_at = time.monotonic()
+        assert received and received[0][0] < stopped_at - 0.2
+        stream.stop()
+        reader.join(timeout=10)
+        stream.wait(timeout=10)
+        assert stream.stopped and stream.error is None and stream.stats()["bytes_captured"] > 24
+
+        # Un fallo de tshark queda registrado antes de que el decodificador vea el final
+        stream = CaptureStream("fallo", tshark_path=tshark_path).start()
+        _read_all(stream.read_fd, [])
+        assert "interfaz no disponible" in stream.error
+        print(f"✅ Captura directa: {len(data)} bytes en streaming, archivo de {stream.archive_bytes} bytes")
+
+def test_direct_capture_endpoint():
+    """La captura directa se encola como trabajo"""
+    print("\n--- Test: Endpoint de captura directa ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ['JOBS_PATH'] = os.path.join(tmp_dir, "jobs.sqlite")
+        app = FastAPI()
+        app.include_router(capture_router)
+        client = TestClient(app)
+        try:
+            response = client.post("/api/capture/ingest", params={"interface_id": "eth0", "duration": 3600,
+                                                                  "capture_filter": "tcp port 443"})
+            assert response.status_code == 202
+            job = get_job(response.json()["id"])
+            assert job["kind"] == 'capture_to_db' and job["status"] == 'queued'
+            assert job["payload"] == {"interface": "eth0", "duration": 3600, "packet_count": None,
+                                      "capture_filter": "tcp port 443", "snaplen": None, "archive": True}
+            print(f"✅ Captura directa encolada como trabajo {job['id']}")
+        finally:
+            del os.environ['JOBS_PATH']
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE LA CAPTURA DIRECTA ===")
+    test_capture_stream()
+    test_direct_capture_endpoint()
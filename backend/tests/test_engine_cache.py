@@ -0,0 +1,74 @@
+import os
+import sys
+import shutil
+import tempfile
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database.engine_cache as engine_cache
+from database.engine_cache import get_engine, get_session, invalidate_engine, clear_engine_cache, engine_cache_stats
+from database.models import CaptureSession
+from test_parquet_export import _create_sample_db
+
+def test_engine_cache_reuse_and_invalidation():
+    """Prueba la reutilización, la expulsión LRU y la invalidación de engines"""
+    print("\n--- Test: Caché de engines ---")
+
+    capacity = engine_cache.ENGINE_CACHE_SIZE
+    engine_cache.ENGINE_CACHE_SIZE = 2
+    clear_engine_cache()
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, f"database_{i}.db") for i in range(3)]
+            for path in paths:
+                _create_sample_db(path, packet_total=5 + len(path) % 3)
+
+            engine = get_engine(paths[0])
+            assert get_engine(paths[0]) is engine
+            db = get_session(paths[0])
+            assert db.query(CaptureSession).count() == 1
+            db.close()
+            assert engine.pool.checkedin() == 1
+            assert engine_cache_stats()["hits"] >= 2
+
+            # Un archivo reemplazado obtiene un engine nuevo con los datos nuevos
+            replacement = os.path.join(tmp_dir, "replacement.db")
+            shutil.copy(paths[0], replacement)
+            db = get_session(replacement)
+            db.add(CaptureSession(file_name="otra.pcap"))
+            db.commit()
+            db.close()
+            invalidate_engine(replacement)
+            os.replace(replacement, paths[0])
+            assert get_engine(paths[0]) is not engine
+            db = get_session(paths[0])
+            assert db.query(CaptureSession).count() == 2
+            db.close()
+
+            # Expulsión LRU: el engine menos usado libera su pool
+            first = get_engine(paths[0])
+            get_engine(paths[1])
+            get_engine(paths[2])
+            stats = engine_cache_stats()
+            assert stats["size"] == 2 and stats["evictions"] >= 1
+            assert first.pool.checkedin() == 0
+            assert get_engine(paths[0]) is not first
+
+            # Un archivo borrado invalida su entrada
+            os.remove(paths[1])
+            try:
+                get_engine(paths[1])
+                assert False, "Se esperaba FileNotFoundError"
+            except FileNotFoundError:
+                pass
+            assert not os.path.exists(paths[1])
+
+            print(f"✅ Caché de engines: {engine_cache_stats()}")
+    finally:
+        clear_engine_cache()
+        engine_cache.ENGINE_CACHE_SIZE = capacity
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE LA CACHÉ DE ENGINES ===")
+    test_engine_cache_reuse_and_invalidation()
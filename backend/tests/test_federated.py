@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.catalog import reconcile_catalog
+from database.federated import search_packets, count_matches, FederatedQueryError
+from test_parquet_export import _create_sample_db
+
+def test_federated_search_across_batches():
+    """Prueba la búsqueda federada con más bases de datos que el límite de ATTACH por lote"""
+    print("\n--- Test: Consultas federadas ---")
+
+    os.environ['FEDERATED_ATTACH_BATCH'] = '3'
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_dir = os.path.join(tmp_dir, "db_files")
+            os.makedirs(db_dir)
+            catalog_path = os.path.join(tmp_dir, "catalog.sqlite")
+            for index in range(7):
+                _create_sample_db(os.path.join(db_dir, f"capture_{index}.db"), packet_total=50)
+            reconcile_catalog(db_dir, catalog_path)
+
+            # 10.0.0.3 envía 10 paquetes por captura
+            matches = count_matches(ip="10.0.0.3", catalog_path=catalog_path)
+            assert len(matches) == 7
+            assert all(match["packets"] == 10 for match in matches)
+
+            packets = list(search_packets(ip="10.0.0.3", limit=25, catalog_path=catalog_path))
+            assert len(packets) == 25
+            keys = [(p["timestamp"], p["db_file"], p["session_id"], p["packet_number"]) for p in packets]
+            assert keys == sorted(keys)
+            assert {p["src_ip"] for p in packets} == {"10.0.0.3"}
+
+            # El rango temporal del catálogo descarta todas las capturas
+            assert count_matches(ip="10.0.0.3", start_time=1800000000.0, catalog_path=catalog_path) == []
+
+            unordered = list(search_packets(port=40001, protocol="tcp", ordered=False, limit=1000,
+                                            catalog_path=catalog_path))
+            assert len(unordered) == 7 * 5
+
+            try:
+                list(search_packets(catalog_path=catalog_path))
+                assert False, "Se esperaba FederatedQueryError"
+            except FederatedQueryError:
+                pass
+
+            print(f"✅ {len(matches)} capturas con coincidencias en lotes de 3")
+    finally:
+        del os.environ['FEDERATED_ATTACH_BATCH']
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE CONSULTAS FEDERADAS ===")
+    test_federated_search_across_batches()
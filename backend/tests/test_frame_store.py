@@ -0,0 +1,139 @@
+import os
+import sys
+import struct
+import random
+import sqlite3
+import tempfile
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.frame_store import (
+    build_frame_store, get_frame_reader, invalidate_frame_reader, iter_capture_frames, frame_store_stats
+)
+from api.database_api import router as database_router
+from test_parquet_export import _create_sample_db
+
+def _sample_frames(total=250):
+    """Frames Ethernet/IPv4/TCP sintéticos con cabeceras parecidas y carga variable"""
+    rng = random.Random(7)
+    frames = []
+    for i in range(total):
+        header = bytes.fromhex("001122334455665544332211080045000028") + struct.pack(">H", i) + \
+            bytes.fromhex("40004006") + bytes([10, 0, 0, i % 5, 10, 0, 0, 100]) + struct.pack(">HH", 40000 + i % 5, 80)
+        payload = bytes(rng.randrange(0, 4) for _ in range(i % 120))
+        frames.append((1700000000.0 + i * 0.01, header + payload))
+    return frames
+
+def _write_pcap(path, frames):
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for timestamp, data in frames:
+            ts_sec = int(timestamp)
+            f.write(struct.pack("<IIII", ts_sec, int(round((timestamp - ts_sec) * 1e6)), len(data), len(data)) + data)
+
+def _write_pcapng(path, frames):
+    def block(block_type, body):
+        body += b"\0" * (-len(body) % 4)
+        length = len(body) + 12
+        return struct.pack("<II", block_type, length) + body + struct.pack("<I", length)
+    with open(path, "wb") as f:
+        f.write(block(0x0A0D0D0A, struct.pack("<IHHq", 0x1A2B3C4D, 1, 0, -1)))
+        f.write(block(1, struct.pack("<HHI", 1, 0, 65535)))
+        for timestamp, data in frames:
+            ticks = int(round(timestamp * 1e6))
+            f.write(block(6, struct.pack("<IIIII", 0, ticks >> 32, ticks & 0xffffffff, len(data), len(data)) + data))
+
+def _check_corrupt_chunks(tmp_dir, db_path, session_id, frames):
+    """Un bloque dañado da un error JSON, o corta la descarga en el último paquete completo"""
+    app = FastAPI()
+    app.include_router(database_router)
+    conn = sqlite3.connect(db_path)
+    chunks = conn.execute(
+        "SELECT id, first_packet FROM frame_chunks WHERE session_id = ? ORDER BY first_packet", (session_id,)
+    ).fetchall()
+    conn.execute("UPDATE frame_chunks SET data = randomblob(64) WHERE id = ?", (chunks[1][0],))
+    conn.commit()
+    conn.close()
+    invalidate_frame_reader(db_path)
+
+    os.environ['DATABASE_DIRECTORY'] = tmp_dir
+    try:
+        with TestClient(app) as client:
+            base = f"/api/database/sessions/{session_id}"
+            params = {"db_file": os.path.basename(db_path)}
+            error = client.get(f"{base}/frames/{chunks[1][1]}", params=params)
+            assert error.status_code == 500 and "dañado" in error.json()["detail"]
+            error = client.get(f"{base}/pcap", params={**params, "start_packet": chunks[1][1]})
+            assert error.status_code == 500 and "dañado" in error.json()["detail"]
+
+            # Iniciada la descarga, el PCAP termina antes del bloque dañado
+            response = client.get(f"{base}/pcap", params=params)
+            assert response.status_code == 200
+            exported = os.path.join(tmp_dir, "truncated.pcap")
+            with open(exported, "wb") as f:
+                f.write(response.content)
+            received = [data for _, _, data in list(iter_capture_frames(exported))[1:]]
+            assert received == [data for _, data in frames[:chunks[1][1] - 1]]
+    finally:
+        del os.environ['DATABASE_DIRECTORY']
+        invalidate_frame_reader(db_path)
+
+def test_frame_store_roundtrip():
+    """Prueba que los frames guardados se recuperan idénticos, por paquete y por rango"""
+    print("\n--- Test: Almacén de frames ---")
+
+    frames = _sample_frames()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pcap_path = os.path.join(tmp_dir, "sample.pcap")
+        pcapng_path = os.path.join(tmp_dir, "sample.pcapng")
+        _write_pcap(pcap_path, frames)
+        _write_pcapng(pcapng_path, frames)
+
+        # Ambos formatos se leen igual
+        classic = list(iter_capture_frames(pcap_path))
+        assert classic[0] == (1, 65535)
+        assert [(round(ts, 6), data) for ts, _, data in classic[1:]] == [(round(ts, 6), data) for ts, data in frames]
+        assert [data for _, _, data in list(iter_capture_frames(pcapng_path))[1:]] == [data for _, data in frames]
+
+        db_path = os.path.join(tmp_dir, "database_test.db")
+        session_id = _create_sample_db(db_path)
+        stats = build_frame_store(db_path, session_id, pcap_path)
+        assert stats["frame_count"] == 250
+        assert stats["chunk_count"] > 1
+        assert stats["pcap_bytes"] == os.path.getsize(pcap_path)
+        assert stats["stored_bytes"] < stats["pcap_bytes"]
+
+        reader = get_frame_reader(db_path)
+        assert reader.get_frame(session_id, 1).data == frames[0][1]
+        assert reader.get_frame(session_id, 137).data == frames[136][1]
+        assert reader.get_frame(session_id, 251) is None
+        assert reader.get_frame(session_id + 1, 1) is None
+
+        ranged = list(reader.iter_frames(session_id, 60, 140))
+        assert [frame.packet_number for frame in ranged] == list(range(60, 141))
+        assert [frame.data for frame in ranged] == [data for _, data in frames[59:140]]
+
+        # El rango exportado es un PCAP válido
+        exported = os.path.join(tmp_dir, "range.pcap")
+        with open(exported, "wb") as f:
+            for part in reader.iter_pcap(session_id, 200):
+                f.write(part)
+        assert [data for _, _, data in list(iter_capture_frames(exported))[1:]] == [data for _, data in frames[199:]]
+
+        # Reconstruir el almacén invalida el lector compartido
+        build_frame_store(db_path, session_id, pcapng_path)
+        assert get_frame_reader(db_path) is not reader
+        assert frame_store_stats(db_path, session_id)["pcap_bytes"] == os.path.getsize(pcapng_path)
+        invalidate_frame_reader(db_path)
+        _check_corrupt_chunks(tmp_dir, db_path, session_id, frames)
+
+        print(f"✅ {stats['frame_count']} frames en {stats['chunk_count']} bloques: "
+              f"{stats['stored_bytes']} bytes ({stats['pcap_percent']}% del PCAP)")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DEL ALMACÉN DE FRAMES ===")
+    test_frame_store_roundtrip()
@@ -0,0 +1,98 @@
+import os
+import sys
+import sqlite3
+import tempfile
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from database.fulltext import (
+    index_session_text, unindex_session_text, search_packets, parse_search_query, FullTextSearchError
+)
+from test_parquet_export import _create_sample_db
+
+def _add_packet_text(db_path):
+    """Textos de resumen al estilo de Wireshark en los paquetes de ejemplo"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        UPDATE packets SET
+            info_text = CASE
+                WHEN packet_number % 10 = 0 THEN 'Destination unreachable (Port unreachable)'
+                WHEN packet_number % 7 = 0 THEN 'Standard query 0x1a2b A www.example.com'
+                WHEN packet_number % 5 = 0 THEN '[TCP Retransmission] 40000 → 80 [ACK] Seq=1'
+                ELSE 'Unreachable host ' || packet_number
+            END,
+            protocol_stack = CASE WHEN packet_number % 7 = 0 THEN 'eth,ip,udp,dns' ELSE 'eth,ip,tcp' END
+    """)
+    conn.execute("""UPDATE packets SET info_text = '<img src=x onerror=alert(1)> Unreachable host "a&b"' WHERE packet_number = 1""")
+    conn.commit()
+    conn.close()
+
+def test_fulltext_search():
+    """Prueba las búsquedas por frase, prefijo y columna con paginación"""
+    print("\n--- Test: Búsqueda de texto completo ---")
+
+    assert parse_search_query('"destination unreachable" exam*') == '"destination unreachable" "exam"*'
+    assert parse_search_query('stack:dns OR www.example.com') == 'protocol_stack : "dns" OR "www.example.com"'
+    for invalid in ('', '  --  ', 'port:80'):
+        try:
+            parse_search_query(invalid)
+            assert False, f"Búsqueda aceptada: {invalid!r}"
+        except FullTextSearchError:
+            pass
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "database_test.db")
+        session_id = _create_sample_db(db_path)
+        _add_packet_text(db_path)
+        engine = create_engine(f'sqlite:///{db_path}')
+        try:
+            with engine.begin() as conn:
+                assert index_session_text(conn, session_id) == 250
+                # Reindexar no duplica entradas
+                assert index_session_text(conn, session_id) == 250
+
+            with engine.connect() as conn:
+                packets, total = search_packets(conn, '"destination unreachable"', session_id)
+                assert total == 25
+                assert all(packet["packet_number"] % 10 == 0 for packet in packets)
+                assert packets[0]["info_highlight"].startswith("<mark>Destination unreachable</mark>")
+
+                # El texto viene de la red: se escapa y solo las coincidencias llevan marcas
+                packets, _ = search_packets(conn, 'onerror', session_id)
+                assert packets[0]["info_highlight"] == (
+                    '&lt;img src=x <mark>onerror</mark>=alert(1)&gt; Unreachable host &quot;a&amp;b&quot;'
+                )
+
+                # "unreachable" aparece en más paquetes que la frase
+                unreachable = [n for n in range(1, 251) if n % 10 == 0 or (n % 7 and n % 5)]
+                assert search_packets(conn, 'unreachable', session_id)[1] == len(unreachable)
+                _, total = search_packets(conn, 'unreach*')
+                assert total == search_packets(conn, 'unreachable')[1]
+
+                _, total = search_packets(conn, 'www.example.com stack:dns')
+                dns_total = len([n for n in range(1, 251) if n % 7 == 0 and n % 10 != 0])
+                assert total == dns_total
+                assert search_packets(conn, 'info:dns')[1] == 0
+
+                # Paginación ordenada por tiempo
+                first, total = search_packets(conn, 'retransmission', limit=5, order='time')
+                second, _ = search_packets(conn, 'retransmission', limit=5, offset=5, order='time')
+                assert len(first) == 5 and len(second) == 5
+                timestamps = [packet["timestamp"] for packet in first + second]
+                assert timestamps == sorted(timestamps)
+                assert not {p["id"] for p in first} & {p["id"] for p in second}
+
+            with engine.begin() as conn:
+                unindex_session_text(conn, session_id)
+            with engine.connect() as conn:
+                assert search_packets(conn, 'retransmission')[1] == 0
+        finally:
+            engine.dispose()
+
+        print(f"✅ Búsquedas de texto completo: {total} retransmisiones")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE BÚSQUEDA DE TEXTO COMPLETO ===")
+    test_fulltext_search()
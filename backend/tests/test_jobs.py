@@ -0,0 +1,306 @@
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing import jobs
+from processing.jobs import (
+    JobManager, JobCancelled, enqueue_job, get_job, list_jobs, cancel_job, JobError, JOB_HANDLERS
+)
+
+def _sleep_job(payload, should_stop):
+    """Trabajo de prueba: espera en pasos cortos y atiende la cancelación"""
+    deadline = time.monotonic() + payload.get("seconds", 0)
+    while time.monotonic() < deadline:
+        if should_stop():
+            raise JobCancelled()
+        time.sleep(0.02)
+    return {"pid": os.getpid(), "name": payload.get("name")}
+
+def _failing_job(payload, should_stop):
+    raise ValueError("fallo de prueba")
+
+def _sessions_job(payload, should_stop):
+    """Trabajo de prueba: sesiones que encuentra en la base de datos al empezar"""
+    if not os.path.exists(payload["db_path"]):
+        return {"sessions": None}
+    conn = sqlite3.connect(payload["db_path"])
+    try:
+        return {"sessions": [row[0] for row in conn.execute("SELECT id FROM capture_sessions ORDER BY id")]}
+    finally:
+        conn.close()
+
+class _CrashedIngest(BaseException):
+    """Simula que el proceso del trabajo muere a mitad de la ingesta"""
+
+class _CrashingCapture:
+    def __iter__(self):
+        raise _CrashedIngest()
+
+    def close(self):
+        pass
+
+def _wait_for(jobs_path, job_id, statuses=('completed', 'failed', 'cancelled'), timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = get_job(job_id, jobs_path)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"El trabajo {job_id} no llegó a {statuses}: {job}")
+
+def test_job_queue():
+    """Prueba la cola duradera, la prioridad, la cancelación y el pool precalentado"""
+    print("\n--- Test: Cola de trabajos ---")
+
+    # Los procesos del pool heredan los tipos de trabajo de prueba
+    os.environ['JOB_START_METHOD'] = 'fork'
+    JOB_HANDLERS['test_sleep'] = _sleep_job
+    JOB_HANDLERS['test_fail'] = _failing_job
+    cancel_interval, jobs.JOB_CANCEL_CHECK_INTERVAL = jobs.JOB_CANCEL_CHECK_INTERVAL, 0.05
+    poll_interval, jobs.JOB_POLL_INTERVAL = jobs.JOB_POLL_INTERVAL, 0.1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jobs_path = os.path.join(tmp_dir, "jobs.sqlite")
+        manager = JobManager(jobs_path, workers=1, concurrency=1).start()
+        jobs._manager = manager
+        try:
+            # Pool precalentado: el primer trabajo empieza sin esperar a crear el proceso
+            first = enqueue_job('test_sleep', {"name": "primero"}, jobs_path=jobs_path)
+            first = _wait_for(jobs_path, first["id"])
+            started = datetime.fromisoformat(first["started_at"]) - datetime.fromisoformat(first["created_at"])
+            assert first["status"] == 'completed' and started.total_seconds() < 0.5
+
+            # Prioridad: con el único proceso ocupado, el trabajo prioritario pasa delante
+            blocker = enqueue_job('test_sleep', {"seconds": 10, "name": "bloqueo"}, jobs_path=jobs_path)
+            _wait_for(jobs_path, blocker["id"], statuses=('running',))
+            low = enqueue_job('test_sleep', {"name": "baja"}, priority=0, jobs_path=jobs_path)
+            high = enqueue_job('test_sleep', {"name": "alta"}, priority=10, jobs_path=jobs_path)
+            dropped = enqueue_job('test_sleep', {"name": "descartada"}, jobs_path=jobs_path)
+
+            # Cancelación de un trabajo encolado (inmediata) y de uno en curso (cooperativa)
+            assert cancel_job(dropped["id"], jobs_path)["status"] == 'cancelled'
+            running = cancel_job(blocker["id"], jobs_path)
+            assert running["status"] == 'running' and running["cancel_requested"]
+            assert _wait_for(jobs_path, blocker["id"])["status"] == 'cancelled'
+
+            high, low = _wait_for(jobs_path, high["id"]), _wait_for(jobs_path, low["id"])
+            assert high["started_at"] < low["started_at"]
+            # El mismo proceso de larga duración atiende todos los trabajos
+            assert high["result"]["pid"] == low["result"]["pid"] == first["result"]["pid"]
+            assert get_job(dropped["id"], jobs_path)["started_at"] is None
+            try:
+                cancel_job(high["id"], jobs_path)
+                assert False, "no se puede cancelar un trabajo terminado"
+            except JobError:
+                pass
+
+            failed = _wait_for(jobs_path, enqueue_job('test_fail', jobs_path=jobs_path)["id"])
+            assert failed["status"] == 'failed' and "fallo de prueba" in failed["error"]
+        finally:
+            jobs._manager = None
+            manager.stop()
+
+        # Durabilidad: lo encolado y lo interrumpido se ejecuta al arrancar de nuevo
+        pending = enqueue_job('test_sleep', {"name": "pendiente"}, jobs_path=jobs_path)
+        interrupted = enqueue_job('test_sleep', {"name": "interrumpida"}, jobs_path=jobs_path)
+        conn = sqlite3.connect(jobs_path)
+        conn.execute("UPDATE jobs SET status = 'running', attempts = 1 WHERE id = ?", (interrupted["id"],))
+        conn.commit()
+        conn.close()
+        manager = JobManager(jobs_path, workers=1).start()
+        try:
+            assert _wait_for(jobs_path, pending["id"])["status"] == 'completed'
+            resumed = _wait_for(jobs_path, interrupted["id"])
+            assert resumed["status"] == 'completed' and resumed["attempts"] == 2
+        finally:
+            manager.stop()
+
+        statuses = [job["status"] for job in list_jobs(jobs_path=jobs_path)]
+        assert statuses.count('completed') == 5 and statuses.count('cancelled') == 2
+
+        # Con más concurrencia que procesos, lo enviado sin empezar vuelve a la cola al apagar
+        # (los que el pool ya pasó a su cola interna aún se ejecutan)
+        manager = JobManager(jobs_path, workers=1, concurrency=5).start()
+        try:
+            sent = [enqueue_job('test_sleep', {"seconds": 0.2}, jobs_path=jobs_path) for _ in range(5)]
+            for job in sent:
+                _wait_for(jobs_path, job["id"], statuses=('running',))
+        finally:
+            manager.stop()
+        sent = [get_job(job["id"], jobs_path) for job in sent]
+        requeued = [job for job in sent if job["status"] == 'queued']
+        assert requeued and all(job["status"] in ('completed', 'queued') for job in sent)
+        assert all(job["attempts"] == 0 and job["started_at"] is None for job in requeued)
+        print(f"✅ Cola de trabajos: {len(statuses)} trabajos, prioridad y cancelación correctas")
+
+    jobs.JOB_CANCEL_CHECK_INTERVAL = cancel_interval
+    jobs.JOB_POLL_INTERVAL = poll_interval
+    del JOB_HANDLERS['test_sleep'], JOB_HANDLERS['test_fail']
+    del os.environ['JOB_START_METHOD']
+
+def test_streaming_jobs_own_pool():
+    """Los trabajos en streaming no ocupan los procesos del resto de trabajos"""
+    print("\n--- Test: Pool de trabajos en streaming ---")
+
+    os.environ['JOB_START_METHOD'] = 'fork'
+    JOB_HANDLERS['test_sleep'] = _sleep_job
+    JOB_HANDLERS['test_stream'] = _sleep_job
+    jobs.STREAMING_KINDS.add('test_stream')
+    cancel_interval, jobs.JOB_CANCEL_CHECK_INTERVAL = jobs.JOB_CANCEL_CHECK_INTERVAL, 0.05
+    poll_interval, jobs.JOB_POLL_INTERVAL = jobs.JOB_POLL_INTERVAL, 0.1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jobs_path = os.path.join(tmp_dir, "jobs.sqlite")
+        manager = JobManager(jobs_path, workers=1, concurrency=1, stream_workers=1).start()
+        jobs._manager = manager
+        try:
+            # Una subida lenta y una captura sin duración ocupan solo el pool en streaming
+            stream = enqueue_job('test_stream', {"seconds": 30}, jobs_path=jobs_path)
+            waiting = enqueue_job('test_stream', {"seconds": 30}, jobs_path=jobs_path)
+            _wait_for(jobs_path, stream["id"], statuses=('running',))
+            batch = _wait_for(jobs_path, enqueue_job('test_sleep', {"name": "normal"}, jobs_path=jobs_path)["id"])
+            assert batch["status"] == 'completed'
+            assert get_job(waiting["id"], jobs_path)["status"] == 'queued'
+            assert manager.stats()["streaming"] == [stream["id"]]
+            cancel_job(stream["id"], jobs_path)
+            cancel_job(waiting["id"], jobs_path)
+            assert _wait_for(jobs_path, stream["id"])["status"] == 'cancelled'
+            print("✅ Pool en streaming: los trabajos largos no bloquean el procesamiento normal")
+        finally:
+            jobs._manager = None
+            manager.stop()
+            jobs.JOB_CANCEL_CHECK_INTERVAL = cancel_interval
+            jobs.JOB_POLL_INTERVAL = poll_interval
+            jobs.STREAMING_KINDS.discard('test_stream')
+            del JOB_HANDLERS['test_sleep'], JOB_HANDLERS['test_stream']
+            del os.environ['JOB_START_METHOD']
+
+def test_upload_returns_job_id():
+    """La subida encola el procesamiento y responde sin esperar a la ingesta"""
+    print("\n--- Test: Subida con trabajo en cola ---")
+    from api import processing_api
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ['JOBS_PATH'] = os.path.join(tmp_dir, "jobs.sqlite")
+        pcap_directory, processing_api.PCAP_DIRECTORY = processing_api.PCAP_DIRECTORY, tmp_dir
+        app = FastAPI()
+        app.include_router(processing_api.router)
+        client = TestClient(app)
+        try:
+            response = client.post(
+                "/api/processing/upload-pcap/",
+                files={"file": ("subida.pcap", b"\xd4\xc3\xb2\xa1" + b"\0" * 20, "application/octet-stream")},
+                data={"process_immediately": "true", "priority": "5"}
+            )
+            assert response.status_code == 200
+            body = response.json()
+            assert body["job_status"] == 'queued' and os.path.exists(body["file_path"])
+
+            job = client.get(f"/api/processing/jobs/{body['job_id']}").json()
+            assert job["priority"] == 5 and job["payload"]["pcap_file"] == body["file_path"]
+            assert client.get("/api/processing/jobs", params={"status": "queued"}).json()["total"] == 1
+            assert client.get("/api/processing/jobs", params={"status": "nope"}).status_code == 400
+
+            assert client.post(f"/api/processing/jobs/{body['job_id']}/cancel").json()["status"] == 'cancelled'
+            assert client.post(f"/api/processing/jobs/{body['job_id']}/cancel").status_code == 409
+            assert client.get("/api/processing/jobs/no-existe").status_code == 404
+            print(f"✅ Subida encolada como trabajo {body['job_id']}")
+        finally:
+            processing_api.PCAP_DIRECTORY = pcap_directory
+            del os.environ['JOBS_PATH']
+
+def test_rerun_discards_partial_ingest():
+    """Un trabajo interrumpido a mitad de la ingesta no duplica la sesión al repetirse"""
+    print("\n--- Test: Reintento tras una ingesta interrumpida ---")
+    from test_parquet_export import _create_sample_db
+
+    JOB_HANDLERS['test_sessions'] = _sessions_job
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jobs_path = os.path.join(tmp_dir, "jobs.sqlite")
+        os.environ['CATALOG_PATH'] = os.path.join(tmp_dir, "catalog.sqlite")
+        db_path = os.path.join(tmp_dir, "database_test.db")
+        _create_sample_db(db_path, packet_total=10)
+        pcap_file = os.path.join(tmp_dir, "captura.pcap")
+        open(pcap_file, "wb").close()
+        try:
+            job = enqueue_job('process_pcap', {"pcap_file": pcap_file, "db_path": db_path}, jobs_path=jobs_path)
+            job_id, _, payload = jobs._claim_next_job(jobs_path)
+            assert job_id == job["id"]
+
+            # El proceso muere con la sesión nueva ya creada (y algún paquete escrito)
+            jobs._current_jobs_path, jobs._current_job_id = jobs_path, job_id
+            try:
+                jobs._process_pcap_job(payload, lambda: False, capture=_CrashingCapture())
+                assert False, "La ingesta debería haberse interrumpido"
+            except _CrashedIngest:
+                pass
+            partial = get_job(job_id, jobs_path)["partial"]
+            assert partial == {"db_path": db_path, "new_database": False, "session_id": 2}
+            conn = sqlite3.connect(db_path)
+            conn.execute("INSERT INTO packets (session_id, packet_number, timestamp, packet_length) "
+                         "VALUES (2, 1, 1700000000.0, 60)")
+            conn.commit()
+            conn.close()
+
+            # Al arrancar de nuevo se reencola y, antes de repetirlo, se descarta la sesión a medias
+            assert jobs.requeue_interrupted_jobs(jobs_path) == 1
+            job_id, _, payload = jobs._claim_next_job(jobs_path)
+            status, result, error = jobs._execute_job(jobs_path, job_id, 'test_sessions', payload)
+            assert status == 'completed' and result["sessions"] == [1], (status, result, error)
+            conn = sqlite3.connect(db_path)
+            assert conn.execute("SELECT COUNT(*) FROM packets WHERE session_id = 2").fetchone()[0] == 0
+            assert conn.execute("SELECT COUNT(*) FROM packets WHERE session_id = 1").fetchone()[0] == 10
+            conn.close()
+            assert get_job(job_id, jobs_path)["partial"] is None
+
+            # Un reintento de un trabajo fallido descarta la base de datos que este creó
+            created = os.path.join(tmp_dir, "database_subida.db")
+            _create_sample_db(created, packet_total=5)
+            retry = enqueue_job('test_sessions', {"db_path": created}, jobs_path=jobs_path,
+                                partial={"db_path": created, "new_database": True, "session_id": 1})
+            job_id, _, payload = jobs._claim_next_job(jobs_path)
+            assert job_id == retry["id"]
+            status, result, _ = jobs._execute_job(jobs_path, job_id, 'test_sessions', payload)
+            assert status == 'completed' and result["sessions"] is None and not os.path.exists(created)
+            print("✅ La sesión a medias se descarta antes de repetir la ingesta")
+        finally:
+            jobs._current_jobs_path = jobs._current_job_id = None
+            del os.environ['CATALOG_PATH']
+
+def test_interrupted_capture_not_restarted():
+    """Al arrancar, una captura directa interrumpida falla en lugar de volver a capturar"""
+    print("\n--- Test: Captura directa interrumpida por un reinicio ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jobs_path = os.path.join(tmp_dir, "jobs.sqlite")
+        capture = enqueue_job('capture_to_db', {"interface": "eth0"}, priority=1, jobs_path=jobs_path)
+        ingest = enqueue_job('process_pcap', {"pcap_file": "captura.pcap"}, jobs_path=jobs_path)
+        # Ambos estaban en curso cuando se detuvo el servidor
+        assert jobs._claim_next_job(jobs_path)[0] == capture["id"]
+        assert jobs._claim_next_job(jobs_path)[0] == ingest["id"]
+
+        assert jobs.requeue_interrupted_jobs(jobs_path) == 1
+        capture = get_job(capture["id"], jobs_path)
+        assert capture["status"] == 'failed' and capture["finished_at"] is not None
+        assert "reinicio" in capture["error"]
+        assert get_job(ingest["id"], jobs_path)["status"] == 'queued'
+        assert jobs._claim_next_job(jobs_path)[0] == ingest["id"]
+        assert jobs._claim_next_job(jobs_path) is None
+        print("✅ La captura interrumpida queda como fallida y la ingesta se reencola")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE LA COLA DE TRABAJOS ===")
+    test_job_queue()
+    test_streaming_jobs_own_pool()
+    test_upload_returns_job_id()
+    test_rerun_discards_partial_ingest()
+    test_interrupted_capture_not_restarted()
@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.capture_api import router as capture_router
+from capture import live_stream
+from capture.live_stream import LiveCaptureHub, LiveSubscriber, parse_live_line
+
+# tshark simulado: 1000 paquetes por segundo en formato de campos hasta que lo terminen
+FAKE_TSHARK = '''#!{python}
+import sys, time
+args = sys.argv[1:]
+if args[args.index("-i") + 1] == "fallo":
+    sys.stderr.write("tshark: interfaz no disponible\\n")
+    sys.exit(1)
+protocols = ["TCP", "UDP", "DNS", "TLSv1.3"]
+n = 0
+while True:
+    for _ in range(100):
+        n += 1
+        src = "10.0.0.%d" % (1 + n % 3 if n % 2 else 1)
+        port = "443" if n % 2 else ""
+        sys.stdout.write("\\t".join([
+            "%.6f" % time.time(), "100", src, "10.0.0.9", "", "",
+            protocols[n % 4], port, "51000" if port else "", "" if port else "53", "" if port else "5353",
+        ]) + "\\n")
+    sys.stdout.flush()
+    time.sleep(0.1)
+'''
+
+def _receive_until(ws, predicate, limit=2000):
+    messages = []
+    for _ in range(limit):
+        message = ws.receive_json()
+        messages.append(message)
+        if predicate(message):
+            return messages
+    raise AssertionError("No llegó el mensaje esperado")
+
+def test_parse_and_backpressure():
+    """Decodificación de una línea y descarte en la cola de un cliente lento"""
+    print("\n--- Test: Decodificación y cola acotada ---")
+    line = "1700000000.5\t60\t\t\tfe80::1\tfe80::2\tUDP\t\t\t53\t5353\n"
+    packet = parse_live_line(line)
+    assert packet["src_ip"] == "fe80::1" and packet["dst_port"] == 5353 and packet["length"] == 60
+    assert parse_live_line("basura\n") is None
+
+    async def fill():
+        subscriber = LiveSubscriber(max_samples=1000)
+        assert subscriber.max_samples == live_stream.LIVE_MAX_SAMPLES_PER_SECOND
+        for i in range(live_stream.LIVE_QUEUE_SIZE + 50):
+            subscriber.offer({"type": "stats", "n": i})
+        return subscriber
+
+    subscriber = asyncio.run(fill())
+    assert subscriber.dropped == 50 and subscriber.queue.qsize() == live_stream.LIVE_QUEUE_SIZE
+    assert subscriber.queue.get_nowait()["n"] == 50
+    print("✅ Cola acotada: los mensajes más antiguos se descartan sin bloquear la captura")
+
+def test_live_capture_websocket():
+    """Captura en vivo por WebSocket: resumen por segundo, muestras limitadas y proceso compartido"""
+    print("\n--- Test: Captura en vivo por WebSocket ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tshark_path = os.path.join(tmp_dir, "tshark")
+        with open(tshark_path, "w") as f:
+            f.write(FAKE_TSHARK.format(python=sys.executable))
+        os.chmod(tshark_path, 0o755)
+        hub = live_stream._hub = LiveCaptureHub(tshark_path=tshark_path)
+
+        app = FastAPI()
+        app.include_router(capture_router)
+        try:
+            with TestClient(app) as client:
+                with client.websocket_connect("/api/capture/live/eth0?max_samples=5") as ws, \
+                        client.websocket_connect("/api/capture/live/eth0") as other:
+                    # Los dos clientes comparten el mismo tshark (se suscriben tras aceptar la conexión)
+                    deadline = time.monotonic() + 5
+                    while sum(len(s.subscribers) for s in hub.sessions.values()) < 2 and time.monotonic() < deadline:
+                        time.sleep(0.02)
+                    assert len(hub.sessions) == 1
+
+                    messages = _receive_until(ws, lambda m: m["type"] == "stats" and m["pps"] > 0)
+                    messages += _receive_until(ws, lambda m: m["type"] == "stats")
+                    stats = messages[-1]
+                    assert 300 < stats["pps"] < 1500
+                    assert abs(stats["bytes_per_second"] - stats["pps"] * 100) < 1
+                    assert set(stats["protocols"]) == {"TCP", "UDP", "DNS", "TLSv1.3"}
+                    assert stats["top_talkers"][0]["ip"] == "10.0.0.1"
+
+                    # Como mucho max_samples paquetes de muestra entre dos resúmenes
+                    window, counts = 0, []
+                    for message in messages:
+                        if message["type"] == "packet":
+                            window += 1
+                        else:
+                            counts.append(window)
+                            window = 0
+                    assert max(counts) <= 5 and sum(counts) > 0
+                    assert _receive_until(other, lambda m: m["type"] == "packet")[-1]["protocol"]
+
+                # Al irse el último cliente se detiene el proceso
+                deadline = time.monotonic() + 5
+                while hub.sessions and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                assert hub.sessions == {}
+
+                with client.websocket_connect("/api/capture/live/fallo") as ws:
+                    end = _receive_until(ws, lambda m: m["type"] == "end")[-1]
+                    assert "interfaz no disponible" in end["error"]
+                print(f"✅ Captura en vivo: {stats['pps']} paquetes/s, {len(stats['top_talkers'])} emisores")
+        finally:
+            live_stream._hub = None
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE LA CAPTURA EN VIVO ===")
+    test_parse_and_backpressure()
+    test_live_capture_websocket()
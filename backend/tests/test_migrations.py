@@ -0,0 +1,108 @@
+import os
+import sys
+import sqlite3
+import tempfile
+import threading
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database.migrations as migrations
+from database.migrations import (
+    migrate_database, migrate_directory, pending_migrations, MigrationInterrupted, SCHEMA_VERSION
+)
+from test_parquet_export import _create_sample_db
+
+def _make_legacy_db(db_path):
+    """Base de datos con el esquema anterior: sin índices nuevos, flujos ni estadísticas"""
+    _create_sample_db(db_path)
+    conn = sqlite3.connect(db_path)
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_packets_%'").fetchall():
+        conn.execute(f"DROP INDEX {name}")
+    conn.execute("DROP TABLE flows")
+    conn.execute("DROP TABLE session_stats")
+    # Paquetes TCP con los flags solo en las columnas booleanas (SYN en los impares)
+    conn.execute("UPDATE packets SET tcp_flags_raw = NULL, tcp_flag_syn = (id % 2)")
+    conn.commit()
+    conn.close()
+
+def test_migrate_legacy_database():
+    """Prueba que una base de datos antigua se migra por bloques y de forma reanudable"""
+    print("\n--- Test: Migraciones de esquema ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ['CATALOG_PATH'] = os.path.join(tmp_dir, "catalog.sqlite")
+        chunk_size = migrations.CHUNK_SIZE
+        migrations.CHUNK_SIZE = 40
+        try:
+            db_path = os.path.join(tmp_dir, "database_legacy.db")
+            _make_legacy_db(db_path)
+            assert len(pending_migrations(db_path)) == SCHEMA_VERSION
+
+            # Una migración detenida guarda la versión alcanzada
+            stop = threading.Event()
+            stop.set()
+            try:
+                migrate_database(db_path, stop_event=stop)
+                assert False, "La migración debería haberse detenido"
+            except MigrationInterrupted:
+                pass
+            conn = sqlite3.connect(db_path)
+            assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+            # Se detiene tras el primer índice
+            assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'ix_packets_%'").fetchone()[0] == 1
+            conn.close()
+
+            assert migrate_database(db_path, target=2)["to_version"] == 2
+            # La versión 2 solo crea sus índices, no los que añadieron versiones posteriores
+            conn = sqlite3.connect(db_path)
+            assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'ix_packets_%'").fetchone()[0] == 3
+            conn.close()
+
+            # El relleno de flags se reanuda desde el cursor guardado
+            conn = sqlite3.connect(db_path)
+            conn.execute("INSERT OR REPLACE INTO schema_migrations (version, name, progress) VALUES (3, 'tcp_flags_raw', '120')")
+            conn.commit()
+            conn.close()
+
+            results = migrate_directory(tmp_dir, workers=2)
+            result = results["database_legacy.db"]
+            assert result["from_version"] == 2 and result["to_version"] == SCHEMA_VERSION
+            assert [m["version"] for m in result["applied"]] == list(range(3, SCHEMA_VERSION + 1))
+
+            conn = sqlite3.connect(db_path)
+            assert conn.execute("SELECT COUNT(*) FROM packets WHERE id <= 120 AND tcp_flags_raw IS NOT NULL").fetchone()[0] == 0
+            assert conn.execute("SELECT COUNT(*) FROM packets WHERE id > 120 AND tcp_flags_raw = 2").fetchone()[0] == 65
+            assert conn.execute("SELECT COUNT(*) FROM flows").fetchone()[0] == 10
+            assert conn.execute("SELECT packet_count FROM session_stats").fetchone()[0] == 250
+            assert conn.execute("SELECT COUNT(*) FROM schema_migrations WHERE completed_at IS NULL").fetchone()[0] == 0
+            assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'ix_packets_%'").fetchone()[0] == 7
+            conn.close()
+
+            # Nada pendiente en la siguiente ejecución
+            assert migrate_directory(tmp_dir) == {}
+            print(f"✅ Base de datos migrada a la versión {result['to_version']}: {result['applied']}")
+        finally:
+            migrations.CHUNK_SIZE = chunk_size
+            del os.environ['CATALOG_PATH']
+
+def test_index_migrations_cover_models():
+    """Cada índice de los modelos lo crea alguna migración con las mismas columnas"""
+    print("\n--- Test: Índices de las migraciones ---")
+    declared = {}
+    for _, _, migration in migrations.MIGRATIONS:
+        for name, table_name, columns in getattr(migration, 'indexes', ()):
+            declared[name] = (table_name, tuple(columns))
+    # frame_chunks se añadió con su índice: lo crea la migración 1 junto con la tabla
+    created_with_table = {'ix_frame_chunks_session_first_packet'}
+    for table in migrations.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in created_with_table:
+                continue
+            assert declared.get(index.name) == (table.name, tuple(c.name for c in index.columns)), index.name
+    print(f"✅ {len(declared)} índices declarados en las migraciones")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE MIGRACIONES ===")
+    test_migrate_legacy_database()
+    test_index_migrations_cover_models()
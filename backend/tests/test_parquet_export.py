@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Base, CaptureSession, Packet, Anomaly
+from database.parquet_export import export_session, pyarrow_available
+
+def _create_sample_db(db_path, packet_total=250):
+    """Crea una base de datos con una sesión y paquetes sintéticos"""
+    engine = create_engine(f'sqlite:///{db_path}')
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    session = CaptureSession(file_name="sample.pcap", capture_date=datetime.now(), packet_count=packet_total)
+    db.add(session)
+    db.commit()
+    for i in range(packet_total):
+        packet = Packet(
+            session_id=session.id,
+            packet_number=i + 1,
+            # Timestamps desordenados: la exportación sigue el orden de captura
+            timestamp=1700000000.0 + ((i * 7) % packet_total),
+            packet_length=60 + i,
+            src_ip=f"10.0.0.{i % 5}",
+            dst_ip="10.0.0.100",
+            transport_protocol="TCP" if i % 2 else "UDP",
+            src_port=40000 + (i % 5),
+            dst_port=80,
+        )
+        db.add(packet)
+        if i % 50 == 0:
+            db.flush()
+            db.add(Anomaly(packet_id=packet.id, session_id=session.id, type="test",
+                           description="anomalía de prueba", severity="baja"))
+    db.commit()
+    session_id = session.id
+    db.close()
+    engine.dispose()
+    return session_id
+
+def test_export_session_parquet():
+    """Prueba la exportación de una sesión a Parquet por row groups"""
+    print("\n--- Test: Exportación Parquet ---")
+
+    if not pyarrow_available():
+        print("⚠️ pyarrow no está instalado, se omite la prueba")
+        return
+
+    import pyarrow.parquet as pq
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "database_test.db")
+        session_id = _create_sample_db(db_path)
+
+        summary = export_session(db_path, session_id, tmp_dir, row_group_size=100)
+
+        packets_file = pq.ParquetFile(summary["packets"]["path"])
+        assert summary["packets"]["rows"] == 250
+        assert packets_file.metadata.num_row_groups == 3
+        assert packets_file.metadata.row_group(0).column(0).compression == "ZSTD"
+
+        # Orden de captura, declarado en los metadatos de cada row group
+        numbers = packets_file.read(columns=["packet_number"]).column("packet_number").to_pylist()
+        assert numbers == list(range(1, 251))
+        index = packets_file.schema_arrow.get_field_index("packet_number")
+        assert packets_file.metadata.row_group(0).sorting_columns == (pq.SortingColumn(index),)
+
+        assert summary["flows"]["rows"] == 10
+        assert summary["anomalies"]["rows"] == 5
+        print(f"✅ Exportadas {summary['packets']['rows']} filas en {packets_file.metadata.num_row_groups} row groups")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE EXPORTACIÓN PARQUET ===")
+    test_export_session_parquet()
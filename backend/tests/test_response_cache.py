@@ -0,0 +1,105 @@
+import os
+import sys
+import sqlite3
+import tempfile
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.database_api import router as database_router
+from database import response_cache
+from database.response_cache import clear_response_cache, response_cache_stats
+from database.engine_cache import clear_engine_cache
+from database.seal import seal_database, unseal_database
+from test_parquet_export import _create_sample_db
+
+def _add_packet(db_path, session_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(
+            "INSERT INTO packets (session_id, packet_number, timestamp, packet_length) VALUES (?, 251, 1700000300.0, 60)",
+            (session_id,)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def _delta(before, name):
+    return response_cache_stats()[name] - before[name]
+
+def test_response_cache():
+    """Prueba la caché de respuestas con ETag, la invalidación y la expulsión LRU"""
+    print("\n--- Test: Caché de respuestas ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "database_test.db")
+        session_id = _create_sample_db(db_path)
+        os.environ['DATABASE_DIRECTORY'] = tmp_dir
+        clear_response_cache()
+        app = FastAPI()
+        app.include_router(database_router)
+        client = TestClient(app)
+        details_url = f"/api/database/sessions/{session_id}"
+        analytics_url = f"/api/database/analytics/{session_id}"
+        params = {"db_file": "database_test.db"}
+        before = response_cache_stats()
+        try:
+            first = client.get(details_url, params=params)
+            assert first.status_code == 200 and first.json()["packet_count"] == 250
+            etag = first.headers["etag"]
+
+            # Segunda petición: desde la caché; con If-None-Match: 304 sin cuerpo
+            again = client.get(details_url, params=params)
+            assert again.headers["etag"] == etag and again.content == first.content
+            assert _delta(before, "hits") == 1
+            not_modified = client.get(details_url, params=params, headers={"If-None-Match": etag})
+            assert not_modified.status_code == 304 and not_modified.content == b""
+            assert _delta(before, "not_modified") == 1
+
+            analytics = client.get(analytics_url, params=params)
+            assert analytics.status_code == 200
+            assert client.get(analytics_url, params=params).json() == analytics.json()
+            sessions = client.get("/api/database/sessions", params=params)
+            assert sessions.json()["total"] == 1
+            assert client.get("/api/database/sessions", params=params,
+                              headers={"If-None-Match": sessions.headers["etag"]}).status_code == 304
+            assert client.get("/api/database/sessions/999", params=params).status_code == 404
+
+            # Una escritura cambia la identidad del contenido: ETag nuevo y datos actualizados
+            _add_packet(db_path, session_id)
+            changed = client.get(details_url, params=params, headers={"If-None-Match": etag})
+            assert changed.status_code == 200 and changed.json()["packet_count"] == 251
+            assert changed.headers["etag"] != etag
+            assert _delta(before, "invalidations") >= 3
+
+            # Sellar el archivo también invalida
+            etag = changed.headers["etag"]
+            clear_engine_cache()
+            seal_database(db_path)
+            sealed = client.get(details_url, params=params, headers={"If-None-Match": etag})
+            assert sealed.status_code == 200 and sealed.headers["etag"] != etag
+            assert sealed.json() == changed.json()
+
+            # Expulsión LRU por tamaño
+            max_bytes = response_cache.RESPONSE_CACHE_MAX_BYTES
+            response_cache.RESPONSE_CACHE_MAX_BYTES = len(sealed.content) + len(analytics.content) - 1
+            try:
+                client.get(analytics_url, params=params)
+                client.get(details_url, params=params)
+                assert _delta(before, "evictions") >= 1
+                assert response_cache_stats()["bytes"] <= response_cache.RESPONSE_CACHE_MAX_BYTES
+            finally:
+                response_cache.RESPONSE_CACHE_MAX_BYTES = max_bytes
+            print(f"✅ Caché de respuestas: {response_cache_stats()}")
+        finally:
+            del os.environ['DATABASE_DIRECTORY']
+            unseal_database(db_path)
+            clear_engine_cache()
+            clear_response_cache()
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE LA CACHÉ DE RESPUESTAS ===")
+    test_response_cache()
@@ -0,0 +1,90 @@
+import os
+import sys
+import sqlite3
+import tempfile
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.analytics import get_analytics_backend
+from database.retention import (
+    apply_retention, archive_status, rehydrate_session, convert_to_incremental, RetentionPolicy
+)
+from test_parquet_export import _create_sample_db
+
+def _count(db_path, table):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+def test_retention_archive_and_rehydrate():
+    """Prueba que la retención archiva los paquetes, conserva la analítica y permite rehidratar"""
+    print("\n--- Test: Retención por niveles ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # La retención actualiza el catálogo: usar uno temporal
+        os.environ['CATALOG_PATH'] = os.path.join(tmp_dir, "catalog.sqlite")
+        try:
+            _run_retention(tmp_dir)
+        finally:
+            del os.environ['CATALOG_PATH']
+
+def _run_retention(tmp_dir):
+    db_path = os.path.join(tmp_dir, "database_test.db")
+    archive_dir = os.path.join(tmp_dir, "archive")
+    session_id = _create_sample_db(db_path)
+
+    with get_analytics_backend(db_path, backend='sqlite', use_stats=False) as analytics:
+        expected = analytics.session_analytics(session_id)
+
+    # Sesión de hace 30 días: paquetes caducados, flujos aún en caliente
+    now = 1700000250.0 + 30 * 86400
+    policy = RetentionPolicy(raw_days=7, flow_days=90)
+
+    summary = apply_retention(db_path, policy, now=now, archive_dir=archive_dir, dry_run=True)
+    assert list(summary["raw"]) == [session_id] and not summary["flows"]
+    assert _count(db_path, "packets") == 250
+
+    summary = apply_retention(db_path, policy, now=now, archive_dir=archive_dir)
+    assert summary["raw"][session_id]["packets"] == 250
+    # Sin auto_vacuum=INCREMENTAL la retención no reescribe el archivo: solo lo indica
+    assert not summary["incremental_vacuum"] and summary["reclaimed_bytes"] == 0
+    assert _count(db_path, "packets") == 0
+    assert _count(db_path, "flows") == 10
+    assert _count(db_path, "anomalies") == 5
+
+    segments = archive_status(db_path, session_id)
+    assert {segment["table"] for segment in segments} == {"packets", "tcp_info", "udp_info", "icmp_info"}
+    assert all(segment["available"] for segment in segments)
+
+    # La analítica se responde desde session_stats
+    with get_analytics_backend(db_path, backend='sqlite') as analytics:
+        assert analytics.session_analytics(session_id) == expected
+
+    # Una segunda ejecución no vuelve a archivar nada
+    summary = apply_retention(db_path, policy, now=now, archive_dir=archive_dir)
+    assert not summary["raw"] and not summary["flows"]
+
+    # La conversión es un paso aparte; después la retención recupera el espacio
+    assert convert_to_incremental(db_path) > 0
+    assert convert_to_incremental(db_path) is None
+
+    # Los flujos caducan más tarde
+    summary = apply_retention(db_path, policy, now=now + 90 * 86400, archive_dir=archive_dir)
+    assert summary["flows"][session_id] == {"flows": 10} and summary["incremental_vacuum"]
+    assert _count(db_path, "flows") == 0
+
+    restored = rehydrate_session(db_path, session_id)
+    assert restored["packets"] == 250 and restored["flows"] == 10
+    assert _count(db_path, "packets") == 250
+    assert archive_status(db_path, session_id) == []
+    with get_analytics_backend(db_path, backend='sqlite', use_stats=False) as analytics:
+        assert analytics.session_analytics(session_id) == expected
+
+    print(f"✅ Sesión {session_id} archivada y rehidratada: {restored}")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE RETENCIÓN ===")
+    test_retention_archive_and_rehydrate()
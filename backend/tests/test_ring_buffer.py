@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.capture_api import router as capture_router
+from capture import capture_manager, tshark_runtime
+from capture.capture_manager import CaptureManager, ring_files
+from capture.network_interfaces import build_capture_command, capture_binary
+from capture.tshark_runtime import TsharkRuntime
+from processing.jobs import get_job
+
+# dumpcap simulado: búfer circular por tamaño (-b filesize, kB) con máximo de archivos (-b files)
+FAKE_DUMPCAP = '''#!{python}
+import os, sys, time, signal, struct
+from datetime import datetime
+args = sys.argv[1:]
+if "-v" in args:
+    print("Dumpcap (Wireshark) 4.0.11")
+    sys.exit(0)
+output = args[args.index("-w") + 1]
+ring = dict(args[i + 1].split(":") for i, a in enumerate(args) if a == "-b")
+duration = float(args[args.index("-a") + 1].split(":")[1]) if "-a" in args else 30
+stem, ext = os.path.splitext(output)
+stop = []
+signal.signal(signal.SIGINT, lambda *a: stop.append(True))
+files, number, f = [], 0, None
+deadline = time.monotonic() + duration
+while not stop and time.monotonic() < deadline:
+    if f is None or f.tell() >= int(ring["filesize"]) * 1000:
+        if f is not None:
+            f.close()
+        number += 1
+        path = "%s_%05d_%s%s" % (stem, number, datetime.now().strftime("%Y%m%d%H%M%S"), ext)
+        f = open(path, "wb")
+        f.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        files.append(path)
+        while "files" in ring and len(files) > int(ring["files"]):
+            os.remove(files.pop(0))
+    f.write(struct.pack("<IIII", 1700000000, 0, 60, 60) + bytes(60))
+    f.flush()
+    time.sleep(0.005)
+f.close()
+'''
+
+def test_ring_buffer_command():
+    """Opciones del búfer circular y formato PCAP según el ejecutable"""
+    command = build_capture_command("/usr/bin/dumpcap", "eth0", "/tmp/c.pcap", 0, None, "tcp",
+                                    ring_buffer={"filesize": 102400, "files": 10}, pcap_format=True)
+    assert command == ["/usr/bin/dumpcap", "-i", "eth0", "-w", "/tmp/c.pcap", "-P", "-f", "tcp",
+                       "-b", "filesize:102400", "-b", "files:10"]
+    assert build_capture_command("tshark", "eth0", "-", pcap_format=True)[-2:] == ["-F", "pcap"]
+
+def _wait_capture(client, capture):
+    deadline = time.monotonic() + 10
+    while capture["status"] == 'running' and time.monotonic() < deadline:
+        time.sleep(0.05)
+        capture = client.get(f"/api/capture/captures/{capture['id']}").json()
+    assert capture["status"] == 'completed'
+    return capture
+
+def test_ring_buffer_capture():
+    """Cada archivo del búfer circular se encola al cerrarse y el disco queda acotado"""
+    print("\n--- Test: Búfer circular con dumpcap ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dumpcap_path = os.path.join(tmp_dir, "dumpcap")
+        with open(dumpcap_path, "w") as f:
+            f.write(FAKE_DUMPCAP.format(python=sys.executable))
+        os.chmod(dumpcap_path, 0o755)
+        os.environ['JOBS_PATH'] = os.path.join(tmp_dir, "jobs.sqlite")
+        os.environ['DUMPCAP_PATH'] = dumpcap_path
+        os.environ['TSHARK_PATH'] = os.path.join(tmp_dir, "no-existe")
+        tshark_runtime._runtime = TsharkRuntime()
+        poll, capture_manager.CAPTURE_RING_POLL = capture_manager.CAPTURE_RING_POLL, 0.05
+        # Sin ruta explícita, el gestor elige dumpcap
+        capture_manager._manager = CaptureManager(pcap_directory=tmp_dir)
+
+        app = FastAPI()
+        app.include_router(capture_router)
+        try:
+            assert capture_binary() == dumpcap_path and capture_binary("tshark") is None
+            with TestClient(app) as client:
+                assert client.post("/api/capture/start", params={"interface_id": "eth0", "ring_files": 3}).status_code == 400
+                # dumpcap borraría archivos todavía en cola: ring_files no se admite con procesamiento
+                assert client.post("/api/capture/start", params={
+                    "interface_id": "eth0", "process": True, "ring_filesize": 2, "ring_files": 3
+                }).status_code == 400
+                capture = client.post("/api/capture/start", params={
+                    "interface_id": "eth0", "duration": 2, "process": True, "ring_filesize": 2
+                }).json()
+                assert capture["backend"] == 'dumpcap' and capture["ring_buffer"] == {"filesize": 2}
+                capture = _wait_capture(client, capture)
+
+                # Todos los archivos se entregaron en orden, cada uno en cuanto se cerró
+                files = capture["files"]
+                numbers = [int(entry["file_name"].split("_")[-2]) for entry in files]
+                assert len(files) >= 8 and numbers == list(range(1, len(files) + 1))
+                jobs = [get_job(entry["job_id"]) for entry in files]
+                finished_at = datetime.fromisoformat(capture["finished_at"])
+                assert datetime.fromisoformat(jobs[0]["created_at"]) < finished_at
+                assert all(job["payload"]["delete_source"] and job["kind"] == 'process_pcap' for job in jobs)
+                assert [job["payload"]["pcap_file"] for job in jobs] == [entry["path"] for entry in files]
+                # Ningún archivo encolado desaparece antes de ingerirlo
+                assert ring_files(capture["file_path"]) == [entry["path"] for entry in files]
+                print(f"✅ Búfer circular: {len(files)} archivos encolados")
+
+                # Sin procesamiento, dumpcap conserva como mucho ring_files archivos
+                capture = client.post("/api/capture/start", params={
+                    "interface_id": "eth0", "duration": 2, "ring_filesize": 2, "ring_files": 3
+                }).json()
+                capture = _wait_capture(client, capture)
+                files = capture["files"]
+                on_disk = ring_files(capture["file_path"])
+                assert all(entry["job_id"] is None for entry in files)
+                assert len(on_disk) <= 3 and on_disk[-1] == files[-1]["path"]
+                print(f"✅ Búfer circular sin procesamiento: {len(files)} archivos, {len(on_disk)} en disco al terminar")
+        finally:
+            capture_manager._manager = None
+            capture_manager.CAPTURE_RING_POLL = poll
+            tshark_runtime._runtime = None
+            for name in ('JOBS_PATH', 'DUMPCAP_PATH', 'TSHARK_PATH'):
+                del os.environ[name]
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DEL BÚFER CIRCULAR ===")
+    test_ring_buffer_command()
+    test_ring_buffer_capture()
@@ -0,0 +1,133 @@
+import os
+import sys
+import stat
+import sqlite3
+import tempfile
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.seal import (
+    seal_database, unseal_database, read_seal, is_sealed, verify_seal, ensure_writable,
+    connect_readonly, DatabaseSealedError
+)
+from database.engine_cache import get_engine, get_session, clear_engine_cache
+from database.catalog import index_database
+from database.retention import apply_retention, RetentionPolicy
+from database.models import CaptureSession, Packet
+from test_parquet_export import _create_sample_db
+
+class _EmptyCapture:
+    """Captura sin paquetes (como un PipeCapture que aún no recibió nada)"""
+    def __iter__(self):
+        return iter([])
+
+    def close(self):
+        pass
+
+def test_seal_database():
+    """Prueba el sellado, la lectura inmutable, el rechazo de escrituras y el resellado"""
+    print("\n--- Test: Sellado de bases de datos ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ['CATALOG_PATH'] = os.path.join(tmp_dir, "catalog.sqlite")
+        try:
+            _run_seal(tmp_dir)
+        finally:
+            del os.environ['CATALOG_PATH']
+            clear_engine_cache()
+
+def _run_seal(tmp_dir):
+    db_path = os.path.join(tmp_dir, "database_test.db")
+    session_id = _create_sample_db(db_path)
+    engine = get_engine(db_path)
+
+    seal = seal_database(db_path)
+    assert is_sealed(db_path)
+    assert seal["stats"]["sessions"] == 1 and seal["stats"]["packets"] == 250
+    assert seal["stats"]["first_timestamp"] <= seal["stats"]["last_timestamp"]
+    assert not os.stat(db_path).st_mode & stat.S_IWUSR
+    assert verify_seal(db_path)["valid"]
+    assert seal_database(db_path) == seal
+
+    # El catálogo refleja el sellado y usa el checksum como hash
+    entry = index_database(db_path)
+    assert entry["sealed"] and entry["content_hash"] == seal["checksum"]
+
+    # Los lectores abren el archivo inmutable; el engine anterior se descarta
+    sealed_engine = get_engine(db_path)
+    assert sealed_engine is not engine
+    assert "immutable=1" in str(sealed_engine.url)
+    db = get_session(db_path)
+    try:
+        assert db.query(Packet).filter(Packet.session_id == session_id).count() == 250
+        db.add(CaptureSession(file_name="otra.pcap"))
+        try:
+            db.commit()
+            assert False, "Se esperaba un error de escritura"
+        except Exception as e:
+            db.rollback()
+            assert "readonly" in str(e)
+    finally:
+        db.close()
+    conn = connect_readonly(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM packets").fetchone()[0] == 250
+    finally:
+        conn.close()
+    try:
+        ensure_writable(db_path)
+        assert False, "Se esperaba DatabaseSealedError"
+    except DatabaseSealedError:
+        pass
+
+    # Retención sin nada que archivar: el sellado no cambia
+    policy = RetentionPolicy(raw_days=7, flow_days=90)
+    apply_retention(db_path, policy, now=1700000250.0, archive_dir=os.path.join(tmp_dir, "archive"))
+    assert read_seal(db_path)["checksum"] == seal["checksum"]
+
+    # Retención que archiva: se desprecinta, se modifica y se vuelve a sellar
+    summary = apply_retention(db_path, policy, now=1700000250.0 + 30 * 86400,
+                              archive_dir=os.path.join(tmp_dir, "archive"))
+    assert summary["raw"][session_id]["packets"] == 250
+    resealed = read_seal(db_path)
+    assert resealed is not None and resealed["checksum"] != seal["checksum"]
+    assert resealed["stats"]["packets"] == 0 and resealed["stats"]["sessions"] == 1
+    assert verify_seal(db_path)["valid"]
+    db = get_session(db_path)
+    try:
+        assert db.query(Packet).count() == 0
+    finally:
+        db.close()
+
+    # Una ingesta cancelada sobre un archivo sellado lo deja sellado de nuevo
+    from processing.pcap_processor import PCAPProcessor, ProcessingCancelled
+    os.environ['SEAL_DATABASES'] = 'false'
+    try:
+        PCAPProcessor(db_path=db_path).process_pcap_file(
+            "cancelada.pcap", should_stop=lambda: True, capture=_EmptyCapture()
+        )
+        assert False, "Se esperaba ProcessingCancelled"
+    except ProcessingCancelled:
+        pass
+    finally:
+        del os.environ['SEAL_DATABASES']
+    assert is_sealed(db_path) and not os.stat(db_path).st_mode & stat.S_IWUSR
+    resealed = read_seal(db_path)
+
+    # Un archivo modificado tras el sellado no supera la verificación
+    assert unseal_database(db_path)
+    assert not is_sealed(db_path) and os.stat(db_path).st_mode & stat.S_IWUSR
+    seal = seal_database(db_path)
+    os.chmod(db_path, 0o644)
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE capture_sessions SET interface = 'eth9'")
+    conn.commit()
+    conn.close()
+    assert verify_seal(db_path)["valid"] is False
+
+    print(f"✅ Sellado: sha256 {seal['checksum'][:12]}…, {resealed['stats']}")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DEL SELLADO DE BASES DE DATOS ===")
+    test_seal_database()
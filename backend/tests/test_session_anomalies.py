@@ -0,0 +1,120 @@
+import os
+import sys
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.database_api import router as database_router
+from database.engine_cache import clear_engine_cache
+from test_parquet_export import _create_sample_db
+
+SEVERITIES = ('alta', 'media', 'baja')
+TYPES = ('port_scan', 'syn_flood')
+
+def _add_anomalies(db_path, session_id, count=40):
+    """Anomalías con severidades, tipos y fechas variadas (con empates y una sin fecha)"""
+    base = datetime(2024, 1, 1, 12, 0, 0)
+    conn = sqlite3.connect(db_path)
+    try:
+        for i in range(count):
+            detection_time = None if i == 7 else (base + timedelta(seconds=(i * 13) % 17)).isoformat(sep=' ')
+            conn.execute(
+                "INSERT INTO anomalies (packet_id, session_id, type, description, severity, detection_time) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (i * 5 + 1, session_id, TYPES[i % 2], f"anomalía {i}", SEVERITIES[i % 3], detection_time)
+            )
+        conn.commit()
+        return [row for row in conn.execute(
+            "SELECT id, detection_time, severity, type FROM anomalies WHERE session_id = ?", (session_id,)
+        )]
+    finally:
+        conn.close()
+
+def _walk(client, url, **params):
+    ids, after = [], None
+    while True:
+        query = {"db_file": "database_test.db", "limit": 7, **params}
+        if after is not None:
+            query["after"] = after
+        page = client.get(url, params=query).json()
+        ids += [anomaly["id"] for anomaly in page["anomalies"]]
+        after = page["next_cursor"]
+        if after is None:
+            return ids, page
+
+def _app():
+    app = FastAPI()
+    app.include_router(database_router)
+    return app
+
+def test_session_anomalies():
+    """Prueba los filtros, las facetas y la paginación por clave de /sessions/{id}/anomalies"""
+    print("\n--- Test: Anomalías de una sesión ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "database_test.db")
+        session_id = _create_sample_db(db_path)
+        rows = _add_anomalies(db_path, session_id)
+        # Orden esperado: sin fecha primero, luego (detection_time, id)
+        expected = [row[0] for row in sorted(rows, key=lambda row: (row[1] is not None, row[1] or '', row[0]))]
+
+        os.environ['DATABASE_DIRECTORY'] = tmp_dir
+        client = TestClient(_app())
+        url = f"/api/database/sessions/{session_id}/anomalies"
+        try:
+            ids, page = _walk(client, url)
+            assert ids == expected and len(ids) == 45
+            assert page["total"] == 45
+            assert page["facets"]["severity"] == {"alta": 14, "media": 13, "baja": 18}
+            assert page["facets"]["type"] == {"port_scan": 20, "syn_flood": 20, "test": 5}
+
+            # Offset: la misma página que por cursor
+            page = client.get(url, params={"db_file": "database_test.db", "limit": 7, "offset": 14}).json()
+            assert [anomaly["id"] for anomaly in page["anomalies"]] == expected[14:21]
+
+            # Filtros sin distinguir mayúsculas y facetas que respetan el otro filtro
+            ids, page = _walk(client, url, severity="ALTA", type="port_scan")
+            matching = {row[0] for row in rows if row[2] == 'alta' and row[3] == 'port_scan'}
+            assert set(ids) == matching and page["total"] == len(matching)
+            assert page["facets"]["type"] == {"port_scan": 7, "syn_flood": 7}
+            assert page["facets"]["severity"] == {"alta": 7, "media": 6, "baja": 7}
+
+            # Proyección reducida del paquete
+            anomaly = client.get(url, params={"db_file": "database_test.db", "limit": 1}).json()["anomalies"][0]
+            assert set(anomaly["packet"]) == {"id", "packet_number", "timestamp", "src_ip", "dst_ip", "protocol"}
+            anomaly = client.get(url, params={"db_file": "database_test.db", "limit": 1,
+                                              "include_packet": False}).json()["anomalies"][0]
+            assert "packet" not in anomaly
+
+            page = client.get(url, params={"db_file": "database_test.db", "type": "nada"}).json()
+            assert page["total"] == 0 and page["anomalies"] == []
+            assert client.get(url, params={"db_file": "database_test.db", "after": 99999}).status_code == 400
+
+            # El conteo de anomalías de /sessions usa Anomaly.session_id
+            sessions = client.get("/api/database/sessions", params={"db_file": "database_test.db"}).json()
+            assert sessions["sessions"][0]["anomaly_count"] == 45
+        finally:
+            del os.environ['DATABASE_DIRECTORY']
+            clear_engine_cache()
+
+        conn = sqlite3.connect(db_path)
+        try:
+            plan = " | ".join(row[3] for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM anomalies WHERE session_id = ? AND severity IN (?) AND type IN (?) "
+                "AND (detection_time, id) > (?, ?) ORDER BY detection_time, id LIMIT 8",
+                (session_id, 'alta', 'port_scan', '2024-01-01 12:00:05', 10)
+            ))
+        finally:
+            conn.close()
+        assert "ix_anomalies_session_severity_type_time" in plan and "TEMP B-TREE" not in plan
+        print(f"✅ Anomalías paginadas por clave con facetas; plan: {plan}")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE LAS ANOMALÍAS DE UNA SESIÓN ===")
+    test_session_anomalies()
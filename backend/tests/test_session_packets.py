@@ -0,0 +1,92 @@
+import os
+import sys
+import sqlite3
+import tempfile
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.database_api import router as database_router
+from database.engine_cache import clear_engine_cache
+from test_parquet_export import _create_sample_db
+
+def _query_plan(db_path, sql, params):
+    conn = sqlite3.connect(db_path)
+    try:
+        return " | ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+    finally:
+        conn.close()
+
+def test_session_packets_keyset_pagination():
+    """Prueba la paginación por clave, los filtros y la proyección de /sessions/{id}/packets"""
+    print("\n--- Test: Paquetes de una sesión paginados ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "database_test.db")
+        session_id = _create_sample_db(db_path)
+        os.environ['DATABASE_DIRECTORY'] = tmp_dir
+        app = FastAPI()
+        app.include_router(database_router)
+        client = TestClient(app)
+        url = f"/api/database/sessions/{session_id}/packets"
+        try:
+            page = client.get(url, params={"db_file": "database_test.db", "limit": 20}).json()
+            assert page["total"] == 250 and len(page["packets"]) == 20
+            assert page["next_cursor"] == 20
+            first = page["packets"][0]
+            assert set(first) == {'id', 'packet_number', 'timestamp', 'src_ip', 'dst_ip', 'protocol',
+                                  'length', 'details', 'anomalies'}
+            assert first["protocol"] == "UDP" and first["details"] == {"src_port": 40000, "dst_port": 80}
+            assert first["anomalies"][0]["type"] == "test"
+            assert page["packets"][1]["details"]["flags"] == "None"
+
+            # Recorrer la sesión completa por cursor
+            numbers, after = [], None
+            while True:
+                params = {"db_file": "database_test.db", "limit": 64, "with_total": False}
+                if after is not None:
+                    params["after"] = after
+                page = client.get(url, params=params).json()
+                assert page["total"] is None
+                numbers += [packet["packet_number"] for packet in page["packets"]]
+                after = page["next_cursor"]
+                if after is None:
+                    break
+            assert numbers == list(range(1, 251))
+
+            # Compatibilidad con offset
+            page = client.get(url, params={"db_file": "database_test.db", "limit": 10, "offset": 100}).json()
+            assert page["packets"][0]["packet_number"] == 101
+            page = client.get(url, params={"db_file": "database_test.db", "offset": 1000}).json()
+            assert page["packets"] == [] and page["next_cursor"] is None
+
+            # Filtros y proyección
+            page = client.get(url, params={"db_file": "database_test.db", "src_ip": "10.0.0.3", "protocol": "tcp",
+                                           "fields": "packet_number,src_ip,protocol"}).json()
+            assert page["total"] == 25
+            assert page["packets"][0] == {"packet_number": 4, "src_ip": "10.0.0.3", "protocol": "TCP"}
+            assert all(packet["packet_number"] % 10 == 4 for packet in page["packets"])
+
+            assert client.get(url, params={"db_file": "database_test.db", "fields": "nope"}).status_code == 400
+            assert client.get("/api/database/sessions/999/packets",
+                              params={"db_file": "database_test.db"}).status_code == 404
+        finally:
+            del os.environ['DATABASE_DIRECTORY']
+            clear_engine_cache()
+
+        # Las páginas filtradas salen ordenadas del índice, sin ordenación temporal
+        plan = _query_plan(
+            db_path,
+            "SELECT packet_number, src_ip FROM packets WHERE session_id = ? AND src_ip = ? AND packet_number > ? "
+            "ORDER BY packet_number LIMIT 21",
+            (session_id, "10.0.0.3", 100)
+        )
+        assert "ix_packets_session_src_ip_number" in plan and "TEMP B-TREE" not in plan
+        print(f"✅ Paginación por clave: {len(numbers)} paquetes; plan: {plan}")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE LA PAGINACIÓN DE PAQUETES ===")
+    test_session_packets_keyset_pagination()
@@ -0,0 +1,54 @@
+import os
+import sys
+import sqlite3
+import tempfile
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.analytics import SQLiteAnalytics, get_analytics_backend
+from database.session_stats import refresh_session_stats, load_session_stats, StatsAnalytics
+from test_parquet_export import _create_sample_db
+
+def test_session_stats_match_live_queries():
+    """Prueba que las estadísticas precalculadas coinciden con las consultas en vivo"""
+    print("\n--- Test: Estadísticas por sesión ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "database_test.db")
+        session_id = _create_sample_db(db_path)
+
+        # Sin estadísticas, el backend responde en vivo
+        with StatsAnalytics(db_path, SQLiteAnalytics(db_path)) as analytics:
+            assert analytics.stats(session_id) is None
+            live_analytics = analytics.session_analytics(session_id)
+
+        assert refresh_session_stats(db_path) == [session_id]
+        assert refresh_session_stats(db_path) == []
+
+        conn = sqlite3.connect(db_path)
+        stats = load_session_stats(conn, session_id)
+        conn.close()
+        assert stats["packet_count"] == 250
+        assert stats["byte_count"] == sum(60 + i for i in range(250))
+        assert stats["size_stats"]["p50"] == 184
+        assert stats["size_stats"]["p99"] == 307
+        assert stats["unique_dst_ports"] == 1
+
+        with SQLiteAnalytics(db_path) as live, get_analytics_backend(db_path, backend='sqlite') as stored:
+            assert isinstance(stored, StatsAnalytics)
+            assert stored.session_analytics(session_id) == live_analytics
+            for method in ('flag_pattern_counts', 'time_bounds', 'size_stats', 'ttl_histogram',
+                           'fragmentation_counts', 'port_scanners', 'asymmetric_pairs', 'anomaly_counts'):
+                assert getattr(stored, method)(session_id) == getattr(live, method)(session_id), method
+            assert stored.interval_summary(session_id) == live.interval_summary(session_id)
+            assert stored.top_values(session_id, 'dst_port', 15, exclude_null=True) == \
+                live.top_values(session_id, 'dst_port', 15, exclude_null=True)
+            # Consultas no precalculadas se resuelven en vivo
+            assert stored.top_values(session_id, 'src_port', 3) == live.top_values(session_id, 'src_port', 3)
+
+        print(f"✅ Estadísticas guardadas para la sesión {session_id}: {stats['packet_count']} paquetes")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE ESTADÍSTICAS POR SESIÓN ===")
+    test_session_stats_match_live_queries()
@@ -0,0 +1,107 @@
+import io
+import os
+import sys
+import csv
+import gzip
+import json
+import tempfile
+import tracemalloc
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.database_api import router as database_router
+from database.engine_cache import clear_engine_cache, get_engine
+from database.parquet_export import pyarrow_available
+from database.frame_store import zstd_available
+from database.stream_export import stream_session_packets
+from test_parquet_export import _create_sample_db
+
+def _peak_export_memory(db_path, session_id, batch_size):
+    """Pico de memoria Python al consumir la exportación completa sin guardarla"""
+    engine = get_engine(db_path)
+    tracemalloc.start()
+    total = 0
+    for chunk in stream_session_packets(engine, session_id, export_format='ndjson', compression='gzip',
+                                        batch_size=batch_size):
+        total += len(chunk)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, total
+
+def test_stream_export():
+    """Prueba la exportación en streaming de /sessions/{id}/export"""
+    print("\n--- Test: Exportación en streaming ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "database_test.db")
+        session_id = _create_sample_db(db_path)
+        os.environ['DATABASE_DIRECTORY'] = tmp_dir
+        app = FastAPI()
+        app.include_router(database_router)
+        client = TestClient(app)
+        url = f"/api/database/sessions/{session_id}/export"
+        try:
+            # NDJSON con la proyección por defecto, en el orden de packet_number
+            response = client.get(url, params={"db_file": "database_test.db"})
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("application/x-ndjson")
+            rows = [json.loads(line) for line in response.text.splitlines()]
+            assert [row["packet_number"] for row in rows] == list(range(1, 251))
+            assert rows[0]["details"] == {"src_port": 40000, "dst_port": 80}
+            assert rows[0]["anomalies"][0]["type"] == "test"
+
+            # CSV comprimido con gzip y los mismos filtros que la paginación
+            response = client.get(url, params={"db_file": "database_test.db", "format": "csv", "compression": "gzip",
+                                               "src_ip": "10.0.0.3", "protocol": "tcp",
+                                               "fields": "packet_number,src_ip,protocol,details"})
+            assert response.status_code == 200
+            assert 'database_test_session1_packets.csv.gz' in response.headers["content-disposition"]
+            table = list(csv.reader(io.StringIO(gzip.decompress(response.content).decode('utf-8'))))
+            assert table[0] == ["packet_number", "src_ip", "protocol", "details"]
+            assert len(table) == 26 and table[1][:3] == ["4", "10.0.0.3", "TCP"]
+            assert json.loads(table[1][3])["flags"] == "None"
+
+            if pyarrow_available():
+                import pyarrow as pa
+                params = {"db_file": "database_test.db", "format": "arrow", "fields": "packet_number,timestamp,length"}
+                if zstd_available():
+                    import zstandard
+                    params["compression"] = "zstd"
+                response = client.get(url, params=params)
+                assert response.status_code == 200
+                content = response.content
+                if zstd_available():
+                    content = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(content)).read()
+                arrow_table = pa.ipc.open_stream(content).read_all()
+                assert arrow_table.num_rows == 250
+                assert arrow_table.schema.field("length").type == pa.int64()
+                assert arrow_table.column("packet_number").to_pylist() == list(range(1, 251))
+
+            assert client.get(url, params={"db_file": "database_test.db", "format": "xml"}).status_code == 400
+            assert client.get(url, params={"db_file": "database_test.db", "fields": "nope"}).status_code == 400
+            assert client.get("/api/database/sessions/999/export",
+                              params={"db_file": "database_test.db"}).status_code == 404
+        finally:
+            del os.environ['DATABASE_DIRECTORY']
+            clear_engine_cache()
+
+    # La memoria depende del tamaño del bloque, no del número de paquetes
+    peaks = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for packet_total in (1000, 8000):
+            db_path = os.path.join(tmp_dir, f"database_{packet_total}.db")
+            session_id = _create_sample_db(db_path, packet_total=packet_total)
+            peaks[packet_total] = _peak_export_memory(db_path, session_id, batch_size=500)
+        clear_engine_cache()
+    small, large = peaks[1000][0], peaks[8000][0]
+    assert peaks[8000][1] > peaks[1000][1]
+    assert large < small * 1.5
+    print(f"✅ Exportación en streaming; pico de memoria {small / 1024:.0f} KiB (1k) / {large / 1024:.0f} KiB (8k)")
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE LA EXPORTACIÓN EN STREAMING ===")
+    test_stream_export()
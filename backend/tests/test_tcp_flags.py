@@ -0,0 +1,54 @@
+import os
+import sys
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Base, CaptureSession, Packet
+from database.tcp_flags import count_flag_patterns, flags_to_text, raw_from_flags, SYN, ACK, FIN, RST, PSH, URG
+
+def test_flag_patterns_on_packed_column():
+    """Prueba los patrones de flags expresados como máscaras sobre tcp_flags_raw"""
+    print("\n--- Test: Patrones de flags TCP ---")
+
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(CaptureSession(id=1, file_name="flags.pcap"))
+
+    samples = [
+        SYN,                              # SYN (inicio de conexión)
+        SYN | ACK,                        # SYN-ACK
+        ACK, ACK,                         # ACK
+        RST | ACK,                        # RST
+        FIN | ACK,                        # FIN normal
+        FIN,                              # FIN scan
+        0,                                # NULL scan
+        FIN | SYN | RST | PSH | URG,      # Christmas tree
+        None,                             # Paquete no TCP
+    ]
+    for number, raw in enumerate(samples, start=1):
+        db.add(Packet(session_id=1, packet_number=number, timestamp=float(number), tcp_flags_raw=raw))
+    db.commit()
+
+    counts = count_flag_patterns(db, Packet.tcp_flags_raw, Packet.session_id == 1)
+    assert counts == {
+        'syn_packets': 2,
+        'rst_packets': 2,
+        'fin_packets': 3,
+        'christmas_tree': 1,
+        'null_scan': 1,
+        'fin_scan': 1,
+    }
+    assert raw_from_flags(syn=True, ack=True) == SYN | ACK
+    assert flags_to_text(SYN | ACK) == "SYN, ACK"
+    assert flags_to_text(None) == "None"
+    print(f"✅ Conteos por patrón: {counts}")
+    db.close()
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DE FLAGS TCP ===")
+    test_flag_patterns_on_packed_column()
@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import tempfile
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Añadir el directorio raíz al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.capture_api import router as capture_router
+from capture import tshark_runtime
+from capture.network_interfaces import find_tshark_path, get_interfaces
+from capture.tshark_runtime import TsharkRuntime, parse_interfaces
+
+# Ejecutable simulado: registra cada llamada y responde a -v, -D y -L
+FAKE_BINARY = '''#!{python}
+import sys, os
+with open(os.path.join(os.path.dirname(__file__), "calls.log"), "a") as log:
+    log.write(os.path.basename(__file__) + " " + " ".join(sys.argv[1:]) + "\\n")
+if "-v" in sys.argv:
+    print("{title} 4.0.11 (Git v4.0.11 packaged as 4.0.11-1)")
+elif "-D" in sys.argv:
+    print("1. eth0")
+    print("2. any")
+    print("3. lo (Loopback)")
+elif "-L" in sys.argv:
+    print("Data link types of interface " + sys.argv[-1] + " (use option -y to set):")
+    print("  EN10MB (Ethernet)")
+    print("  DOCSIS (DOCSIS)")
+'''
+
+def _install(tmp_dir, name, title):
+    path = os.path.join(tmp_dir, name)
+    with open(path, "w") as f:
+        f.write(FAKE_BINARY.format(python=sys.executable, title=title))
+    os.chmod(path, 0o755)
+    return path
+
+def _calls(tmp_dir):
+    log = os.path.join(tmp_dir, "calls.log")
+    if not os.path.exists(log):
+        return []
+    with open(log) as f:
+        return f.read().splitlines()
+
+def test_tshark_runtime():
+    """Prueba la resolución única de ejecutables, la caché de interfaces y las capacidades"""
+    print("\n--- Test: Entorno de TShark ---")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tshark_path = _install(tmp_dir, "tshark", "TShark (Wireshark)")
+        _install(tmp_dir, "dumpcap", "Dumpcap (Wireshark)")
+        os.environ['TSHARK_PATH'] = tshark_path
+        runtime = tshark_runtime._runtime = TsharkRuntime(interfaces_ttl=0.3)
+        try:
+            # Los ejecutables se resuelven una vez (dumpcap junto a tshark)
+            for _ in range(5):
+                assert find_tshark_path() == tshark_path
+            binaries = runtime.binaries()
+            assert binaries["tshark"]["version"] == binaries["dumpcap"]["version"] == "4.0.11"
+            assert _calls(tmp_dir) == ["tshark -v", "dumpcap -v"]
+
+            # Interfaces con dumpcap, en caché
+            interfaces = get_interfaces()
+            assert [i["id"] for i in interfaces] == ["eth0", "any", "lo"]
+            assert interfaces[2]["description"] == "Loopback"
+            started = time.monotonic()
+            for _ in range(100):
+                get_interfaces()
+            assert time.monotonic() - started < 0.1
+            assert runtime.interface_name("lo") == "lo" and runtime.interface_name("wlan9") == "wlan9"
+            assert [c for c in _calls(tmp_dir) if "-D" in c] == ["dumpcap -D"]
+
+            # Caducada: responde con la lista anterior y la actualiza en segundo plano
+            time.sleep(0.35)
+            assert get_interfaces() == interfaces
+            deadline = time.monotonic() + 5
+            while runtime.stats["interface_listings"] < 2 and time.monotonic() < deadline:
+                time.sleep(0.02)
+            assert runtime.stats["interface_listings"] == 2
+            get_interfaces(refresh=True)
+            assert runtime.stats["interface_listings"] == 3
+
+            # Tipos de enlace en caché por interfaz y capacidades por la API
+            app = FastAPI()
+            app.include_router(capture_router)
+            client = TestClient(app)
+            link_types = client.get("/api/capture/interfaces/eth0/link-types").json()["link_types"]
+            assert link_types == [{"name": "EN10MB", "description": "Ethernet"}, {"name": "DOCSIS", "description": "DOCSIS"}]
+            client.get("/api/capture/interfaces/eth0/link-types")
+            assert len([c for c in _calls(tmp_dir) if "-L" in c]) == 1
+            capabilities = client.get("/api/capture/capabilities").json()
+            assert capabilities["dumpcap_available"] and capabilities["link_types"] == {"eth0": ["EN10MB", "DOCSIS"]}
+            assert capabilities["interface_count"] == 3
+            assert len(client.get("/api/capture/interfaces", params={"refresh": True}).json()) == 3
+            assert [c for c in _calls(tmp_dir) if "-v" in c] == ["tshark -v", "dumpcap -v"]
+            print(f"✅ Entorno de TShark: {len(_calls(tmp_dir))} llamadas a los ejecutables en total")
+        finally:
+            tshark_runtime._runtime = None
+            del os.environ['TSHARK_PATH']
+
+    # Sin tshark no hay interfaces
+    os.environ['TSHARK_PATH'] = os.path.join(tempfile.gettempdir(), "no-existe", "tshark")
+    tshark_runtime._runtime = TsharkRuntime()
+    try:
+        assert find_tshark_path() is None and get_interfaces() == []
+    finally:
+        tshark_runtime._runtime = None
+        del os.environ['TSHARK_PATH']
+
+def test_parse_interfaces():
+    """Formato de tshark -D con rutas de dispositivo y descripciones"""
+    output = "1. enp0s3\n2. any\n3. lo (Loopback)\n4. ciscodump (Cisco remote capture)\nbasura\n"
+    interfaces = parse_interfaces(output)
+    assert [i["id"] for i in interfaces] == ["enp0s3", "any", "lo", "ciscodump"]
+    assert interfaces[3]["description"] == "Cisco remote capture"
+
+if __name__ == "__main__":
+    print("=== PRUEBAS DEL ENTORNO DE TSHARK ===")
+    test_tshark_runtime()
+    test_parse_interfaces()
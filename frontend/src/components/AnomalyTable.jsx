@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { getSessionAnomalies } from '../services/api';
 import { debounce } from 'lodash'; // Asegúrate de tener lodash instalado
 
@@ -17,10 +17,13 @@ function AnomalyTable({ sessionId }) {
   });
   // Estado intermedio para inputs (para debounce)
   const [inputFilters, setInputFilters] = useState(filters);
+  // Cursor (id de anomalía) con el que empieza cada página ya visitada
+  const pageCursors = useRef([null]);
 
   // Debounce la actualización de los filtros principales
   const debouncedSetFilters = useCallback(debounce((newFilters) => {
     setFilters(newFilters);
+    pageCursors.current = [null];
     setCurrentPage(0); // Resetear a la primera página al aplicar filtros
   }, 500), []); // 500ms de debounce
 
@@ -39,11 +42,15 @@ function AnomalyTable({ sessionId }) {
       setLoading(true);
       setError(null);
       try {
-        // Construir parámetros incluyendo filtros no vacíos
-        const params = {
-          limit,
-          offset: currentPage * limit,
-        };
+        // Construir parámetros incluyendo filtros no vacíos.
+        // Las páginas ya conocidas se piden por cursor (sin OFFSET)
+        const cursor = pageCursors.current[currentPage];
+        const params = { limit };
+        if (cursor !== undefined && cursor !== null) {
+          params.after = cursor;
+        } else if (currentPage > 0) {
+          params.offset = currentPage * limit;
+        }
         for (const key in filters) {
           if (filters[key]) {
             params[key] = filters[key];
@@ -53,6 +60,9 @@ function AnomalyTable({ sessionId }) {
         const response = await getSessionAnomalies(sessionId, params);
         setAnomalies(response.data.anomalies || []);
         setTotalAnomalies(response.data.total || 0);
+        if (response.data.next_cursor !== null && response.data.next_cursor !== undefined) {
+          pageCursors.current[currentPage + 1] = response.data.next_cursor;
+        }
       } catch (err) {
         console.error(`Error fetching anomalies for session ${sessionId}:`, err);
         setError(`Error al cargar las anomalías.`);
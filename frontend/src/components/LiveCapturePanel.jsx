@@ -0,0 +1,111 @@
+import React, { useState, useEffect, useRef } from 'react';
+import { openLiveCapture } from '../services/api';
+
+const MAX_LIVE_PACKETS = 50;
+
+function LiveCapturePanel({ interfaceId }) {
+  const [active, setActive] = useState(false);
+  const [stats, setStats] = useState(null);
+  const [packets, setPackets] = useState([]);
+  const [error, setError] = useState(null);
+  const socketRef = useRef(null);
+
+  // Cerrar la conexión al cambiar de interfaz o salir de la página
+  useEffect(() => () => socketRef.current?.close(), [interfaceId]);
+
+  const handleToggle = () => {
+    if (active) {
+      socketRef.current?.close();
+      setActive(false);
+      return;
+    }
+    setError(null);
+    setStats(null);
+    setPackets([]);
+    const socket = openLiveCapture(interfaceId, { maxSamples: 10 });
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'stats') {
+        setStats(message);
+      } else if (message.type === 'packet') {
+        setPackets((previous) => [message, ...previous].slice(0, MAX_LIVE_PACKETS));
+      } else if (message.type === 'end') {
+        if (message.error) setError(message.error);
+        setActive(false);
+      }
+    };
+    socket.onerror = () => setError('Error en la conexión de la captura en vivo.');
+    socket.onclose = () => setActive(false);
+    socketRef.current = socket;
+    setActive(true);
+  };
+
+  const formatBytes = (bytes) => (bytes >= 1024 * 1024
+    ? `${(bytes / (1024 * 1024)).toFixed(2)} MB`
+    : `${(bytes / 1024).toFixed(1)} KB`);
+
+  return (
+    <div className="mt-6 space-y-4">
+      <button
+        className="w-full py-3 px-6 rounded-2xl font-semibold text-white shadow-lg transition-all duration-300 bg-gradient-to-r from-blue-400 to-indigo-500 hover:from-blue-500 hover:to-indigo-600 disabled:opacity-50 disabled:cursor-not-allowed"
+        onClick={handleToggle}
+        disabled={!interfaceId}
+      >
+        {active ? '⏹️ Detener captura en vivo' : '📡 Captura en vivo'}
+      </button>
+
+      {error && (
+        <div className="p-4 bg-gradient-to-r from-red-900/50 to-rose-900/50 border border-red-700/50 rounded-2xl shadow-sm">
+          <p className="text-red-300 font-medium">{error}</p>
+        </div>
+      )}
+
+      {stats && (
+        <div className="p-4 bg-gray-700/50 border border-gray-600/50 rounded-2xl text-gray-300 space-y-3">
+          <div className="grid grid-cols-3 gap-3 text-center">
+            <div>
+              <p className="text-2xl font-bold text-emerald-400">{stats.pps}</p>
+              <p className="text-xs text-gray-400">paquetes/s</p>
+            </div>
+            <div>
+              <p className="text-2xl font-bold text-emerald-400">{formatBytes(stats.bytes_per_second)}</p>
+              <p className="text-xs text-gray-400">por segundo</p>
+            </div>
+            <div>
+              <p className="text-2xl font-bold text-emerald-400">{stats.total_packets}</p>
+              <p className="text-xs text-gray-400">paquetes en total</p>
+            </div>
+          </div>
+          <div>
+            <p className="text-sm font-semibold mb-1">Protocolos</p>
+            <div className="flex flex-wrap gap-2">
+              {Object.entries(stats.protocols).map(([protocol, count]) => (
+                <span key={protocol} className="px-2 py-1 bg-gray-800 rounded-lg text-xs">{protocol}: {count}</span>
+              ))}
+            </div>
+          </div>
+          <div>
+            <p className="text-sm font-semibold mb-1">Principales emisores</p>
+            {stats.top_talkers.map((talker) => (
+              <p key={talker.ip} className="text-xs font-mono">{talker.ip} — {formatBytes(talker.bytes)} ({talker.packets} paquetes)</p>
+            ))}
+          </div>
+        </div>
+      )}
+
+      {packets.length > 0 && (
+        <div className="max-h-64 overflow-y-auto p-3 bg-gray-800/70 rounded-2xl font-mono text-xs text-gray-400">
+          {packets.map((packet, index) => (
+            <p key={`${packet.timestamp}-${index}`}>
+              {new Date(packet.timestamp * 1000).toLocaleTimeString()} {packet.protocol} {packet.src_ip || '?'}
+              {packet.src_port ? `:${packet.src_port}` : ''} → {packet.dst_ip || '?'}
+              {packet.dst_port ? `:${packet.dst_port}` : ''} ({packet.length} B)
+            </p>
+          ))}
+        </div>
+      )}
+    </div>
+  );
+}
+
+export default LiveCapturePanel;
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { getSessionPackets } from '../services/api';
 import { debounce } from 'lodash'; // Necesitarás instalar lodash: npm install lodash
 
@@ -18,10 +18,13 @@ function PacketTable({ sessionId }) {
   });
   // Estado intermedio para inputs (para debounce)
   const [inputFilters, setInputFilters] = useState(filters);
+  // Cursor (packet_number) con el que empieza cada página ya visitada
+  const pageCursors = useRef([null]);
 
   // Debounce la actualización de los filtros principales
   const debouncedSetFilters = useCallback(debounce((newFilters) => {
     setFilters(newFilters);
+    pageCursors.current = [null];
     setCurrentPage(0); // Resetear a la primera página al aplicar filtros
   }, 500), []); // 500ms de debounce
 
@@ -40,11 +43,15 @@ function PacketTable({ sessionId }) {
       setLoading(true);
       setError(null);
       try {
-        // Construir parámetros incluyendo filtros no vacíos
-        const params = {
-          limit,
-          offset: currentPage * limit,
-        };
+        // Construir parámetros incluyendo filtros no vacíos.
+        // Las páginas ya conocidas se piden por cursor (sin OFFSET) y el total solo en la primera
+        const cursor = pageCursors.current[currentPage];
+        const params = { limit, with_total: currentPage === 0 };
+        if (cursor !== undefined && cursor !== null) {
+          params.after = cursor;
+        } else if (currentPage > 0) {
+          params.offset = currentPage * limit;
+        }
         for (const key in filters) {
           if (filters[key]) {
             params[key] = filters[key];
@@ -53,7 +60,12 @@ function PacketTable({ sessionId }) {
         
         const response = await getSessionPackets(sessionId, params);
         setPackets(response.data.packets || []);
-        setTotalPackets(response.data.total || 0);
+        if (response.data.total !== null && response.data.total !== undefined) {
+          setTotalPackets(response.data.total);
+        }
+        if (response.data.next_cursor !== null && response.data.next_cursor !== undefined) {
+          pageCursors.current[currentPage + 1] = response.data.next_cursor;
+        }
       } catch (err) {
         console.error(`Error fetching packets for session ${sessionId}:`, err);
         setError(`Error al cargar los paquetes.`);
@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
-import { getInterfaces, startCapture, listPcapFiles, uploadPcapFile } from '../services/api';
+import { getInterfaces, startCapture, getCapture, stopCapture, listPcapFiles, uploadPcapFileChunked, getJob } from '../services/api';
+import LiveCapturePanel from '../components/LiveCapturePanel';
 
 function CapturePage() {
   const [interfaces, setInterfaces] = useState([]);
@@ -9,6 +10,7 @@ function CapturePage() {
   const [isCapturing, setIsCapturing] = useState(false);
   const [captureStatus, setCaptureStatus] = useState('');
   const [loading, setLoading] = useState(false);
+  const captureIdRef = useRef(null);
   
   const [pcapFiles, setPcapFiles] = useState([]);
   const [selectedFile, setSelectedFile] = useState(null);
@@ -43,30 +45,46 @@ function CapturePage() {
     fetchPcapFiles();
   }, []);
 
-  const handleStartCapture = () => {
+  const handleStartCapture = async () => {
     setLoading(true);
     setIsCapturing(true);
     setCaptureStatus('🛜 Iniciando captura...');
 
-    startCapture(selectedInterface, duration, packetCount).catch((error) => {
+    try {
+      // La captura se ejecuta en segundo plano: consultar su estado hasta que termine
+      let capture = (await startCapture(selectedInterface, duration, packetCount)).data;
+      captureIdRef.current = capture.id;
+      setLoading(false);
+      while (capture.status === 'running') {
+        setCaptureStatus(`⚙️ Capturando tráfico de red... (${(capture.size / 1024).toFixed(1)} KB)`);
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        capture = (await getCapture(capture.id)).data;
+      }
+      if (capture.status === 'failed') {
+        setCaptureStatus(`Error durante la captura: ${capture.error}`);
+      } else {
+        setCaptureStatus(capture.status === 'stopped' ? '⏹️ Captura detenida.' : '✅ Captura completada.');
+      }
+      const filesResponse = await listPcapFiles();
+      setPcapFiles(filesResponse.data);
+    } catch (error) {
       console.error('Error al iniciar captura:', error);
       setCaptureStatus(`Error al iniciar captura: ${error.response?.data?.detail || error.message}`);
+    } finally {
+      captureIdRef.current = null;
       setIsCapturing(false);
       setLoading(false);
-    });
+    }
+  };
 
-    setCaptureStatus('⚙️ Capturando tráfico de red... ');
-    setTimeout(async () => {
-      try {
-        const filesResponse = await listPcapFiles();
-        setPcapFiles(filesResponse.data);
-        setCaptureStatus('✅ Captura completada.');
-      } catch (err) {
-        console.error('Error al actualizar archivos:', err);
-      }
-      setIsCapturing(false);
-      setLoading(false);
-    }, (duration + 5) * 1000);
+  const handleStopCapture = async () => {
+    if (!captureIdRef.current) return;
+    try {
+      setCaptureStatus('⏹️ Deteniendo captura...');
+      await stopCapture(captureIdRef.current);
+    } catch (error) {
+      console.error('Error al detener captura:', error);
+    }
   };
 
   const handleFileChange = (event) => {
@@ -82,15 +100,39 @@ function CapturePage() {
     
     try {
       setFileLoading(true);
-      setUploadStatus('Generando base de datos...');
+      setUploadStatus('Subiendo archivo...');
       
-      const response = await uploadPcapFile(
+      // Subida por bloques: la base de datos se genera mientras se sube
+      const response = await uploadPcapFileChunked(
         selectedFile,
-        true,
-        selectedInterface
+        selectedInterface,
+        (progress) => setUploadStatus(`Subiendo y procesando archivo... ${Math.round(progress * 100)}%`)
       );
       
-      setUploadStatus(`Base de datos generada.`);
+      // El procesamiento se ejecuta en la cola de trabajos: consultar su estado hasta que termine
+      const jobId = response.data.job_id;
+      if (jobId) {
+        setUploadStatus('Archivo subido. Procesamiento en cola...');
+        let job = response.data;
+        while (true) {
+          await new Promise((resolve) => setTimeout(resolve, 2000));
+          job = (await getJob(jobId)).data;
+          if (job.status === 'running') {
+            setUploadStatus('Generando base de datos...');
+          } else if (['completed', 'failed', 'cancelled'].includes(job.status)) {
+            break;
+          }
+        }
+        if (job.status === 'completed') {
+          setUploadStatus(`Base de datos generada: ${job.result?.db_file}`);
+        } else if (job.status === 'cancelled') {
+          setUploadStatus('Procesamiento cancelado.');
+        } else {
+          setUploadStatus(`Error al generar base de datos: ${job.error}`);
+        }
+      } else {
+        setUploadStatus('Archivo subido.');
+      }
       
       const filesResponse = await listPcapFiles();
       setPcapFiles(filesResponse.data);
@@ -185,13 +227,13 @@ function CapturePage() {
                     ? 'bg-gradient-to-r from-amber-400 to-orange-500 hover:from-amber-500 hover:to-orange-600' 
                     : 'bg-gradient-to-r from-emerald-400 to-teal-500 hover:from-emerald-500 hover:to-teal-600 hover:shadow-xl'
                 }`}
-                onClick={handleStartCapture}
-                disabled={isCapturing || loading || !selectedInterface}
+                onClick={isCapturing ? handleStopCapture : handleStartCapture}
+                disabled={loading || !selectedInterface}
               >
                 {isCapturing ? (
                   <span className="flex items-center justify-center">
                     <span className="animate-spin mr-2">⚙️</span>
-                    Capturando...
+                    Capturando... (detener)
                   </span>
                 ) : (
                   <span className="flex items-center justify-center">
@@ -206,6 +248,8 @@ function CapturePage() {
                   <p className="text-gray-300 font-medium">{captureStatus}</p>
                 </div>
               )}
+
+              <LiveCapturePanel interfaceId={selectedInterface} />
             </div>
           </div>
 
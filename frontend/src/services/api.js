@@ -10,18 +10,61 @@ const apiClient = axios.create({
 });
 
 // --- Funciones existentes ---
-export const getInterfaces = () => apiClient.get('/capture/interfaces');
+export const getInterfaces = (refresh = false) => apiClient.get('/capture/interfaces', { params: { refresh } });
 
-export const startCapture = (interfaceId, duration, packetCount) => {
+export const getCaptureCapabilities = () => apiClient.get('/capture/capabilities');
+
+export const startCapture = (interfaceId, duration, packetCount, process = false, ringBuffer = {}, { captureFilter, snaplen } = {}) => {
   return apiClient.post('/capture/start', null, {
     params: {
       interface_id: interfaceId,
       duration: duration,
       packet_count: packetCount,
+      process: process,
+      // Filtro BPF (se compila antes de capturar: un error llega como 400) y bytes por paquete
+      capture_filter: captureFilter,
+      snaplen: snaplen,
+      // Búfer circular: cada archivo se procesa en cuanto se cierra
+      ring_filesize: ringBuffer.filesize,
+      ring_duration: ringBuffer.duration,
+      ring_files: ringBuffer.files,
     },
   });
 };
 
+// Captura directa a base de datos (trabajo de la cola; cancelarlo detiene la captura)
+export const startDirectCapture = (interfaceId, { duration, packetCount, captureFilter, snaplen, archive = true } = {}) => {
+  return apiClient.post('/capture/ingest', null, {
+    params: {
+      interface_id: interfaceId,
+      duration: duration,
+      packet_count: packetCount,
+      capture_filter: captureFilter,
+      snaplen: snaplen,
+      archive: archive,
+    },
+  });
+};
+
+// Capturas asíncronas: estado, listado y parada
+export const getCapture = (captureId) => apiClient.get(`/capture/captures/${captureId}`);
+
+export const listCaptures = (status) => apiClient.get('/capture/captures', { params: { status } });
+
+export const stopCapture = (captureId) => apiClient.post(`/capture/captures/${captureId}/stop`);
+
+// Compila un filtro de captura para una interfaz (código BPF o 400 si no es válido)
+export const compileCaptureFilter = (interfaceId, captureFilter, snaplen) =>
+  apiClient.get('/capture/filters/compile', { params: { interface_id: interfaceId, capture_filter: captureFilter, snaplen } });
+
+// Captura en vivo: resumen por segundo y muestra de paquetes por WebSocket
+export const openLiveCapture = (interfaceId, { captureFilter, maxSamples } = {}) => {
+  const url = new URL(`${API_URL.replace(/^http/, 'ws')}/capture/live/${encodeURIComponent(interfaceId)}`);
+  if (captureFilter) url.searchParams.set('capture_filter', captureFilter);
+  if (maxSamples !== undefined) url.searchParams.set('max_samples', maxSamples);
+  return new WebSocket(url);
+};
+
 export const listPcapFiles = () => apiClient.get('/capture/files');
 
 export const uploadPcapFile = (file, processNow, interfaceId) => {
@@ -29,7 +72,7 @@ export const uploadPcapFile = (file, processNow, interfaceId) => {
   formData.append('file', file);
   formData.append('process_now', processNow);
   if (interfaceId) {
-    formData.append('interface', interfaceId);
+    formData.append('interface_id', interfaceId);
   }
   return apiClient.post('/processing/upload-pcap', formData, {
     headers: {
@@ -38,6 +81,49 @@ export const uploadPcapFile = (file, processNow, interfaceId) => {
   });
 };
 
+// Estado de un trabajo de procesamiento (la subida devuelve job_id)
+export const getJob = (jobId) => apiClient.get(`/processing/jobs/${jobId}`);
+
+// Listar trabajos de procesamiento (opcionalmente por estado)
+export const listJobs = (status) => apiClient.get('/processing/jobs', { params: status ? { status } : {} });
+
+// Cancelar un trabajo encolado o en curso
+export const cancelJob = (jobId) => apiClient.post(`/processing/jobs/${jobId}/cancel`);
+
+// Subida por bloques reanudable: el procesamiento empieza con el primer bloque recibido
+export const uploadPcapFileChunked = async (file, interfaceId, onProgress, chunkSize = 8 * 1024 * 1024) => {
+  const created = await apiClient.post('/processing/uploads', {
+    file_name: file.name,
+    size: file.size,
+    process_immediately: true,
+    interface_id: interfaceId || null,
+  });
+  const upload = created.data;
+  let offset = 0;
+  let retries = 0;
+  while (offset < file.size) {
+    try {
+      const response = await apiClient.patch(`/processing/uploads/${upload.id}`, file.slice(offset, offset + chunkSize), {
+        headers: {
+          'Content-Type': 'application/offset+octet-stream',
+          'Upload-Offset': offset,
+        },
+      });
+      offset = Number(response.headers['upload-offset']);
+      retries = 0;
+      if (onProgress) onProgress(offset / file.size);
+    } catch (error) {
+      // Conexión cortada u offset desfasado: continuar desde el offset guardado en el servidor
+      if ((error.response && error.response.status !== 409) || retries >= 5) throw error;
+      retries += 1;
+      await new Promise((resolve) => setTimeout(resolve, 1000 * retries));
+      const head = await apiClient.head(`/processing/uploads/${upload.id}`);
+      offset = Number(head.headers['upload-offset']);
+    }
+  }
+  return { data: { ...upload, offset } };
+};
+
 export const processPcapFile = (filePath, interfaceId) => {
   return apiClient.post('/processing/process-pcap', null, {
     params: {